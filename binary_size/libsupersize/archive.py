@@ -5,8 +5,10 @@
 """Main Python API for analyzing binary size."""
 
 import argparse
+import array
 import calendar
 import collections
+import cStringIO
 import datetime
 import gzip
 import itertools
@@ -102,6 +104,11 @@ class SectionSizeKnobs(object):
 
     self.src_root = path_util.SRC_ROOT
 
+    # Directory used to cache per-object-file nm and string literal results
+    # across runs (None disables caching), and its maximum size in bytes.
+    self.object_cache_dir = None
+    self.object_cache_max_size = 1 << 30
+
 
 def _OpenMaybeGz(path):
   """Calls `gzip.open()` if |path| ends in ".gz", otherwise calls `open()`."""
@@ -727,6 +734,67 @@ def LoadAndPostProcessSizeInfo(path, file_obj=None):
   return size_info
 
 
+def _LoadAndPostProcessSizeInfoForTransfer(idx, path):
+  """Loads a SizeInfo and encodes it for LoadAndPostProcessSizeInfos().
+
+  Pickling a SizeInfo is much slower than re-parsing the .size format, so the
+  post-processed SizeInfo is returned as a version 2 .size buffer (which holds
+  normalized |full_name| and |flags|), plus the fields that are derived during
+  post-processing. Columns are in |raw_symbols| order, which matches the order
+  symbols are written in since they are already grouped by section.
+  """
+  size_info = LoadAndPostProcessSizeInfo(path)
+  raw_symbols = size_info.raw_symbols
+  stringio = cStringIO.StringIO()
+  file_format.SaveSizeInfo(size_info, path, file_obj=stringio, version=2)
+  sizes = array.array('l', (s.size for s in raw_symbols))
+  paddings = array.array('l', (s.padding for s in raw_symbols))
+  template_names = '\0'.join(s.template_name for s in raw_symbols)
+  names = '\0'.join(s.name for s in raw_symbols)
+  return (idx, stringio.getvalue(), sizes.tostring(), paddings.tostring(),
+          template_names, names)
+
+
+def _SizeInfoFromTransfer(path, size_buf, sizes, paddings, template_names,
+                          names):
+  """Decodes the return value of _LoadAndPostProcessSizeInfoForTransfer()."""
+  size_info = file_format.LoadSizeInfo(
+      path, file_obj=cStringIO.StringIO(size_buf))
+  raw_symbols = size_info.raw_symbols
+  size_array = array.array('l')
+  size_array.fromstring(sizes)
+  padding_array = array.array('l')
+  padding_array.fromstring(paddings)
+  template_names = template_names.split('\0')
+  names = names.split('\0')
+  assert len(size_array) == len(raw_symbols), 'Corrupt transfer.'
+  for symbol, size, padding, template_name, name in itertools.izip(
+      raw_symbols, size_array, padding_array, template_names, names):
+    symbol.size = size
+    symbol.padding = padding
+    symbol.template_name = template_name
+    symbol.name = name
+    function_signature.InternSameNames(symbol)
+  return size_info
+
+
+def LoadAndPostProcessSizeInfos(paths):
+  """Returns a list of SizeInfos for the given |paths|.
+
+  Files are loaded and post-processed in parallel.
+  """
+  if len(paths) < 2 or concurrent.DISABLE_ASYNC:
+    return [LoadAndPostProcessSizeInfo(p) for p in paths]
+
+  logging.debug('Loading %d .size files in parallel', len(paths))
+  ret = [None] * len(paths)
+  for result in concurrent.BulkForkAndCall(
+      _LoadAndPostProcessSizeInfoForTransfer, enumerate(paths)):
+    idx = result[0]
+    ret[idx] = _SizeInfoFromTransfer(paths[idx], *result[1:])
+  return ret
+
+
 def CreateMetadata(map_path, elf_path, apk_path, tool_prefix, output_directory,
                    linker_name):
   """Creates metadata dict.
@@ -792,7 +860,7 @@ def _ResolveThinArchivePaths(raw_symbols, thin_archives):
 
 
 def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
-                  outdir_context=None, linker_name=None):
+                  outdir_context=None, linker_name=None, knobs=None):
   """Adds ELF section sizes and symbols."""
   if elf_path:
     # Run nm on the elf file to retrieve the list of symbol names per-address.
@@ -813,7 +881,9 @@ def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
     if outdir_context:
       bulk_analyzer = obj_analyzer.BulkObjectFileAnalyzer(
           tool_prefix, outdir_context.output_directory,
-          track_string_literals=track_string_literals)
+          track_string_literals=track_string_literals,
+          cache_dir=knobs and knobs.object_cache_dir,
+          cache_max_size=knobs and knobs.object_cache_max_size)
       bulk_analyzer.AnalyzePaths(outdir_context.elf_object_paths)
 
   logging.info('Parsing Linker Map')
@@ -1257,7 +1327,7 @@ def CreateSectionSizesAndSymbols(
 
   section_sizes, raw_symbols, object_paths_by_name = _ParseElfInfo(
       map_path, elf_path, tool_prefix, track_string_literals,
-      outdir_context=outdir_context, linker_name=linker_name)
+      outdir_context=outdir_context, linker_name=linker_name, knobs=knobs)
   elf_overhead_size = _CalculateElfOverhead(section_sizes, elf_path)
 
   pak_symbols_by_id = None
@@ -1465,6 +1535,16 @@ def AddArguments(parser):
                            'granular symbols.')
   parser.add_argument('--source-directory',
                       help='Custom path to the root source directory.')
+  parser.add_argument('--object-cache-dir',
+                      help='Directory in which to cache per-object-file '
+                           'results across runs. Results for object files '
+                           'that have not changed are reused.')
+  parser.add_argument('--object-cache-size', type=int, default=1024,
+                      help='Maximum size of --object-cache-dir in MiB. Least '
+                           'recently used entries are evicted beyond this.')
+  parser.add_argument('--demangle-cache',
+                      help='Path to a file in which to cache demangled names '
+                           'across runs.')
   AddMainPathsArguments(parser)
 
 
@@ -1539,6 +1619,11 @@ def Run(args, parser):
   knobs = SectionSizeKnobs()
   if args.source_directory:
     knobs.src_root = args.source_directory
+  if args.object_cache_dir:
+    knobs.object_cache_dir = args.object_cache_dir
+    knobs.object_cache_max_size = args.object_cache_size * 1024 * 1024
+  if args.demangle_cache:
+    demangle.SetCachePath(args.demangle_cache)
 
   section_sizes, raw_symbols = CreateSectionSizesAndSymbols(
       map_path=map_path, tool_prefix=tool_prefix, elf_path=elf_path,
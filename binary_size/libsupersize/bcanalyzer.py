@@ -16,6 +16,10 @@ RunBcAnalyzerOnIntermediates():
   BulkForkAndCall() target: Given BC file [paths], runs (llvm-)bcanalyzer on
   each path, parses the output, extracts strings, and returns {path: [strings]}.
 
+CollectStringsFromIntermediates():
+  Same as RunBcAnalyzerOnIntermediates(), but returns results without encoding
+  them.
+
 This file can also be run stand-alone in order to test out the logic on smaller
 sample sizes.
 """
@@ -336,9 +340,8 @@ class _BcAnalyzerRunner:
     return output.splitlines()
 
 
-# This is a target for BulkForkAndCall().
-def RunBcAnalyzerOnIntermediates(target, tool_prefix, output_directory):
-  """Calls bcanalyzer and returns encoded map from path to strings.
+def CollectStringsFromIntermediates(target, tool_prefix, output_directory):
+  """Calls bcanalyzer and returns a map from path to strings.
 
   Args:
     target: A list of BC file paths.
@@ -348,6 +351,18 @@ def RunBcAnalyzerOnIntermediates(target, tool_prefix, output_directory):
   strings_by_path = {}
   for t in target:
     strings_by_path[t] = [s for _, s in _ParseBcAnalyzer(runner.RunOnFile(t))]
+  return strings_by_path
+
+
+# This is a target for BulkForkAndCall().
+def RunBcAnalyzerOnIntermediates(target, tool_prefix, output_directory):
+  """Calls bcanalyzer and returns encoded map from path to strings.
+
+  Args:
+    target: A list of BC file paths.
+  """
+  strings_by_path = CollectStringsFromIntermediates(
+      target, tool_prefix, output_directory)
   # Escape strings by repr() so there will be no special characters to interfere
   # concurrent.EncodeDictOfLists() and decoding.
   return concurrent.EncodeDictOfLists(strings_by_path, value_transform=repr)
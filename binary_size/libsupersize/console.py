@@ -458,7 +458,7 @@ def Run(args, parser):
     if not path.endswith('.size'):
       parser.error('All inputs must end with ".size"')
 
-  size_infos = [archive.LoadAndPostProcessSizeInfo(p) for p in args.inputs]
+  size_infos = archive.LoadAndPostProcessSizeInfos(args.inputs)
   output_directory_finder = path_util.OutputDirectoryFinder(
       value=args.output_directory,
       any_path_within_output_directory=args.inputs[0])
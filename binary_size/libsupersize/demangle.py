@@ -4,17 +4,46 @@
 
 """Utilities for demangling C++ symbols."""
 
+import atexit
 import collections
 import logging
+import multiprocessing
+import os
 import re
+import sqlite3
 import subprocess
+import threading
+import time
 
+import concurrent
 import path_util
 
 _LOWER_HEX_PATTERN = re.compile(r'^[0-9a-f]*$')
 _PROMOTED_GLOBAL_NAME_DEMANGLED_PATTERN = re.compile(
     r' \((\.\d+)?\.llvm\.\d+\)$')
 _PROMOTED_GLOBAL_NAME_RAW_PATTERN = re.compile(r'(\.\d+)?\.llvm\.\d+$')
+# Bump this when the format of cached values changes.
+_CACHE_VERSION = '1'
+# Max number of host parameters in a single sqlite statement is 999.
+_CACHE_QUERY_BATCH_SIZE = 900
+# The oldest entries are evicted when the cache holds more names than this
+# (roughly 1GB). A typical build has about 1M unique mangled names.
+_CACHE_MAX_ENTRIES = 5000000
+# Misses are split among multiple c++filt processes only when there are at
+# least this many.
+_PARALLEL_MIN_NAMES = 20000
+
+# Path to the sqlite database used to cache demangled names. None disables
+# caching.
+_cache_path = None
+# Process-local cache object. Connections must not be shared across fork().
+_cache = None
+# Idle c++filt processes (see _CppFiltProcess), by c++filt path. They are
+# reused by later calls, and belong to the process which started them.
+_idle_cppfilt_procs = collections.defaultdict(list)
+_idle_cppfilt_procs_pid = None
+_idle_cppfilt_procs_lock = threading.Lock()
+
 
 def StripLlvmPromotedGlobalNames(name):
   """Strips LLVM promoted global names suffix, and returns the result.
@@ -51,17 +80,209 @@ def _StripHashSuffix(names):
       yield name
 
 
+class _DemangleCache(object):
+  """A persistent mapping of mangled -> demangled names, stored in sqlite.
+
+  Holds at most _CACHE_MAX_ENTRIES names. Once full, the least recently
+  inserted names are evicted first (hits do not count as uses, to keep
+  lookups read-only). Safe to use from multiple processes, but not across
+  fork().
+  """
+
+  def __init__(self, path, cppfilt_path):
+    self._conn = sqlite3.connect(path, timeout=60)
+    # Names are byte strings.
+    self._conn.text_factory = str
+    with self._conn:
+      self._conn.execute('CREATE TABLE IF NOT EXISTS meta '
+                         '(key TEXT PRIMARY KEY, value TEXT)')
+      self._conn.execute('CREATE TABLE IF NOT EXISTS names '
+                         '(mangled TEXT PRIMARY KEY, demangled TEXT)')
+      # Results depend on the version of c++filt, so start over when it
+      # changes.
+      fingerprint = '%s:%s' % (
+          _CACHE_VERSION, path_util.GetToolFingerprint(cppfilt_path))
+      row = self._conn.execute(
+          'SELECT value FROM meta WHERE key = ?', ('fingerprint',)).fetchone()
+      if not row or row[0] != fingerprint:
+        if row:
+          logging.info('Clearing demangle cache since c++filt changed.')
+        self._conn.execute('DELETE FROM names')
+        self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                           ('fingerprint', fingerprint))
+
+  def Lookup(self, names):
+    """Returns a dict of mangled -> demangled for cached entries of |names|."""
+    names = list(names)
+    ret = {}
+    for i in xrange(0, len(names), _CACHE_QUERY_BATCH_SIZE):
+      batch = names[i:i + _CACHE_QUERY_BATCH_SIZE]
+      query = 'SELECT mangled, demangled FROM names WHERE mangled IN (%s)' % (
+          ','.join('?' * len(batch)))
+      ret.update(self._conn.execute(query, batch))
+    return ret
+
+  def Store(self, demangled_by_mangled):
+    with self._conn:
+      self._conn.executemany('INSERT OR REPLACE INTO names VALUES (?, ?)',
+                             demangled_by_mangled.iteritems())
+      num_entries = self._conn.execute(
+          'SELECT COUNT(*) FROM names').fetchone()[0]
+      if num_entries > _CACHE_MAX_ENTRIES:
+        # Rowids increase with insertion order.
+        self._conn.execute(
+            'DELETE FROM names WHERE rowid IN '
+            '(SELECT rowid FROM names ORDER BY rowid LIMIT ?)',
+            (num_entries - _CACHE_MAX_ENTRIES,))
+
+
+def SetCachePath(path):
+  """Enables caching of demangled names across runs in the file at |path|.
+
+  Pass None to disable caching.
+  """
+  global _cache_path
+  global _cache
+  _cache_path = path and os.path.abspath(path)
+  _cache = None
+
+
+def _GetCache(cppfilt_path):
+  global _cache
+  if not _cache_path:
+    return None
+  if _cache is None or _cache[0] != os.getpid():
+    _cache = (os.getpid(), _DemangleCache(_cache_path, cppfilt_path))
+  return _cache[1]
+
+
+class _CppFiltProcess(object):
+  """A long-lived c++filt process, which demangles a name per input line."""
+
+  def __init__(self, cppfilt_path):
+    self._proc = subprocess.Popen([cppfilt_path], bufsize=-1,
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE)
+
+  def _Write(self, names):
+    try:
+      for name in _StripHashSuffix(names):
+        self._proc.stdin.write(name + '\n')
+      self._proc.stdin.flush()
+    except IOError:
+      pass  # c++filt died. Demangle() notices that it has no output.
+
+  def Demangle(self, names):
+    # Names are written on another thread, so that neither side blocks on a
+    # full pipe.
+    writer = threading.Thread(target=self._Write, args=(names,))
+    writer.daemon = True
+    writer.start()
+    ret = []
+    for _ in xrange(len(names)):
+      line = self._proc.stdout.readline()
+      if not line:
+        raise Exception('c++filt exited with code %s' % self._proc.poll())
+      ret.append(StripLlvmPromotedGlobalNames(line.rstrip('\n')))
+    writer.join()
+    return ret
+
+  def Close(self):
+    try:
+      self._proc.stdin.close()
+    except IOError:
+      pass
+    self._proc.wait()
+
+  def Kill(self):
+    if self._proc.poll() is None:
+      self._proc.kill()
+    self.Close()
+
+
+def _CloseIdleCppFiltProcesses():
+  with _idle_cppfilt_procs_lock:
+    if _idle_cppfilt_procs_pid == os.getpid():
+      for procs in _idle_cppfilt_procs.itervalues():
+        for proc in procs:
+          proc.Close()
+    _idle_cppfilt_procs.clear()
+
+
+atexit.register(_CloseIdleCppFiltProcesses)
+
+
+def _RunCppFilt(names, cppfilt_path):
+  """Demangles |names| using an idle c++filt process, or a new one."""
+  global _idle_cppfilt_procs_pid
+  with _idle_cppfilt_procs_lock:
+    if _idle_cppfilt_procs_pid != os.getpid():
+      # Processes started before fork() belong to the parent.
+      _idle_cppfilt_procs.clear()
+      _idle_cppfilt_procs_pid = os.getpid()
+    procs = _idle_cppfilt_procs[cppfilt_path]
+    proc = procs.pop() if procs else None
+  if proc is None:
+    proc = _CppFiltProcess(cppfilt_path)
+  try:
+    ret = proc.Demangle(names)
+  except:
+    proc.Kill()
+    raise
+  with _idle_cppfilt_procs_lock:
+    _idle_cppfilt_procs[cppfilt_path].append(proc)
+  return ret
+
+
+def _DemangleUniqueNames(names, cppfilt_path):
+  """Demangles |names|, using multiple c++filt processes when there are many.
+
+  The processes are kept alive and reused by later calls.
+  """
+  num_chunks = 1
+  if len(names) >= _PARALLEL_MIN_NAMES:
+    num_chunks = multiprocessing.cpu_count()
+  chunk_size = (len(names) + num_chunks - 1) // num_chunks
+  results = [concurrent.CallOnThread(_RunCppFilt, names[i:i + chunk_size],
+                                     cppfilt_path)
+             for i in xrange(0, len(names), chunk_size)]
+  ret = []
+  for result in results:
+    ret.extend(result.get())
+  return ret
+
+
 def _DemangleNames(names, tool_prefix):
-  """Uses c++filt to demangle a list of names."""
-  proc = subprocess.Popen([path_util.GetCppFiltPath(tool_prefix)],
-                          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-  stdout = proc.communicate('\n'.join(_StripHashSuffix(names)))[0]
-  assert proc.returncode == 0
-  ret = [StripLlvmPromotedGlobalNames(line) for line in stdout.splitlines()]
+  """Uses c++filt to demangle a list of names.
+
+  Each unique name is demangled once, and only names missing from the cache
+  (see SetCachePath()) are passed to c++filt.
+  """
+  start_time = time.time()
+  names = list(names)
+  cppfilt_path = path_util.GetCppFiltPath(tool_prefix)
+  unique_names = set(names)
+  cache = _GetCache(cppfilt_path)
+  demangled_by_mangled = cache.Lookup(unique_names) if cache else {}
+  num_hits = len(demangled_by_mangled)
+
+  misses = [n for n in unique_names if n not in demangled_by_mangled]
+  if misses:
+    missed_by_mangled = dict(
+        zip(misses, _DemangleUniqueNames(misses, cppfilt_path)))
+    assert len(missed_by_mangled) == len(misses)
+    if cache:
+      cache.Store(missed_by_mangled)
+    demangled_by_mangled.update(missed_by_mangled)
+
+  ret = [demangled_by_mangled[n] for n in names]
   if logging.getLogger().isEnabledFor(logging.INFO):
     fail_count = sum(1 for s in ret if s.startswith('_Z'))
     if fail_count:
       logging.info('* Failed to demangle %d/%d items', fail_count, len(ret))
+    if cache:
+      logging.info('* Demangle cache: %d hits, %d misses (%.1fs)', num_hits,
+                   len(misses), time.time() - start_time)
   return ret
 
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import demangle
+
+
+_SCRIPT_DIR = os.path.dirname(__file__)
+_TEST_TOOL_PREFIX = os.path.join(
+    os.path.abspath(_SCRIPT_DIR), 'testdata', 'mock_toolchain', '')
+
+_MANGLED_NAMES = [
+    '_ZN6chrome5mojom11FilePatcher5Name_E',
+    '_ZTV18ChromeMainDelegate',
+    '_ZN6chrome5mojom11FilePatcher5Name_E',
+    '_ZTVN4mojo15MessageReceiverE',
+]
+_DEMANGLED_NAMES = [
+    'chrome::mojom::FilePatcher::Name_',
+    'vtable for ChromeMainDelegate',
+    'chrome::mojom::FilePatcher::Name_',
+    'vtable for mojo::MessageReceiver',
+]
+
+
+class DemangleTest(unittest.TestCase):
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._cppfilt_inputs = []
+    self._orig_run_cppfilt = demangle._RunCppFilt
+    def run_cppfilt(names, cppfilt_path):
+      self._cppfilt_inputs.append(sorted(names))
+      return self._orig_run_cppfilt(names, cppfilt_path)
+    demangle._RunCppFilt = run_cppfilt
+
+  def tearDown(self):
+    demangle._RunCppFilt = self._orig_run_cppfilt
+    demangle.SetCachePath(None)
+    demangle._CloseIdleCppFiltProcesses()
+    shutil.rmtree(self._temp_dir)
+
+  def testDemangleNames_NoCache(self):
+    self.assertEquals(
+        _DEMANGLED_NAMES,
+        demangle._DemangleNames(_MANGLED_NAMES, _TEST_TOOL_PREFIX))
+    # Duplicates are demangled once.
+    self.assertEquals([sorted(set(_MANGLED_NAMES))], self._cppfilt_inputs)
+
+  def testDemangleNames_Cache(self):
+    demangle.SetCachePath(os.path.join(self._temp_dir, 'demangle.sqlite'))
+    self.assertEquals(
+        _DEMANGLED_NAMES[:2],
+        demangle._DemangleNames(_MANGLED_NAMES[:2], _TEST_TOOL_PREFIX))
+    # Simulate a new run.
+    demangle.SetCachePath(os.path.join(self._temp_dir, 'demangle.sqlite'))
+    self.assertEquals(
+        _DEMANGLED_NAMES,
+        demangle._DemangleNames(_MANGLED_NAMES, _TEST_TOOL_PREFIX))
+    self.assertEquals([sorted(_MANGLED_NAMES[:2]), [_MANGLED_NAMES[3]]],
+                      self._cppfilt_inputs)
+
+  def testDemangleNames_Parallel(self):
+    orig_min_names = demangle._PARALLEL_MIN_NAMES
+    demangle._PARALLEL_MIN_NAMES = 1
+    try:
+      self.assertEquals(
+          _DEMANGLED_NAMES,
+          demangle._DemangleNames(_MANGLED_NAMES, _TEST_TOOL_PREFIX))
+    finally:
+      demangle._PARALLEL_MIN_NAMES = orig_min_names
+    # One c++filt process per CPU, at most one per unique name.
+    self.assertEquals(min(multiprocessing.cpu_count(), 3),
+                      len(self._cppfilt_inputs))
+
+  def testDemangleNames_ReusesProcesses(self):
+    demangle._DemangleNames(_MANGLED_NAMES[:2], _TEST_TOOL_PREFIX)
+    procs = list(demangle._idle_cppfilt_procs.itervalues())
+    self.assertEquals(1, len(procs))
+    self.assertEquals(1, len(procs[0]))
+    proc = procs[0][0]
+    self.assertEquals(
+        _DEMANGLED_NAMES,
+        demangle._DemangleNames(_MANGLED_NAMES, _TEST_TOOL_PREFIX))
+    self.assertEquals([[proc]], demangle._idle_cppfilt_procs.values())
+
+  def testDemangleNames_CacheEviction(self):
+    orig_max_entries = demangle._CACHE_MAX_ENTRIES
+    demangle._CACHE_MAX_ENTRIES = 2
+    try:
+      demangle.SetCachePath(os.path.join(self._temp_dir, 'demangle.sqlite'))
+      for i in (0, 1, 3):
+        demangle._DemangleNames([_MANGLED_NAMES[i]], _TEST_TOOL_PREFIX)
+      # The first name was evicted to make room for the last one.
+      self.assertEquals(
+          _DEMANGLED_NAMES,
+          demangle._DemangleNames(_MANGLED_NAMES, _TEST_TOOL_PREFIX))
+    finally:
+      demangle._CACHE_MAX_ENTRIES = orig_max_entries
+    self.assertEquals([[_MANGLED_NAMES[0]], [_MANGLED_NAMES[1]],
+                       [_MANGLED_NAMES[3]], [_MANGLED_NAMES[0]]],
+                      self._cppfilt_inputs)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -4,33 +4,52 @@
 """Logic for diffing two SizeInfo objects."""
 
 import collections
+import itertools
 import logging
+import multiprocessing
+import operator
 import re
 
+import concurrent
 import models
 
 
-_STRIP_NUMBER_SUFFIX_PATTERN = re.compile(r'[.0-9]+$')
+_NUMBER_SUFFIX_CHARS = '.0123456789'
 _NORMALIZE_STAR_SYMBOLS_PATTERN = re.compile(r'\s+\d+( \(.*\))?$')
 
+# Symbols are matched in separate processes only when diffing at least this
+# many symbols, since forking and returning results has a fixed cost.
+_PARALLEL_MIN_SYMBOLS = 200000
 
-def _ExactMatchKey(s):
+# Summary of a diff, as returned by SummarizeDiff().
+# Fields:
+#   section_sizes: Dict of section_name -> delta size (same as
+#       DeltaSizeInfo.section_sizes).
+#   counts_by_section_name: Dict of section_name -> list of symbol counts,
+#       indexed by models.DIFF_STATUS_*.
+#   size_by_section_name: Dict of section_name -> delta size of symbols.
+#   pss_by_section_name: Dict of section_name -> delta PSS of symbols.
+DiffSummary = collections.namedtuple('DiffSummary', [
+    'section_sizes', 'counts_by_section_name', 'size_by_section_name',
+    'pss_by_section_name'])
+
+
+def _StrippedNames(symbols):
+  """Returns a list of normalized full_names, parallel to |symbols|."""
   # Remove numbers and periods for symbols defined by macros that use __line__
-  # in names, or for linker symbols like ".L.ref.tmp.2".
-  name = _STRIP_NUMBER_SUFFIX_PATTERN.sub('', s.full_name)
-  # Use section rather than section_name since clang & gcc use
-  # .data.rel.ro vs. .data.rel.ro.local.
-  return s.section, name, s.object_path, s.size_without_padding
+  # in names, or for linker symbols like ".L.ref.tmp.2". Same as
+  # re.sub(r'[.0-9]+$', '', name), but much faster.
+  return [s.full_name.rstrip(_NUMBER_SUFFIX_CHARS) for s in symbols]
 
 
-def _GoodMatchKey(symbol):
-  """Returns a tuple that can be used to see if two Symbol are the same.
+def _GoodNames(symbols):
+  """Returns a list of loosely normalized names, parallel to |symbols|.
 
-  Keys are not guaranteed to be unique within a SymbolGroup. When multiple
-  symbols have the same key, they will be matched up in order of appearance.
+  Names are not guaranteed to be unique within a SymbolGroup. When multiple
+  symbols have the same name, they will be matched up in order of appearance.
   We do this because the numbering of these generated symbols is not stable.
 
-  Examples of symbols with shared keys:
+  Examples of symbols with shared names:
     "** merge strings"
     "** symbol gap 3", "** symbol gap 5 (end of section)"
     "foo() [clone ##]"
@@ -39,78 +58,241 @@ def _GoodMatchKey(symbol):
     "._468", "._467"
     ".L__unnamed_1193", ".L__unnamed_712"
   """
-  if symbol.IsPak():
-    # full_name looks like "about_ui_resources.grdp: IDR_ABOUT_UI_CREDITS_HTML".
-    # name is just "IDR_ABOUT_UI_CREDITS_HTML".
-    name = symbol.name
-  else:
-    name = _STRIP_NUMBER_SUFFIX_PATTERN.sub('', symbol.full_name)
-    clone_idx = name.find(' [clone ')
-    if clone_idx != -1:
-      name = name[:clone_idx]
-    if name.startswith('*'):
-      # "symbol gap 3 (bar)" -> "symbol gaps"
-      name = _NORMALIZE_STAR_SYMBOLS_PATTERN.sub('s', name)
+  ret = []
+  for symbol, name in itertools.izip(symbols, _StrippedNames(symbols)):
+    if symbol.IsPak():
+      # full_name looks like
+      # "about_ui_resources.grdp: IDR_ABOUT_UI_CREDITS_HTML".
+      # name is just "IDR_ABOUT_UI_CREDITS_HTML".
+      name = symbol.name
+    else:
+      clone_idx = name.find(' [clone ')
+      if clone_idx != -1:
+        name = name[:clone_idx]
+      if name.startswith('*'):
+        # "symbol gap 3 (bar)" -> "symbol gaps"
+        name = _NORMALIZE_STAR_SYMBOLS_PATTERN.sub('s', name)
+    ret.append(name)
+  return ret
+
+
+# Keys do not contain the section since symbols are matched one section at a
+# time.
+def _ExactMatchKeys(symbols):
+  return [(name, s.object_path, s.size - s.padding)
+          for s, name in itertools.izip(symbols, _StrippedNames(symbols))]
+
+
+def _GoodMatchKeys(symbols):
+  return [(s.object_path, name)
+          for s, name in itertools.izip(symbols, _GoodNames(symbols))]
 
-  return symbol.section, symbol.object_path, name
 
+def _PoorMatchKeys(symbols):
+  return _GoodNames(symbols)
 
-def _PoorMatchKey(symbol):
-  section, _, name = _GoodMatchKey(symbol)
-  return section, name
 
+def _MatchPass(before, after, before_indices, after_indices, keys_func):
+  """Matches symbols with equal keys, in order of appearance.
 
-def _MatchSymbols(before, after, key_func, padding_by_section_name):
-  logging.debug('%s: Building symbol index', key_func.__name__)
-  before_symbols_by_key = collections.defaultdict(list)
-  for s in before:
-    before_symbols_by_key[key_func(s)].append(s)
+  Keys are computed once per symbol by |keys_func|, and looked up via a dict.
 
-  logging.debug('%s: Creating delta symbols', key_func.__name__)
+  Returns:
+    A tuple of (matched_before, matched_after, unmatched_before,
+    unmatched_after), which are lists of indices into |before| and |after|.
+    The first two lists are parallel.
+  """
+  before_keys = keys_func([before[i] for i in before_indices])
+  after_keys = keys_func([after[i] for i in after_indices])
+
+  # Most keys are unique, so store the first index for each key directly, and
+  # create a list only for the (rare) repeated keys.
+  first_index_by_key = {}
+  repeated_indices_by_key = {}
+  for i, key in itertools.izip(before_indices, before_keys):
+    if first_index_by_key.setdefault(key, i) != i:
+      repeated = repeated_indices_by_key.get(key)
+      if repeated is None:
+        repeated_indices_by_key[key] = collections.deque((i,))
+      else:
+        repeated.append(i)
+
+  matched_before = []
+  matched_after = []
   unmatched_after = []
-  delta_symbols = []
-  for after_sym in after:
-    before_sym = before_symbols_by_key.get(key_func(after_sym))
-    if before_sym:
-      before_sym = before_sym.pop(0)
-      # Padding tracked in aggregate, except for padding-only symbols.
-      if before_sym.size_without_padding != 0:
-        padding_by_section_name[before_sym.section_name] += (
-            after_sym.padding_pss - before_sym.padding_pss)
-      delta_symbols.append(models.DeltaSymbol(before_sym, after_sym))
+  for i, key in itertools.izip(after_indices, after_keys):
+    before_idx = first_index_by_key.pop(key, None)
+    if before_idx is None:
+      unmatched_after.append(i)
+      continue
+    matched_before.append(before_idx)
+    matched_after.append(i)
+    if repeated_indices_by_key:
+      repeated = repeated_indices_by_key.get(key)
+      if repeated:
+        first_index_by_key[key] = repeated.popleft()
+
+  unmatched_before = first_index_by_key.values()
+  for repeated in repeated_indices_by_key.itervalues():
+    unmatched_before.extend(repeated)
+  unmatched_before.sort()
+  return matched_before, matched_after, unmatched_before, unmatched_after
+
+
+# This is a target for BulkForkAndCall().
+def _MatchPartition(before_indices, after_indices, before=None, after=None):
+  """Runs the exact and good matching passes for a partition of symbols.
+
+  Returns:
+    A tuple of (matches_by_pass, unmatched_before, unmatched_after), where
+    matches_by_pass is a list of (matched_before, matched_after) for each
+    pass, and all values are lists of indices into |before| and |after|.
+  """
+  matches_by_pass = []
+  # Usually >90% of symbols are exact matches, so most of the time is spent in
+  # this first pass.
+  for keys_func in (_ExactMatchKeys, _GoodMatchKeys):
+    matched_before, matched_after, before_indices, after_indices = _MatchPass(
+        before, after, before_indices, after_indices, keys_func)
+    matches_by_pass.append((matched_before, matched_after))
+  return matches_by_pass, before_indices, after_indices
+
+
+def _IndicesByPartition(symbols, num_object_path_buckets):
+  """Partitions symbols by section and by object_path.
+
+  Symbols from different sections never match. Both exact and good keys
+  contain the object_path, so symbols from different object_path buckets do
+  not match in those passes either.
+  """
+  section_by_name = models.SECTION_NAME_TO_SECTION
+  ret = collections.defaultdict(list)
+  for i, s in enumerate(symbols):
+    # Use section rather than section_name since clang & gcc use
+    # .data.rel.ro vs. .data.rel.ro.local.
+    section = section_by_name[s.section_name]
+    if num_object_path_buckets == 1:
+      ret[section].append(i)
     else:
-      unmatched_after.append(after_sym)
+      ret[(section, hash(s.object_path) % num_object_path_buckets)].append(i)
+  return ret
+
 
-  logging.debug('%s: Matched %d of %d symbols', key_func.__name__,
-                len(delta_symbols), len(after))
+def _MatchSymbols(before, after):
+  """Matches symbols in |before| with symbols in |after|.
 
+  Symbols are matched first by an exact key, then by progressively looser keys.
+  For large inputs, the first two passes run in parallel over partitions of
+  the symbols (see _IndicesByPartition()).
+
+  Returns:
+    A tuple of (matched_pairs, unmatched_before, unmatched_after), where
+    matched_pairs is a list of (before_index, after_index).
+  """
+  num_symbols = len(before) + len(after)
+  parallel = (num_symbols >= _PARALLEL_MIN_SYMBOLS and
+              not concurrent.DISABLE_ASYNC and multiprocessing.cpu_count() > 1)
+  num_object_path_buckets = multiprocessing.cpu_count() if parallel else 1
+  before_indices_by_partition = _IndicesByPartition(
+      before, num_object_path_buckets)
+  after_indices_by_partition = _IndicesByPartition(
+      after, num_object_path_buckets)
+  partitions = sorted(
+      set(before_indices_by_partition).union(after_indices_by_partition))
+  arg_tuples = [(before_indices_by_partition.get(p, []),
+                 after_indices_by_partition.get(p, [])) for p in partitions]
+
+  logging.debug('Matching %d symbols in %d partitions', num_symbols,
+                len(partitions))
+  if parallel:
+    results = list(concurrent.BulkForkAndCall(
+        _MatchPartition, arg_tuples, before=before, after=after))
+  else:
+    results = [_MatchPartition(*args, before=before, after=after)
+               for args in arg_tuples]
+
+  # Sort so that the order does not depend on the order in which partitions
+  # finish.
+  matches_by_pass = [([], []) for _ in xrange(3)]
   unmatched_before = []
-  for syms in before_symbols_by_key.itervalues():
-    unmatched_before.extend(syms)
-  return delta_symbols, unmatched_before, unmatched_after
+  unmatched_after = []
+  for partition_matches_by_pass, partition_unmatched_before, \
+      partition_unmatched_after in results:
+    for (all_before, all_after), (matched_before, matched_after) in zip(
+        matches_by_pass, partition_matches_by_pass):
+      all_before.extend(matched_before)
+      all_after.extend(matched_after)
+    unmatched_before.extend(partition_unmatched_before)
+    unmatched_after.extend(partition_unmatched_after)
+  unmatched_before.sort()
+  unmatched_after.sort()
 
+  # Few symbols remain, so the last pass (whose key lacks object_path) runs
+  # over whole sections serially.
+  logging.debug('Matching %d remaining symbols',
+                len(unmatched_before) + len(unmatched_after))
+  poor_matched_before, poor_matched_after = matches_by_pass[2]
+  remaining_before = []
+  remaining_after = []
+  before_by_section = _IndicesByPartition(
+      [before[i] for i in unmatched_before], 1)
+  after_by_section = _IndicesByPartition(
+      [after[i] for i in unmatched_after], 1)
+  for section in set(before_by_section).union(after_by_section):
+    matched_before, matched_after, section_before, section_after = _MatchPass(
+        before, after,
+        [unmatched_before[i] for i in before_by_section.get(section, [])],
+        [unmatched_after[i] for i in after_by_section.get(section, [])],
+        _PoorMatchKeys)
+    poor_matched_before.extend(matched_before)
+    poor_matched_after.extend(matched_after)
+    remaining_before.extend(section_before)
+    remaining_after.extend(section_after)
+  remaining_before.sort()
+  remaining_after.sort()
 
-def _DiffSymbolGroups(before, after):
-  # For changed symbols, padding is zeroed out. In order to not lose the
-  # information entirely, store it in aggregate.
+  matched_pairs = []
+  for matched_before, matched_after in matches_by_pass:
+    pairs = zip(matched_before, matched_after)
+    pairs.sort(key=lambda p: p[1])
+    matched_pairs.extend(pairs)
+
+  logging.debug('Matched %d of %d symbols', len(matched_pairs), len(after))
+  return matched_pairs, remaining_before, remaining_after
+
+
+def _IterDeltaPairs(before, after):
+  """Yields (before_symbol, after_symbol) for each DeltaSymbol of a diff.
+
+  Either symbol is None for added / removed symbols.
+
+  For changed symbols, padding is zeroed out. In order to not lose the
+  information entirely, it is stored in aggregate and yielded as added
+  "Overhead: aggregate padding" symbols at the end.
+  """
+  before = list(before)
+  after = list(after)
   padding_by_section_name = collections.defaultdict(int)
+  matched_pairs, unmatched_before, unmatched_after = _MatchSymbols(
+      before, after)
 
-  # Usually >90% of symbols are exact matches, so all of the time is spent in
-  # this first pass.
-  all_deltas, before, after = _MatchSymbols(
-      before, after, _ExactMatchKey, padding_by_section_name)
-  for key_func in (_GoodMatchKey, _PoorMatchKey):
-    delta_syms, before, after = _MatchSymbols(
-        before, after, key_func, padding_by_section_name)
-    all_deltas.extend(delta_syms)
-
-  logging.debug('Creating %d unmatched symbols', len(after) + len(before))
-  for after_sym in after:
-    all_deltas.append(models.DeltaSymbol(None, after_sym))
-  for before_sym in before:
-    all_deltas.append(models.DeltaSymbol(before_sym, None))
-
-  # Create a DeltaSymbol to represent the zero'd out padding of matched symbols.
+  for before_idx, after_idx in matched_pairs:
+    before_sym = before[before_idx]
+    after_sym = after[after_idx]
+    # Padding tracked in aggregate, except for padding-only symbols.
+    if before_sym.size_without_padding != 0:
+      padding_by_section_name[before_sym.section_name] += (
+          after_sym.padding_pss - before_sym.padding_pss)
+    yield before_sym, after_sym
+
+  logging.debug('Creating %d unmatched symbols',
+                len(unmatched_after) + len(unmatched_before))
+  for i in unmatched_after:
+    yield None, after[i]
+  for i in unmatched_before:
+    yield before[i], None
+
+  # Create a symbol to represent the zero'd out padding of matched symbols.
   for section_name, padding in padding_by_section_name.iteritems():
     if padding != 0:
       after_sym = models.Symbol(
@@ -118,21 +300,28 @@ def _DiffSymbolGroups(before, after):
           padding,
           name="Overhead: aggregate padding of diff'ed symbols")
       after_sym.padding = padding
-      all_deltas.append(models.DeltaSymbol(None, after_sym))
+      yield None, after_sym
 
-  return models.DeltaSymbolGroup(all_deltas)
 
+def _DiffSymbolGroups(before, after):
+  return models.DeltaSymbolGroup(
+      [models.DeltaSymbol(b, a) for b, a in _IterDeltaPairs(before, after)])
 
-def Diff(before, after, sort=False):
-  """Diffs two SizeInfo objects. Returns a DeltaSizeInfo."""
-  assert isinstance(before, models.SizeInfo)
-  assert isinstance(after, models.SizeInfo)
+
+def _DiffSectionSizes(before, after):
   section_sizes = {k: after.section_sizes.get(k, 0) - v
                    for k, v in before.section_sizes.iteritems()}
   for k, v in after.section_sizes.iteritems():
     if k not in section_sizes:
       section_sizes[k] = v
+  return section_sizes
+
 
+def Diff(before, after, sort=False):
+  """Diffs two SizeInfo objects. Returns a DeltaSizeInfo."""
+  assert isinstance(before, models.SizeInfo)
+  assert isinstance(after, models.SizeInfo)
+  section_sizes = _DiffSectionSizes(before, after)
   symbol_diff = _DiffSymbolGroups(before.raw_symbols, after.raw_symbols)
   ret = models.DeltaSizeInfo(before, after, section_sizes, symbol_diff)
 
@@ -146,3 +335,88 @@ def Diff(before, after, sort=False):
     ret.symbols = syms.Sorted()
   logging.debug('Diff complete')
   return ret
+
+
+def _SummarizeDeltaPair(before_sym, after_sym):
+  """Returns (status, size, pss) of DeltaSymbol(before_sym, after_sym)."""
+  if before_sym is None:
+    return models.DIFF_STATUS_ADDED, after_sym.size, after_sym.pss
+  if after_sym is None:
+    return models.DIFF_STATUS_REMOVED, -before_sym.size, -before_sym.pss
+  # Padding tracked in aggregate, except for padding-only symbols.
+  if before_sym.size_without_padding == 0:
+    size = after_sym.padding - before_sym.padding
+    pss = after_sym.pss - before_sym.pss
+  else:
+    size = after_sym.size_without_padding - before_sym.size_without_padding
+    pss = after_sym.pss_without_padding - before_sym.pss_without_padding
+  if size != 0 or pss != 0:
+    return models.DIFF_STATUS_CHANGED, size, pss
+  return models.DIFF_STATUS_UNCHANGED, size, pss
+
+
+def SummarizeDiff(before, after):
+  """Summarizes Diff(before, after) without creating a DeltaSizeInfo.
+
+  Symbols are matched as for Diff(), but no DeltaSymbol is created. Most matched
+  pairs have the same size and padding and no aliases, so they are unchanged
+  and do not add to the totals. Such pairs are found and counted with C-level
+  map() and list.count() calls, and only the other pairs are looked at one at a
+  time.
+
+  Returns:
+    A DiffSummary.
+  """
+  assert isinstance(before, models.SizeInfo)
+  assert isinstance(after, models.SizeInfo)
+  before_symbols = list(before.raw_symbols)
+  after_symbols = list(after.raw_symbols)
+  matched_pairs, unmatched_before, unmatched_after = _MatchSymbols(
+      before_symbols, after_symbols)
+  counts_by_section_name = collections.defaultdict(lambda: [0, 0, 0, 0])
+  size_by_section_name = collections.defaultdict(int)
+  pss_by_section_name = collections.defaultdict(float)
+  padding_by_section_name = collections.defaultdict(int)
+
+  before_indices = [p[0] for p in matched_pairs]
+  after_indices = [p[1] for p in matched_pairs]
+  get_fields = operator.attrgetter('size', 'padding', 'aliases')
+  # Symbols have no __eq__(), so pairs with aliases never compare equal.
+  is_unchanged = map(
+      operator.eq,
+      map(get_fields, map(before_symbols.__getitem__, before_indices)),
+      map(get_fields, map(after_symbols.__getitem__, after_indices)))
+  unchanged_section_names = map(
+      operator.attrgetter('section_name'),
+      map(after_symbols.__getitem__,
+          itertools.compress(after_indices, is_unchanged)))
+  for section_name in set(unchanged_section_names):
+    counts_by_section_name[section_name][models.DIFF_STATUS_UNCHANGED] = (
+        unchanged_section_names.count(section_name))
+
+  remaining_pairs = itertools.compress(
+      matched_pairs, itertools.imap(operator.not_, is_unchanged))
+  for before_sym, after_sym in itertools.chain(
+      ((before_symbols[b], after_symbols[a]) for b, a in remaining_pairs),
+      ((None, after_symbols[i]) for i in unmatched_after),
+      ((before_symbols[i], None) for i in unmatched_before)):
+    section_name = (after_sym or before_sym).section_name
+    status, size, pss = _SummarizeDeltaPair(before_sym, after_sym)
+    counts_by_section_name[section_name][status] += 1
+    size_by_section_name[section_name] += size
+    pss_by_section_name[section_name] += pss
+    # Same as the "Overhead: aggregate padding" symbols of Diff().
+    if (before_sym is not None and after_sym is not None and
+        before_sym.size_without_padding != 0):
+      padding_by_section_name[before_sym.section_name] += (
+          after_sym.padding_pss - before_sym.padding_pss)
+
+  for section_name, padding in padding_by_section_name.iteritems():
+    if padding != 0:
+      counts_by_section_name[section_name][models.DIFF_STATUS_ADDED] += 1
+      size_by_section_name[section_name] += padding
+      pss_by_section_name[section_name] += padding
+  return DiffSummary(
+      _DiffSectionSizes(before, after), dict(counts_by_section_name),
+      {k: size_by_section_name[k] for k in counts_by_section_name},
+      {k: pss_by_section_name[k] for k in counts_by_section_name})
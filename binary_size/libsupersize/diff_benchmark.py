@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmarks diff.Diff() against the previous (unindexed) implementation.
+
+Also checks that diff.SummarizeDiff() is faster than diff.Diff() and agrees
+with it.
+
+Example usage:
+  # Diff two .size files:
+  diff_benchmark.py before.size after.size
+
+  # Diff synthetic inputs with 500k symbols each:
+  diff_benchmark.py --synthetic 500000
+"""
+
+import argparse
+import collections
+import logging
+import random
+import re
+import resource
+import time
+
+import archive
+import diff
+import models
+
+
+_STRIP_NUMBER_SUFFIX_PATTERN = re.compile(r'[.0-9]+$')
+_NORMALIZE_STAR_SYMBOLS_PATTERN = re.compile(r'\s+\d+( \(.*\))?$')
+
+
+# The reference implementation is the three-pass algorithm that diff.py used
+# before keys were computed in bulk and symbols were matched in partitions.
+def _ReferenceExactMatchKey(s):
+  name = _STRIP_NUMBER_SUFFIX_PATTERN.sub('', s.full_name)
+  return s.section, name, s.object_path, s.size_without_padding
+
+
+def _ReferenceGoodMatchKey(symbol):
+  if symbol.IsPak():
+    name = symbol.name
+  else:
+    name = _STRIP_NUMBER_SUFFIX_PATTERN.sub('', symbol.full_name)
+    clone_idx = name.find(' [clone ')
+    if clone_idx != -1:
+      name = name[:clone_idx]
+    if name.startswith('*'):
+      name = _NORMALIZE_STAR_SYMBOLS_PATTERN.sub('s', name)
+  return symbol.section, symbol.object_path, name
+
+
+def _ReferencePoorMatchKey(symbol):
+  section, _, name = _ReferenceGoodMatchKey(symbol)
+  return section, name
+
+
+def _ReferenceMatchSymbols(before, after, key_func, padding_by_section_name):
+  before_symbols_by_key = collections.defaultdict(list)
+  for s in before:
+    before_symbols_by_key[key_func(s)].append(s)
+  unmatched_after = []
+  delta_symbols = []
+  for after_sym in after:
+    before_sym = before_symbols_by_key.get(key_func(after_sym))
+    if before_sym:
+      before_sym = before_sym.pop(0)
+      if before_sym.size_without_padding != 0:
+        padding_by_section_name[before_sym.section_name] += (
+            after_sym.padding_pss - before_sym.padding_pss)
+      delta_symbols.append(models.DeltaSymbol(before_sym, after_sym))
+    else:
+      unmatched_after.append(after_sym)
+  unmatched_before = []
+  for syms in before_symbols_by_key.itervalues():
+    unmatched_before.extend(syms)
+  return delta_symbols, unmatched_before, unmatched_after
+
+
+def _ReferenceDiff(before, after):
+  before = before.raw_symbols
+  after = after.raw_symbols
+  all_deltas = []
+  padding_by_section_name = collections.defaultdict(int)
+  for key_func in (_ReferenceExactMatchKey, _ReferenceGoodMatchKey,
+                   _ReferencePoorMatchKey):
+    delta_syms, before, after = _ReferenceMatchSymbols(
+        before, after, key_func, padding_by_section_name)
+    all_deltas.extend(delta_syms)
+  all_deltas.extend(models.DeltaSymbol(None, s) for s in after)
+  all_deltas.extend(models.DeltaSymbol(s, None) for s in before)
+  return models.DeltaSymbolGroup(all_deltas)
+
+
+def _CreateSyntheticSizeInfos(num_symbols):
+  """Returns a pair of SizeInfos that differ in roughly 10% of symbols."""
+  rand = random.Random(0)
+  sections = (models.SECTION_TEXT,) * 6 + (
+      models.SECTION_RODATA, models.SECTION_DATA, models.SECTION_DATA_REL_RO,
+      models.SECTION_BSS)
+
+  def make_symbol(i):
+    section_name = rand.choice(sections)
+    if i % 50 == 0:
+      name = '** symbol gap %d' % rand.randint(0, 100)
+    elif i % 20 == 0:
+      name = '.L.ref.tmp.%d' % rand.randint(0, 1000)
+    else:
+      name = 'ns%d::Function%d() [clone .part.%d]' % (i % 997, i, i % 3)
+    return models.Symbol(section_name, rand.randint(1, 500), full_name=name,
+                         object_path='obj/dir%d/file%d.o' % (i % 31, i % 2003))
+
+  before_syms = [make_symbol(i) for i in xrange(num_symbols)]
+  after_syms = []
+  for s in before_syms:
+    roll = rand.random()
+    if roll < .03:
+      continue  # Removed.
+    if roll < .1:
+      s = models.Symbol(s.section_name, s.size + rand.randint(1, 16),
+                        full_name=s.full_name, object_path=s.object_path)
+    after_syms.append(s)
+  after_syms.extend(make_symbol(num_symbols + i)
+                    for i in xrange(num_symbols // 30))
+
+  def make_size_info(syms):
+    return models.SizeInfo({}, models.SymbolGroup(syms))
+  return make_size_info(before_syms), make_size_info(after_syms)
+
+
+def _Measure(name, func, runs):
+  best = None
+  for _ in xrange(runs):
+    # Do not keep the previous result alive, since a large heap slows down
+    # garbage collection.
+    ret = None
+    start = time.time()
+    ret = func()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  print '%-24s %8.2fs' % (name, best)
+  return ret, best
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('before', nargs='?', help='Path to .size file.')
+  parser.add_argument('after', nargs='?', help='Path to .size file.')
+  parser.add_argument('--synthetic', type=int, metavar='NUM_SYMBOLS',
+                      help='Use generated inputs instead of .size files.')
+  parser.add_argument('--runs', type=int, default=3,
+                      help='Report the fastest of this many runs.')
+  parser.add_argument('-v', '--verbose', action='store_true')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+  if args.synthetic:
+    before, after = _CreateSyntheticSizeInfos(args.synthetic)
+  elif args.before and args.after:
+    before, after = archive.LoadAndPostProcessSizeInfos(
+        [args.before, args.after])
+  else:
+    parser.error('Pass either two .size files or --synthetic.')
+
+  print 'Diffing %d -> %d symbols (best of %d runs):' % (
+      len(before.raw_symbols), len(after.raw_symbols), args.runs)
+  # Measure SummarizeDiff() first so that it is not slowed down by results of
+  # the others.
+  summary, summary_time = _Measure(
+      'diff.SummarizeDiff()', lambda: diff.SummarizeDiff(before, after),
+      args.runs)
+  actual, diff_time = _Measure(
+      'diff.Diff()', lambda: diff.Diff(before, after).raw_symbols, args.runs)
+  reference, _ = _Measure('Reference',
+                          lambda: _ReferenceDiff(before, after), args.runs)
+  print 'Peak RAM usage: %d MB' % (
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+  for group in actual.GroupedBySectionName():
+    assert (group.CountsByDiffStatus() ==
+            summary.counts_by_section_name[group.name]), group.name
+    assert (sum(s.size for s in group) ==
+            summary.size_by_section_name[group.name]), group.name
+  assert summary_time < diff_time, (
+      'SummarizeDiff() took %.2fs, but Diff() took %.2fs' % (
+          summary_time, diff_time))
+
+  # Symbols with shared keys (e.g. "** symbol gap") may be paired up
+  # differently, so counts can differ slightly.
+  actual = models.DeltaSymbolGroup(
+      [s for s in actual if not s.name.startswith('Overhead: ')])
+  print 'Counts by diff status (reference):', reference.CountsByDiffStatus()
+  print 'Counts by diff status (diff.Diff()):', actual.CountsByDiffStatus()
+
+
+if __name__ == '__main__':
+  main()
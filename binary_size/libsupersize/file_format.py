@@ -67,22 +67,60 @@ a single symbol. Values are tab seperated and follow this format:
 symbol.full_name, symbol.num_aliases, symbol.flags
 |num_aliases| will be omitted if the aliases of the symbol are the same as the
 previous line. |flags| will be omitted if there are no flags.
+
+Version 2
+---------
+Version 1 files must be gunzipped and parsed line-by-line, which is slow for
+large binaries. Version 2 files are not compressed and store all per-symbol
+values as fixed-width little-endian arrays, so that they can be mmap()ed and
+unpacked without any per-row parsing.
+
+The first 4 lines are the same as for version 1, except that the JSON header
+also contains:
+  * section_names, section_counts: Same as the "Symbol counts" section.
+  * paths: The path list, as [object_path, source_path] pairs.
+  * components: The component list.
+  * names_size: The number of bytes in the string table.
+
+The header is followed by null bytes up to the next 8-byte boundary, and then by
+these arrays (each with one entry per symbol, in the same order as version 1):
+  * addresses: uint64.
+  * sizes: uint32. Padding is not stored, just as for version 1.
+  * path indices: uint32.
+  * component indices: uint32.
+  * num_aliases: uint32. 0 except for the first symbol of an alias group.
+  * flags: uint32.
+The file ends with the string table, which is all symbol full_names joined
+by null bytes.
 """
 
+import collections
 import cStringIO
 import contextlib
+import gc
 import gzip
 import itertools
 import json
 import logging
+import mmap
 import os
 import shutil
+import struct
 
 import models
 
 
 # File format version for .size files.
 _SERIALIZATION_VERSION = 'Size File Format v1'
+_SERIALIZATION_VERSION_2 = 'Size File Format v2'
+_COMMON_HEADER = '# Created by //tools/binary_size\n'
+_GZIP_MAGIC = '\x1f\x8b'
+# Format version written by SaveSizeInfo() when none is given. Version 2 files
+# are much larger (they are not compressed), and older versions of supersize can
+# not read them.
+_DEFAULT_VERSION = 1
+# Struct format codes (little-endian) for the numeric arrays of v2 files.
+_V2_ARRAY_FORMATS = ('Q', 'I', 'I', 'I', 'I', 'I')
 
 
 def _LogSize(file_obj, desc):
@@ -101,7 +139,7 @@ def _SaveSizeInfoToFile(size_info, file_obj):
     file_object: File opened for writing
   """
   # Created by supersize header
-  file_obj.write('# Created by //tools/binary_size\n')
+  file_obj.write(_COMMON_HEADER)
   file_obj.write('%s\n' % _SERIALIZATION_VERSION)
   # JSON metadata
   headers = {
@@ -182,6 +220,68 @@ def _SaveSizeInfoToFile(size_info, file_obj):
   _LogSize(file_obj, 'names (final)')  # For libchrome: adds 3.5mb.
 
 
+def _SaveSizeInfoToFileV2(size_info, file_obj):
+  """Saves size info to a version 2 .size file.
+
+  See the module docstring for a description of the format.
+
+  Args:
+    size_info: Data to write to the file
+    file_object: File opened for writing
+  """
+  unique_path_tuples = sorted(set(
+      (s.object_path, s.source_path) for s in size_info.raw_symbols))
+  path_tuples = {tup: i for i, tup in enumerate(unique_path_tuples)}
+  unique_components = sorted(set(s.component for s in size_info.raw_symbols))
+  components = {comp: i for i, comp in enumerate(unique_components)}
+  by_section = size_info.raw_symbols.GroupedBySectionName()
+  symbols = [s for group in by_section for s in group]
+
+  names = '\0'.join(s.full_name for s in symbols)
+  headers = {
+      'metadata': size_info.metadata,
+      'section_sizes': size_info.section_sizes,
+      'has_components': True,
+      'section_names': [g.name for g in by_section],
+      'section_counts': [len(g) for g in by_section],
+      'paths': unique_path_tuples,
+      'components': unique_components,
+      'names_size': len(names),
+  }
+  metadata_str = json.dumps(headers, indent=2, sort_keys=True)
+  header = '%s%s\n%d\n%s\n' % (_COMMON_HEADER, _SERIALIZATION_VERSION_2,
+                                 len(metadata_str), metadata_str)
+  file_obj.write(header)
+  file_obj.write('\0' * (-len(header) % 8))
+  _LogSize(file_obj, 'header')
+
+  num_aliases = []
+  prev_aliases = None
+  for symbol in symbols:
+    if symbol.aliases and symbol.aliases is not prev_aliases:
+      num_aliases.append(symbol.num_aliases)
+    else:
+      num_aliases.append(0)
+    prev_aliases = symbol.aliases
+
+  columns = (
+      [s.address for s in symbols],
+      # Do not write padding except for overhead symbols, it will be
+      # recalculated from addresses on load.
+      [s.size if s.IsOverhead() else s.size_without_padding for s in symbols],
+      [path_tuples[(s.object_path, s.source_path)] for s in symbols],
+      [components[s.component] for s in symbols],
+      num_aliases,
+      [s.flags for s in symbols],
+  )
+  for fmt, values in itertools.izip(_V2_ARRAY_FORMATS, columns):
+    file_obj.write(struct.pack('<%d%s' % (len(values), fmt), *values))
+  _LogSize(file_obj, 'numeric arrays')
+
+  file_obj.write(names)
+  _LogSize(file_obj, 'names (final)')
+
+
 def _ReadLine(file_iter):
   """Read a line from a file object iterator and remove the newline character.
 
@@ -340,6 +440,112 @@ def _LoadSizeInfoFromFile(file_obj, size_path):
                          size_path=size_path)
 
 
+def _LoadSizeInfoFromBufferV2(buf, size_path):
+  """Loads a size_info from a version 2 .size file.
+
+  See the module docstring for a description of the format.
+
+  Args:
+    buf: Contents of the file. Anything that supports the buffer interface
+        (e.g. a str or an mmap) that also supports find().
+  """
+  # Header lines: Created by supersize header, version, JSON length.
+  offset = 0
+  header_lines = []
+  for _ in xrange(3):
+    end = buf.find('\n', offset)
+    header_lines.append(buf[offset:end])
+    offset = end + 1
+  assert header_lines[1] == _SERIALIZATION_VERSION_2, (
+      'Version mismatch. Need to write some upgrade code.')
+  json_len = int(header_lines[2])
+  headers = json.loads(buf[offset:offset + json_len])
+  offset += json_len + 1
+  offset += -offset % 8
+
+  section_names = headers['section_names']
+  section_counts = headers['section_counts']
+  # Use str rather than unicode, to match what version 1 files load as.
+  path_tuples = [(o.encode('utf-8'), s.encode('utf-8'))
+                 for o, s in headers['paths']]
+  components = [c.encode('utf-8') for c in headers['components']]
+  num_symbols = sum(section_counts)
+
+  columns = []
+  for fmt in _V2_ARRAY_FORMATS:
+    array_struct = struct.Struct('<%d%s' % (num_symbols, fmt))
+    columns.append(array_struct.unpack_from(buf, offset))
+    offset += array_struct.size
+  names = buf[offset:offset + headers['names_size']].split('\0')
+  if not num_symbols:
+    names = []
+  assert len(names) == num_symbols, 'Corrupt string table.'
+
+  # Rather than parsing rows, create the symbols in bulk and then fill in one
+  # field at a time. All of the loops below run in C.
+  raw_symbols = map(models.Symbol.__new__,
+                    itertools.repeat(models.Symbol, num_symbols))
+  addresses, sizes, path_indices, component_indices, num_aliases, flags = (
+      columns)
+  object_paths = [p[0] for p in path_tuples]
+  source_paths = [p[1] for p in path_tuples]
+  # Use a bit less RAM by using the same instance for this common string.
+  shared_names = {models.STRING_LITERAL_NAME: models.STRING_LITERAL_NAME}
+  _SetField(raw_symbols, 'section_name', itertools.chain.from_iterable(
+      itertools.repeat(name, count)
+      for name, count in itertools.izip(section_names, section_counts)))
+  _SetField(raw_symbols, 'full_name',
+            itertools.imap(shared_names.get, names, names))
+  _SetField(raw_symbols, 'address', addresses)
+  _SetField(raw_symbols, 'size', sizes)
+  _SetField(raw_symbols, 'object_path',
+            itertools.imap(object_paths.__getitem__, path_indices))
+  _SetField(raw_symbols, 'source_path',
+            itertools.imap(source_paths.__getitem__, path_indices))
+  _SetField(raw_symbols, 'component',
+            itertools.imap(components.__getitem__, component_indices))
+  _SetField(raw_symbols, 'flags', flags)
+  # Derived
+  _SetField(raw_symbols, 'padding', itertools.repeat(0))
+  _SetField(raw_symbols, 'template_name', itertools.repeat(''))
+  _SetField(raw_symbols, 'name', itertools.repeat(''))
+  _SetField(raw_symbols, 'aliases', itertools.repeat(None))
+
+  # Only the first symbol of each alias group has a non-zero |num_aliases|.
+  group_end = 0
+  for symbol_idx in itertools.compress(xrange(num_symbols), num_aliases):
+    assert symbol_idx >= group_end, 'Corrupt alias groups.'
+    group_end = symbol_idx + num_aliases[symbol_idx]
+    aliases = raw_symbols[symbol_idx:group_end]
+    assert len(aliases) == num_aliases[symbol_idx], 'Corrupt alias groups.'
+    _SetField(aliases, 'aliases', itertools.repeat(aliases))
+
+  return models.SizeInfo(headers['section_sizes'], raw_symbols,
+                         metadata=headers.get('metadata'), size_path=size_path)
+
+
+@contextlib.contextmanager
+def _GarbageCollectionDisabled():
+  """Pauses the cyclic garbage collector.
+
+  Symbols are all kept alive, but creating millions of them triggers many full
+  collections, which take about as long as creating the symbols.
+  """
+  was_enabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if was_enabled:
+      gc.enable()
+
+
+def _SetField(symbols, field, values):
+  """Assigns each of |values| to the |field| slot of each of |symbols|."""
+  setter = getattr(models.Symbol, field).__set__
+  collections.deque(itertools.imap(setter, symbols, values), maxlen=0)
+
+
 @contextlib.contextmanager
 def _OpenGzipForWrite(path, file_obj=None):
   # Open in a way that doesn't set any gzip header fields.
@@ -352,8 +558,25 @@ def _OpenGzipForWrite(path, file_obj=None):
         yield fz
 
 
-def SaveSizeInfo(size_info, path, file_obj=None):
-  """Saves |size_info| to |path}."""
+def SaveSizeInfo(size_info, path, file_obj=None, version=None):
+  """Saves |size_info| to |path}.
+
+  Args:
+    version: .size format version to write. Defaults to 1, unless overridden by
+        the SUPERSIZE_SIZE_FORMAT environment variable. Version 2 files load
+        faster, but are several times larger.
+  """
+  if version is None:
+    version = int(os.environ.get('SUPERSIZE_SIZE_FORMAT', _DEFAULT_VERSION))
+  if version == 2:
+    if file_obj:
+      _SaveSizeInfoToFileV2(size_info, file_obj)
+    else:
+      with open(path, 'wb') as f:
+        _SaveSizeInfoToFileV2(size_info, f)
+    return
+
+  assert version == 1, 'Unknown .size format version: %r' % version
   if os.environ.get('SUPERSIZE_MEASURE_GZIP') == '1':
     with _OpenGzipForWrite(path, file_obj=file_obj) as f:
       _SaveSizeInfoToFile(size_info, f)
@@ -369,6 +592,28 @@ def SaveSizeInfo(size_info, path, file_obj=None):
 
 
 def LoadSizeInfo(filename, file_obj=None):
-  """Returns a SizeInfo loaded from |filename|."""
-  with gzip.GzipFile(filename=filename, fileobj=file_obj) as f:
-    return _LoadSizeInfoFromFile(f, filename)
+  """Returns a SizeInfo loaded from |filename|.
+
+  Version 1 (gzipped) and version 2 files are both supported. Version 2 files
+  are mmap()ed when |file_obj| is not given.
+  """
+  if file_obj:
+    start = file_obj.tell()
+    is_gzip = file_obj.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+    file_obj.seek(start)
+    with _GarbageCollectionDisabled():
+      if is_gzip:
+        with gzip.GzipFile(filename=filename, fileobj=file_obj) as f:
+          return _LoadSizeInfoFromFile(f, filename)
+      return _LoadSizeInfoFromBufferV2(file_obj.read(), filename)
+
+  with open(filename, 'rb') as f, _GarbageCollectionDisabled():
+    if f.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC:
+      f.seek(0)
+      with gzip.GzipFile(filename=filename, fileobj=f) as fz:
+        return _LoadSizeInfoFromFile(fz, filename)
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      return _LoadSizeInfoFromBufferV2(mapped, filename)
+    finally:
+      mapped.close()
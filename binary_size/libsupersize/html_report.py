@@ -10,6 +10,7 @@ import itertools
 import json
 import logging
 import os
+import shutil
 
 import archive
 import diff
@@ -36,6 +37,9 @@ _MIN_SYMBOL_COUNT = 1000
 _MAX_OTHER_SYMBOL_COVERAGE = .05
 # Don't insert "other" symbols smaller than this (just noise at this point).
 _MIN_OTHER_PSS = 1
+# For sharded reports, files are grouped into shards by this many leading
+# directories of their path. Files with shorter paths stay in the root index.
+_SHARD_PATH_DEPTH = 2
 
 
 def _GetOrAddFileNode(path, component, file_nodes, components):
@@ -194,7 +198,8 @@ def _MakeTreeViewList(symbols, include_all_symbols):
   return meta, file_nodes.values()
 
 
-def BuildReportFromSizeInfo(out_path, size_info, all_symbols=False):
+def BuildReportFromSizeInfo(out_path, size_info, all_symbols=False,
+                            shards_dir=None):
   """Builds a .ndjson report for a .size file.
 
   Args:
@@ -202,6 +207,8 @@ def BuildReportFromSizeInfo(out_path, size_info, all_symbols=False):
     size_info: A SizeInfo or DeltaSizeInfo to use for the report.
     all_symbols: If true, all symbols will be included in the report rather
       than truncated.
+    shards_dir: If set, file nodes are split by directory into files within
+      this directory, and |out_path| contains only an index of them.
   """
   logging.info('Reading .size file')
   symbols = size_info.raw_symbols
@@ -223,8 +230,16 @@ def BuildReportFromSizeInfo(out_path, size_info, all_symbols=False):
   else:
     meta['metadata'] = size_info.metadata
 
+  if shards_dir:
+    tree_nodes = _WriteShards(
+        shards_dir, meta, tree_nodes, 0 if is_diff else 1)
+
   # Write newline-delimited JSON file
   logging.info('Serializing JSON')
+  _WriteNdjson(out_path, itertools.chain((meta,), tree_nodes))
+
+
+def _WriteNdjson(path, objs):
   # Use separators without whitespace to get a smaller file.
   json_dump_args = {
     'separators': (',', ':'),
@@ -232,15 +247,74 @@ def BuildReportFromSizeInfo(out_path, size_info, all_symbols=False):
     'check_circular': False,
   }
 
-  with codecs.open(out_path, 'w', encoding='ascii') as out_file:
-    json.dump(meta, out_file, **json_dump_args)
-    out_file.write('\n')
-
-    for tree_node in tree_nodes:
-      json.dump(tree_node, out_file, **json_dump_args)
+  with codecs.open(path, 'w', encoding='ascii') as out_file:
+    for obj in objs:
+      json.dump(obj, out_file, **json_dump_args)
       out_file.write('\n')
 
 
+def _ShardPath(path):
+  """Returns the directory whose shard |path| belongs to ('' for none)."""
+  dir_parts = path.split('/')[:-1]
+  if len(dir_parts) < _SHARD_PATH_DEPTH:
+    return ''
+  return '/'.join(dir_parts[:_SHARD_PATH_DEPTH])
+
+
+def _WriteShards(shards_dir, meta, tree_nodes, default_symbol_count):
+  """Writes file nodes into one .ndjson file per directory.
+
+  Adds a description of each shard to |meta| so that the viewer can show
+  directory sizes without fetching shards, and fetch them only when the
+  directory is opened.
+
+  Returns:
+    The file nodes that belong in the root index.
+  """
+  nodes_by_shard_path = collections.defaultdict(list)
+  for tree_node in tree_nodes:
+    nodes_by_shard_path[_ShardPath(tree_node[_COMPACT_FILE_PATH_KEY])].append(
+        tree_node)
+  root_nodes = nodes_by_shard_path.pop('', [])
+
+  if os.path.isdir(shards_dir):
+    shutil.rmtree(shards_dir)
+  _MakeDirIfDoesNotExist(shards_dir)
+  shards = []
+  for i, shard_path in enumerate(sorted(nodes_by_shard_path)):
+    nodes = nodes_by_shard_path[shard_path]
+    # Dict of type -> [size, count], matching what tree-worker.js computes for
+    # each symbol.
+    stats = collections.defaultdict(lambda: [0, 0])
+    flags = 0
+    for tree_node in nodes:
+      for symbol_entry in tree_node[_COMPACT_FILE_SYMBOLS_KEY]:
+        type_stats = stats[symbol_entry[_COMPACT_SYMBOL_TYPE_KEY]]
+        type_stats[0] += symbol_entry[_COMPACT_SYMBOL_BYTE_SIZE_KEY]
+        type_stats[1] += symbol_entry.get(
+            _COMPACT_SYMBOL_COUNT_KEY, default_symbol_count)
+        flags |= symbol_entry.get(_COMPACT_SYMBOL_FLAGS_KEY, 0)
+    file_name = '%d.ndjson' % i
+    _WriteNdjson(os.path.join(shards_dir, file_name), nodes)
+    shards.append({
+      'path': shard_path,
+      # Relative to the root index.
+      'url': '%s/%s' % (os.path.basename(shards_dir), file_name),
+      'stats': stats,
+      'flags': flags,
+    })
+
+  meta['shards'] = shards
+  logging.info('Wrote %d shards. %d tree nodes are in the root index',
+               len(shards), len(root_nodes))
+  return root_nodes
+
+
+def ShardsDirForReport(out_path):
+  """Returns the directory that shards of a sharded report are written to."""
+  return os.path.splitext(out_path)[0] + '_shards'
+
+
 def _MakeDirIfDoesNotExist(rel_path):
   """Ensures a directory exists."""
   abs_path = os.path.abspath(rel_path)
@@ -262,6 +336,12 @@ def AddArguments(parser):
                            'take longer to load.')
   parser.add_argument('--diff-with',
                       help='Diffs the input_file against an older .size file')
+  parser.add_argument('--sharded', action='store_true',
+                      help='Split symbols by directory into separate files '
+                           'that the viewer fetches as directories are '
+                           'opened. Useful with --all-symbols. Shards are '
+                           'written to a "_shards" directory alongside the '
+                           'output file.')
 
 
 def Run(args, parser):
@@ -272,13 +352,19 @@ def Run(args, parser):
   if not args.output_report_file.endswith('.ndjson'):
     parser.error('Output must end with ".ndjson"')
 
-  size_info = archive.LoadAndPostProcessSizeInfo(args.input_size_file)
   if args.diff_with:
-    before_size_info = archive.LoadAndPostProcessSizeInfo(args.diff_with)
+    before_size_info, size_info = archive.LoadAndPostProcessSizeInfos(
+        [args.diff_with, args.input_size_file])
     size_info = diff.Diff(before_size_info, size_info)
+  else:
+    size_info = archive.LoadAndPostProcessSizeInfo(args.input_size_file)
 
+  shards_dir = None
+  if args.sharded:
+    shards_dir = ShardsDirForReport(args.output_report_file)
   BuildReportFromSizeInfo(
-      args.output_report_file, size_info, all_symbols=args.all_symbols)
+      args.output_report_file, size_info, all_symbols=args.all_symbols,
+      shards_dir=shards_dir)
 
   msg = [
       'Done!',
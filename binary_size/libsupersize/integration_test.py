@@ -4,10 +4,12 @@
 # found in the LICENSE file.
 
 import cStringIO
+import collections
 import contextlib
 import copy
 import glob
 import itertools
+import json
 import os
 import unittest
 import re
@@ -21,6 +23,7 @@ import archive
 import describe
 import diff
 import file_format
+import html_report
 import models
 import test_util
 
@@ -189,7 +192,8 @@ class IntegrationTest(unittest.TestCase):
     return copy.deepcopy(IntegrationTest.cached_size_info[cache_key])
 
   def _DoArchive(self, archive_path, use_output_directory=True, use_elf=True,
-                 use_apk=False, use_pak=False, debug_measures=False):
+                 use_apk=False, use_pak=False, debug_measures=False,
+                 object_cache_dir=None):
     args = [
       archive_path,
       '--map-file', _TEST_MAP_PATH,
@@ -209,15 +213,18 @@ class IntegrationTest(unittest.TestCase):
       args += ['--pak-file', _TEST_APK_LOCALE_PAK_PATH,
                '--pak-file', _TEST_APK_PAK_PATH,
                '--pak-info-file', _TEST_PAK_INFO_PATH]
+    if object_cache_dir:
+      args += ['--object-cache-dir', object_cache_dir]
     _RunApp('archive', args, debug_measures=debug_measures)
 
   def _DoArchiveTest(self, use_output_directory=True, use_elf=True,
-                     use_apk=False, use_pak=False, debug_measures=False):
+                     use_apk=False, use_pak=False, debug_measures=False,
+                     object_cache_dir=None):
     with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
       self._DoArchive(
           temp_file.name, use_output_directory=use_output_directory,
           use_elf=use_elf, use_apk=use_apk, use_pak=use_pak,
-          debug_measures=debug_measures)
+          debug_measures=debug_measures, object_cache_dir=object_cache_dir)
       size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
     # Check that saving & loading is the same as directly parsing.
     expected_size_info = self._CloneSizeInfo(
@@ -263,6 +270,17 @@ class IntegrationTest(unittest.TestCase):
   def test_Archive_Elf_DebugMeasures(self):
     return self._DoArchiveTest(debug_measures=True)
 
+  # The second run is served from the cache, and must not change the output.
+  @_CompareWithGolden(name='Archive_Elf')
+  def test_Archive_Elf_ObjectCache(self):
+    cache_dir = tempfile.mkdtemp()
+    try:
+      self._DoArchiveTest(object_cache_dir=cache_dir)
+      self.assertTrue(os.listdir(cache_dir))
+      return list(self._DoArchiveTest(object_cache_dir=cache_dir))
+    finally:
+      shutil.rmtree(cache_dir)
+
   @_CompareWithGolden()
   def test_Console(self):
     with tempfile.NamedTemporaryFile(suffix='.size') as size_file, \
@@ -304,6 +322,67 @@ class IntegrationTest(unittest.TestCase):
       file_format.SaveSizeInfo(self._CloneSizeInfo(), temp_file.name)
       return _RunApp('diff', [temp_file.name, temp_file.name])
 
+  def test_HtmlReport_Sharded(self):
+    def read_ndjson(path):
+      with open(path) as f:
+        return [json.loads(l) for l in f]
+
+    def sorted_nodes(nodes):
+      return sorted(nodes, key=lambda n: json.dumps(n, sort_keys=True))
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+      size_path = os.path.join(temp_dir, 'test.size')
+      file_format.SaveSizeInfo(self._CloneSizeInfo(), size_path)
+      full_path = os.path.join(temp_dir, 'full.ndjson')
+      sharded_path = os.path.join(temp_dir, 'sharded.ndjson')
+      _RunApp('html_report', [size_path, full_path, '--all-symbols'])
+      _RunApp('html_report',
+              [size_path, sharded_path, '--all-symbols', '--sharded'])
+      full_meta = read_ndjson(full_path)[0]
+      full_nodes = read_ndjson(full_path)[1:]
+      sharded_meta = read_ndjson(sharded_path)[0]
+      root_nodes = read_ndjson(sharded_path)[1:]
+
+      # Group the nodes of the unsharded report by their leading directories.
+      expected_nodes_by_dir = collections.defaultdict(list)
+      for node in full_nodes:
+        dir_parts = node['p'].split('/')[:-1]
+        shard_dir = ''
+        if len(dir_parts) >= html_report._SHARD_PATH_DEPTH:
+          shard_dir = '/'.join(dir_parts[:html_report._SHARD_PATH_DEPTH])
+        expected_nodes_by_dir[shard_dir].append(node)
+      expected_root_nodes = expected_nodes_by_dir.pop('')
+      self.assertTrue(expected_root_nodes)
+      self.assertTrue(expected_nodes_by_dir)
+
+      # The root index holds the root-level nodes only.
+      self.assertNotIn('shards', full_meta)
+      self.assertEqual(sorted_nodes(expected_root_nodes),
+                       sorted_nodes(root_nodes))
+      shards = sharded_meta.pop('shards')
+      self.assertEqual(full_meta, sharded_meta)
+
+      # Each shard holds the nodes of its directory, and summarizes them.
+      self.assertEqual(sorted(expected_nodes_by_dir),
+                       [shard['path'] for shard in shards])
+      for shard in shards:
+        expected_nodes = expected_nodes_by_dir[shard['path']]
+        shard_nodes = read_ndjson(os.path.join(temp_dir, shard['url']))
+        self.assertEqual(sorted_nodes(expected_nodes),
+                         sorted_nodes(shard_nodes))
+        expected_stats = collections.defaultdict(lambda: [0, 0])
+        expected_flags = 0
+        for node in expected_nodes:
+          for symbol in node['s']:
+            expected_stats[symbol['t']][0] += symbol['b']
+            expected_stats[symbol['t']][1] += symbol.get('u', 1)
+            expected_flags |= symbol.get('f', 0)
+        self.assertEqual(expected_stats, shard['stats'])
+        self.assertEqual(expected_flags, shard['flags'])
+    finally:
+      shutil.rmtree(temp_dir)
+
   # Runs archive 3 times, and asserts the contents are the same each time.
   def test_Idempotent(self):
     prev_contents = None
@@ -314,6 +393,63 @@ class IntegrationTest(unittest.TestCase):
         self.assertTrue(prev_contents is None or contents == prev_contents)
         prev_contents = contents
 
+  # Both .size format versions should load to the same thing, whether read
+  # from a file object or mmap()ed.
+  def test_SizeFileVersions(self):
+    expected_lines = None
+    for version in (1, 2):
+      stringio = cStringIO.StringIO()
+      file_format.SaveSizeInfo(self._CloneSizeInfo(), 'path', file_obj=stringio,
+                               version=version)
+      stringio.seek(0)
+      size_info = archive.LoadAndPostProcessSizeInfo('path', file_obj=stringio)
+      lines = list(describe.GenerateLines(size_info, verbose=True))
+      if expected_lines is None:
+        expected_lines = lines
+      self.assertEquals(expected_lines, lines)
+
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+        file_format.SaveSizeInfo(self._CloneSizeInfo(), temp_file.name,
+                                 version=version)
+        size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
+      self.assertEquals(
+          expected_lines,
+          list(describe.GenerateLines(size_info, verbose=True)))
+
+  def test_SizeFileVersions_Default(self):
+    stringio = cStringIO.StringIO()
+    file_format.SaveSizeInfo(self._CloneSizeInfo(), 'path', file_obj=stringio)
+    self.assertTrue(stringio.getvalue().startswith(file_format._GZIP_MAGIC))
+
+  def test_LoadAndPostProcessSizeInfos(self):
+    def symbol_fields(size_info):
+      return [(s.full_name, s.template_name, s.name, s.size, s.padding, s.flags)
+              for s in size_info.raw_symbols]
+
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file1, \
+        tempfile.NamedTemporaryFile(suffix='.size') as temp_file2:
+      file_format.SaveSizeInfo(self._CloneSizeInfo(), temp_file1.name,
+                               version=1)
+      file_format.SaveSizeInfo(self._CloneSizeInfo(use_pak=True),
+                               temp_file2.name)
+      paths = [temp_file1.name, temp_file2.name]
+      expected = [archive.LoadAndPostProcessSizeInfo(p) for p in paths]
+      actual = archive.LoadAndPostProcessSizeInfos(paths)
+      # Also exercise the encoding when async is disabled.
+      transferred = [
+          archive._SizeInfoFromTransfer(
+              p, *archive._LoadAndPostProcessSizeInfoForTransfer(i, p)[1:])
+          for i, p in enumerate(paths)]
+
+    for size_infos in (actual, transferred):
+      self.assertEquals(len(expected), len(size_infos))
+      for expected_info, size_info in zip(expected, size_infos):
+        self.assertEquals(symbol_fields(expected_info),
+                          symbol_fields(size_info))
+        self.assertEquals(
+            list(describe.GenerateLines(expected_info, verbose=True)),
+            list(describe.GenerateLines(size_info, verbose=True)))
+
   @_CompareWithGolden()
   def test_Diff_Basic(self):
     size_info1 = self._CloneSizeInfo(use_elf=False, use_pak=True)
@@ -462,6 +598,42 @@ class IntegrationTest(unittest.TestCase):
                       0)
     self.assertEquals(d.symbols.size, 0)
 
+  def _CreateDiffTestInputs(self):
+    size_info1 = self._CloneSizeInfo(use_pak=True)
+    size_info2 = self._CloneSizeInfo(use_pak=True)
+    size_info2.raw_symbols -= size_info2.raw_symbols[::5]
+    for sym in size_info2.raw_symbols[::7]:
+      sym.size += 4
+    return size_info1, size_info2
+
+  def test_Diff_Parallel(self):
+    size_info1, size_info2 = self._CreateDiffTestInputs()
+    expected = [repr(s) for s in diff.Diff(size_info1, size_info2).raw_symbols]
+    old_min_symbols = diff._PARALLEL_MIN_SYMBOLS
+    diff._PARALLEL_MIN_SYMBOLS = 0
+    try:
+      d = diff.Diff(size_info1, size_info2)
+    finally:
+      diff._PARALLEL_MIN_SYMBOLS = old_min_symbols
+    self.assertEquals(expected, [repr(s) for s in d.raw_symbols])
+
+  def test_SummarizeDiff(self):
+    size_info1, size_info2 = self._CreateDiffTestInputs()
+    d = diff.Diff(size_info1, size_info2)
+    summary = diff.SummarizeDiff(size_info1, size_info2)
+    self.assertEquals(d.section_sizes, summary.section_sizes)
+    for group in d.raw_symbols.GroupedBySectionName():
+      section_name = group.name
+      self.assertEquals(group.CountsByDiffStatus(),
+                        summary.counts_by_section_name[section_name])
+      self.assertEquals(sum(s.size for s in group),
+                        summary.size_by_section_name[section_name])
+      self.assertAlmostEqual(sum(s.pss for s in group),
+                             summary.pss_by_section_name[section_name])
+    self.assertEquals(len(d.raw_symbols),
+                      sum(sum(c) for c in
+                          summary.counts_by_section_name.itervalues()))
+
   @_CompareWithGolden()
   def test_FullDescription(self):
     size_info = self._CloneSizeInfo()
@@ -24,10 +24,12 @@ import argparse
 import code
 import itertools
 import logging
+import multiprocessing
 import os
 import re
 import readline
 
+import concurrent
 import demangle
 import models
 
@@ -38,6 +40,10 @@ import models
 #   whereas "nm" skips over these (they don't account for much though).
 # * The parse time for compressed linker maps is dominated by ungzipping.
 
+# Number of lines per chunk when parsing LLD linker maps in parallel. Maps with
+# fewer lines are parsed without forking.
+_LLD_LINES_PER_CHUNK = 400000
+
 
 class MapFileParserGold(object):
   """Parses a linker map file from gold linker."""
@@ -301,11 +307,20 @@ class MapFileParserLld(object):
   _LINE_RE_V1 = re.compile(
       r'\s*[0-9a-f]+\s+([0-9a-f]+)\s+([0-9a-f]+)\s+(\d+) ( *)(.*)')
   _LINE_RE = [_LINE_RE_V0, _LINE_RE_V1]
-
-  def __init__(self, linker_name):
+  # Matches Level 1 lines (section names) within a chunk of text.
+  _SECTION_RE_V0 = re.compile(
+      r'^[0-9a-f]+[ \t]+[0-9a-f]+[ \t]+\d+ (\S.*)$', re.M)
+  _SECTION_RE_V1 = re.compile(
+      r'^[ \t]*[0-9a-f]+[ \t]+[0-9a-f]+[ \t]+[0-9a-f]+[ \t]+\d+ (\S.*)$', re.M)
+  _SECTION_RE = [_SECTION_RE_V0, _SECTION_RE_V1]
+
+  def __init__(self, linker_name, lines_per_chunk=None):
     self._linker_name = linker_name
     self._common_symbols = []
     self._section_sizes = {}
+    self._lines_per_chunk = lines_per_chunk or _LLD_LINES_PER_CHUNK
+    # Extract e.g., 'lld_v0' -> 0, or 'lld-lto_v1' -> 1.
+    self._map_file_version = int(linker_name.split('_v')[1])
 
   @staticmethod
   def ParseArmAnnotations(tok):
@@ -328,9 +343,7 @@ class MapFileParserLld(object):
 
   def Tokenize(self, lines):
     """Generator to filter and tokenize linker map lines."""
-    # Extract e.g., 'lld_v0' -> 0, or 'lld-lto_v1' -> 1.
-    map_file_version = int(self._linker_name.split('_v')[1])
-    pattern = MapFileParserLld._LINE_RE[map_file_version]
+    pattern = MapFileParserLld._LINE_RE[self._map_file_version]
 
     # A Level 3 symbol can have |size == 0| in some situations (e.g., assembly
     # code symbols). To provided better size estimates in this case, the "span"
@@ -387,9 +400,43 @@ class MapFileParserLld(object):
       level = next_level
       tok = next_tok
 
+  def _IterChunks(self, lines):
+    """Splits |lines| into chunks that can be parsed independently.
+
+    Chunks are split only before Level 1 (section) and Level 2 (input section)
+    lines, since no parsing state other than the current section carries over
+    them.
+
+    Yields:
+      Tuples of (section, chunk_lines), where |section| is the section that
+      is active at the start of the chunk (None for the first chunk).
+    """
+    line_pattern = MapFileParserLld._LINE_RE[self._map_file_version]
+    section_pattern = MapFileParserLld._SECTION_RE[self._map_file_version]
+    lines = iter(lines)
+    cur_section = None
+    next_chunk_start = []
+    while True:
+      chunk = next_chunk_start
+      chunk.extend(itertools.islice(lines, self._lines_per_chunk))
+      if not chunk:
+        return
+      next_chunk_start = []
+      for line in lines:
+        m = line_pattern.match(line)
+        if m and len(m.group(4)) < 16:
+          next_chunk_start.append(line)
+          break
+        chunk.append(line)
+      yield cur_section, chunk
+      for m in section_pattern.finditer(''.join(chunk)):
+        cur_section = m.group(1)
+
   def Parse(self, lines):
     """Parses a linker map file.
 
+    Large maps are split into chunks, which are parsed in parallel.
+
     Args:
       lines: Iterable of lines, the first of which has been consumed to
       identify file type.
@@ -397,6 +444,56 @@ class MapFileParserLld(object):
     Returns:
       A tuple of (section_sizes, symbols).
     """
+    chunks = self._IterChunks(lines)
+    first_chunk = next(chunks, (None, []))
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+      syms, promoted_name_count = self._ParseChunk(first_chunk[1], None)
+    else:
+      syms = []
+      promoted_name_count = 0
+      # Parse a bounded number of chunks at a time to limit memory usage.
+      chunks = itertools.chain((first_chunk, second_chunk), chunks)
+      batch_size = multiprocessing.cpu_count() * 2
+      chunk_index = 0
+      while True:
+        batch = list(itertools.islice(chunks, batch_size))
+        if not batch:
+          break
+        logging.debug('Parsing linker map chunks %d-%d', chunk_index,
+                      chunk_index + len(batch) - 1)
+        arg_tuples = [(chunk_index + i, section, chunk_lines)
+                      for i, (section, chunk_lines) in enumerate(batch)]
+        chunk_index += len(batch)
+        del batch
+        results = sorted(concurrent.BulkForkAndCall(
+            _ParseLldChunk, arg_tuples, linker_name=self._linker_name))
+        del arg_tuples
+        for _, section_sizes, encoded_syms, chunk_promoted_count in results:
+          self._section_sizes.update(section_sizes)
+          promoted_name_count += chunk_promoted_count
+          for section_name, size, address, full_name, object_path in (
+              encoded_syms):
+            syms.append(models.Symbol(section_name, size, address=address,
+                                      full_name=full_name,
+                                      object_path=object_path))
+
+    if promoted_name_count:
+      logging.info('Found %d promoted global names', promoted_name_count)
+    return self._section_sizes, syms
+
+  def _ParseChunk(self, lines, cur_section):
+    """Parses a chunk of a linker map file.
+
+    Args:
+      lines: Iterable of lines that starts at a Level 1 or Level 2 line (or at
+          the start of the file).
+      cur_section: The section that is active at the start of |lines|.
+
+    Returns:
+      A tuple of (symbols, promoted_name_count). Section sizes are added to
+      self._section_sizes.
+    """
 # Newest format:
 #     VMA      LMA     Size Align Out     In      Symbol
 #     194      194       13     1 .interp
@@ -429,8 +526,10 @@ class MapFileParserLld(object):
 # 00000000002010ed 0000000000000071     1         a.o:(.text)
 # 00000000002010ed 0000000000000071     0                 main
     syms = []
-    cur_section = None
     cur_section_is_useful = None
+    if cur_section is not None:
+      mangled_start_idx = len(cur_section) + 2
+      cur_section_is_useful = _IsUsefulSection(cur_section)
     promoted_name_count = 0
     # A Level 2 line does not supply |full_name| data (unless '<internal>').
     # This would be taken from a Level 3 line. |is_partial| indicates that an
@@ -457,11 +556,7 @@ class MapFileParserLld(object):
         cur_section = tok
         # E.g., Want to convert "(.text._name)" -> "_name" later.
         mangled_start_idx = len(cur_section) + 2
-        cur_section_is_useful = (
-            cur_section in (models.SECTION_BSS,
-                            models.SECTION_RODATA,
-                            models.SECTION_TEXT) or
-            cur_section.startswith(models.SECTION_DATA))
+        cur_section_is_useful = _IsUsefulSection(cur_section)
 
       elif cur_section_is_useful:
         # Level 2 data match the "In" column. They specify object paths and
@@ -556,9 +651,32 @@ class MapFileParserLld(object):
         else:
           logging.error('Problem line: %r', line)
 
-    if promoted_name_count:
-      logging.info('Found %d promoted global names', promoted_name_count)
-    return self._section_sizes, syms
+    return syms, promoted_name_count
+
+
+def _IsUsefulSection(section_name):
+  """Returns whether symbols should be created for |section_name|."""
+  return (section_name in (models.SECTION_BSS,
+                           models.SECTION_RODATA,
+                           models.SECTION_TEXT) or
+          section_name.startswith(models.SECTION_DATA))
+
+
+def _ParseLldChunk(chunk_index, cur_section, lines, linker_name=None):
+  """Parses a chunk of an LLD linker map within a forked process.
+
+  Returns:
+    A tuple of (chunk_index, section_sizes, encoded_symbols,
+    promoted_name_count), where |encoded_symbols| contains tuples of (
+    section_name, size, address, full_name, object_path), which are much
+    cheaper to marshal than Symbol objects.
+  """
+  parser = MapFileParserLld(linker_name)
+  syms, promoted_name_count = parser._ParseChunk(lines, cur_section)
+  encoded_syms = [
+      (s.section_name, s.size, s.address, s.full_name, s.object_path)
+      for s in syms]
+  return chunk_index, parser._section_sizes, encoded_syms, promoted_name_count
 
 
 def _DetectLto(lines):
@@ -63,6 +63,19 @@ class LinkerMapParserTest(unittest.TestCase):
       ret.append(repr(sym))
     return ret
 
+  def test_ParserChunked(self):
+    map_file = _ReadMapFile(_TEST_MAP_PATH)
+    linker_name = linker_map_parser.DetectLinkerNameFromMapFile(iter(map_file))
+    parser = linker_map_parser.MapFileParserLld(linker_name)
+    expected_sizes, expected_syms = parser.Parse(iter(map_file[1:]))
+    expected_syms = [repr(s) for s in expected_syms]
+    for lines_per_chunk in (1, 2, 5, 17):
+      parser = linker_map_parser.MapFileParserLld(
+          linker_name, lines_per_chunk=lines_per_chunk)
+      section_sizes, syms = parser.Parse(iter(map_file[1:]))
+      self.assertEquals(expected_sizes, section_sizes)
+      self.assertEquals(expected_syms, [repr(s) for s in syms])
+
   def test_ParseArmAnnotations(self):
     fun = linker_map_parser.MapFileParserLld.ParseArmAnnotations
 
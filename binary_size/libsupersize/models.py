@@ -29,7 +29,9 @@ Description of common properties:
 """
 
 import collections
+import itertools
 import logging
+import operator
 import os
 import re
 
@@ -661,11 +663,7 @@ class SymbolGroup(BaseSymbol):
   @property
   def size(self):
     if self._size is None:
-      if self.IsBss():
-        self._size = sum(s.size for s in self.IterUniqueSymbols())
-      else:
-        self._size = sum(
-            s.size for s in self.IterUniqueSymbols() if not s.IsBss())
+      self._ComputeSums()
     return self._size
 
   @property
@@ -676,16 +674,13 @@ class SymbolGroup(BaseSymbol):
   @property
   def pss(self):
     if self._pss is None:
-      if self.IsBss():
-        self._pss = sum(s.pss for s in self)
-      else:
-        self._pss = sum(s.pss for s in self if not s.IsBss())
+      self._ComputeSums()
     return self._pss
 
   @property
   def padding(self):
     if self._padding is None:
-      self._padding = sum(s.padding for s in self.IterUniqueSymbols())
+      self._ComputeSums()
     return self._padding
 
   @property
@@ -695,6 +690,35 @@ class SymbolGroup(BaseSymbol):
   def IsGroup(self):
     return True
 
+  def _ComputeSums(self):
+    """Computes |size|, |pss| and |padding| in a single pass.
+
+    |size| and |padding| count only one symbol from each alias group, while
+    |pss| counts all symbols. .bss symbols are excluded from |size| and |pss|
+    unless this is a .bss group.
+    """
+    include_bss = self.IsBss()
+    size = 0
+    pss = 0
+    padding = 0
+    seen_aliases_lists = set()
+    for s in self._symbols:
+      include = include_bss or s.section_name != SECTION_BSS
+      if include:
+        pss += s.pss
+      aliases = s.aliases
+      if aliases:
+        aliases_id = id(aliases)
+        if aliases_id in seen_aliases_lists:
+          continue
+        seen_aliases_lists.add(aliases_id)
+      padding += s.padding
+      if include:
+        size += s.size
+    self._size = size
+    self._pss = pss
+    self._padding = padding
+
   def SetName(self, full_name, template_name=None, name=None):
     self.full_name = full_name
     self.template_name = full_name if template_name is None else template_name
@@ -756,17 +780,37 @@ class SymbolGroup(BaseSymbol):
                        reverse=not reverse)
 
   def Filter(self, func):
-    filtered_and_kept = ([], [])
+    symbols = self._symbols
     symbol = None
     try:
-      for symbol in self:
-        filtered_and_kept[int(bool(func(symbol)))].append(symbol)
+      # Compute a mask first, since it is faster than appending to one of two
+      # lists per-symbol.
+      mask = [bool(func(symbol)) for symbol in symbols]
     except:
       logging.warning('Filter failed on symbol %r', symbol)
       raise
 
-    return self._CreateTransformed(filtered_and_kept[1],
-                                   filtered_symbols=filtered_and_kept[0])
+    return self._FilterByMask(mask)
+
+  def _FilterByMask(self, mask):
+    symbols = self._symbols
+    kept = list(itertools.compress(symbols, mask))
+    if len(kept) == len(symbols):
+      filtered = []
+    else:
+      filtered = list(itertools.compress(
+          symbols, itertools.imap(operator.not_, mask)))
+    return self._CreateTransformed(kept, filtered_symbols=filtered)
+
+  def _PathMatchesMask(self, regex, *fields):
+    """Returns whether |regex| is found in any of |fields|, for each symbol.
+
+    Only for paths and components. See _MemoizedSearch.
+    """
+    search = _MemoizedSearch(regex)
+    masks = [map(search.__getitem__, map(operator.attrgetter(f), self._symbols))
+             for f in fields]
+    return masks[0] if len(masks) == 1 else map(operator.or_, *masks)
 
   def WhereIsGroup(self):
     return self.Filter(lambda s: s.IsGroup())
@@ -826,30 +870,32 @@ class SymbolGroup(BaseSymbol):
 
   def WhereObjectPathMatches(self, pattern):
     regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.object_path))
+    return self._FilterByMask(self._PathMatchesMask(regex, 'object_path'))
 
   def WhereSourcePathMatches(self, pattern):
     regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.source_path))
+    return self._FilterByMask(self._PathMatchesMask(regex, 'source_path'))
 
   def WherePathMatches(self, pattern):
     regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: (regex.search(s.source_path) or
-                                  regex.search(s.object_path)))
+    return self._FilterByMask(
+        self._PathMatchesMask(regex, 'source_path', 'object_path'))
 
   def WhereComponentMatches(self, pattern):
     regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: regex.search(s.component))
+    return self._FilterByMask(self._PathMatchesMask(regex, 'component'))
 
   def WhereMatches(self, pattern):
     """Looks for |pattern| within all paths & names."""
     regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
-    return self.Filter(lambda s: (
-        regex.search(s.source_path) or
-        regex.search(s.object_path) or
-        regex.search(s.full_name) or
-        s.full_name is not s.template_name and regex.search(s.template_name) or
-        s.full_name is not s.name and regex.search(s.name)))
+    path_mask = self._PathMatchesMask(regex, 'source_path', 'object_path')
+    return self._FilterByMask([
+        path_matches or
+        bool(regex.search(s.full_name) or
+             s.full_name is not s.template_name and
+             regex.search(s.template_name) or
+             s.full_name is not s.name and regex.search(s.name))
+        for path_matches, s in itertools.izip(path_mask, self._symbols)])
 
   def WhereAddressInRange(self, start, end=None):
     """Searches for addesses within [start, end).
@@ -1086,6 +1132,8 @@ class SymbolGroup(BaseSymbol):
                  Use a negative value to omit symbols entirely rather than
                  include them outside of a group.
     """
+    # Many symbols share the same path, so compute tokens once per path.
+    tokens_by_path = {}
     def extract_path(symbol):
       path = symbol.source_path
       if fallback_to_object_path and not path:
@@ -1093,11 +1141,16 @@ class SymbolGroup(BaseSymbol):
       path = path or fallback
       if path is None:
         return None
-      # Group by base of foo/bar/{shared}/2
-      shared_idx = path.find('{shared}')
-      if shared_idx != -1:
-        path = path[:shared_idx + 8]
-      return _ExtractPrefixBeforeSeparator(path, os.path.sep, depth)
+      token = tokens_by_path.get(path)
+      if token is None:
+        # Group by base of foo/bar/{shared}/2
+        token = path
+        shared_idx = token.find('{shared}')
+        if shared_idx != -1:
+          token = token[:shared_idx + 8]
+        token = _ExtractPrefixBeforeSeparator(token, os.path.sep, depth)
+        tokens_by_path[path] = token
+      return token
     return self.GroupedBy(extract_path, min_count=min_count)
 
 
@@ -1147,6 +1200,25 @@ class DeltaSymbolGroup(SymbolGroup):
     return self.Filter(lambda s: s.diff_status == diff_status)
 
 
+class _MemoizedSearch(dict):
+  """Maps strings to whether |regex| is found in them.
+
+  Only for paths and components: they are shared by many symbols, so the regex
+  runs once per unique string and all other lookups are plain dict lookups.
+  Names are nearly all unique, so caching them would only add lookups and
+  memory.
+  """
+
+  def __init__(self, regex):
+    super(_MemoizedSearch, self).__init__()
+    self._regex = regex
+
+  def __missing__(self, value):
+    ret = bool(self._regex.search(value))
+    self[value] = ret
+    return ret
+
+
 def _ExtractPrefixBeforeSeparator(string, separator, count):
   idx = -len(separator)
   prev_idx = None
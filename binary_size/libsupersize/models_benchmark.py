@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmarks SymbolGroup queries against their previous implementations.
+
+Example usage:
+  # Query the symbols of a .size file:
+  models_benchmark.py chrome.size
+
+  # Query 1M synthetic symbols:
+  models_benchmark.py --synthetic 1000000
+"""
+
+import argparse
+import logging
+import os
+import random
+import re
+import time
+
+import archive
+import match_util
+import models
+
+
+# The reference implementations are the ones that models.py used before paths
+# were searched once per unique value and sums were computed in one pass.
+def _ReferenceFilter(group, func):
+  filtered_and_kept = ([], [])
+  for symbol in group:
+    filtered_and_kept[int(bool(func(symbol)))].append(symbol)
+  return group._CreateTransformed(filtered_and_kept[1],
+                                  filtered_symbols=filtered_and_kept[0])
+
+
+def _ReferenceWhere(group, pattern, func):
+  regex = re.compile(match_util.ExpandRegexIdentifierPlaceholder(pattern))
+  return _ReferenceFilter(group, lambda s: func(regex, s))
+
+
+def _ReferenceSums(group):
+  size = sum(s.size for s in group.IterUniqueSymbols() if not s.IsBss())
+  pss = sum(s.pss for s in group if not s.IsBss())
+  padding = sum(s.padding for s in group.IterUniqueSymbols())
+  return size, pss, padding
+
+
+def _ReferenceGroupedByPath(group, depth):
+  def extract_path(symbol):
+    path = symbol.source_path or symbol.object_path or '{no path}'
+    shared_idx = path.find('{shared}')
+    if shared_idx != -1:
+      path = path[:shared_idx + 8]
+    return models._ExtractPrefixBeforeSeparator(path, os.path.sep, depth)
+  return group.GroupedBy(extract_path)
+
+
+def _Sums(group):
+  group = group._CreateTransformed(list(group))
+  return group.size, group.pss, group.padding
+
+
+# Tuples of (name, reference function, function).
+_QUERIES = [
+    ('WhereFullNameMatches',
+     lambda g: _ReferenceWhere(g, r'Function1\d*\(',
+                               lambda r, s: r.search(s.full_name)),
+     lambda g: g.WhereFullNameMatches(r'Function1\d*\(')),
+    ('WhereNameMatches',
+     lambda g: _ReferenceWhere(g, 'ns1', lambda r, s: r.search(s.name)),
+     lambda g: g.WhereNameMatches('ns1')),
+    ('WherePathMatches',
+     lambda g: _ReferenceWhere(g, r'dir1\d/', lambda r, s: (
+         r.search(s.source_path) or r.search(s.object_path))),
+     lambda g: g.WherePathMatches(r'dir1\d/')),
+    ('WhereComponentMatches',
+     lambda g: _ReferenceWhere(g, 'Blink', lambda r, s: r.search(s.component)),
+     lambda g: g.WhereComponentMatches('Blink')),
+    ('WhereMatches',
+     lambda g: _ReferenceWhere(g, 'file1', lambda r, s: (
+         r.search(s.source_path) or
+         r.search(s.object_path) or
+         r.search(s.full_name) or
+         s.full_name is not s.template_name and r.search(s.template_name) or
+         s.full_name is not s.name and r.search(s.name))),
+     lambda g: g.WhereMatches('file1')),
+    ('GroupedByPath(depth=2)',
+     lambda g: _ReferenceGroupedByPath(g, 2),
+     lambda g: g.GroupedByPath(depth=2)),
+    ('size, pss, padding', _ReferenceSums, _Sums),
+]
+
+
+def _CreateSyntheticSymbols(num_symbols):
+  rand = random.Random(0)
+  sections = (models.SECTION_TEXT,) * 6 + (
+      models.SECTION_RODATA, models.SECTION_DATA, models.SECTION_DATA_REL_RO,
+      models.SECTION_BSS)
+  components = ('Blink>DOM', 'Blink>CSS', 'Internals>Network', 'UI', '')
+  symbols = []
+  for i in xrange(num_symbols):
+    name = 'ns%d::Function%d()' % (i % 997, i)
+    # Like in real binaries, there are many symbols per source file.
+    file_idx = i % 2003
+    symbol = models.Symbol(
+        rand.choice(sections), rand.randint(1, 500), full_name=name,
+        template_name=name, name=name,
+        object_path='obj/dir%d/file%d.o' % (file_idx % 31, file_idx),
+        source_path='dir%d/sub%d/file%d.cc' % (
+            file_idx % 31, file_idx % 7, file_idx))
+    symbol.padding = rand.randint(0, 3)
+    symbol.component = components[i % len(components)]
+    symbols.append(symbol)
+  # Create some alias groups.
+  for i in xrange(0, num_symbols - 3, 50):
+    aliases = symbols[i:i + 3]
+    for symbol in aliases:
+      symbol.section_name = models.SECTION_TEXT
+      symbol.aliases = aliases
+  return models.SymbolGroup(symbols)
+
+
+def _Measure(func, runs):
+  best = None
+  for _ in xrange(runs):
+    start = time.time()
+    ret = func()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return ret, best
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('size_file', nargs='?', help='Path to .size file.')
+  parser.add_argument('--synthetic', type=int, metavar='NUM_SYMBOLS',
+                      help='Use generated symbols instead of a .size file.')
+  parser.add_argument('--runs', type=int, default=3,
+                      help='Report the fastest of this many runs.')
+  parser.add_argument('-v', '--verbose', action='store_true')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+  if args.synthetic:
+    group = _CreateSyntheticSymbols(args.synthetic)
+  elif args.size_file:
+    group = archive.LoadAndPostProcessSizeInfo(args.size_file).raw_symbols
+  else:
+    parser.error('Pass either a .size file or --synthetic.')
+
+  print 'Querying %d symbols (best of %d runs):' % (len(group), args.runs)
+  print '%-24s %10s %10s' % ('', 'Reference', 'Current')
+  for name, reference_func, func in _QUERIES:
+    expected, reference_time = _Measure(lambda: reference_func(group),
+                                        args.runs)
+    actual, actual_time = _Measure(lambda: func(group), args.runs)
+    print '%-24s %9.3fs %9.3fs' % (name, reference_time, actual_time)
+    if isinstance(expected, models.SymbolGroup):
+      assert list(expected) == list(actual), 'Results differ for ' + name
+    else:
+      assert expected == actual, 'Results differ for ' + name
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import re
+import unittest
+
+import models
+
+
+def _MakeSymbol(section_name, size, name, object_path='', source_path='',
+                component='', padding=0):
+  symbol = models.Symbol(section_name, size, full_name=name, name=name,
+                         template_name=name, object_path=object_path,
+                         source_path=source_path)
+  symbol.component = component
+  symbol.padding = padding
+  symbol.size += padding
+  return symbol
+
+
+def _MakeSymbols():
+  symbols = []
+  for i in xrange(40):
+    symbols.append(_MakeSymbol(
+        models.SECTION_TEXT, i + 1, 'ns%d::Func%d()' % (i % 3, i),
+        object_path='obj/dir%d/file%d.o' % (i % 2, i % 5),
+        source_path='dir%d/file%d.cc' % (i % 2, i % 5) if i % 4 else '',
+        component='Blink>DOM' if i % 3 else 'UI', padding=i % 2))
+  symbols.append(_MakeSymbol(
+      models.SECTION_TEXT, 8, 'shared()',
+      source_path='third_party/{shared}/1', object_path='obj/file1.o'))
+  # An alias group, and a .bss symbol.
+  aliases = [_MakeSymbol(models.SECTION_TEXT, 30, 'alias%d()' % i,
+                         object_path='obj/alias%d.o' % i, padding=3)
+             for i in xrange(3)]
+  for symbol in aliases:
+    symbol.aliases = aliases
+  symbols.extend(aliases)
+  symbols.append(_MakeSymbol(models.SECTION_BSS, 100, 'g_bss',
+                             object_path='obj/dir1/file1.o'))
+  return models.SymbolGroup(symbols)
+
+
+class SymbolGroupTest(unittest.TestCase):
+
+  def setUp(self):
+    self.group = _MakeSymbols()
+
+  def _CheckFilter(self, actual, func, group=None):
+    if group is None:
+      group = self.group
+    self.assertEqual([s for s in group if func(s)], list(actual))
+    self.assertEqual([s for s in group if not func(s)],
+                     list(actual.Inverted()))
+
+  def testWhereMatches(self):
+    patterns = ('dir1', r'file[23]', r'\.o$', 'Blink', 'UI', 'ns1::',
+                'Func1', 'alias', 'shared', 'nomatch')
+    for pattern in patterns:
+      regex = re.compile(pattern)
+      search = lambda value: bool(regex.search(value))
+      self._CheckFilter(self.group.WhereObjectPathMatches(pattern),
+                        lambda s: search(s.object_path))
+      self._CheckFilter(self.group.WhereSourcePathMatches(pattern),
+                        lambda s: search(s.source_path))
+      self._CheckFilter(
+          self.group.WherePathMatches(pattern),
+          lambda s: search(s.source_path) or search(s.object_path))
+      self._CheckFilter(self.group.WhereComponentMatches(pattern),
+                        lambda s: search(s.component))
+      self._CheckFilter(self.group.WhereFullNameMatches(pattern),
+                        lambda s: search(s.full_name))
+      self._CheckFilter(self.group.WhereNameMatches(pattern),
+                        lambda s: search(s.name))
+      self._CheckFilter(
+          self.group.WhereMatches(pattern),
+          lambda s: (search(s.source_path) or search(s.object_path) or
+                     search(s.full_name)))
+
+  def testWhereMatchesOnGroups(self):
+    by_path = self.group.GroupedByPath()
+    self._CheckFilter(by_path.WherePathMatches('dir0'),
+                      lambda g: 'dir0' in g.source_path + g.object_path,
+                      group=by_path)
+
+  def testSums(self):
+    unique_symbols = self.group[:-4] + self.group[-4:-3] + self.group[-1:]
+    self.assertEqual(
+        sum(s.size for s in unique_symbols if not s.IsBss()),
+        self.group.size)
+    self.assertEqual(sum(s.padding for s in unique_symbols),
+                     self.group.padding)
+    self.assertAlmostEqual(sum(s.pss for s in self.group if not s.IsBss()),
+                           self.group.pss)
+    bss = self.group.WhereInSection(models.SECTION_BSS)
+    self.assertEqual(100, bss.size)
+    self.assertEqual(100, bss.pss)
+
+  def testGroupedByPath(self):
+    sizes_by_path = {g.name: g.size for g in self.group.GroupedByPath(depth=1)}
+    self.assertEqual(
+        {'dir0', 'dir1', 'obj', 'third_party'}, set(sizes_by_path))
+    sizes_by_path = {g.name: g.size for g in self.group.GroupedByPath()}
+    self.assertIn('third_party/{shared}', sizes_by_path)
+    self.assertEqual(8, sizes_by_path['third_party/{shared}'])
+    self.assertEqual(
+        self.group.size,
+        sum(g.size for g in self.group.GroupedByPath(depth=2)))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -15,6 +15,9 @@ RunNmOnIntermediates():
   BulkForkAndCall() target: Runs nm on a .a file or a list of .o files, parses
   the output, extracts symbol information, and (if available) extracts string
   offset information.
+
+CollectNmResultsFromIntermediates():
+  Same as RunNmOnIntermediates(), but returns results without encoding them.
 """
 
 import collections
@@ -175,12 +178,15 @@ def _ParseOneObjectFileNmOutput(lines):
   return symbol_names, string_addresses
 
 
-# This is a target for BulkForkAndCall().
-def RunNmOnIntermediates(target, tool_prefix, output_directory):
-  """Returns encoded_symbol_names_by_path, encoded_string_addresses_by_path.
+def CollectNmResultsFromIntermediates(target, tool_prefix, output_directory):
+  """Runs nm on |target| and parses the results.
 
   Args:
     target: Either a single path to a .a (as a string), or a list of .o paths.
+
+  Returns:
+    A tuple of (symbol_names_by_path, string_addresses_by_path, stderr_lines).
+    |stderr_lines| lists the objects that nm found no symbols in.
   """
   is_archive = isinstance(target, basestring)
   args = [path_util.GetNmPath(tool_prefix), '--no-sort', '--defined-only']
@@ -194,11 +200,11 @@ def RunNmOnIntermediates(target, tool_prefix, output_directory):
   # lines, to be returned to the caller.
   stdout, stderr = proc.communicate()
   assert proc.returncode == 0
-  num_no_symbols = len(stderr.splitlines())
+  stderr_lines = stderr.splitlines()
   lines = stdout.splitlines()
   # Empty .a file has no output.
   if not lines:
-    return concurrent.EMPTY_ENCODED_DICT, concurrent.EMPTY_ENCODED_DICT
+    return {}, {}, stderr_lines
   is_multi_file = not lines[0]
   lines = iter(lines)
   if is_multi_file:
@@ -220,11 +226,22 @@ def RunNmOnIntermediates(target, tool_prefix, output_directory):
     if string_addresses:
       string_addresses_by_path[path] = string_addresses
     path = next(lines, ':')[:-1]
+  return symbol_names_by_path, string_addresses_by_path, stderr_lines
+
 
+# This is a target for BulkForkAndCall().
+def RunNmOnIntermediates(target, tool_prefix, output_directory):
+  """Returns encoded_symbol_names_by_path, encoded_string_addresses_by_path.
+
+  Args:
+    target: Either a single path to a .a (as a string), or a list of .o paths.
+  """
+  symbol_names_by_path, string_addresses_by_path, stderr_lines = (
+      CollectNmResultsFromIntermediates(target, tool_prefix, output_directory))
   # The multiprocess API uses pickle, which is ridiculously slow. More than 2x
   # faster to use join & split.
   # TODO(agrieve): We could use path indices as keys rather than paths to cut
   #     down on marshalling overhead.
   return (concurrent.EncodeDictOfLists(symbol_names_by_path),
           concurrent.EncodeDictOfLists(string_addresses_by_path),
-          num_no_symbols)
+          len(stderr_lines))
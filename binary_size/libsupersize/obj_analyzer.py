@@ -53,7 +53,7 @@ import traceback
 import bcanalyzer
 import concurrent
 import demangle
-import nm
+import object_cache
 import string_extract
 
 
@@ -89,10 +89,13 @@ class _PathsByType:
 
 
 class _BulkObjectFileAnalyzerWorker(object):
-  def __init__(self, tool_prefix, output_directory, track_string_literals=True):
+  def __init__(self, tool_prefix, output_directory, track_string_literals=True,
+               cache_dir=None, cache_max_size=None):
     self._tool_prefix = _MakeToolPrefixAbsolute(tool_prefix)
     self._output_directory = output_directory
     self._track_string_literals = track_string_literals
+    self._cache_dir = cache_dir and os.path.abspath(cache_dir)
+    self._cache_max_size = cache_max_size
     self._list_of_encoded_elf_string_ranges_by_path = None
     self._paths_by_name = collections.defaultdict(list)
     self._encoded_string_addresses_by_path_chunks = []
@@ -132,7 +135,12 @@ class _BulkObjectFileAnalyzerWorker(object):
     # and our output is a dict where paths are the key.
     return concurrent.BulkForkAndCall(
         runner, batches, tool_prefix=self._tool_prefix,
-        output_directory=self._output_directory)
+        output_directory=self._output_directory, cache_dir=self._cache_dir)
+
+  def _LogCacheStats(self, tool_name, num_hits, num_files):
+    if self._cache_dir:
+      logging.info('%s cache: %d hits, %d misses.', tool_name, num_hits,
+                   num_files - num_hits)
 
   def _RunNm(self, paths_by_type):
     """Calls nm to get symbols and (for non-BC files) string addresses."""
@@ -142,13 +150,15 @@ class _BulkObjectFileAnalyzerWorker(object):
     BATCH_SIZE = 50  # Arbitrarily chosen.
     batches.extend(
         self._MakeBatches(paths_by_type.obj + paths_by_type.bc, BATCH_SIZE))
-    results = self._DoBulkFork(nm.RunNmOnIntermediates, batches)
+    results = self._DoBulkFork(object_cache.RunNmOnIntermediates, batches)
 
     # Names are still mangled.
     all_paths_by_name = self._paths_by_name
     total_no_symbols = 0
-    for encoded_syms, encoded_strs, num_no_symbols in results:
+    total_hits = 0
+    for encoded_syms, encoded_strs, num_no_symbols, num_hits in results:
       total_no_symbols += num_no_symbols
+      total_hits += num_hits
       symbol_names_by_path = concurrent.DecodeDictOfLists(encoded_syms)
       for path, names in symbol_names_by_path.iteritems():
         for name in names:
@@ -158,16 +168,21 @@ class _BulkObjectFileAnalyzerWorker(object):
         self._encoded_string_addresses_by_path_chunks.append(encoded_strs)
     if total_no_symbols:
       logging.warn('nm found no symbols in %d objects.', total_no_symbols)
+    self._LogCacheStats('nm', total_hits, len(paths_by_type.arch) +
+                        len(paths_by_type.obj) + len(paths_by_type.bc))
 
   def _RunLlvmBcAnalyzer(self, paths_by_type):
     """Calls llvm-bcanalyzer to extract string data (for LLD-LTO)."""
     BATCH_SIZE = 50  # Arbitrarily chosen.
     batches = self._MakeBatches(paths_by_type.bc, BATCH_SIZE)
     results = self._DoBulkFork(
-        bcanalyzer.RunBcAnalyzerOnIntermediates, batches)
-    for encoded_strs in results:
+        object_cache.RunBcAnalyzerOnIntermediates, batches)
+    total_hits = 0
+    for encoded_strs, num_hits in results:
+      total_hits += num_hits
       if encoded_strs != concurrent.EMPTY_ENCODED_DICT:
         self._encoded_strings_by_path_chunks.append(encoded_strs);
+    self._LogCacheStats('llvm-bcanalyzer', total_hits, len(paths_by_type.bc))
 
   def AnalyzePaths(self, paths):
     logging.debug('worker: AnalyzePaths() started.')
@@ -178,6 +193,8 @@ class _BulkObjectFileAnalyzerWorker(object):
     self._RunNm(paths_by_type)
     if self._track_string_literals:
       self._RunLlvmBcAnalyzer(paths_by_type)
+    if self._cache_dir and self._cache_max_size is not None:
+      object_cache.TrimCache(self._cache_dir, self._cache_max_size)
     logging.debug('worker: AnalyzePaths() completed.')
 
   def SortPaths(self):
@@ -260,10 +277,13 @@ def _TerminateSubprocesses():
 
 class _BulkObjectFileAnalyzerMaster(object):
   """Runs BulkObjectFileAnalyzer in a subprocess."""
-  def __init__(self, tool_prefix, output_directory, track_string_literals=True):
+  def __init__(self, tool_prefix, output_directory, track_string_literals=True,
+               cache_dir=None, cache_max_size=None):
     self._tool_prefix = tool_prefix
     self._output_directory = output_directory
     self._track_string_literals = track_string_literals
+    self._cache_dir = cache_dir
+    self._cache_max_size = cache_max_size
     self._child_pid = None
     self._pipe = None
 
@@ -284,7 +304,8 @@ class _BulkObjectFileAnalyzerMaster(object):
           'obj_analyzer: %(levelname).1s %(relativeCreated)6d %(message)s'))
       worker_analyzer = _BulkObjectFileAnalyzerWorker(
           self._tool_prefix, self._output_directory,
-          track_string_literals=self._track_string_literals)
+          track_string_literals=self._track_string_literals,
+          cache_dir=self._cache_dir, cache_max_size=self._cache_max_size)
       slave = _BulkObjectFileAnalyzerSlave(worker_analyzer, child_conn)
       slave.Run()
 
@@ -411,6 +432,8 @@ def main():
   parser.add_argument('--elf-file', type=os.path.realpath)
   parser.add_argument('--show-names', action='store_true')
   parser.add_argument('--show-strings', action='store_true')
+  parser.add_argument('--cache-dir',
+                      help='Directory to cache per-object-file results in.')
   parser.add_argument('objects', type=os.path.realpath, nargs='+')
 
   args = parser.parse_args()
@@ -419,11 +442,11 @@ def main():
 
   if args.multiprocess:
     bulk_analyzer = _BulkObjectFileAnalyzerMaster(
-        args.tool_prefix, args.output_directory)
+        args.tool_prefix, args.output_directory, cache_dir=args.cache_dir)
   else:
     concurrent.DISABLE_ASYNC = True
     bulk_analyzer = _BulkObjectFileAnalyzerWorker(
-        args.tool_prefix, args.output_directory)
+        args.tool_prefix, args.output_directory, cache_dir=args.cache_dir)
 
   # Pass individually to test multiple calls.
   for path in args.objects:
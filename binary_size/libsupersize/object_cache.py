@@ -0,0 +1,309 @@
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""On-disk cache for the results of analyzing object files.
+
+Most object files do not change between adjacent commits, so the results of
+running nm and llvm-bcanalyzer on them are stored in a directory, keyed by a
+hash of the file's path and contents (and of the tool that created them). The
+least recently used entries are evicted once the directory grows beyond a given
+size.
+
+ObjectFileCache:
+  Reads and writes cache entries. Safe to use from multiple processes.
+
+RunNmOnIntermediates():
+  BulkForkAndCall() target: Same as nm.RunNmOnIntermediates(), but runs nm
+  only on files that are not cached. Also returns the number of cache hits.
+
+RunBcAnalyzerOnIntermediates():
+  BulkForkAndCall() target: Same as bcanalyzer.RunBcAnalyzerOnIntermediates(),
+  but runs llvm-bcanalyzer only on files that are not cached. Also returns the
+  number of cache hits.
+"""
+
+import hashlib
+import logging
+import marshal
+import os
+import tempfile
+
+import bcanalyzer
+import concurrent
+import nm
+import path_util
+
+
+# Bump this when the format of cached values changes.
+_CACHE_VERSION = '1'
+_KIND_NM = 'nm'
+_KIND_BCANALYZER = 'bc'
+_READ_CHUNK_SIZE = 1 << 20
+
+
+class ObjectFileCache(object):
+  """A content-addressed store of per-object-file results.
+
+  Values are arbitrary marshal()able objects.
+  """
+
+  def __init__(self, cache_dir, salt=''):
+    self._cache_dir = cache_dir
+    self._salt = _CACHE_VERSION + salt
+
+  def _EntryPath(self, key):
+    return os.path.join(self._cache_dir, key[:2], key)
+
+  def ComputeKey(self, output_directory, path):
+    """Returns the cache key for the file at |path|.
+
+    The (relative) path is included in the key since tool output can refer to
+    it, and since identical files at different paths are rare.
+
+    Returns None if the file cannot be read (such files are never cached).
+    """
+    h = hashlib.sha1(self._salt)
+    h.update(path + '\0')
+    try:
+      with open(os.path.join(output_directory, path), 'rb') as f:
+        while True:
+          data = f.read(_READ_CHUNK_SIZE)
+          if not data:
+            break
+          h.update(data)
+    except IOError:
+      return None
+    return h.hexdigest()
+
+  def Get(self, key):
+    """Returns the value for |key|, or None if it is not cached."""
+    if key is None:
+      return None
+    entry_path = self._EntryPath(key)
+    try:
+      with open(entry_path, 'rb') as f:
+        value = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+      return None
+    # Update mtime so that eviction is least-recently-used.
+    try:
+      os.utime(entry_path, None)
+    except OSError:
+      pass
+    return value
+
+  def Put(self, key, value):
+    """Stores |value| for |key|. Does nothing if |key| is None."""
+    if key is None:
+      return
+    entry_path = self._EntryPath(key)
+    entry_dir = os.path.dirname(entry_path)
+    if not os.path.isdir(entry_dir):
+      try:
+        os.makedirs(entry_dir)
+      except OSError:
+        # Another process may have created it.
+        if not os.path.isdir(entry_dir):
+          raise
+    # Write to a temporary file and rename so that concurrent readers never see
+    # partially written entries.
+    fd, tmp_path = tempfile.mkstemp(dir=entry_dir)
+    with os.fdopen(fd, 'wb') as f:
+      marshal.dump(value, f)
+    os.rename(tmp_path, entry_path)
+
+  def Trim(self, max_size):
+    """Deletes least recently used entries until |max_size| bytes remain.
+
+    Returns:
+      A tuple of (num_entries, total_size, num_evicted).
+    """
+    entries = []
+    total_size = 0
+    for dirpath, _, filenames in os.walk(self._cache_dir):
+      for name in filenames:
+        entry_path = os.path.join(dirpath, name)
+        try:
+          st = os.stat(entry_path)
+        except OSError:
+          continue
+        entries.append((st.st_mtime, st.st_size, entry_path))
+        total_size += st.st_size
+
+    num_evicted = 0
+    if total_size > max_size:
+      entries.sort()
+      for _, size, entry_path in entries:
+        if total_size <= max_size:
+          break
+        try:
+          os.unlink(entry_path)
+        except OSError:
+          continue
+        total_size -= size
+        num_evicted += 1
+    return len(entries) - num_evicted, total_size, num_evicted
+
+
+def _CreateNmCache(cache_dir, tool_prefix):
+  nm_path = path_util.GetNmPath(tool_prefix)
+  return ObjectFileCache(
+      cache_dir, _KIND_NM + path_util.GetToolFingerprint(nm_path))
+
+
+def _CreateBcAnalyzerCache(cache_dir, tool_prefix):
+  salt = '%s%s:%d' % (
+      _KIND_BCANALYZER,
+      path_util.GetToolFingerprint(
+          path_util.GetBcAnalyzerPath(tool_prefix)),
+      bcanalyzer._CHAR_WIDTH_LIMIT)
+  return ObjectFileCache(cache_dir, salt)
+
+
+def _CountLinesMentioning(lines, path):
+  needle = path + ':'
+  return sum(1 for l in lines if needle in l)
+
+
+def _LookupNmResultsForArchive(cache, target, tool_prefix, output_directory):
+  """Returns (symbol_names_by_path, string_addresses_by_path, num_no_symbols,
+  num_hits) for a .a file."""
+  key = cache.ComputeKey(output_directory, target)
+  value = cache.Get(key)
+  num_hits = 1
+  if value is None:
+    num_hits = 0
+    symbol_names_by_path, string_addresses_by_path, stderr_lines = (
+        nm.CollectNmResultsFromIntermediates(
+            target, tool_prefix, output_directory))
+    # Store by member name to keep entries small. E.g. foo/bar.a(baz.o) -> baz.o
+    prefix_len = len(target) + 1
+    value = (
+        {p[prefix_len:-1]: list(names)
+         for p, names in symbol_names_by_path.iteritems()},
+        {p[prefix_len:-1]: addresses
+         for p, addresses in string_addresses_by_path.iteritems()},
+        len(stderr_lines))
+    cache.Put(key, value)
+
+  names_by_member, addresses_by_member, num_no_symbols = value
+  symbol_names_by_path = {
+      '%s(%s)' % (target, m): names
+      for m, names in names_by_member.iteritems()}
+  string_addresses_by_path = {
+      '%s(%s)' % (target, m): addresses
+      for m, addresses in addresses_by_member.iteritems()}
+  return (symbol_names_by_path, string_addresses_by_path, num_no_symbols,
+          num_hits)
+
+
+def _LookupNmResultsForObjects(cache, target, tool_prefix, output_directory):
+  """Returns (symbol_names_by_path, string_addresses_by_path, num_no_symbols,
+  num_hits) for a list of .o files."""
+  symbol_names_by_path = {}
+  string_addresses_by_path = {}
+  num_no_symbols = 0
+  keys_by_missed_path = {}
+  for path in target:
+    key = cache.ComputeKey(output_directory, path)
+    value = cache.Get(key)
+    if value is None:
+      keys_by_missed_path[path] = key
+      continue
+    names, addresses, path_num_no_symbols = value
+    symbol_names_by_path[path] = names
+    if addresses:
+      string_addresses_by_path[path] = addresses
+    num_no_symbols += path_num_no_symbols
+
+  if keys_by_missed_path:
+    # Preserve the order of |target|.
+    missed_paths = [p for p in target if p in keys_by_missed_path]
+    missed_names_by_path, missed_addresses_by_path, stderr_lines = (
+        nm.CollectNmResultsFromIntermediates(
+            missed_paths, tool_prefix, output_directory))
+    num_no_symbols += len(stderr_lines)
+    for path in missed_paths:
+      names = list(missed_names_by_path.get(path, ()))
+      addresses = missed_addresses_by_path.get(path, [])
+      if path in missed_names_by_path:
+        symbol_names_by_path[path] = names
+      if addresses:
+        string_addresses_by_path[path] = addresses
+      cache.Put(keys_by_missed_path[path],
+                (names, addresses, _CountLinesMentioning(stderr_lines, path)))
+
+  num_hits = len(target) - len(keys_by_missed_path)
+  return (symbol_names_by_path, string_addresses_by_path, num_no_symbols,
+          num_hits)
+
+
+# This is a target for BulkForkAndCall().
+def RunNmOnIntermediates(target, tool_prefix, output_directory, cache_dir=None):
+  """Returns the same values as nm.RunNmOnIntermediates(), plus num_hits.
+
+  Args:
+    target: Either a single path to a .a (as a string), or a list of .o paths.
+    cache_dir: Directory of the cache. When None, nothing is cached.
+  """
+  if cache_dir is None:
+    return nm.RunNmOnIntermediates(target, tool_prefix, output_directory) + (0,)
+
+  cache = _CreateNmCache(cache_dir, tool_prefix)
+  if isinstance(target, basestring):
+    lookup_func = _LookupNmResultsForArchive
+  else:
+    lookup_func = _LookupNmResultsForObjects
+  symbol_names_by_path, string_addresses_by_path, num_no_symbols, num_hits = (
+      lookup_func(cache, target, tool_prefix, output_directory))
+  return (concurrent.EncodeDictOfLists(symbol_names_by_path),
+          concurrent.EncodeDictOfLists(string_addresses_by_path),
+          num_no_symbols, num_hits)
+
+
+# This is a target for BulkForkAndCall().
+def RunBcAnalyzerOnIntermediates(target, tool_prefix, output_directory,
+                                 cache_dir=None):
+  """Returns the same value as bcanalyzer.RunBcAnalyzerOnIntermediates(), plus
+  num_hits.
+
+  Args:
+    target: A list of BC file paths.
+    cache_dir: Directory of the cache. When None, nothing is cached.
+  """
+  if cache_dir is None:
+    return (bcanalyzer.RunBcAnalyzerOnIntermediates(
+        target, tool_prefix, output_directory), 0)
+
+  cache = _CreateBcAnalyzerCache(cache_dir, tool_prefix)
+  strings_by_path = {}
+  keys_by_missed_path = {}
+  for path in target:
+    key = cache.ComputeKey(output_directory, path)
+    value = cache.Get(key)
+    if value is None:
+      keys_by_missed_path[path] = key
+    else:
+      strings_by_path[path] = value
+
+  if keys_by_missed_path:
+    missed_paths = [p for p in target if p in keys_by_missed_path]
+    missed_strings_by_path = bcanalyzer.CollectStringsFromIntermediates(
+        missed_paths, tool_prefix, output_directory)
+    for path, strings in missed_strings_by_path.iteritems():
+      strings_by_path[path] = strings
+      cache.Put(keys_by_missed_path[path], strings)
+
+  num_hits = len(target) - len(keys_by_missed_path)
+  # See bcanalyzer.RunBcAnalyzerOnIntermediates() for why repr() is used.
+  return (concurrent.EncodeDictOfLists(strings_by_path, value_transform=repr),
+          num_hits)
+
+
+def TrimCache(cache_dir, max_size):
+  """Evicts least recently used entries from |cache_dir|."""
+  num_entries, total_size, num_evicted = ObjectFileCache(cache_dir).Trim(
+      max_size)
+  logging.info('Object file cache has %d entries (%.1fMiB). Evicted %d.',
+               num_entries, total_size / 1024.0 / 1024, num_evicted)
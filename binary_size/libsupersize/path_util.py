@@ -191,3 +191,12 @@ def GetBcAnalyzerPath(tool_prefix):
   if tool_prefix[-5:] != 'llvm-':
     raise ValueError('BC analyzer is only supported in LLVM.')
   return tool_prefix + 'bcanalyzer'
+
+
+def GetToolFingerprint(tool_path):
+  """Returns a string that changes when the tool at |tool_path| is updated."""
+  try:
+    st = os.stat(tool_path)
+    return '%s:%d:%d' % (tool_path, st.st_size, int(st.st_mtime))
+  except OSError:
+    return tool_path
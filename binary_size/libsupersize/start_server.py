@@ -9,6 +9,8 @@ import logging
 import os
 import SimpleHTTPServer
 
+import html_report
+
 
 class SupersizeHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler,
                                   object):
@@ -16,6 +18,8 @@ class SupersizeHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler,
   serve_from = None
   # Path to data file
   data_file_path = None
+  # Path to the shards of a sharded data file
+  shards_dir_path = None
 
   #override
   def translate_path(self, path):
@@ -23,8 +27,11 @@ class SupersizeHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler,
     relative_path = os.path.relpath(f, os.getcwd())
     if relative_path == 'data.ndjson':
       return SupersizeHTTPRequestHandler.data_file_path
-    else:
-      return os.path.join(SupersizeHTTPRequestHandler.serve_from, relative_path)
+    shards_dir_path = SupersizeHTTPRequestHandler.shards_dir_path
+    shards_dir_name = os.path.basename(shards_dir_path)
+    if relative_path.startswith(shards_dir_name + os.sep):
+      return os.path.join(os.path.dirname(shards_dir_path), relative_path)
+    return os.path.join(SupersizeHTTPRequestHandler.serve_from, relative_path)
 
 
 def AddArguments(parser):
@@ -44,6 +51,8 @@ def Run(args, _parser):
 
   SupersizeHTTPRequestHandler.serve_from = static_files
   SupersizeHTTPRequestHandler.data_file_path = args.report_file
+  SupersizeHTTPRequestHandler.shards_dir_path = os.path.abspath(
+      html_report.ShardsDirForReport(args.report_file))
   httpd = BaseHTTPServer.HTTPServer(server_addr, SupersizeHTTPRequestHandler)
 
   sa = httpd.socket.getsockname()
@@ -16,6 +16,16 @@
  * @prop {string[]} components
  * @prop {number} total
  * @prop {boolean} diff_mode
+ * @prop {ShardEntry[]} [shards] Present for sharded data files.
+ */
+/**
+ * @typedef {object} ShardEntry JSON object describing a data file containing
+ * the FileEntries of a single directory.
+ * @prop {string} path Path of the directory.
+ * @prop {string} url URL of the shard, relative to the main data file.
+ * @prop {{[type: string]: number[]}} stats Total size and count of symbols by
+ * type, as [size, count].
+ * @prop {number} flags Bit flags of all symbols, OR'ed together.
  */
 /**
  * @typedef {object} SymbolEntry JSON object representing a single symbol.
@@ -80,6 +90,23 @@ function dirname(path, sep) {
   return path.substring(0, lastIndexOf(path, sep));
 }
 
+/**
+ * Yields each line of a newline delimited JSON (.ndjson) file. Used for shards,
+ * which are small enough that streaming is not worthwhile.
+ * @param {string} url
+ * @returns {AsyncIterable<FileEntry>}
+ */
+async function* fetchNdjson(url) {
+  const response = await fetch(url, {credentials: 'same-origin'});
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${url}: ${response.status}`);
+  }
+  const text = await response.text();
+  for (const line of text.split('\n')) {
+    if (line) yield JSON.parse(line);
+  }
+}
+
 /**
  * Compare two nodes for sorting. Used in sortTree.
  * @param {TreeNode} a
@@ -141,13 +168,21 @@ class TreeBuilder {
    * see if a symbol should be highlighted.
    * @param {string} options.sep Path seperator used to find parent names.
    * @param {Meta} options.meta Metadata associated with this tree.
+   * @param {(type: string) => boolean} [options.typeTest] Called to see if
+   * symbols of a type should be included in the size of unloaded shards.
    */
   constructor(options) {
     this._getPath = options.getPath;
     this._filterTest = options.filterTest;
     this._highlightTest = options.highlightTest;
+    this._typeTest = options.typeTest || (() => true);
     this._sep = options.sep || _PATH_SEP;
     this._meta = options.meta;
+    /**
+     * @type {Map<string, ShardEntry & {absoluteUrl: string}>} Shards that have
+     * not been loaded yet, by directory path.
+     */
+    this._pendingShards = new Map();
 
     // srcPath and component don't make sense for the root node.
     this.rootNode = createNode({
@@ -302,7 +337,8 @@ class TreeBuilder {
     const childDepth = depth - 1;
     // `null` represents that the children have not been loaded yet
     let children = null;
-    if (depth > 0 || node.children.length <= 1) {
+    const isUnloaded = this._pendingShards.has(node.idPath);
+    if (!isUnloaded && (depth > 0 || node.children.length <= 1)) {
       // If depth is larger than 0, include the children.
       // If there are 0 children, include the empty array to indicate the node
       // is a leaf.
@@ -441,13 +477,85 @@ class TreeBuilder {
     }
   }
 
+  /**
+   * Adds (or with `sign` = -1, removes) the sizes of a shard to its directory
+   * node and all ancestors, creating the directory node if needed.
+   * @param {ShardEntry} shard
+   * @param {number} sign
+   * @private
+   */
+  _addShardStats(shard, sign) {
+    let size = 0;
+    const childStats = {};
+    for (const [type, [typeSize, count]] of Object.entries(shard.stats)) {
+      if (this._typeTest(type)) {
+        size += typeSize;
+        childStats[type] = {
+          size: sign * typeSize,
+          count: sign * count,
+          highlight: 0,
+        };
+      }
+    }
+    // A temporary child, used to update the sizes of all ancestors.
+    const stubNode = createNode({
+      idPath: `${shard.path}${_PATH_SEP}`,
+      shortNameIndex: shard.path.length + 1,
+      type: _CONTAINER_TYPES.FILE,
+      size: sign * size,
+      flags: sign > 0 ? shard.flags : 0,
+      childStats,
+    });
+    let orphanNode = stubNode;
+    while (orphanNode.parent == null && orphanNode !== this.rootNode) {
+      orphanNode = this._getOrMakeParentNode(orphanNode);
+    }
+    const dirNode = stubNode.parent;
+    dirNode.children.splice(dirNode.children.indexOf(stubNode), 1);
+  }
+
+  /**
+   * Adds a directory whose FileEntries are loaded only once it is opened.
+   * @param {ShardEntry} shard
+   * @param {string} absoluteUrl URL to fetch the shard from.
+   */
+  addShard(shard, absoluteUrl) {
+    if (!Object.keys(shard.stats).some(this._typeTest)) return;
+    this._addShardStats(shard, 1);
+    this._pendingShards.set(shard.path, Object.assign({absoluteUrl}, shard));
+  }
+
+  /**
+   * Fetches and adds unloaded shards that contain the node with `idPath`.
+   * @param {string} idPath
+   */
+  async loadShardsFor(idPath) {
+    for (const [path, shard] of this._pendingShards) {
+      const containsNode =
+        idPath === path ||
+        idPath.startsWith(`${path}${_PATH_SEP}`) ||
+        idPath.startsWith(`${path}:`);
+      if (containsNode) {
+        this._pendingShards.delete(path);
+        // The sizes from the shard's entry are replaced by actual symbols.
+        this._addShardStats(shard, -1);
+        for await (const fileEntry of fetchNdjson(shard.absoluteUrl)) {
+          this.addFileEntry(fileEntry, this._meta.diff_mode);
+        }
+      }
+    }
+  }
+
   /**
    * Finalize the creation of the tree and return the root node.
    */
   build() {
-    this._getPath = () => '';
-    this._filterTest = () => false;
-    this._parents.clear();
+    // Adding entries from shards requires the in-progress state.
+    if (this._pendingShards.size === 0) {
+      this._getPath = () => '';
+      this._filterTest = () => false;
+      this._parents.clear();
+    }
     return this.rootNode;
   }
 
@@ -528,6 +636,19 @@ class DataFetcher {
     this._input = input;
   }
 
+  /**
+   * Resolves a URL relative to the input.
+   * @param {string} url
+   */
+  resolveUrl(url) {
+    if (typeof this._input !== 'string' || this._input.startsWith('blob:')) {
+      throw new Error(
+          'Sharded data files must be loaded from a URL (e.g. via ' +
+          'start_server)');
+    }
+    return new URL(url, new URL(this._input, self.location.href)).href;
+  }
+
   /**
    * Starts a new request and aborts the previous one.
    * @param {string | Request} url
@@ -659,6 +780,8 @@ function parseOptions(options) {
    * check each symbol. If any returns false, the symbol will not be used.
    */
   const filters = [];
+  /** @type {(type: string) => boolean} */
+  let typeTest = () => true;
 
   // Ensure symbol size is past the minimum
   if (minSymbolSize > 0) {
@@ -667,8 +790,12 @@ function parseOptions(options) {
 
   // Ensure the symbol size wasn't filtered out
   if (typeFilter.size < _SYMBOL_TYPE_SET.size) {
+    typeTest = type => typeFilter.has(type);
     filters.push(s => typeFilter.has(s.type));
   }
+  // Shards can be loaded lazily only when sizes of their directories can be
+  // computed without looking at each symbol.
+  const numFiltersByType = typeFilter.size < _SYMBOL_TYPE_SET.size ? 1 : 0;
 
   // Only show generated files
   if (filterGeneratedFiles) {
@@ -709,7 +836,19 @@ function parseOptions(options) {
     highlightTest = () => false;
   }
 
-  return {groupBy, filterTest, highlightTest, url};
+  const canLoadShardsLazily =
+    groupBy === 'source_path' &&
+    !flagToHighlight &&
+    filters.length === numFiltersByType;
+
+  return {
+    groupBy,
+    filterTest,
+    highlightTest,
+    typeTest,
+    canLoadShardsLazily,
+    url,
+  };
 }
 
 /** @type {TreeBuilder | null} */
@@ -723,10 +862,21 @@ const fetcher = new DataFetcher('data.ndjson');
  * each symbol is tested against
  * @param {(symbolNode: TreeNode) => boolean} highlightTest Filter function that
  * each symbol's flags are tested against
+ * @param {(type: string) => boolean} typeTest Filter function that symbol types
+ * are tested against
+ * @param {boolean} canLoadShardsLazily Whether shards of sharded data files
+ * should be fetched only when their directory is opened.
  * @param {(msg: TreeProgress) => void} onProgress
  * @returns {Promise<TreeProgress>}
  */
-async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
+async function buildTree(
+  groupBy,
+  filterTest,
+  highlightTest,
+  typeTest,
+  canLoadShardsLazily,
+  onProgress
+) {
   /** @type {Meta | null} Object from the first line of the data file */
   let meta = null;
 
@@ -791,6 +941,7 @@ async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
           getPath: getPathMap[groupBy],
           filterTest,
           highlightTest,
+          typeTest,
           sep: groupBy === 'component' ? '>' : _PATH_SEP,
           meta,
         });
@@ -807,6 +958,23 @@ async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
       }
     }
 
+    for (const shard of (meta && meta.shards) || []) {
+      const absoluteUrl = fetcher.resolveUrl(shard.url);
+      if (canLoadShardsLazily) {
+        builder.addShard(shard, absoluteUrl);
+        continue;
+      }
+      for await (const fileEntry of fetchNdjson(absoluteUrl)) {
+        builder.addFileEntry(fileEntry, diffMode);
+      }
+      const currentTime = Date.now();
+      if (currentTime - lastBatchSent > 500) {
+        postToUi();
+        await Promise.resolve(); // Pause loop to check for worker messages
+        lastBatchSent = currentTime;
+      }
+    }
+
     return createProgressMessage({
       root: builder.build(),
       percent: 1,
@@ -824,7 +992,14 @@ async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
 const actions = {
   /** @param {{input:string|null,options:string}} param0 */
   load({input, options}) {
-    const {groupBy, filterTest, highlightTest, url} = parseOptions(options);
+    const {
+      groupBy,
+      filterTest,
+      highlightTest,
+      typeTest,
+      canLoadShardsLazily,
+      url,
+    } = parseOptions(options);
     if (input === 'from-url://' && url) {
       // Display the data from the `load_url` query parameter
       console.info('Displaying data from', url);
@@ -834,14 +1009,22 @@ const actions = {
       fetcher.setInput(input);
     }
 
-    return buildTree(groupBy, filterTest, highlightTest, progress => {
-      // @ts-ignore
-      self.postMessage(progress);
-    });
+    return buildTree(
+      groupBy,
+      filterTest,
+      highlightTest,
+      typeTest,
+      canLoadShardsLazily,
+      progress => {
+        // @ts-ignore
+        self.postMessage(progress);
+      }
+    );
   },
   /** @param {string} path */
   async open(path) {
     if (!builder) throw new Error('Called open before load');
+    await builder.loadShardsFor(path);
     const node = builder.find(path);
     return builder.formatNode(node);
   },
@@ -63,9 +63,11 @@ _MAPPINGS = {
 
 
 def main():
-  for line in sys.stdin:
+  # Like c++filt, replies to each line as it is read.
+  for line in iter(sys.stdin.readline, ''):
     sys.stdout.write(_MAPPINGS[line.rstrip()])
     sys.stdout.write('\n')
+    sys.stdout.flush()
 
 
 if __name__ == '__main__':
@@ -137,8 +137,8 @@ def _CreateResourceSizesDelta(apk_name, before_dir, after_dir):
 def _CreateSupersizeDiff(apk_name, before_dir, after_dir):
   before_size_path = os.path.join(before_dir, apk_name + '.size')
   after_size_path = os.path.join(after_dir, apk_name + '.size')
-  before = archive.LoadAndPostProcessSizeInfo(before_size_path)
-  after = archive.LoadAndPostProcessSizeInfo(after_size_path)
+  before, after = archive.LoadAndPostProcessSizeInfos(
+      [before_size_path, after_size_path])
   size_info_delta = diff.Diff(before, after, sort=True)
 
   lines = list(describe.GenerateLines(size_info_delta))
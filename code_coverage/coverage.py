@@ -73,11 +73,13 @@ import argparse
 import json
 import logging
 import multiprocessing
+import multiprocessing.pool
 import os
 import re
 import shlex
 import shutil
 import subprocess
+import threading
 import urllib2
 
 sys.path.append(
@@ -127,6 +129,9 @@ CLANG_COVERAGE_BUILD_ARG = 'use_clang_coverage'
 
 LOGS_DIR_NAME = 'logs'
 
+# Directory (in the report root dir) for the per-target profraw directories.
+PROFRAW_DIR_NAME = 'profraw'
+
 # Used to extract a mapping between directories and components.
 COMPONENT_MAPPING_URL = (
     'https://storage.googleapis.com/chromium-owners/component_map.json')
@@ -235,6 +240,12 @@ def _GetLogsDirectoryPath():
       coverage_utils.GetCoverageReportRootDirPath(OUTPUT_DIR), LOGS_DIR_NAME)
 
 
+def _GetProfrawDirectoryPath():
+  """Path to the directory containing the per-target profraw directories."""
+  return os.path.join(
+      coverage_utils.GetCoverageReportRootDirPath(OUTPUT_DIR), PROFRAW_DIR_NAME)
+
+
 def _GetProfdataFilePath():
   """Path to the resulting .profdata file."""
   return os.path.join(
@@ -249,7 +260,10 @@ def _GetSummaryFilePath():
       SUMMARY_FILE_NAME)
 
 
-def _CreateCoverageProfileDataForTargets(targets, commands, jobs_count=None):
+def _CreateCoverageProfileDataForTargets(targets,
+                                         commands,
+                                         jobs_count=None,
+                                         test_jobs_count=1):
   """Builds and runs target to generate the coverage profile data.
 
   Args:
@@ -257,13 +271,14 @@ def _CreateCoverageProfileDataForTargets(targets, commands, jobs_count=None):
     commands: A list of commands used to run the targets.
     jobs_count: Number of jobs to run in parallel for building. If None, a
                 default value is derived based on CPUs availability.
+    test_jobs_count: Number of targets to run in parallel.
 
   Returns:
     A relative path to the generated profdata file.
   """
   _BuildTargets(targets, jobs_count)
   target_profdata_file_paths = _GetTargetProfDataPathsByExecutingCommands(
-      targets, commands)
+      targets, commands, test_jobs_count)
   coverage_profdata_file_path = (
       _CreateCoverageProfileDataFromTargetProfDataFiles(
           target_profdata_file_paths))
@@ -295,12 +310,19 @@ def _BuildTargets(targets, jobs_count):
   logging.debug('Finished building %s.', str(targets))
 
 
-def _GetTargetProfDataPathsByExecutingCommands(targets, commands):
+def _GetTargetProfDataPathsByExecutingCommands(targets,
+                                               commands,
+                                               test_jobs_count=1):
   """Runs commands and returns the relative paths to the profraw data files.
 
+  Each target writes its profraw data files into its own directory, so that up
+  to |test_jobs_count| targets can run at the same time. The profraw data files
+  of a target are merged as soon as it finishes, while other targets run.
+
   Args:
     targets: A list of targets built with coverage instrumentation.
     commands: A list of commands used to run the targets.
+    test_jobs_count: Number of targets to run in parallel.
 
   Returns:
     A list of relative paths to the generated profraw data files.
@@ -312,20 +334,66 @@ def _GetTargetProfDataPathsByExecutingCommands(targets, commands):
   for file_or_dir in os.listdir(report_root_dir):
     if file_or_dir.endswith(PROFRAW_FILE_EXTENSION):
       os.remove(os.path.join(report_root_dir, file_or_dir))
+  shutil.rmtree(_GetProfrawDirectoryPath(), ignore_errors=True)
 
   # Ensure that logs directory exists.
   if not os.path.exists(_GetLogsDirectoryPath()):
     os.makedirs(_GetLogsDirectoryPath())
 
-  profdata_file_paths = []
+  # On iOS, all the commands share the iossim profraw data file (see
+  # _ExecuteIOSCommand), hence they must run one at a time.
+  if _IsIOS():
+    test_jobs_count = 1
+
+  # A target holds a slot of |run_semaphore| while running and a slot of
+  # |merge_semaphore| while merging its profraw data files. Hence the merge of a
+  # target overlaps with the execution of the next ones.
+  run_semaphore = threading.BoundedSemaphore(test_jobs_count)
+  merge_semaphore = threading.BoundedSemaphore(test_jobs_count)
+
+  def _RunAndMergeTarget(index_and_target_and_command):
+    index, (target, command) = index_and_target_and_command
+    profraw_dir = os.path.join(_GetProfrawDirectoryPath(),
+                               '%d_%s' % (index, target))
+    return _ExecuteCommandAndMergeProfRawFiles(target, command, profraw_dir,
+                                               run_semaphore, merge_semaphore)
+
+  pool = multiprocessing.pool.ThreadPool(
+      min(len(targets), 2 * test_jobs_count))
+  try:
+    # Results are in the same order as |targets|.
+    profdata_file_paths = pool.map(_RunAndMergeTarget,
+                                   enumerate(zip(targets, commands)))
+  finally:
+    pool.close()
+    pool.join()
+    shutil.rmtree(_GetProfrawDirectoryPath(), ignore_errors=True)
+
+  logging.debug('Finished executing the test commands.')
+
+  return profdata_file_paths
+
+
+def _ExecuteCommandAndMergeProfRawFiles(target, command, profraw_dir,
+                                        run_semaphore, merge_semaphore):
+  """Runs a target and returns the path to its merged profdata file.
+
+  Args:
+    target: The target to run.
+    command: The command used to run the target.
+    profraw_dir: A directory, owned by this target, for its profraw files.
+    run_semaphore: Limits the number of targets running at the same time.
+    merge_semaphore: Limits the number of concurrent merges.
+  """
+  output_file_name = os.extsep.join([target + '_output', 'log'])
+  output_file_path = os.path.join(_GetLogsDirectoryPath(), output_file_name)
 
-  # Run all test targets to generate profraw data files.
-  for target, command in zip(targets, commands):
-    output_file_name = os.extsep.join([target + '_output', 'log'])
-    output_file_path = os.path.join(_GetLogsDirectoryPath(), output_file_name)
+  profdata_file_path = None
+  for _ in xrange(MERGE_RETRIES):
+    if not os.path.exists(profraw_dir):
+      os.makedirs(profraw_dir)
 
-    profdata_file_path = None
-    for _ in xrange(MERGE_RETRIES):
+    with run_semaphore:
       logging.info('Running command: "%s", the output is redirected to "%s".',
                    command, output_file_path)
 
@@ -335,46 +403,44 @@ def _GetTargetProfDataPathsByExecutingCommands(targets, commands):
         # in the output of the command execution.
         output = _ExecuteIOSCommand(command, output_file_path)
       else:
-        # On other platforms, profraw files are generated inside the OUTPUT_DIR.
-        output = _ExecuteCommand(target, command, output_file_path)
-
-      profraw_file_paths = []
-      if _IsIOS():
-        profraw_file_paths = [_GetProfrawDataFileByParsingOutput(output)]
-      else:
-        for file_or_dir in os.listdir(report_root_dir):
-          if file_or_dir.endswith(PROFRAW_FILE_EXTENSION):
-            profraw_file_paths.append(
-                os.path.join(report_root_dir, file_or_dir))
+        # On other platforms, profraw files are generated inside the
+        # target's profraw directory.
+        output = _ExecuteCommand(target, command, output_file_path,
+                                 profraw_dir)
+
+    profraw_file_paths = []
+    if _IsIOS():
+      profraw_file_paths = [_GetProfrawDataFileByParsingOutput(output)]
+    else:
+      for file_or_dir in os.listdir(profraw_dir):
+        if file_or_dir.endswith(PROFRAW_FILE_EXTENSION):
+          profraw_file_paths.append(os.path.join(profraw_dir, file_or_dir))
 
-      assert profraw_file_paths, (
-          'Running target "%s" failed to generate any profraw data file, '
-          'please make sure the binary exists, is properly instrumented and '
-          'does not crash. %s' % (target, FILE_BUG_MESSAGE))
+    assert profraw_file_paths, (
+        'Running target "%s" failed to generate any profraw data file, '
+        'please make sure the binary exists, is properly instrumented and '
+        'does not crash. %s' % (target, FILE_BUG_MESSAGE))
 
-      assert isinstance(profraw_file_paths, list), (
-          'Variable \'profraw_file_paths\' is expected to be of type \'list\', '
-          'but it is a %s. %s' % (type(profraw_file_paths), FILE_BUG_MESSAGE))
+    assert isinstance(profraw_file_paths, list), (
+        'Variable \'profraw_file_paths\' is expected to be of type \'list\', '
+        'but it is a %s. %s' % (type(profraw_file_paths), FILE_BUG_MESSAGE))
 
-      try:
+    try:
+      with merge_semaphore:
         profdata_file_path = _CreateTargetProfDataFileFromProfRawFiles(
             target, profraw_file_paths)
-        break
-      except Exception:
-        logging.info('Retrying...')
-      finally:
-        # Remove profraw files now so that they are not used in next iteration.
-        for profraw_file_path in profraw_file_paths:
-          os.remove(profraw_file_path)
-
-    assert profdata_file_path, (
-        'Failed to merge target "%s" profraw files after %d retries. %s' %
-        (target, MERGE_RETRIES, FILE_BUG_MESSAGE))
-    profdata_file_paths.append(profdata_file_path)
-
-  logging.debug('Finished executing the test commands.')
-
-  return profdata_file_paths
+      break
+    except Exception:
+      logging.info('Retrying...')
+    finally:
+      # Remove profraw files now so that they are not used in next iteration.
+      for profraw_file_path in profraw_file_paths:
+        os.remove(profraw_file_path)
+
+  assert profdata_file_path, (
+      'Failed to merge target "%s" profraw files after %d retries. %s' %
+      (target, MERGE_RETRIES, FILE_BUG_MESSAGE))
+  return profdata_file_path
 
 
 def _GetEnvironmentVars(profraw_file_path):
@@ -387,8 +453,8 @@ def _GetEnvironmentVars(profraw_file_path):
   return env
 
 
-def _ExecuteCommand(target, command, output_file_path):
-  """Runs a single command and generates a profraw data file."""
+def _ExecuteCommand(target, command, output_file_path, profraw_dir):
+  """Runs a single command and generates profraw data files in profraw_dir."""
   # Per Clang "Source-based Code Coverage" doc:
   #
   # "%p" expands out to the process ID. It's not used by this scripts due to:
@@ -412,9 +478,8 @@ def _ExecuteCommand(target, command, output_file_path):
   profile_pattern_string = '%1m' if _IsFuzzerTarget(target) else '%4m'
   expected_profraw_file_name = os.extsep.join(
       [target, profile_pattern_string, PROFRAW_FILE_EXTENSION])
-  expected_profraw_file_path = os.path.join(
-      coverage_utils.GetCoverageReportRootDirPath(OUTPUT_DIR),
-      expected_profraw_file_name)
+  expected_profraw_file_path = os.path.join(profraw_dir,
+                                            expected_profraw_file_name)
   command = command.replace(LLVM_PROFILE_FILE_PATH_SUBSTITUTION,
                             expected_profraw_file_path)
 
@@ -590,13 +655,12 @@ def _GeneratePerFileCoverageSummary(binary_paths, profdata_file_path, filters,
   if ignore_filename_regex:
     subprocess_cmd.append('-ignore-filename-regex=%s' % ignore_filename_regex)
 
-  export_output = subprocess.check_output(subprocess_cmd)
-
-  # Write output on the disk to be used by code coverage bot.
+  # Stream the output to the disk: it is also used by code coverage bot, and it
+  # can be too large to be kept in memory.
   with open(_GetSummaryFilePath(), 'w') as f:
-    f.write(export_output)
+    subprocess.check_call(subprocess_cmd, stdout=f)
 
-  return export_output
+  return _GetSummaryFilePath()
 
 
 def _AddArchArgumentForIOSIfNeeded(cmd_list, num_archs):
@@ -897,6 +961,15 @@ def _ParseCommandArguments():
       'will be derived based on CPUs and goma availability. Please refer to '
       '\'autoninja -h\' for more details.')
 
+  arg_parser.add_argument(
+      '--test-jobs',
+      type=int,
+      default=1,
+      help='Run N test targets in parallel. Only use this with targets that '
+      'do not interfere with each other (e.g. by sharing ports or a display). '
+      'Regardless of this, the profraw files of a target are merged while the '
+      'next target runs.')
+
   arg_parser.add_argument(
       '-v',
       '--verbose',
@@ -950,6 +1023,8 @@ def Main():
   assert not args.command or (len(args.targets) == len(args.command)), (
       'Number of targets must be equal to the number of test commands.')
 
+  assert args.test_jobs >= 1, '--test-jobs must be a positive number.'
+
   assert os.path.exists(BUILD_DIR), (
       'Build directory: "%s" doesn\'t exist. '
       'Please run "gn gen" to generate.' % BUILD_DIR)
@@ -967,7 +1042,7 @@ def Main():
   if args.web_tests:
     commands = [_GetCommandForWebTests(args.web_tests)]
     profdata_file_path = _CreateCoverageProfileDataForTargets(
-        args.targets, commands, args.jobs)
+        args.targets, commands, args.jobs, args.test_jobs)
     binary_paths = [_GetBinaryPathForWebTests()]
   elif args.command:
     for i in range(len(args.command)):
@@ -979,7 +1054,7 @@ def Main():
     # create a list of binary paths from parsing commands.
     _VerifyTargetExecutablesAreInBuildDirectory(args.command)
     profdata_file_path = _CreateCoverageProfileDataForTargets(
-        args.targets, args.command, args.jobs)
+        args.targets, args.command, args.jobs, args.test_jobs)
     binary_paths = [_GetBinaryPath(command) for command in args.command]
   else:
     # An input prof-data file is already provided. Just calculate binary paths.
@@ -991,7 +1066,7 @@ def Main():
 
   logging.info('Generating code coverage report in html (this can take a while '
                'depending on size of target!).')
-  per_file_summary_data = _GeneratePerFileCoverageSummary(
+  summary_file_path = _GeneratePerFileCoverageSummary(
       binary_paths, profdata_file_path, absolute_filter_paths,
       args.ignore_filename_regex)
   _GeneratePerFileLineByLineCoverageInHtml(binary_paths, profdata_file_path,
@@ -1002,15 +1077,16 @@ def Main():
     component_mappings = json.load(urllib2.urlopen(COMPONENT_MAPPING_URL))
 
   # Call prepare here.
-  processor = coverage_utils.CoverageReportPostProcessor(
-      OUTPUT_DIR,
-      SRC_ROOT_PATH,
-      per_file_summary_data,
-      no_component_view=args.no_component_view,
-      no_file_view=args.no_file_view,
-      component_mappings=component_mappings)
-
-  processor.PrepareHtmlReport()
+  with open(summary_file_path) as summary_file:
+    processor = coverage_utils.CoverageReportPostProcessor(
+        OUTPUT_DIR,
+        SRC_ROOT_PATH,
+        summary_file,
+        no_component_view=args.no_component_view,
+        no_file_view=args.no_file_view,
+        component_mappings=component_mappings)
+
+    processor.PrepareHtmlReport()
 
 
 if __name__ == '__main__':
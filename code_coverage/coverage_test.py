@@ -4,14 +4,26 @@
 # found in the LICENSE file.
 """Tests for code coverage tools."""
 
+import json
 import os
 import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from collections import defaultdict
 
+import coverage
 import coverage_utils
 
+SRC = os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)
+sys.path.append(os.path.join(SRC, 'third_party', 'pymock'))
+
+import mock
+
 
 def _RecursiveDirectoryListing(dirpath):
   """Returns a list of relative paths to all files in a given directory."""
@@ -28,6 +40,182 @@ def _ReadFile(filepath):
     return f.read()
 
 
+def _MakeExportJson(src_root_dir, files, num_data_entries=1):
+  """Returns a llvm-cov export -summary-only output for |files|.
+
+  Args:
+    files: A dict of relative file path -> (lines total, lines covered).
+  """
+  files_data = []
+  for path, (total, covered) in sorted(files.items()):
+    files_data.append({
+        'filename': os.path.join(src_root_dir, path),
+        'summary': {
+            'lines': {'count': total, 'covered': covered, 'percent': 0},
+            'regions': {'count': 2 * total, 'covered': covered,
+                        'notcovered': 2 * total - covered, 'percent': 0},
+            'functions': {'count': 1, 'covered': 1, 'percent': 100},
+            'instantiations': {'count': 1, 'covered': 1, 'percent': 100},
+        },
+    })
+  entry = {'files': files_data, 'totals': {'lines': {'count': 0}}}
+  return json.dumps({
+      'data': [entry] * num_data_entries,
+      'type': 'llvm.coverage.json.export',
+      'version': '2.0.0',
+  }, indent=1)
+
+
+def _IterChunks(data, chunk_size):
+  for i in range(0, len(data), chunk_size):
+    yield data[i:i + chunk_size]
+
+
+class CoverageUtilsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.src_root_dir = tempfile.mkdtemp()
+    self.files = {
+        'a.cc': (10, 5),
+        'base/b.cc': (20, 0),
+        'base/c.h': (3, 3),
+        'base/strings/d.cc': (7, 1),
+        # Brackets, commas and quotes in file names are part of the strings.
+        'third_party/x/y/[e],"files".cc': (1, 1),
+        'third_party/x/z/f.cc': (4, 2),
+        'empty.cc': (0, 0),
+    }
+
+  def tearDown(self):
+    shutil.rmtree(self.src_root_dir)
+
+  def _CreatePostProcessor(self, summary_data):
+    return coverage_utils.CoverageReportPostProcessor(
+        os.path.join(self.src_root_dir, 'out'), self.src_root_dir,
+        summary_data, no_component_view=True, no_file_view=False)
+
+  def test_iter_files_coverage_data_matches_json_load(self):
+    export_json = _MakeExportJson(self.src_root_dir, self.files)
+    expected = json.loads(export_json)['data'][0]['files']
+    for chunk_size in (1, 2, 7, 64, len(export_json)):
+      self.assertEqual(
+          expected,
+          list(coverage_utils._IterFilesCoverageData(
+              _IterChunks(export_json, chunk_size))))
+
+  def test_iter_files_coverage_data_requires_single_data_entry(self):
+    export_json = _MakeExportJson(
+        self.src_root_dir, self.files, num_data_entries=2)
+    with self.assertRaises(AssertionError):
+      list(coverage_utils._IterFilesCoverageData(_IterChunks(export_json, 5)))
+
+  def test_iter_files_coverage_data_truncated(self):
+    export_json = _MakeExportJson(self.src_root_dir, self.files)
+    truncated = export_json[:export_json.index('base/c.h')]
+    with self.assertRaises(ValueError):
+      list(coverage_utils._IterFilesCoverageData(_IterChunks(truncated, 5)))
+
+  def test_per_directory_summary_matches_per_file_walk(self):
+    export_json = _MakeExportJson(self.src_root_dir, self.files)
+    processor = self._CreatePostProcessor(export_json)
+    per_file_coverage_summary = processor.GeneratePerFileCoverageSummary()
+    self.assertNotIn(
+        os.path.join(self.src_root_dir, 'empty.cc'), per_file_coverage_summary)
+
+    # The summaries computed by walking up the directories of each file.
+    expected = defaultdict(lambda: coverage_utils.CoverageSummary())
+    for file_path, summary in per_file_coverage_summary.items():
+      parent_dir = os.path.dirname(file_path)
+      while True:
+        expected[parent_dir].AddSummary(summary)
+        if (os.path.normpath(parent_dir) ==
+            os.path.normpath(processor.src_root_dir)):
+          break
+        parent_dir = os.path.dirname(parent_dir)
+
+    actual = processor.CalculatePerDirectoryCoverageSummary(
+        per_file_coverage_summary)
+    self.assertEqual(sorted(expected), sorted(actual))
+    for dir_path in expected:
+      self.assertEqual(expected[dir_path].Get(), actual[dir_path].Get())
+    self.assertEqual(
+        {'total': 45, 'covered': 12},
+        actual[os.path.normpath(self.src_root_dir)].Get()['lines'])
+
+
+class ExecuteCommandsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.output_dir = tempfile.mkdtemp()
+    os.makedirs(coverage_utils.GetCoverageReportRootDirPath(self.output_dir))
+    self.lock = threading.Lock()
+    self.running = 0
+    self.max_running = 0
+    self.profraw_dirs = {}
+    self.merged_profraw_file_paths = {}
+
+    for name, value in (('OUTPUT_DIR', self.output_dir),
+                        ('_IsIOS', lambda: False),
+                        ('_IsIOSCommand', lambda command: False),
+                        ('_ExecuteCommand', self._ExecuteCommand),
+                        ('_CreateTargetProfDataFileFromProfRawFiles',
+                         self._CreateTargetProfDataFile)):
+      patcher = mock.patch.object(coverage, name, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self.output_dir)
+
+  def _ExecuteCommand(self, target, command, output_file_path, profraw_dir):
+    with self.lock:
+      self.running += 1
+      self.max_running = max(self.max_running, self.running)
+      self.profraw_dirs[target] = profraw_dir
+    time.sleep(0.1)
+    with open(os.path.join(profraw_dir, target + '.profraw'), 'w'):
+      pass
+    with self.lock:
+      self.running -= 1
+    return ''
+
+  def _CreateTargetProfDataFile(self, target, profraw_file_paths):
+    self.merged_profraw_file_paths[target] = profraw_file_paths
+    return os.path.join(self.output_dir, '%s.profdata' % target)
+
+  def _Run(self, targets, test_jobs_count):
+    commands = ['%s --flag' % target for target in targets]
+    return coverage._GetTargetProfDataPathsByExecutingCommands(
+        targets, commands, test_jobs_count)
+
+  def test_targets_use_separate_profraw_dirs(self):
+    targets = ['a_unittests', 'b_unittests', 'c_unittests']
+    self.assertEqual(
+        [os.path.join(self.output_dir, '%s.profdata' % t) for t in targets],
+        self._Run(targets, 3))
+
+    profraw_dirs = [self.profraw_dirs[t] for t in targets]
+    self.assertEqual(len(targets), len(set(profraw_dirs)))
+    for target, profraw_dir in zip(targets, profraw_dirs):
+      self.assertEqual(coverage._GetProfrawDirectoryPath(),
+                       os.path.dirname(profraw_dir))
+      self.assertEqual([os.path.join(profraw_dir, target + '.profraw')],
+                       self.merged_profraw_file_paths[target])
+    self.assertFalse(os.path.exists(coverage._GetProfrawDirectoryPath()))
+
+  def test_test_jobs_limit(self):
+    targets = ['target_%d' % i for i in range(6)]
+    self._Run(targets, 2)
+    self.assertEqual(2, self.max_running)
+    self.assertEqual(sorted(targets), sorted(self.merged_profraw_file_paths))
+
+  def test_single_test_job(self):
+    targets = ['target_%d' % i for i in range(3)]
+    self._Run(targets, 1)
+    self.assertEqual(1, self.max_running)
+    self.assertEqual(sorted(targets), sorted(self.merged_profraw_file_paths))
+
+
 class CoverageTest(unittest.TestCase):
 
   def setUp(self):
@@ -10,6 +10,7 @@ import functools
 import jinja2
 import json
 import logging
+import multiprocessing
 import os
 import re
 import shutil
@@ -25,6 +26,20 @@ DIRECTORY_VIEW_INDEX_FILE = os.extsep.join(['directory_view_index', 'html'])
 FILE_VIEW_INDEX_FILE = os.extsep.join(['file_view_index', 'html'])
 INDEX_HTML_FILE = os.extsep.join(['index', 'html'])
 
+# Size of the chunks in which the llvm-cov export output is read.
+_EXPORT_READ_CHUNK_SIZE = 1 << 20
+
+# Matches whitespace and separators between the entries of a JSON array.
+_JSON_ARRAY_SEPARATOR_RE = re.compile(r'[\s,]*')
+_JSON_WHITESPACE_RE = re.compile(r'\s*')
+
+# Loaded once per process by _GetHtmlTemplates.
+_html_templates = None
+
+# The state shared with the worker processes rendering the per-directory html
+# reports. It is set before forking them, so that it is not pickled.
+_directory_html_worker_args = None
+
 
 class CoverageSummary(object):
   """Encapsulates coverage summary representation."""
@@ -64,6 +79,102 @@ class CoverageSummary(object):
           'covered']
 
 
+def _GetHtmlTemplates():
+  """Returns the (header, table, footer) templates and the style overrides."""
+  global _html_templates
+  if _html_templates is None:
+    source_dir = os.path.dirname(os.path.realpath(__file__))
+    template_dir = os.path.join(source_dir, 'html_templates')
+
+    jinja_env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(template_dir), trim_blocks=True)
+    with open(os.path.join(source_dir, 'static', 'css', 'style.css')) as f:
+      style_overrides = f.read()
+    _html_templates = (jinja_env.get_template('header.html'),
+                       jinja_env.get_template('table.html'),
+                       jinja_env.get_template('footer.html'), style_overrides)
+  return _html_templates
+
+
+def _IterFilesCoverageData(chunks):
+  """Yields the entries of data[0]['files'] of a llvm-cov export JSON.
+
+  Args:
+    chunks: An iterable of strings which, concatenated, form the JSON.
+
+  The entries are decoded one at a time, so that the export output (which can
+  be huge) never needs to be loaded in memory as a whole. Once they are all
+  read, the rest of the output is checked to hold a single data entry.
+  """
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  buf = ''
+
+  # Skip everything up to the beginning of the 'files' array.
+  while True:
+    key_pos = buf.find('"files"')
+    array_pos = buf.find('[', key_pos) if key_pos != -1 else -1
+    if array_pos != -1:
+      break
+    chunk = next(chunks, None)
+    assert chunk is not None, 'No files in the coverage summary.'
+    buf += chunk
+  pos = array_pos + 1
+
+  while True:
+    pos = _JSON_ARRAY_SEPARATOR_RE.match(buf, pos).end()
+    if pos < len(buf):
+      if buf[pos] == ']':
+        _CheckSingleDataEntry(buf[pos + 1:] + ''.join(chunks))
+        return
+      try:
+        entry, pos = decoder.raw_decode(buf, pos)
+        yield entry
+        continue
+      except ValueError:
+        pass  # The entry is incomplete, read more data.
+    chunk = next(chunks, None)
+    if chunk is None:
+      raise ValueError('Truncated coverage summary.')
+    buf = buf[pos:] + chunk
+    pos = 0
+
+
+def _CheckSingleDataEntry(rest):
+  """Checks that data[0] is the only entry of the llvm-cov export data array.
+
+  Args:
+    rest: The end of the export output, after data[0]['files'] (e.g. the
+          totals). It is small.
+  """
+  decoder = json.JSONDecoder()
+
+  def skip_whitespace(pos):
+    return _JSON_WHITESPACE_RE.match(rest, pos).end()
+
+  # Skip the remaining members of data[0].
+  pos = skip_whitespace(0)
+  while rest[pos:pos + 1] == ',':
+    _, pos = decoder.raw_decode(rest, skip_whitespace(pos + 1))
+    pos = skip_whitespace(pos)
+    assert rest[pos:pos + 1] == ':', 'Malformed coverage summary.'
+    _, pos = decoder.raw_decode(rest, skip_whitespace(pos + 1))
+    pos = skip_whitespace(pos)
+  assert rest[pos:pos + 1] == '}', 'Malformed coverage summary.'
+  pos = skip_whitespace(pos + 1)
+  assert rest[pos:pos + 1] == ']', (
+      'Expected a single data entry in the coverage summary.')
+
+
+def _GenerateCoverageInHtmlForDirectoriesInWorker(dir_paths):
+  """Worker process entry point for GeneratePerDirectoryCoverageInHtml."""
+  (post_processor, per_directory_coverage_summary,
+   per_file_coverage_summary) = _directory_html_worker_args
+  for dir_path in dir_paths:
+    post_processor.GenerateCoverageInHtmlForDirectory(
+        dir_path, per_directory_coverage_summary, per_file_coverage_summary)
+
+
 class CoverageReportHtmlGenerator(object):
   """Encapsulates coverage html report generation.
 
@@ -94,17 +205,8 @@ class CoverageReportHtmlGenerator(object):
     self._table_entries = []
     self._total_entry = {}
 
-    source_dir = os.path.dirname(os.path.realpath(__file__))
-    template_dir = os.path.join(source_dir, 'html_templates')
-
-    jinja_env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(template_dir), trim_blocks=True)
-    self._header_template = jinja_env.get_template('header.html')
-    self._table_template = jinja_env.get_template('table.html')
-    self._footer_template = jinja_env.get_template('footer.html')
-
-    self._style_overrides = open(
-        os.path.join(source_dir, 'static', 'css', 'style.css')).read()
+    (self._header_template, self._table_template, self._footer_template,
+     self._style_overrides) = _GetHtmlTemplates()
 
   def AddLinkToAnotherReport(self, html_report_path, name, summary):
     """Adds a link to another html report in this report.
@@ -238,17 +340,26 @@ class CoverageReportPostProcessor(object):
                no_component_view,
                no_file_view,
                component_mappings={},
-               path_equivalence=None):
-    """Initializes CoverageReportPostProcessor object."""
+               path_equivalence=None,
+               jobs=None):
+    """Initializes CoverageReportPostProcessor object.
+
+    Args:
+      summary_data: The output of "llvm-cov export -summary-only", either as a
+                    string or as a file object. A file object is parsed as a
+                    stream and must be kept open until PrepareHtmlReport.
+      jobs: Number of worker processes rendering the html reports. If None, it
+            defaults to the number of CPUs.
+    """
     # Caller provided parameters.
     self.output_dir = output_dir
     self.src_root_dir = os.path.normpath(GetFullPath(src_root_dir))
     if not self.src_root_dir.endswith(os.sep):
       self.src_root_dir += os.sep
-    self.summary_data = json.loads(summary_data)
-    assert len(self.summary_data['data']) == 1
+    self.summary_data = summary_data
     self.no_component_view = no_component_view
     self.no_file_view = no_file_view
+    self.jobs = jobs or multiprocessing.cpu_count()
 
     # Mapping from components to directories
     self.component_to_directories = None
@@ -309,20 +420,34 @@ class CoverageReportPostProcessor(object):
     return path.replace(self.path_map[0], self.path_map[1], 1)
 
   def CalculatePerDirectoryCoverageSummary(self, per_file_coverage_summary):
-    """Calculates per directory coverage summary."""
+    """Calculates per directory coverage summary.
+
+    Files are added to their directory only, then the directory summaries are
+    rolled up into their parents in a single bottom-up pass.
+    """
     logging.debug('Calculating per-directory coverage summary.')
     per_directory_coverage_summary = defaultdict(lambda: CoverageSummary())
+    src_root_dir = os.path.normpath(self.src_root_dir)
 
     for file_path in per_file_coverage_summary:
-      summary = per_file_coverage_summary[file_path]
-      parent_dir = os.path.dirname(file_path)
-
-      while True:
-        per_directory_coverage_summary[parent_dir].AddSummary(summary)
+      per_directory_coverage_summary[os.path.dirname(file_path)].AddSummary(
+          per_file_coverage_summary[file_path])
 
-        if os.path.normpath(parent_dir) == os.path.normpath(self.src_root_dir):
+    # Create the (possibly empty) summaries of all the ancestor directories.
+    for dir_path in list(per_directory_coverage_summary):
+      while os.path.normpath(dir_path) != src_root_dir:
+        dir_path = os.path.dirname(dir_path)
+        if dir_path in per_directory_coverage_summary:
           break
-        parent_dir = os.path.dirname(parent_dir)
+        per_directory_coverage_summary[dir_path] = CoverageSummary()
+
+    # A parent path is always shorter than its children's. Hence, visiting the
+    # longest paths first, a directory is complete when added to its parent.
+    for dir_path in sorted(per_directory_coverage_summary, key=len,
+                           reverse=True):
+      if os.path.normpath(dir_path) != src_root_dir:
+        per_directory_coverage_summary[os.path.dirname(dir_path)].AddSummary(
+            per_directory_coverage_summary[dir_path])
 
     logging.debug('Finished calculating per-directory coverage summary.')
     return per_directory_coverage_summary
@@ -454,10 +579,13 @@ class CoverageReportPostProcessor(object):
 
   def GeneratePerFileCoverageSummary(self):
     """Generate per file coverage summary using coverage data in JSON format."""
-    files_coverage_data = self.summary_data['data'][0]['files']
+    if hasattr(self.summary_data, 'read'):
+      chunks = iter(lambda: self.summary_data.read(_EXPORT_READ_CHUNK_SIZE), '')
+    else:
+      chunks = [self.summary_data]
 
     per_file_coverage_summary = {}
-    for file_coverage_data in files_coverage_data:
+    for file_coverage_data in _IterFilesCoverageData(chunks):
       file_path = file_coverage_data['filename']
       assert file_path.startswith(self.src_root_dir), (
           'File path "%s" in coverage summary is outside source checkout.' %
@@ -480,11 +608,33 @@ class CoverageReportPostProcessor(object):
 
   def GeneratePerDirectoryCoverageInHtml(self, per_directory_coverage_summary,
                                          per_file_coverage_summary):
-    """Generates per directory coverage breakdown in html."""
+    """Generates per directory coverage breakdown in html.
+
+    The reports are rendered by |self.jobs| worker processes, which inherit the
+    summaries from this process (fork) rather than receiving them pickled.
+    """
     logging.debug('Writing per-directory coverage html reports.')
-    for dir_path in per_directory_coverage_summary:
-      self.GenerateCoverageInHtmlForDirectory(
-          dir_path, per_directory_coverage_summary, per_file_coverage_summary)
+    dir_paths = list(per_directory_coverage_summary)
+    jobs = min(self.jobs, len(dir_paths))
+    if jobs <= 1 or sys.platform == 'win32':
+      for dir_path in dir_paths:
+        self.GenerateCoverageInHtmlForDirectory(
+            dir_path, per_directory_coverage_summary, per_file_coverage_summary)
+    else:
+      global _directory_html_worker_args
+      _directory_html_worker_args = (self, per_directory_coverage_summary,
+                                     per_file_coverage_summary)
+      # Interleave the directories, so that the large (top level) ones are
+      # spread across workers.
+      num_tasks = jobs * 4
+      tasks = [dir_paths[i::num_tasks] for i in range(num_tasks)]
+      pool = multiprocessing.Pool(jobs)
+      try:
+        pool.map(_GenerateCoverageInHtmlForDirectoriesInWorker, tasks)
+      finally:
+        pool.close()
+        pool.join()
+        _directory_html_worker_args = None
 
     logging.debug('Finished writing per-directory coverage html reports.')
 
@@ -762,17 +912,15 @@ def _CmdSharedLibraries(args):
 
 def _CmdPostProcess(args):
   """Handles 'post_process' command."""
-  with open(args.summary_file) as f:
-    summary_data = f.read()
-
-  processor = CoverageReportPostProcessor(
-      args.output_dir,
-      args.src_root_dir,
-      summary_data,
-      no_component_view=True,
-      no_file_view=False,
-      path_equivalence=args.path_equivalence)
-  processor.PrepareHtmlReport()
+  with open(args.summary_file) as summary_file:
+    processor = CoverageReportPostProcessor(
+        args.output_dir,
+        args.src_root_dir,
+        summary_file,
+        no_component_view=True,
+        no_file_view=False,
+        path_equivalence=args.path_equivalence)
+    processor.PrepareHtmlReport()
 
 
 def Main():
@@ -8,17 +8,39 @@
 its content.
 """
 
+import argparse
 import array
 import collections
 import hashlib
 import logging
+import mmap
+import multiprocessing
 import os
+import sqlite3
 import struct
-import sys
+import tempfile
 import zlib
 
 
 PAGE_SIZE = 1 << 12
+_ZERO_PAGE = '\0' * PAGE_SIZE
+# Number of pages analyzed by each worker task.
+_PAGES_PER_TASK = 1 << 14
+# Number of pages scanned for freed patterns at a time.
+_PAGES_PER_SCAN = 1 << 8
+# These are typically only populated with DCHECK() on.
+_FREED_PATTERNS = (0xcccccccc,  # V8
+                   0xcdcdcdcd,  # PartitionAlloc "zapped"
+                   0xabababab,  # PartitionAlloc "uninitialized"
+                   0xdeadbeef,  # V8 "zapped"
+                   0x0baddeaf,  # V8 zapped handles
+                   0x0baffedf,  # V8 zapped global handles
+                   0x0beefdaf,  # V8 zapped from space
+                   0xbeefdeef,  # V8 zapped slots
+                   0xbadbaddb,  # V8 debug zapped
+                   0xfeed1eaf)  # V8 zapped freelist
+# In native byte order, to match array.array('I').
+_FREED_PATTERN_STRINGS = tuple(struct.pack('=I', x) for x in _FREED_PATTERNS)
 
 
 def _ReadPage(f):
@@ -90,83 +112,170 @@ class MappingStats(object):
     self.freed = 0
 
 
-def _GetStatsFromFileDump(filename):
-  """Computes per-dump statistics.
+def _AnalyzePages(filename, first_page, end_page):
+  """Computes statistics for a range of pages of a dump.
+
+  Runs in a worker process, so results are returned as compact strings rather
+  than as lists.
 
   Args:
     filename: (str) Path to the dump.
+    first_page: (int) Index of the first page to analyze.
+    end_page: (int) Index of the page after the last one to analyze.
 
   Returns:
-    MappingStats for the mapping.
+    (freed, is_zero, compressed_sizes, hashes), where |freed| is the number of
+    bytes matching a freed pattern, |is_zero| has a '\1' for each zero page,
+    |compressed_sizes| is an array.array('I') of the compressed size of each
+    page (0 for zero pages) and |hashes| is the concatenated SHA1 digests of
+    the non-zero pages.
+  """
+  freed = 0
+  is_zero = []
+  compressed_sizes = array.array('I')
+  hashes = []
+  with open(filename, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    for scan_start in xrange(first_page, end_page, _PAGES_PER_SCAN):
+      scan_end = min(scan_start + _PAGES_PER_SCAN, end_page)
+      chunk = data[scan_start * PAGE_SIZE:scan_end * PAGE_SIZE]
+      # Unaligned matches are possible, so this is only a fast filter for the
+      # common case of chunks that contain no freed pattern at all.
+      if any(p in chunk for p in _FREED_PATTERN_STRINGS):
+        words = array.array('I')
+        words.fromstring(chunk)
+        freed += 4 * sum(words.count(x) for x in _FREED_PATTERNS)
+      for offset in xrange(0, len(chunk), PAGE_SIZE):
+        page = chunk[offset:offset + PAGE_SIZE]
+        if page == _ZERO_PAGE:
+          is_zero.append('\1')
+          compressed_sizes.append(0)
+        else:
+          is_zero.append('\0')
+          compressed_sizes.append(len(zlib.compress(page, 1)))
+          hashes.append(hashlib.sha1(page).digest())
+  finally:
+    data.close()
+  return freed, ''.join(is_zero), compressed_sizes.tostring(), ''.join(hashes)
+
+
+def _AnalyzePagesTask(args):
+  return args[:2], _AnalyzePages(*args)
+
+
+def _IterAnalyzedPages(tasks):
+  """Analyzes page ranges in parallel.
+
+  Args:
+    tasks: ([(str, int, int)]) (filename, first_page, end_page) tuples.
+
+  Yields:
+    ((filename, first_page), page_stats) as they complete, where |page_stats|
+    is the return value of _AnalyzePages().
+  """
+  pool = multiprocessing.Pool()
+  try:
+    for result in pool.imap_unordered(_AnalyzePagesTask, tasks):
+      yield result
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+
+
+def _TasksForDump(filename, pages):
+  return [(filename, i, min(i + _PAGES_PER_TASK, pages))
+          for i in xrange(0, pages, _PAGES_PER_TASK)]
+
+
+def _CheckDump(filename):
+  """Checks the integrity of a dump and its metadata.
+
+  Args:
+    filename: (str) Path to the dump.
+
+  Returns:
+    (pid, start, end) of the dumped mapping.
   """
-  # These are typically only populated with DCHECK() on.
-  FREED_PATTERNS = (0xcccccccc,  # V8
-                    0xcdcdcdcd,  # PartitionAlloc "zapped"
-                    0xabababab,  # PartitionAlloc "uninitialized"
-                    0xdeadbeef,  # V8 "zapped"
-                    0x0baddeaf,  # V8 zapped handles
-                    0x0baffedf,  # V8 zapped global handles
-                    0x0beefdaf,  # V8 zapped from space
-                    0xbeefdeef,  # V8 zapped slots
-                    0xbadbaddb,  # V8 debug zapped
-                    0xfeed1eaf)  # V8 zapped freelist
-  # Dump integrity checks.
   metadata_filename = filename + '.metadata'
   pid_start_end = os.path.basename(filename)[:-len('.dump')]
-  (_, start, end) = [int(x, 10) for x in pid_start_end.split('-')]
+  (pid, start, end) = [int(x, 10) for x in pid_start_end.split('-')]
   file_stat = os.stat(filename)
   assert start % PAGE_SIZE == 0
   assert end % PAGE_SIZE == 0
   assert file_stat.st_size == (end - start)
   metadata_file_stat = os.stat(metadata_filename)
-  result = MappingStats(filename, start, end)
   # each line is [01]{2}\n, eg '10\n', 1 line per page.
-  assert metadata_file_stat.st_size == 3 * result.pages
-
-  with open(filename, 'r') as f, open(metadata_filename, 'r') as metadata_f:
-    for i in range(result.pages):
-      page = _ReadPage(f)
-      assert len(page) == 1024
-      result.freed += 4 * sum(x in FREED_PATTERNS for x in page)
-      is_zero = max(page) == 0
-      present, swapped = (bool(int(x)) for x in metadata_f.readline().strip())
+  assert metadata_file_stat.st_size == 3 * (end - start) / PAGE_SIZE
+  return pid, start, end
+
+
+def _GetStatsFromFileDumps(filenames):
+  """Computes per-dump statistics.
+
+  Dumps are memory-mapped and split into page ranges that are analyzed in
+  parallel.
+
+  Args:
+    filenames: ([str]) Paths to the dumps.
+
+  Returns:
+    [MappingStats], one for each dump.
+  """
+  results = []
+  tasks = []
+  for filename in filenames:
+    _, start, end = _CheckDump(filename)
+    result = MappingStats(filename, start, end)
+    with open(filename + '.metadata', 'r') as metadata_f:
+      metadata = metadata_f.read()
+    result.is_present = [c == '1' for c in metadata[0::3]]
+    result.is_swapped = [c == '1' for c in metadata[1::3]]
+    results.append(result)
+    tasks.extend(_TasksForDump(filename, result.pages))
+
+  result_by_filename = {result.filename: result for result in results}
+  for (filename, first_page), page_stats in _IterAnalyzedPages(tasks):
+    result = result_by_filename[filename]
+    freed, is_zero, compressed_sizes, hashes = page_stats
+    result.freed += freed
+    sizes = array.array('I')
+    sizes.fromstring(compressed_sizes)
+    end_page = first_page + len(sizes)
+    result.compressed_size[first_page:end_page] = sizes.tolist()
+    result.is_zero[first_page:end_page] = [c == '\1' for c in is_zero]
+    hash_offset = 0
+    for i in xrange(first_page, end_page):
+      if not result.is_zero[i]:
+        result.hashes[i] = hashes[hash_offset:hash_offset + 20]
+        hash_offset += 20
+
+  for result in results:
+    for is_zero, present, swapped in zip(
+        result.is_zero, result.is_present, result.is_swapped):
       # Not present, not swapped private anonymous == lazily initialized zero
       # page.
       if not present and not swapped:
         assert is_zero
-      result.is_zero[i] = is_zero
-      result.is_present[i] = present
-      result.is_swapped[i] = swapped
-      if not is_zero:
-        sha1 = hashlib.sha1()
-        sha1.update(page)
-        page_hash = sha1.digest()
-        result.hashes[i] = page_hash
-        compressed = zlib.compress(page, 1)
-        result.compressed_size[i] = len(compressed)
-  return result
+  return results
 
 
-def _FindPageFromHash(mappings, page_hash):
-  """Returns a page with a given hash from a list of mappings.
+def _ReadPageAt(filename, index):
+  """Reads a page of data from a dump.
 
   Args:
-    mappings: ([MappingStats]) List of mappings.
-    page_hash: (str) Page hash to look for,
+    filename: (str) Path to the dump.
+    index: (int) Index of the page within the dump.
 
   Returns:
     array.array(uint32_t) with the page content
   """
-  for mapping in mappings:
-    for i in range(mapping.pages):
-      if mapping.hashes[i] == page_hash:
-        with open(mapping.filename, 'r') as f:
-          f.seek(i * PAGE_SIZE)
-          page = _ReadPage(f)
-          sha1 = hashlib.sha1()
-          sha1.update(page)
-          assert page_hash == sha1.digest()
-          return page
+  with open(filename, 'rb') as f:
+    f.seek(index * PAGE_SIZE)
+    return _ReadPage(f)
 
 
 def _PrintPage(page):
@@ -177,14 +286,35 @@ def _PrintPage(page):
       print
 
 
+def _IndexPageHashes(dump_stats):
+  """Indexes the non-zero pages of dumps by content.
+
+  Args:
+    dump_stats: ([MappingStats]) Statistics of the dumps.
+
+  Returns:
+    (content_to_count, page_location_by_hash), where |content_to_count| maps a
+    page hash to its number of occurrences, and |page_location_by_hash| maps
+    it to the (filename, page index) of its first occurrence.
+  """
+  content_to_count = collections.defaultdict(int)
+  page_location_by_hash = {}
+  for stats in dump_stats:
+    for i, page_hash in enumerate(stats.hashes):
+      if page_hash:
+        content_to_count[page_hash] += 1
+        if page_hash not in page_location_by_hash:
+          page_location_by_hash[page_hash] = (stats.filename, i)
+  return content_to_count, page_location_by_hash
+
+
 def PrintStats(dumps):
   """Logs statistics about a process mappings dump.
 
   Args:
     dumps: ([str]) List of dumps.
   """
-  dump_stats = [_GetStatsFromFileDump(filename) for filename in dumps]
-  content_to_count = collections.defaultdict(int)
+  dump_stats = _GetStatsFromFileDumps(dumps)
   total_pages = sum(stats.pages for stats in dump_stats)
   total_zero_pages = sum(sum(stats.is_zero) for stats in dump_stats)
   total_compressed_size = sum(sum(stats.compressed_size)
@@ -197,11 +327,7 @@ def PrintStats(dumps):
       for stats in dump_stats)
   total_freed_space = sum(stats.freed for stats in dump_stats)
 
-  content_to_count = collections.defaultdict(int)
-  for stats in dump_stats:
-    for page_hash in stats.hashes:
-      if page_hash:
-        content_to_count[page_hash] += 1
+  content_to_count, page_location_by_hash = _IndexPageHashes(dump_stats)
 
   print 'Total pages = %d (%s)' % (total_pages,
                                    _PrettyPrintSize(total_pages * PAGE_SIZE))
@@ -230,22 +356,203 @@ def PrintStats(dumps):
   print 'Freed = %d (%s)' % (
       total_freed_space, _PrettyPrintSize(total_freed_space))
   print 'Top Duplicated Pages:'
-  for i in range(10):
-    count, page_hash = count_and_hashes[i]
+  for count, page_hash in count_and_hashes[:10]:
     print '%d common pages' % count
-    page = _FindPageFromHash(dump_stats, page_hash)
+    page = _ReadPageAt(*page_location_by_hash[page_hash])
     _PrintPage(page)
     print
 
 
+class PageIndex(object):
+  """On-disk index of the non-zero pages of dumps from many processes.
+
+  Holds one row per non-zero page, so that memory use does not depend on the
+  number of pages. A process is a (directory, pid) pair.
+  """
+
+  def __init__(self, path):
+    self._conn = sqlite3.connect(path)
+    self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS processes (
+            id INTEGER PRIMARY KEY, directory TEXT, pid INTEGER);
+        CREATE TABLE IF NOT EXISTS mappings (
+            id INTEGER PRIMARY KEY, process_id INTEGER, filename TEXT,
+            pages INTEGER);
+        CREATE TABLE IF NOT EXISTS pages (hash BLOB, mapping_id INTEGER);
+        """)
+
+  def Close(self):
+    self._conn.close()
+
+  def HasDirectory(self, directory):
+    return self._conn.execute(
+        'SELECT 1 FROM processes WHERE directory = ?',
+        (directory,)).fetchone() is not None
+
+  def AddDirectory(self, directory):
+    """Adds all dumps from |directory| to the index."""
+    process_ids = {}
+    mapping_ids = {}
+    tasks = []
+    for filename in sorted(os.listdir(directory)):
+      if not filename.endswith('.dump'):
+        continue
+      filename = os.path.join(directory, filename)
+      pid, start, end = _CheckDump(filename)
+      if pid not in process_ids:
+        process_ids[pid] = self._conn.execute(
+            'INSERT INTO processes (directory, pid) VALUES (?, ?)',
+            (directory, pid)).lastrowid
+      pages = (end - start) / PAGE_SIZE
+      mapping_ids[filename] = self._conn.execute(
+          'INSERT INTO mappings (process_id, filename, pages) VALUES (?, ?, ?)',
+          (process_ids[pid], filename, pages)).lastrowid
+      tasks.extend(_TasksForDump(filename, pages))
+
+    for (filename, _), page_stats in _IterAnalyzedPages(tasks):
+      hashes = page_stats[3]
+      mapping_id = mapping_ids[filename]
+      self._conn.executemany(
+          'INSERT INTO pages (hash, mapping_id) VALUES (?, ?)',
+          ((sqlite3.Binary(hashes[i:i + 20]), mapping_id)
+           for i in xrange(0, len(hashes), 20)))
+    self._conn.commit()
+
+  def ComputeSharing(self):
+    """Computes which page contents are present in more than one process."""
+    self._conn.executescript("""
+        DROP TABLE IF EXISTS process_hashes;
+        CREATE TABLE process_hashes AS
+            SELECT DISTINCT pages.hash AS hash,
+                            mappings.process_id AS process_id
+            FROM pages JOIN mappings ON pages.mapping_id = mappings.id;
+        CREATE INDEX process_hashes_hash ON process_hashes (hash);
+        DROP TABLE IF EXISTS shared_hashes;
+        CREATE TABLE shared_hashes AS
+            SELECT hash, COUNT(*) AS num_processes FROM process_hashes
+            GROUP BY hash HAVING COUNT(*) > 1;
+        CREATE INDEX shared_hashes_hash ON shared_hashes (hash);
+        """)
+
+  def TotalStats(self):
+    """Returns (pages, unique_pages, cross_process_duplicate_pages).
+
+    |cross_process_duplicate_pages| is the number of non-zero pages that would
+    be saved if each page content was shared by all processes that have it.
+    """
+    pages, unique_pages = self._conn.execute(
+        'SELECT COUNT(*), COUNT(DISTINCT hash) FROM pages').fetchone()
+    duplicate_pages = self._conn.execute(
+        'SELECT TOTAL(num_processes - 1) FROM shared_hashes').fetchone()[0]
+    return pages, unique_pages, int(duplicate_pages)
+
+  def SharedPagesByMapping(self):
+    """Returns [(directory, pid, filename, pages, shared_pages)].
+
+    |shared_pages| is the number of pages of the mapping whose content is
+    present in at least one other process. Sorted by decreasing shared_pages.
+    """
+    return self._conn.execute("""
+        SELECT processes.directory, processes.pid, mappings.filename,
+               mappings.pages, COUNT(*) AS shared_pages
+        FROM pages
+            JOIN mappings ON pages.mapping_id = mappings.id
+            JOIN processes ON mappings.process_id = processes.id
+        WHERE pages.hash IN (SELECT hash FROM shared_hashes)
+        GROUP BY pages.mapping_id
+        ORDER BY shared_pages DESC, mappings.filename""").fetchall()
+
+  def SharedPagesByProcessPair(self):
+    """Returns [(directory1, pid1, directory2, pid2, shared_pages)].
+
+    |shared_pages| is the number of distinct page contents present in both
+    processes. Sorted by decreasing shared_pages.
+    """
+    return self._conn.execute("""
+        SELECT p1.directory, p1.pid, p2.directory, p2.pid,
+               COUNT(*) AS shared_pages
+        FROM process_hashes a
+            JOIN process_hashes b
+                ON a.hash = b.hash AND a.process_id < b.process_id
+            JOIN processes p1 ON a.process_id = p1.id
+            JOIN processes p2 ON b.process_id = p2.id
+        GROUP BY a.process_id, b.process_id
+        ORDER BY shared_pages DESC, p1.id, p2.id""").fetchall()
+
+
+def PrintCrossProcessStats(directories, index_path, max_rows=20):
+  """Logs how much memory could be shared across processes.
+
+  Args:
+    directories: ([str]) Dump directories to ingest into the index. Those
+      already in the index are skipped.
+    index_path: (str) Path to the on-disk page index. Reused across runs.
+    max_rows: (int) Maximum number of mappings and process pairs to list.
+  """
+  index = PageIndex(index_path)
+  try:
+    for directory in directories:
+      directory = os.path.abspath(directory)
+      if index.HasDirectory(directory):
+        logging.info('Already indexed: %s', directory)
+        continue
+      logging.info('Indexing %s', directory)
+      index.AddDirectory(directory)
+    index.ComputeSharing()
+
+    pages, unique_pages, duplicate_pages = index.TotalStats()
+    print 'Total non-zero pages = %d (%s)' % (
+        pages, _PrettyPrintSize(pages * PAGE_SIZE))
+    print 'Unique non-zero pages = %d (%s)' % (
+        unique_pages, _PrettyPrintSize(unique_pages * PAGE_SIZE))
+    print 'Cross-process duplicated pages = %d (%s)' % (
+        duplicate_pages, _PrettyPrintSize(duplicate_pages * PAGE_SIZE))
+
+    print 'Top mappings by pages shared with other processes:'
+    for _, _, filename, mapping_pages, shared_pages in (
+        index.SharedPagesByMapping()[:max_rows]):
+      print '  %s: %s / %s' % (
+          filename, _PrettyPrintSize(shared_pages * PAGE_SIZE),
+          _PrettyPrintSize(mapping_pages * PAGE_SIZE))
+    print 'Top process pairs by shared pages:'
+    for directory1, pid1, directory2, pid2, shared_pages in (
+        index.SharedPagesByProcessPair()[:max_rows]):
+      print '  %s (pid %d) <-> %s (pid %d): %s' % (
+          directory1, pid1, directory2, pid2,
+          _PrettyPrintSize(shared_pages * PAGE_SIZE))
+  finally:
+    index.Close()
+
+
 def main():
   logging.basicConfig(level=logging.INFO)
-  if len(sys.argv) != 2:
-    logging.error('Usage: %s <dumps_directory>', sys.argv[0])
-    sys.exit(1)
-  directory = sys.argv[1]
-  dumps = [os.path.join(directory, f) for f in os.listdir(directory)
-           if f.endswith('.dump')]
+  parser = argparse.ArgumentParser()
+  parser.add_argument('directories', nargs='+', metavar='dumps_directory',
+                      help='Directory containing dumps from dump_process.')
+  parser.add_argument('--cross-process', action='store_true',
+                      help='Report pages that are duplicated across '
+                           'processes, using an on-disk index rather than '
+                           'holding per-page statistics in memory.')
+  parser.add_argument('--index',
+                      help='Path to the on-disk page index for '
+                           '--cross-process. Directories already in it are '
+                           'not re-read. Defaults to a temporary file.')
+  args = parser.parse_args()
+
+  if args.cross_process:
+    if args.index:
+      PrintCrossProcessStats(args.directories, args.index)
+      return
+    fd, index_path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+      PrintCrossProcessStats(args.directories, index_path)
+    finally:
+      os.remove(index_path)
+    return
+
+  dumps = [os.path.join(directory, f) for directory in args.directories
+           for f in os.listdir(directory) if f.endswith('.dump')]
   PrintStats(dumps)
 
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import array
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+import analyze_dumps
+
+
+PAGE_SIZE = analyze_dumps.PAGE_SIZE
+_PAGE_A = 'a' * PAGE_SIZE
+_PAGE_B = 'b' * PAGE_SIZE
+_PAGE_C = 'c' * PAGE_SIZE
+
+
+def _WriteDump(directory, pid, start_page, pages):
+  """Writes a dump and its metadata, in the format of dump_process.cc.
+
+  Args:
+    directory: (str) Dump directory.
+    pid: (int) Process ID.
+    start_page: (int) Index of the first page of the mapping.
+    pages: ([str]) Content of each page. All pages are present.
+
+  Returns:
+    (str) Path to the dump.
+  """
+  start = start_page * PAGE_SIZE
+  end = start + len(pages) * PAGE_SIZE
+  filename = os.path.join(directory, '%d-%d-%d.dump' % (pid, start, end))
+  with open(filename, 'wb') as f:
+    f.write(''.join(pages))
+  with open(filename + '.metadata', 'w') as f:
+    f.write('10\n' * len(pages))
+  return filename
+
+
+def _SerialStats(filename):
+  """Computes the statistics of a dump one page at a time.
+
+  Returns:
+    (freed, is_zero, compressed_size, hashes), as in MappingStats.
+  """
+  freed = 0
+  is_zero = []
+  compressed_size = []
+  hashes = []
+  with open(filename, 'rb') as f:
+    for _ in xrange(os.path.getsize(filename) / PAGE_SIZE):
+      page = analyze_dumps._ReadPage(f)
+      freed += 4 * sum(page.count(x) for x in analyze_dumps._FREED_PATTERNS)
+      data = page.tostring()
+      is_zero.append(data == analyze_dumps._ZERO_PAGE)
+      if is_zero[-1]:
+        compressed_size.append(0)
+        hashes.append(None)
+      else:
+        compressed_size.append(len(zlib.compress(data, 1)))
+        hashes.append(hashlib.sha1(data).digest())
+  return freed, is_zero, compressed_size, hashes
+
+
+class GetStatsFromFileDumpsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    # Split dumps into several tasks, and tasks into several scans.
+    self.old_pages_per_task = analyze_dumps._PAGES_PER_TASK
+    self.old_pages_per_scan = analyze_dumps._PAGES_PER_SCAN
+    analyze_dumps._PAGES_PER_TASK = 4
+    analyze_dumps._PAGES_PER_SCAN = 3
+
+  def tearDown(self):
+    analyze_dumps._PAGES_PER_TASK = self.old_pages_per_task
+    analyze_dumps._PAGES_PER_SCAN = self.old_pages_per_scan
+    shutil.rmtree(self.temp_dir)
+
+  def testMatchesSerialComputation(self):
+    freed_page = array.array('I', [0xcdcdcdcd] * 3 + [0xdeadbeef] * 5)
+    freed_page.extend([7] * (PAGE_SIZE / 4 - len(freed_page)))
+    # Freed patterns at unaligned offsets are not counted.
+    unaligned_page = 'x' + struct.pack('=I', 0xcccccccc)
+    unaligned_page += 'y' * (PAGE_SIZE - len(unaligned_page))
+    pages1 = [_PAGE_A, analyze_dumps._ZERO_PAGE, freed_page.tostring(),
+              _PAGE_B, unaligned_page] * 2 + [_PAGE_C]
+    pages2 = [analyze_dumps._ZERO_PAGE, _PAGE_C, _PAGE_A]
+    filenames = [_WriteDump(self.temp_dir, 1, 16, pages1),
+                 _WriteDump(self.temp_dir, 2, 64, pages2)]
+
+    dump_stats = analyze_dumps._GetStatsFromFileDumps(filenames)
+    self.assertEqual(filenames, [stats.filename for stats in dump_stats])
+    for stats in dump_stats:
+      self.assertEqual(
+          _SerialStats(stats.filename),
+          (stats.freed, stats.is_zero, stats.compressed_size, stats.hashes))
+    self.assertEqual(4 * 8 * 2, dump_stats[0].freed)
+
+    content_to_count, page_location_by_hash = (
+        analyze_dumps._IndexPageHashes(dump_stats))
+    hash_a = hashlib.sha1(_PAGE_A).digest()
+    hash_c = hashlib.sha1(_PAGE_C).digest()
+    self.assertEqual(3, content_to_count[hash_a])
+    self.assertEqual(2, content_to_count[hash_c])
+    self.assertEqual(5, len(content_to_count))
+    self.assertEqual((filenames[0], 0), page_location_by_hash[hash_a])
+    self.assertEqual((filenames[0], 10), page_location_by_hash[hash_c])
+    for page_hash, location in page_location_by_hash.iteritems():
+      page = analyze_dumps._ReadPageAt(*location)
+      self.assertEqual(page_hash, hashlib.sha1(page.tostring()).digest())
+
+
+class PageIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.dir1 = os.path.join(self.temp_dir, 'dump1')
+    self.dir2 = os.path.join(self.temp_dir, 'dump2')
+    os.mkdir(self.dir1)
+    os.mkdir(self.dir2)
+    # _PAGE_A is the only page shared across processes. _PAGE_B is repeated,
+    # but within a single process.
+    self.filename1 = _WriteDump(
+        self.dir1, 1, 16, [_PAGE_A, _PAGE_B, analyze_dumps._ZERO_PAGE])
+    self.filename2 = _WriteDump(self.dir1, 1, 32, [_PAGE_B])
+    self.filename3 = _WriteDump(self.dir2, 2, 16, [_PAGE_C, _PAGE_A])
+    self.index = analyze_dumps.PageIndex(
+        os.path.join(self.temp_dir, 'index.sqlite'))
+
+  def tearDown(self):
+    self.index.Close()
+    shutil.rmtree(self.temp_dir)
+
+  def _AddDirectories(self):
+    self.index.AddDirectory(self.dir1)
+    self.index.AddDirectory(self.dir2)
+    self.index.ComputeSharing()
+
+  def testHasDirectory(self):
+    self.assertFalse(self.index.HasDirectory(self.dir1))
+    self.index.AddDirectory(self.dir1)
+    self.assertTrue(self.index.HasDirectory(self.dir1))
+    self.assertFalse(self.index.HasDirectory(self.dir2))
+
+  def testTotalStats(self):
+    self._AddDirectories()
+    # Zero pages are not indexed.
+    self.assertEqual((5, 3, 1), self.index.TotalStats())
+
+  def testSharedPagesByMapping(self):
+    self._AddDirectories()
+    self.assertEqual(
+        [(self.dir1, 1, self.filename1, 3, 1),
+         (self.dir2, 2, self.filename3, 2, 1)],
+        self.index.SharedPagesByMapping())
+
+  def testSharedPagesByProcessPair(self):
+    self._AddDirectories()
+    self.assertEqual([(self.dir1, 1, self.dir2, 2, 1)],
+                     self.index.SharedPagesByProcessPair())
+
+
+if __name__ == '__main__':
+  unittest.main()
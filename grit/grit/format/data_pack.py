@@ -9,6 +9,7 @@ files.
 
 import collections
 import exceptions
+import mmap
 import os
 import struct
 import sys
@@ -24,6 +25,11 @@ from grit.node import structure
 PACK_FILE_VERSION = 5
 BINARY, UTF8, UTF16 = range(3)
 
+# Each main table entry is a uint16 resource ID and a uint32 offset.
+_INDEX_ENTRY = struct.Struct('<HI')
+# Each alias table entry is a uint16 resource ID and a uint16 main table index.
+_ALIAS_ENTRY = struct.Struct('<HH')
+
 
 class WrongFileVersion(Exception):
   pass
@@ -95,57 +101,181 @@ def ReadDataPack(input_file):
 
 def ReadDataPackFromString(data):
   """Reads a data pack file and returns a dictionary."""
-  # Read the header.
-  version = struct.unpack('<I', data[:4])[0]
-  if version == 4:
-    resource_count, encoding = struct.unpack('<IB', data[4:9])
-    alias_count = 0
-    header_size = 9
-  elif version == 5:
-    encoding, resource_count, alias_count = struct.unpack('<BxxxHH', data[4:12])
-    header_size = 12
-  else:
-    raise WrongFileVersion('Found version: ' + str(version))
-
+  pack = DataPack(data)
   resources = {}
-  kIndexEntrySize = 2 + 4  # Each entry is a uint16 and a uint32.
-  def entry_at_index(idx):
-    offset = header_size + idx * kIndexEntrySize
-    return struct.unpack('<HI', data[offset:offset + kIndexEntrySize])
-
-  prev_resource_id, prev_offset = entry_at_index(0)
-  for i in xrange(1, resource_count + 1):
-    resource_id, offset = entry_at_index(i)
-    resources[prev_resource_id] = data[prev_offset:offset]
-    prev_resource_id, prev_offset = resource_id, offset
-
-  id_table_size = (resource_count + 1) * kIndexEntrySize
-  # Read the alias table.
-  kAliasEntrySize = 2 + 2  # uint16, uint16
-  def alias_at_index(idx):
-    offset = header_size + id_table_size + idx * kAliasEntrySize
-    return struct.unpack('<HH', data[offset:offset + kAliasEntrySize])
-
-  aliases = {}
-  for i in xrange(alias_count):
-    resource_id, index = alias_at_index(i)
-    aliased_id = entry_at_index(index)[0]
-    aliases[resource_id] = aliased_id
+  for resource_id, start, end in pack._IterMainEntries():
+    resources[resource_id] = data[start:end]
+  # Aliases share the same str object as their canonical resource.
+  aliases = pack.aliases
+  for resource_id, aliased_id in aliases.iteritems():
     resources[resource_id] = resources[aliased_id]
-
-  alias_table_size = kAliasEntrySize * alias_count
-  sizes = DataPackSizes(
-      header_size, id_table_size, alias_table_size,
-      len(data) - header_size - id_table_size - alias_table_size)
+  sizes = pack.sizes
   assert sizes.total == len(data), 'original={} computed={}'.format(
       len(data), sizes.total)
-  return DataPackContents(resources, encoding, version, aliases, sizes)
+  return DataPackContents(resources, pack.encoding, pack.version, aliases,
+                          sizes)
 
 
-def WriteDataPackToString(resources, encoding):
-  """Returns a string with a map of id=>data in the data pack format."""
-  ret = []
+class DataPack(object):
+  """A data pack that decodes its index on demand.
+
+  Lookups binary-search the (sorted) main and alias tables, and resource bodies
+  are returned as read-only buffer objects that point into |data|, so nothing
+  is copied unless the caller asks for it. Supports enough of the dict
+  interface to be passed to RePackFromDataPackStrings().
+  """
+
+  def __init__(self, data):
+    """Args:
+        data: Contents of a .pak file. Anything that supports the buffer
+              interface (e.g. a str or an mmap).
+    """
+    self._data = data
+    self.version = struct.unpack_from('<I', data)[0]
+    if self.version == 4:
+      self.resource_count, self.encoding = struct.unpack_from('<IB', data, 4)
+      self.alias_count = 0
+      self._header_size = 9
+    elif self.version == 5:
+      self.encoding, self.resource_count, self.alias_count = (
+          struct.unpack_from('<BxxxHH', data, 4))
+      self._header_size = 12
+    else:
+      raise WrongFileVersion('Found version: ' + str(self.version))
+    self._id_table_size = (self.resource_count + 1) * _INDEX_ENTRY.size
+    self._alias_table_offset = self._header_size + self._id_table_size
+
+  def close(self):
+    if isinstance(self._data, mmap.mmap):
+      self._data.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _EntryAt(self, idx):
+    return _INDEX_ENTRY.unpack_from(
+        self._data, self._header_size + idx * _INDEX_ENTRY.size)
+
+  def _AliasAt(self, idx):
+    return _ALIAS_ENTRY.unpack_from(
+        self._data, self._alias_table_offset + idx * _ALIAS_ENTRY.size)
+
+  def _BodyAt(self, idx):
+    start = self._EntryAt(idx)[1]
+    end = self._EntryAt(idx + 1)[1]
+    return buffer(self._data, start, end - start)
+
+  @staticmethod
+  def _BinarySearch(entry_at, count, resource_id):
+    """Returns the index of the entry for |resource_id|, or None."""
+    lo = 0
+    hi = count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      mid_id = entry_at(mid)[0]
+      if mid_id < resource_id:
+        lo = mid + 1
+      elif mid_id > resource_id:
+        hi = mid
+      else:
+        return mid
+    return None
+
+  def _FindIndex(self, resource_id):
+    """Returns the main table index for |resource_id|, or None."""
+    idx = self._BinarySearch(self._EntryAt, self.resource_count, resource_id)
+    if idx is not None:
+      return idx
+    alias_idx = self._BinarySearch(self._AliasAt, self.alias_count, resource_id)
+    if alias_idx is not None:
+      return self._AliasAt(alias_idx)[1]
+    return None
+
+  def __getitem__(self, resource_id):
+    idx = self._FindIndex(resource_id)
+    if idx is None:
+      raise KeyError(resource_id)
+    return self._BodyAt(idx)
+
+  def get(self, resource_id, default=None):
+    idx = self._FindIndex(resource_id)
+    if idx is None:
+      return default
+    return self._BodyAt(idx)
+
+  def __contains__(self, resource_id):
+    return self._FindIndex(resource_id) is not None
+
+  def __len__(self):
+    return self.resource_count + self.alias_count
+
+  def _IterMainEntries(self):
+    """Yields (resource_id, start, end) for each main table entry."""
+    resource_id, start = self._EntryAt(0)
+    for idx in xrange(1, self.resource_count + 1):
+      next_resource_id, end = self._EntryAt(idx)
+      yield resource_id, start, end
+      resource_id, start = next_resource_id, end
+
+  def iteritems(self):
+    """Yields (resource_id, body) tuples, sorted by resource_id."""
+    aliases = (self._AliasAt(i) for i in xrange(self.alias_count))
+    next_alias = next(aliases, None)
+    for resource_id, start, end in self._IterMainEntries():
+      while next_alias and next_alias[0] < resource_id:
+        yield next_alias[0], self._BodyAt(next_alias[1])
+        next_alias = next(aliases, None)
+      yield resource_id, buffer(self._data, start, end - start)
+    while next_alias:
+      yield next_alias[0], self._BodyAt(next_alias[1])
+      next_alias = next(aliases, None)
+
+  def __iter__(self):
+    return (resource_id for resource_id, _ in self.iteritems())
+
+  def keys(self):
+    return list(self)
+
+  @property
+  def aliases(self):
+    """Map of resource_id->canonical_resource_id."""
+    ret = {}
+    for i in xrange(self.alias_count):
+      resource_id, idx = self._AliasAt(i)
+      ret[resource_id] = self._EntryAt(idx)[0]
+    return ret
 
+  @property
+  def sizes(self):
+    alias_table_size = _ALIAS_ENTRY.size * self.alias_count
+    data_size = (len(self._data) - self._alias_table_offset -
+                 alias_table_size)
+    return DataPackSizes(self._header_size, self._id_table_size,
+                         alias_table_size, data_size)
+
+
+def OpenDataPack(input_file):
+  """Returns a DataPack backed by an mmap of |input_file|.
+
+  Call close() (or use a "with" statement) once done with the DataPack and any
+  buffers returned by it.
+  """
+  with open(input_file, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      # Empty files cannot be mmap()ed. Let DataPack() raise the error.
+      return DataPack(f.read())
+    return DataPack(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _IterDataPackChunks(resources, encoding):
+  """Yields the data pack for a map of id=>data as a series of strings.
+
+  Values of |resources| may also be buffer objects (e.g. from DataPack), in
+  which case they are yielded without being copied.
+  """
   # Compute alias map.
   resource_ids = sorted(resources)
   # Use reversed() so that for duplicates lower IDs clobber higher ones.
@@ -157,8 +287,8 @@ def WriteDataPackToString(resources, encoding):
   # Write file header.
   resource_count = len(resources) - len(alias_map)
   # Padding bytes added for alignment.
-  ret.append(struct.pack('<IBxxxHH', PACK_FILE_VERSION, encoding,
-                         resource_count, len(alias_map)))
+  yield struct.pack('<IBxxxHH', PACK_FILE_VERSION, encoding, resource_count,
+                    len(alias_map))
   HEADER_LENGTH = 4 + 4 + 2 + 2
 
   # Each main table entry is: uint16 + uint32 (and an extra entry at the end).
@@ -174,30 +304,35 @@ def WriteDataPackToString(resources, encoding):
       continue
     data = resources[resource_id]
     index_by_id[resource_id] = index
-    ret.append(struct.pack('<HI', resource_id, data_offset))
+    yield _INDEX_ENTRY.pack(resource_id, data_offset)
     data_offset += len(data)
     deduped_data.append(data)
     index += 1
 
   assert index == resource_count
   # Add an extra entry at the end.
-  ret.append(struct.pack('<HI', 0, data_offset))
+  yield _INDEX_ENTRY.pack(0, data_offset)
 
   # Write alias table.
   for resource_id in sorted(alias_map):
     index = index_by_id[alias_map[resource_id]]
-    ret.append(struct.pack('<HH', resource_id, index))
+    yield _ALIAS_ENTRY.pack(resource_id, index)
 
   # Write data.
-  ret.extend(deduped_data)
-  return ''.join(ret)
+  for data in deduped_data:
+    yield data
+
+
+def WriteDataPackToString(resources, encoding):
+  """Returns a string with a map of id=>data in the data pack format."""
+  return ''.join(_IterDataPackChunks(resources, encoding))
 
 
 def WriteDataPack(resources, output_file, encoding):
   """Writes a map of id=>data into output_file as a data pack."""
-  content = WriteDataPackToString(resources, encoding)
   with open(output_file, 'wb') as file:
-    file.write(content)
+    for chunk in _IterDataPackChunks(resources, encoding):
+      file.write(chunk)
 
 
 def RePack(output_file, input_files, whitelist_file=None,
@@ -217,7 +352,6 @@ def RePack(output_file, input_files, whitelist_file=None,
       KeyError: if there are duplicate keys or resource encoding is
       inconsistent.
   """
-  input_data_packs = [ReadDataPack(filename) for filename in input_files]
   input_info_files = [filename + '.info' for filename in input_files]
   whitelist = None
   if whitelist_file:
@@ -225,10 +359,19 @@ def RePack(output_file, input_files, whitelist_file=None,
     if not lines:
       raise Exception('Whitelist file should not be empty')
     whitelist = set(int(x) for x in lines)
-  inputs = [(p.resources, p.encoding) for p in input_data_packs]
-  resources, encoding = RePackFromDataPackStrings(
-      inputs, whitelist, suppress_removed_key_output)
-  WriteDataPack(resources, output_file, encoding)
+  # Inputs are mmap()ed and resource bodies are streamed from them into the
+  # output file, so that memory use does not grow with the size of the inputs.
+  input_data_packs = []
+  try:
+    for filename in input_files:
+      input_data_packs.append(OpenDataPack(filename))
+    inputs = [(p, p.encoding) for p in input_data_packs]
+    resources, encoding = RePackFromDataPackStrings(
+        inputs, whitelist, suppress_removed_key_output)
+    WriteDataPack(resources, output_file, encoding)
+  finally:
+    for pack in input_data_packs:
+      pack.close()
   with open(output_file + '.info', 'w') as output_info_file:
     for filename in input_info_files:
       with open(filename, 'r') as info_file:
@@ -241,6 +384,7 @@ def RePackFromDataPackStrings(inputs, whitelist,
 
   Args:
       inputs: a list of (resources_by_id, encoding) tuples to be combined.
+              resources_by_id can be a dict or a DataPack.
       whitelist: a list of resource IDs that should be kept in the output string
                  or None to include all resources.
       suppress_removed_key_output: Do not print removed keys.
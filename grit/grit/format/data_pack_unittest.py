@@ -7,7 +7,9 @@
 
 
 import os
+import shutil
 import sys
+import tempfile
 if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
@@ -69,6 +71,61 @@ class FormatDataPackUnittest(unittest.TestCase):
     loaded = data_pack.ReadDataPackFromString(expected_data)
     self.assertDictEqual(expected_data_pack.__dict__, loaded.__dict__)
 
+  def testDataPackLookup(self):
+    input_resources = {
+        1: '',
+        4: 'this is id 4',
+        6: 'this is id 6',
+        10: 'this is id 4',
+        12: 'this is id 12',
+    }
+    pack = data_pack.DataPack(
+        data_pack.WriteDataPackToString(input_resources, data_pack.UTF8))
+    self.assertEquals(5, pack.version)
+    self.assertEquals(data_pack.UTF8, pack.encoding)
+    self.assertEquals(len(input_resources), len(pack))
+    for resource_id, value in input_resources.iteritems():
+      self.assertIn(resource_id, pack)
+      self.assertEquals(value, str(pack[resource_id]))
+    self.assertNotIn(5, pack)
+    self.assertNotIn(13, pack)
+    self.assertRaises(KeyError, lambda: pack[0])
+    self.assertIsNone(pack.get(2))
+    self.assertEquals({10: 4}, pack.aliases)
+    self.assertEquals(sorted(input_resources), pack.keys())
+    self.assertEquals(sorted(input_resources.iteritems()),
+                      [(k, str(v)) for k, v in pack.iteritems()])
+
+  def testRePackFiles(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      inputs = [{1: 'Never gonna', 4: 'click', 6: 'give you up'},
+                {20: 'Never gonna let', 30: 'give you up'},
+                {}]
+      input_files = []
+      for i, resources in enumerate(inputs):
+        path = os.path.join(temp_dir, '%d.pak' % i)
+        data_pack.WriteDataPack(resources, path, data_pack.UTF8)
+        with open(path + '.info', 'w') as f:
+          f.write('info %d\n' % i)
+        input_files.append(path)
+      output_file = os.path.join(temp_dir, 'out.pak')
+
+      data_pack.RePack(output_file, input_files)
+      expected = {}
+      for resources in inputs:
+        expected.update(resources)
+      with open(output_file, 'rb') as f:
+        self.assertEquals(
+            data_pack.WriteDataPackToString(expected, data_pack.UTF8),
+            f.read())
+      with open(output_file + '.info') as f:
+        self.assertEquals('info 0\ninfo 1\ninfo 2\n', f.read())
+      with data_pack.OpenDataPack(output_file) as pack:
+        self.assertEquals({30: 6}, pack.aliases)
+    finally:
+      shutil.rmtree(temp_dir)
+
   def testRePackUnittest(self):
     expected_with_whitelist = {
         1: 'Never gonna', 10: 'give you up', 20: 'Never gonna let',
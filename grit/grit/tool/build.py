@@ -9,6 +9,7 @@ SCons build system.
 import codecs
 import filecmp
 import getopt
+import multiprocessing
 import os
 import shutil
 import sys
@@ -45,6 +46,22 @@ _format_modules = {
   'resource_map_source': 'resource_map',
 }
 
+# The RcBuilder whose outputs are being generated by worker processes. Set
+# before forking so that workers inherit the fully-populated resource tree
+# rather than having it pickled.
+_builder_for_workers = None
+
+
+def _ProcessOutputInWorker(output_index):
+  builder = _builder_for_workers
+  builder.ProcessOutput(builder.res.GetOutputFiles()[output_index])
+  # Translation fallbacks are recorded while formatting, so report them back to
+  # the parent process.
+  uberclique = builder.res.UberClique()
+  return (uberclique.fallback_translations_,
+          uberclique.missing_translations_)
+
+
 def GetFormatter(type):
   modulename = 'grit.format.' + _format_modules[type]
   __import__(modulename)
@@ -108,6 +125,12 @@ Options:
   -w WHITELISTFILE  Path to a file containing the string names of the
                     resources to include.  Anything not listed is dropped.
 
+  -j JOBS           Generate outputs using this many worker processes. IDs
+                    are assigned once up front, and each worker generates
+                    whole output files, so the results are identical to
+                    those of a serial build. Defaults to 1. Not supported on
+                    Windows, where outputs are always generated serially.
+
   -t PLATFORM       Specifies the platform the build is targeting; defaults
                     to the value of sys.platform. The value provided via this
                     flag should match what sys.platform would report for your
@@ -161,7 +184,7 @@ are exported to translation interchange files (e.g. XMB files), etc.
     depend_on_stamp = False
     js_minifier = None
     replace_ellipsis = True
-    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:w:t:',
+    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:j:w:t:',
         ('depdir=','depfile=','assert-file-list=',
          'help',
          'output-all-resource-defines',
@@ -190,6 +213,8 @@ are exported to translation interchange files (e.g. XMB files), etc.
         # lands in WebKit.grd to specify the first_ids_file in the
         # .grd itself.
         first_ids_file = val
+      elif key == '-j':
+        self.jobs = int(val)
       elif key == '-w':
         whitelist_filenames.append(val)
       elif key == '--no-replace-ellipsis':
@@ -293,6 +318,9 @@ are exported to translation interchange files (e.g. XMB files), etc.
     # Whether to compare outputs to their old contents before writing.
     self.write_only_new = False
 
+    # Number of worker processes to generate outputs with.
+    self.jobs = 1
+
   @staticmethod
   def AddWhitelistTags(start_node, whitelist_names):
     # Walk the tree of nodes added attributes for the nodes that shouldn't
@@ -371,59 +399,13 @@ are exported to translation interchange files (e.g. XMB files), etc.
     if self.whitelist_names:
       self.AddWhitelistTags(self.res, self.whitelist_names)
 
-    for output in self.res.GetOutputFiles():
-      self.VerboseOut('Creating %s...' % output.GetOutputFilename())
-
-      # Set the context, for conditional inclusion of resources
-      self.res.SetOutputLanguage(output.GetLanguage())
-      self.res.SetOutputContext(output.GetContext())
-      self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
-      self.res.SetDefines(self.defines)
-
-      # Assign IDs only once to ensure that all outputs use the same IDs.
-      if self.res.GetIdMap() is None:
-        self.res.InitializeIds()
-
-      # Make the output directory if it doesn't exist.
-      self.MakeDirectoriesTo(output.GetOutputFilename())
-
-      # Write the results to a temporary file and only overwrite the original
-      # if the file changed.  This avoids unnecessary rebuilds.
-      outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
-
-      if output.GetType() != 'data_package':
-        encoding = self._EncodingForOutputType(output.GetType())
-        outfile = util.WrapOutputStream(outfile, encoding)
-
-      # Iterate in-order through entire resource tree, calling formatters on
-      # the entry into a node and on exit out of it.
-      with outfile:
-        self.ProcessNode(self.res, output, outfile)
-
-      # Now copy from the temp file back to the real output, but on Windows,
-      # only if the real output doesn't exist or the contents of the file
-      # changed.  This prevents identical headers from being written and .cc
-      # files from recompiling (which is painful on Windows).
-      if not os.path.exists(output.GetOutputFilename()):
-        os.rename(output.GetOutputFilename() + '.tmp',
-                  output.GetOutputFilename())
-      else:
-        # CHROMIUM SPECIFIC CHANGE.
-        # This clashes with gyp + vstudio, which expect the output timestamp
-        # to change on a rebuild, even if nothing has changed, so only do
-        # it when opted in.
-        if not self.write_only_new:
-          write_file = True
-        else:
-          files_match = filecmp.cmp(output.GetOutputFilename(),
-              output.GetOutputFilename() + '.tmp')
-          write_file = not files_match
-        if write_file:
-          shutil.copy2(output.GetOutputFilename() + '.tmp',
-                       output.GetOutputFilename())
-        os.remove(output.GetOutputFilename() + '.tmp')
-
-      self.VerboseOut(' done.\n')
+    outputs = self.res.GetOutputFiles()
+    jobs = min(self.jobs, len(outputs))
+    if jobs > 1 and sys.platform != 'win32':
+      self._ProcessOutputsInParallel(outputs, jobs)
+    else:
+      for output in outputs:
+        self.ProcessOutput(output)
 
     # Print warnings if there are any duplicate shortcuts.
     warnings = shortcuts.GenerateDuplicateShortcutsWarnings(
@@ -443,6 +425,101 @@ are exported to translation interchange files (e.g. XMB files), etc.
       sys.exit(-1)
 
 
+  def _SetOutputContext(self, output):
+    # Set the context, for conditional inclusion of resources
+    self.res.SetOutputLanguage(output.GetLanguage())
+    self.res.SetOutputContext(output.GetContext())
+    self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
+    self.res.SetDefines(self.defines)
+
+    # Assign IDs only once to ensure that all outputs use the same IDs.
+    if self.res.GetIdMap() is None:
+      self.res.InitializeIds()
+
+  def ProcessOutput(self, output):
+    '''Generates a single output file, in that output's language and context.
+
+    Args:
+      output: grit.node.io.OutputNode
+    '''
+    self.VerboseOut('Creating %s...' % output.GetOutputFilename())
+
+    self._SetOutputContext(output)
+
+    # Make the output directory if it doesn't exist.
+    self.MakeDirectoriesTo(output.GetOutputFilename())
+
+    # Write the results to a temporary file and only overwrite the original
+    # if the file changed.  This avoids unnecessary rebuilds.
+    outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
+
+    if output.GetType() != 'data_package':
+      encoding = self._EncodingForOutputType(output.GetType())
+      outfile = util.WrapOutputStream(outfile, encoding)
+
+    # Iterate in-order through entire resource tree, calling formatters on
+    # the entry into a node and on exit out of it.
+    with outfile:
+      self.ProcessNode(self.res, output, outfile)
+
+    # Now copy from the temp file back to the real output, but on Windows,
+    # only if the real output doesn't exist or the contents of the file
+    # changed.  This prevents identical headers from being written and .cc
+    # files from recompiling (which is painful on Windows).
+    if not os.path.exists(output.GetOutputFilename()):
+      os.rename(output.GetOutputFilename() + '.tmp',
+                output.GetOutputFilename())
+    else:
+      # CHROMIUM SPECIFIC CHANGE.
+      # This clashes with gyp + vstudio, which expect the output timestamp
+      # to change on a rebuild, even if nothing has changed, so only do
+      # it when opted in.
+      if not self.write_only_new:
+        write_file = True
+      else:
+        files_match = filecmp.cmp(output.GetOutputFilename(),
+            output.GetOutputFilename() + '.tmp')
+        write_file = not files_match
+      if write_file:
+        shutil.copy2(output.GetOutputFilename() + '.tmp',
+                     output.GetOutputFilename())
+      os.remove(output.GetOutputFilename() + '.tmp')
+
+    self.VerboseOut(' done.\n')
+
+  def _ProcessOutputsInParallel(self, outputs, jobs):
+    '''Generates |outputs| using |jobs| forked worker processes.'''
+    global _builder_for_workers
+    # Assign IDs in the context of the first output (as a serial build would),
+    # and create output directories, before forking.
+    self._SetOutputContext(outputs[0])
+    for output in outputs:
+      self.MakeDirectoriesTo(output.GetOutputFilename())
+
+    _builder_for_workers = self
+    try:
+      pool = multiprocessing.Pool(jobs)
+    finally:
+      _builder_for_workers = None
+    try:
+      results = pool.map(_ProcessOutputInWorker, range(len(outputs)))
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+    uberclique = self.res.UberClique()
+    for fallback_translations, missing_translations in results:
+      for src, dst in ((fallback_translations,
+                        uberclique.fallback_translations_),
+                       (missing_translations,
+                        uberclique.missing_translations_)):
+        for clique_id, langs in src.iteritems():
+          dst.setdefault(clique_id, {}).update(langs)
+
+
   def CheckAssertedOutputFiles(self, assert_output_files):
     '''Checks that the asserted output files are specified in the given list.
 
@@ -335,6 +335,52 @@ class BuildUnittest(unittest.TestCase):
       ])
     output_dir.CleanUp()
 
+  def testParallelOutputsMatchSerial(self):
+    class DummyOpts(object):
+      def __init__(self, input):
+        self.input = util.PathFromRoot(input)
+        self.verbose = False
+        self.extra_verbose = False
+    for grd in ('grit/testdata/substitute.grd',
+                'grit/testdata/whitelist_resources.grd'):
+      contents_by_jobs = {}
+      for jobs in ('1', '3'):
+        output_dir = util.TempDir({})
+        builder = build.RcBuilder()
+        self.failUnlessEqual(0, builder.Run(DummyOpts(grd), [
+            '-o', output_dir.GetPath(), '-j', jobs]))
+        contents = {}
+        for name in os.listdir(output_dir.GetPath()):
+          with open(output_dir.GetPath(name), 'rb') as f:
+            contents[name] = f.read()
+        contents_by_jobs[jobs] = contents
+        output_dir.CleanUp()
+      self.assertTrue(len(contents_by_jobs['1']) > 1)
+      self.assertEqual(contents_by_jobs['1'], contents_by_jobs['3'])
+
+  def testParallelWriteOnlyNew(self):
+    output_dir = util.TempDir({})
+    builder = build.RcBuilder()
+    class DummyOpts(object):
+      def __init__(self):
+        self.input = util.PathFromRoot('grit/testdata/substitute.grd')
+        self.verbose = False
+        self.extra_verbose = False
+    UNCHANGED = 10
+    header = output_dir.GetPath('resource.h')
+
+    builder.Run(DummyOpts(), ['-o', output_dir.GetPath(), '-j', '2'])
+    self.failUnless(os.path.exists(header))
+    os.utime(header, (UNCHANGED, UNCHANGED))
+    builder = build.RcBuilder()
+    builder.Run(DummyOpts(),
+                ['-o', output_dir.GetPath(), '-j', '2',
+                 '--write-only-new', '1'])
+    self.assertTrue(abs(os.stat(header).st_mtime - UNCHANGED) < 5)
+    self.failIf([n for n in os.listdir(output_dir.GetPath())
+                 if n.endswith('.tmp')])
+    output_dir.CleanUp()
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -23,12 +23,11 @@ def _RepackMain(args):
 
 
 def _ExtractMain(args):
-  pak = data_pack.ReadDataPack(args.pak_file)
-
-  for resource_id, payload in pak.resources.iteritems():
-    path = os.path.join(args.output_dir, str(resource_id))
-    with open(path, 'w') as f:
-      f.write(payload)
+  with data_pack.OpenDataPack(args.pak_file) as pak:
+    for resource_id, payload in pak.iteritems():
+      path = os.path.join(args.output_dir, str(resource_id))
+      with open(path, 'w') as f:
+        f.write(payload)
 
 
 def _CreateMain(args):
@@ -14,13 +14,74 @@ PLY can be found at:
    http://www.dabeaz.com/ply/
 """
 
+import hashlib
+import imp
+import os
 import os.path
+import stat
 import sys
 
 SRC_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
 sys.path.insert(0, os.path.join(SRC_DIR, 'third_party'))
 from ply import lex
 
+# Building the lexer and parser tables takes longer than most parses, so
+# callers can pass a |tables_dir| (e.g. a directory in the build output) where
+# the generated tables are cached and shared by all processes. File names
+# include a hash of the rules the tables were generated from, so changing the
+# grammar (or PLY) just makes the cache miss. The cached tables are executed
+# (lexer) and unpickled (parser), so the directory must be private: it is only
+# used if it is owned by the current user and not writable by anyone else.
+
+
+def GetTablesSignature(*parts):
+  """Returns a hash of the |parts| that generated tables depend on."""
+  return hashlib.sha1(repr(parts)).hexdigest()[:16]
+
+
+def GetRules(obj, prefix):
+  """Returns (name, rule) pairs for the |prefix| rules defined on |obj|.
+
+  Function rules come first, in the order of their definition (which is the
+  order PLY uses), followed by the string rules sorted by name.
+  """
+  functions = []
+  strings = []
+  for name in dir(obj):
+    if not name.startswith(prefix):
+      continue
+    value = getattr(obj, name)
+    if callable(value):
+      # lex.TOKEN() stores the regular expression in |regex|.
+      rule = getattr(value, 'regex', value.__doc__)
+      functions.append((value.__code__.co_firstlineno, name, rule))
+    else:
+      strings.append((name, value))
+  return [(name, rule) for _, name, rule in sorted(functions)] + strings
+
+
+def PublishTables(tmp_path, path):
+  """Atomically moves the generated tables at |tmp_path| to |path|."""
+  try:
+    os.rename(tmp_path, path)
+  except OSError:
+    # Another process published the same tables first (Windows doesn't
+    # replace existing files).
+    os.remove(tmp_path)
+
+
+def OpenTablesDir(tables_dir):
+  """Creates |tables_dir| if needed. Returns whether it is safe to use."""
+  try:
+    os.makedirs(tables_dir, 0700)
+  except OSError:
+    if not os.path.isdir(tables_dir):
+      return False
+  st = os.stat(tables_dir)
+  if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+    return False
+  return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
 
 #
 # IDL Lexer
@@ -254,9 +315,35 @@ class IDLLexer(object):
 
   def Lexer(self):
     if not self._lexobj:
-      self._lexobj = lex.lex(object=self, lextab=None, optimize=0)
+      self._lexobj = self._BuildLexer()
     return self._lexobj
 
+  def _BuildLexer(self):
+    if not self._tables_dir or not OpenTablesDir(self._tables_dir):
+      return lex.lex(object=self, lextab=None, optimize=0)
+
+    signature = GetTablesSignature(lex.__tabversion__, self.tokens,
+                                   self.literals, GetRules(self, 't_'))
+    lextab = '%s_lextab_%s' % (self.__class__.__name__, signature)
+    path = os.path.join(self._tables_dir, lextab + '.py')
+    if os.path.exists(path):
+      try:
+        module = imp.load_source(lextab, path)
+        return lex.lex(object=self, lextab=module, optimize=1)
+      except Exception:
+        # A corrupt or stale file; regenerate it below.
+        pass
+
+    lexobj = lex.lex(object=self, lextab=None, optimize=0)
+    # Writing the cache is best effort.
+    try:
+      tmp_lextab = '%s_%d' % (lextab, os.getpid())
+      lexobj.writetab(tmp_lextab, self._tables_dir)
+      PublishTables(os.path.join(self._tables_dir, tmp_lextab + '.py'), path)
+    except (IOError, OSError):
+      pass
+    return lexobj
+
   def _AddToken(self, token):
     if token in self.tokens:
       raise RuntimeError('Same token: ' + token)
@@ -277,7 +364,9 @@ class IDLLexer(object):
       self.tokens.remove(key.upper())
       del self.keywords[key]
 
-  def __init__(self):
+  # |tables_dir| is a private directory where the generated lexer tables are
+  # cached, or None to always build them.
+  def __init__(self, tables_dir=None):
     self.index = [0]
     self._lex_errors = 0
     self.linex = []
@@ -287,6 +376,7 @@ class IDLLexer(object):
     self._AddTokens(IDLLexer.tokens)
     self._AddKeywords(IDLLexer.keywords)
     self._lexobj = None
+    self._tables_dir = tables_dir
     self.last = None
     self.lines = None
 
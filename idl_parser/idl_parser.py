@@ -33,7 +33,11 @@ import os.path
 import sys
 import time
 
+from idl_lexer import GetRules
+from idl_lexer import GetTablesSignature
 from idl_lexer import IDLLexer
+from idl_lexer import OpenTablesDir
+from idl_lexer import PublishTables
 from idl_node import IDLAttribute
 from idl_node import IDLNode
 
@@ -1122,11 +1126,17 @@ class IDLParser(object):
   def LastToken(self):
     return self.lexer.last
 
-  def __init__(self, lexer, verbose=False, debug=False, mute_error=False):
+  # |tables_dir| is a private directory where the generated parser tables are
+  # cached, or None to always build them.
+  def __init__(self, lexer, verbose=False, debug=False, mute_error=False,
+               tables_dir=None):
     self.lexer = lexer
     self.tokens = lexer.KnownTokens()
-    self.yaccobj = yacc.yacc(module=self, tabmodule=None, debug=debug,
-                             optimize=0, write_tables=0)
+    if debug or not tables_dir or not OpenTablesDir(tables_dir):
+      self.yaccobj = yacc.yacc(module=self, tabmodule=None, debug=debug,
+                               optimize=0, write_tables=0)
+    else:
+      self.yaccobj = self._BuildCachedYacc(tables_dir)
     self.parse_debug = debug
     self.verbose = verbose
     self.mute_error = mute_error
@@ -1136,6 +1146,32 @@ class IDLParser(object):
     self._last_error_lineno = 0
     self._last_error_pos = 0
 
+  def _BuildCachedYacc(self, tables_dir):
+    signature = GetTablesSignature(
+        yacc.__tabversion__, self.tokens, getattr(self, 'start', None),
+        getattr(self, 'precedence', None), GetRules(self, 'p_'))
+    path = os.path.join(tables_dir, '%s_parsetab_%s.pickle' % (
+        self.__class__.__name__, signature))
+    if os.path.exists(path):
+      try:
+        return yacc.yacc(module=self, debug=0, optimize=1, write_tables=0,
+                         picklefile=path)
+      except Exception:
+        # A corrupt or stale file; regenerate it below.
+        pass
+
+    # yacc() writes the pickle itself (and ignores errors doing so), so build
+    # into a private file and publish it once complete.
+    tmp_path = '%s.%d' % (path, os.getpid())
+    yaccobj = yacc.yacc(module=self, debug=0, optimize=0, write_tables=0,
+                        picklefile=tmp_path)
+    if os.path.exists(tmp_path):
+      try:
+        PublishTables(tmp_path, path)
+      except OSError:
+        pass
+    return yaccobj
+
 
 #
 # BuildProduction
@@ -5,6 +5,8 @@
 
 import glob
 import os
+import shutil
+import tempfile
 import unittest
 
 from idl_lexer import IDLLexer
@@ -52,6 +54,57 @@ class WebIDLParser(unittest.TestCase):
         self._TestNode(node, filename)
 
 
+class TestCachedTables(unittest.TestCase):
+
+  def setUp(self):
+    self.tables_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tables_dir)
+
+  def _ParseTree(self, tables_dir):
+    parser = IDLParser(IDLLexer(tables_dir=tables_dir), mute_error=True,
+                       tables_dir=tables_dir)
+    filenode = parser.ParseText(
+        filename='', data='interface I { attribute long a; void f(); };')
+    return filenode.Tree()
+
+  def testCachedTablesMatchGeneratedTables(self):
+    expected = self._ParseTree(None)
+    self.assertEqual([], os.listdir(self.tables_dir))
+
+    # The first parser generates the tables and the second one loads them.
+    self.assertEqual(expected, self._ParseTree(self.tables_dir))
+    tables = sorted(name for name in os.listdir(self.tables_dir)
+                    if not name.endswith('.pyc'))
+    self.assertEqual(2, len(tables))
+    self.assertTrue(tables[0].startswith('IDLLexer_lextab_'))
+    self.assertTrue(tables[1].startswith('IDLParser_parsetab_'))
+    self.assertEqual(expected, self._ParseTree(self.tables_dir))
+
+  def testCorruptTablesAreRegenerated(self):
+    self._ParseTree(self.tables_dir)
+    for name in os.listdir(self.tables_dir):
+      with open(os.path.join(self.tables_dir, name), 'w') as f:
+        f.write('corrupt')
+    self.assertEqual(self._ParseTree(None), self._ParseTree(self.tables_dir))
+
+  def testNewTablesDirIsPrivate(self):
+    tables_dir = os.path.join(self.tables_dir, 'tables')
+    self._ParseTree(tables_dir)
+    self.assertEqual(0700, os.stat(tables_dir).st_mode & 0777)
+    self.assertEqual(2, len(os.listdir(tables_dir)))
+
+  def testSharedTablesDirIsNotUsed(self):
+    os.chmod(self.tables_dir, 0777)
+    planted = os.path.join(self.tables_dir, 'IDLParser_parsetab_planted')
+    with open(planted, 'w') as f:
+      f.write('planted')
+    self.assertEqual(self._ParseTree(None), self._ParseTree(self.tables_dir))
+    self.assertEqual(['IDLParser_parsetab_planted'],
+                     os.listdir(self.tables_dir))
+
+
 class TestImplements(unittest.TestCase):
 
   def setUp(self):
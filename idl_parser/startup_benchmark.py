@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Measures the startup cost of the IDL parser with and without cached tables.
+
+Every run is a new process which imports the parser, creates an IDLParser and
+parses a small file, like each build action which uses the parser does.
+
+Example usage:
+  startup_benchmark.py --runs 20
+"""
+
+import argparse
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+_CHILD_SCRIPT = """
+import sys
+import time
+start = time.time()
+sys.path.insert(0, %(path)r)
+from idl_lexer import IDLLexer
+from idl_parser import IDLParser
+parser = IDLParser(IDLLexer(tables_dir=%(tables_dir)r),
+                   tables_dir=%(tables_dir)r)
+parser.ParseText('benchmark.idl', 'interface I { void f(long a); };')
+sys.stdout.write(repr(time.time() - start))
+"""
+
+
+def _RunChild(tables_dir):
+  script = _CHILD_SCRIPT % {'path': os.path.dirname(os.path.abspath(__file__)),
+                            'tables_dir': tables_dir}
+  return float(subprocess.check_output([sys.executable, '-c', script]))
+
+
+def _Measure(name, tables_dir, runs):
+  times = sorted(_RunChild(tables_dir) for _ in xrange(runs))
+  median = times[len(times) // 2]
+  print '%-24s %8.1fms (best %.1fms)' % (name, median * 1000, times[0] * 1000)
+  return median
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--runs', type=int, default=10,
+                      help='Report the median of this many runs.')
+  args = parser.parse_args()
+
+  tables_dir = tempfile.mkdtemp()
+  try:
+    print 'Import + IDLParser() + parse, per process (median of %d runs):' % (
+        args.runs)
+    uncached = _Measure('Without cache', None, args.runs)
+    first = _RunChild(tables_dir)
+    print '%-24s %8.1fms' % ('Generating the cache', first * 1000)
+    cached = _Measure('With cache', tables_dir, args.runs)
+    print 'Saving per invocation: %.1fms' % ((uncached - cached) * 1000)
+  finally:
+    shutil.rmtree(tables_dir)
+
+
+if __name__ == '__main__':
+  main()
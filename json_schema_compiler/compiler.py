@@ -14,12 +14,19 @@ Usage example:
     tabs.json
   compiler.py --destdir gen --root /home/Work/src
     --namespace extensions windows.json tabs.json
+
+Many compilations can be run by a single process, sharing the loaded schemas:
+  compiler.py --jobs-file jobs.rsp
+where each line of jobs.rsp holds the arguments of one compilation. With
+--jobs-file -, jobs are read from stdin as they come, and after each one
+'OK' or 'ERROR <message>' is written to stdout (a persistent worker).
 """
 
 import optparse
 import os
 import shlex
 import sys
+import traceback
 
 from cpp_bundle_generator import CppBundleGenerator
 from cpp_generator import CppGenerator
@@ -30,6 +37,7 @@ import json_schema
 from cpp_namespace_environment import CppNamespaceEnvironment
 from model import Model
 from namespace_resolver import NamespaceResolver
+from schema_loader import SchemaCache
 from schema_loader import SchemaLoader
 
 # Names of supported code generators, as specified on the command-line.
@@ -45,12 +53,13 @@ def GenerateSchema(generator_name,
                    cpp_namespace_pattern,
                    bundle_name,
                    impl_dir,
-                   include_rules):
+                   include_rules,
+                   schema_cache=None):
   # Merge the source files into a single list of schemas.
   api_defs = []
   for file_path in file_paths:
     schema = os.path.relpath(file_path, root)
-    api_def = SchemaLoader(root).LoadSchema(schema)
+    api_def = SchemaLoader(root, schema_cache).LoadSchema(schema)
 
     # If compiling the C++ model code, delete 'nocompile' nodes.
     if generator_name == 'cpp':
@@ -94,7 +103,8 @@ def GenerateSchema(generator_name,
   # Construct the type generator with all the namespaces in this model.
   schema_dir = os.path.dirname(os.path.relpath(file_paths[0], root))
   namespace_resolver = NamespaceResolver(root, schema_dir,
-                                         include_rules, cpp_namespace_pattern)
+                                         include_rules, cpp_namespace_pattern,
+                                         schema_cache)
   type_generator = CppTypeGenerator(api_model,
                                     namespace_resolver,
                                     default_namespace)
@@ -158,7 +168,7 @@ def GenerateSchema(generator_name,
   return '\n'.join(output_code)
 
 
-if __name__ == '__main__':
+def _CreateOptionParser():
   parser = optparse.OptionParser(
       description='Generates a C++ model of an API from JSON schema',
       usage='usage: %prog [option]... schema')
@@ -183,12 +193,17 @@ if __name__ == '__main__':
       help='A list of paths to include when searching for referenced objects,'
       ' with the namespace separated by a \':\'. Example: '
       '/foo/bar:Foo::Bar::%(namespace)s')
+  parser.add_option('--jobs-file',
+      help='Runs the compilations listed in this file, one line of arguments'
+      ' per compilation, sharing the loaded schemas. \'-\' reads them from'
+      ' stdin and acknowledges each one on stdout.')
+  return parser
 
-  (opts, file_paths) = parser.parse_args()
-
-  if not file_paths:
-    sys.exit(0) # This is OK as a no-op
 
+def _Compile(opts, file_paths, schema_cache=None):
+  """Runs the compilation for the parsed command line. Returns the generated
+  code.
+  """
   # Unless in bundle mode, only one file should be specified.
   if (opts.generator not in ('cpp-bundle-registration', 'cpp-bundle-schema') and
       len(file_paths) > 1):
@@ -207,8 +222,66 @@ if __name__ == '__main__':
     include_rules = map(split_path_and_namespace,
                         shlex.split(opts.include_rules))
 
-  result = GenerateSchema(opts.generator, file_paths, opts.root, opts.destdir,
-                          opts.namespace, opts.bundle_name, opts.impl_dir,
-                          include_rules)
+  return GenerateSchema(opts.generator, file_paths, opts.root, opts.destdir,
+                        opts.namespace, opts.bundle_name, opts.impl_dir,
+                        include_rules, schema_cache)
+
+
+def _CompileJob(parser, job, schema_cache):
+  """Runs the compilation for the |job| line of a jobs file."""
+  opts, file_paths = parser.parse_args(shlex.split(job))
+  if opts.jobs_file:
+    raise Exception('--jobs-file can\'t be used in a job: %s' % job)
+  if not opts.destdir:
+    raise Exception('Jobs must have a --destdir: %s' % job)
+  if file_paths:
+    _Compile(opts, file_paths, schema_cache)
+
+
+def RunJobsFile(parser, jobs_file):
+  """Runs the compilations in |jobs_file|, stopping at the first failure."""
+  schema_cache = SchemaCache()
+  with open(jobs_file) as f:
+    for job in f:
+      if job.strip():
+        _CompileJob(parser, job, schema_cache)
+
+
+def RunWorker(parser, stdin, stdout):
+  """Runs the compilations read from |stdin| until EOF, replying with a line
+  per job on |stdout|. Anything else printed goes to stderr.
+  """
+  schema_cache = SchemaCache()
+  sys.stdout = sys.stderr
+  try:
+    for job in iter(stdin.readline, ''):
+      if not job.strip():
+        continue
+      try:
+        _CompileJob(parser, job, schema_cache)
+        stdout.write('OK\n')
+      except (Exception, SystemExit) as e:
+        traceback.print_exc()
+        stdout.write('ERROR %s\n' % str(e).strip().replace('\n', ' '))
+      stdout.flush()
+  finally:
+    sys.stdout = stdout
+
+
+if __name__ == '__main__':
+  parser = _CreateOptionParser()
+  (opts, file_paths) = parser.parse_args()
+
+  if opts.jobs_file == '-':
+    RunWorker(parser, sys.stdin, sys.stdout)
+    sys.exit(0)
+  if opts.jobs_file:
+    RunJobsFile(parser, opts.jobs_file)
+    sys.exit(0)
+
+  if not file_paths:
+    sys.exit(0) # This is OK as a no-op
+
+  result = _Compile(opts, file_paths)
   if not opts.destdir:
     print result
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shlex
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import compiler
+from schema_loader import SchemaCache
+
+_JOBS = [
+  '-g cpp -n "test::api::%(namespace)s" test/simple_api.json',
+  '-g cpp -n "test::api::%(namespace)s" test/crossref.json',
+  '-g externs test/crossref.json',
+  '-g cpp-bundle-schema -n "test::api::%(namespace)s" -b Test -i test '
+      'test/simple_api.json test/crossref.json',
+]
+
+
+def _ReadFiles(root):
+  contents = {}
+  for dirpath, _, filenames in os.walk(root):
+    for filename in filenames:
+      path = os.path.join(dirpath, filename)
+      with open(path) as f:
+        contents[os.path.relpath(path, root)] = f.read()
+  return contents
+
+
+class CompilerTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.parser = compiler._CreateOptionParser()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _Job(self, job, destdir):
+    return '%s -d %s' % (job, os.path.join(self.temp_dir, destdir))
+
+  def testJobsFileMatchesSeparateCompilations(self):
+    for job in _JOBS:
+      opts, file_paths = self.parser.parse_args(
+          shlex.split(self._Job(job, 'separate')))
+      compiler._Compile(opts, file_paths)
+    jobs_file = os.path.join(self.temp_dir, 'jobs.rsp')
+    with open(jobs_file, 'w') as f:
+      f.write('\n'.join(self._Job(job, 'batch') for job in _JOBS))
+    compiler.RunJobsFile(self.parser, jobs_file)
+
+    separate = _ReadFiles(os.path.join(self.temp_dir, 'separate'))
+    self.assertIn(os.path.join('test', 'crossref.cc'), separate)
+    self.assertEqual(separate, _ReadFiles(os.path.join(self.temp_dir, 'batch')))
+
+  def testWorker(self):
+    stdin = StringIO('\n'.join([self._Job(_JOBS[0], 'out'),
+                                '-g cpp test/simple_api.json',
+                                self._Job('-g cpp test/missing.json', 'out'),
+                                self._Job(_JOBS[1], 'out')]))
+    stdout = StringIO()
+    compiler.RunWorker(self.parser, stdin, stdout)
+    replies = stdout.getvalue().splitlines()
+    self.assertEqual(4, len(replies))
+    self.assertEqual('OK', replies[0])
+    self.assertTrue(replies[1].startswith('ERROR Jobs must have a --destdir'))
+    self.assertTrue(replies[2].startswith('ERROR '))
+    self.assertEqual('OK', replies[3])
+    self.assertTrue(os.path.exists(
+        os.path.join(self.temp_dir, 'out', 'test', 'crossref.h')))
+
+
+class SchemaCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.temp_dir, 'schema.json')
+    self.loads = 0
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _Write(self, contents):
+    with open(self.path, 'w') as f:
+      f.write(contents)
+
+  def _Load(self):
+    self.loads += 1
+    with open(self.path) as f:
+      return [{'contents': f.read()}]
+
+  def testGetSchema(self):
+    cache = SchemaCache()
+    self._Write('a')
+    schema = cache.GetSchema(self.path, self._Load)
+    schema[0]['contents'] = 'modified'
+    self.assertEqual([{'contents': 'a'}], cache.GetSchema(self.path,
+                                                          self._Load))
+    self.assertEqual(1, self.loads)
+
+    self._Write('b')
+    self.assertEqual([{'contents': 'b'}], cache.GetSchema(self.path,
+                                                          self._Load))
+    self.assertEqual(2, self.loads)
+
+  def testGetNamespace(self):
+    cache = SchemaCache()
+    self._Write('a')
+    namespace = cache.GetNamespace(self.path, 'ns', object)
+    self.assertIs(namespace, cache.GetNamespace(self.path, 'ns', object))
+    self.assertIsNot(namespace, cache.GetNamespace(self.path, 'other', object))
+    self._Write('b')
+    self.assertIsNot(namespace, cache.GetNamespace(self.path, 'ns', object))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -38,10 +38,13 @@ class NamespaceResolver(object):
   - |include_rules| List containing tuples with (path, cpp_namespace_pattern)
     used when searching for types.
   - |cpp_namespace_pattern| Default namespace pattern
+  - |schema_cache| optional SchemaCache for the resolved namespaces.
   '''
-  def __init__(self, root, path, include_rules, cpp_namespace_pattern):
+  def __init__(self, root, path, include_rules, cpp_namespace_pattern,
+               schema_cache=None):
     self._root = root
     self._include_rules = [(path, cpp_namespace_pattern)] + include_rules
+    self._schema_cache = schema_cache
 
   def ResolveNamespace(self, full_namespace):
     '''Returns the model.Namespace object associated with the |full_namespace|,
@@ -55,13 +58,22 @@ class NamespaceResolver(object):
       for filename in reversed(filenames):
         filepath = os.path.join(path, filename);
         if os.path.exists(os.path.join(self._root, filepath)):
-          schema = SchemaLoader(self._root).LoadSchema(filepath)[0]
-          return Model().AddNamespace(
-              schema,
-              filepath,
-              environment=cpp_namespace_environment)
+          if self._schema_cache:
+            return self._schema_cache.GetNamespace(
+                os.path.join(self._root, filepath), cpp_namespace,
+                lambda: self._LoadNamespace(filepath,
+                                            cpp_namespace_environment))
+          return self._LoadNamespace(filepath, cpp_namespace_environment)
     return None
 
+  def _LoadNamespace(self, filepath, cpp_namespace_environment):
+    schema = SchemaLoader(self._root, self._schema_cache).LoadSchema(
+        filepath)[0]
+    return Model().AddNamespace(
+        schema,
+        filepath,
+        environment=cpp_namespace_environment)
+
   def ResolveType(self, full_name, default_namespace):
     '''Returns the model.Namespace object where the type with the given
     |full_name| is defined, or None if one can't be found.
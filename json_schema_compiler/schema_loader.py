@@ -2,18 +2,56 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import copy
+import hashlib
 import os
 import sys
 
 import idl_schema
 import json_schema
 
+class SchemaCache(object):
+  '''Caches loaded schemas and the namespaces resolved from them, so that
+  compilations run in the same process (see compiler.py --jobs-file) don't
+  parse the same files again. Entries are keyed by the file contents, so a
+  schema which changed between compilations is loaded again.
+  '''
+  def __init__(self):
+    self._schemas = {}
+    self._namespaces = {}
+
+  def _GetKey(self, path):
+    with open(path, 'rb') as f:
+      return (os.path.abspath(path), hashlib.sha1(f.read()).hexdigest())
+
+  def GetSchema(self, path, load_schema):
+    '''Returns the result of |load_schema()| for the schema at |path|. The
+    result is a copy, since callers modify the schemas.
+    '''
+    key = self._GetKey(path)
+    if key not in self._schemas:
+      self._schemas[key] = load_schema()
+    return copy.deepcopy(self._schemas[key])
+
+  def GetNamespace(self, path, cpp_namespace, create_namespace):
+    '''Returns the result of |create_namespace()| for the schema at |path|,
+    with the |cpp_namespace| pattern. The namespace is shared and mustn't be
+    modified.
+    '''
+    key = self._GetKey(path) + (cpp_namespace,)
+    if key not in self._namespaces:
+      self._namespaces[key] = create_namespace()
+    return self._namespaces[key]
+
+
 class SchemaLoader(object):
   '''Loads a schema from a provided filename.
   |root|: path to the root directory.
+  |cache|: an optional SchemaCache for the loaded schemas.
   '''
-  def __init__(self, root):
+  def __init__(self, root, cache=None):
     self._root = root
+    self._cache = cache
 
   def LoadSchema(self, schema):
     '''Load a schema definition. The schema parameter must be a file name
@@ -22,12 +60,17 @@ class SchemaLoader(object):
 
     schema_path = os.path.join(self._root, schema)
     if schema_extension == '.json':
-      api_defs = json_schema.Load(schema_path)
+      load_schema = lambda: json_schema.Load(schema_path)
     elif schema_extension == '.idl':
-      api_defs = idl_schema.Load(schema_path)
+      load_schema = lambda: idl_schema.Load(schema_path)
     else:
       sys.exit('Did not recognize file extension %s for schema %s' %
                (schema_extension, schema))
 
+    if self._cache:
+      api_defs = self._cache.GetSchema(schema_path, load_schema)
+    else:
+      api_defs = load_schema()
+
     # TODO(devlin): This returns a list. Does it need to? Is it ever > 1?
     return api_defs
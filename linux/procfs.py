@@ -11,11 +11,13 @@
 
 
 import collections
+import io
 import logging
 import os
 import re
 import struct
 import sys
+import time
 
 
 class _NullHandler(logging.Handler):
@@ -509,6 +511,101 @@ class ProcSmaps(object):
     return self._vma_internals
 
 
+ProcSmapsDelta = collections.namedtuple('ProcSmapsDelta', [
+    'new',  # {(begin, end): values} of VMAs that appeared.
+    'removed',  # {(begin, end): values} of VMAs that disappeared.
+    'changed',  # {(begin, end): (old_values, new_values)}.
+    ])
+
+
+class ProcSmapsTracker(object):
+  """Tracks changes of /proc/pid/smaps between samples.
+
+  VMAs are keyed by address range. Each VMA's raw text is compared with the
+  previous sample's, and only the requested fields of VMAs whose text changed
+  are parsed, so that a process with many stable mappings is cheap to track.
+  Values are tuples of ints (in kB), ordered as |fields|.
+  """
+  _VMA_HEADER_PATTERN = re.compile(r'^([0-9a-f]+)-([0-9a-f]+) ',
+                                   re.IGNORECASE | re.MULTILINE)
+
+  def __init__(self, pid, fields=('Rss', 'Pss', 'Private_Dirty')):
+    self._pid = pid
+    self._fields = tuple(fields)
+    self._field_prefixes = tuple('\n%s:' % f for f in self._fields)
+    self._file = None
+    # Maps an address range string (e.g. '7f00-7f10') to (text, values).
+    self._vmas = {}
+
+  @property
+  def fields(self):
+    return self._fields
+
+  @property
+  def values(self):
+    """Returns {(begin, end): values} for the last sample."""
+    return dict((self._range(key), values)
+                for key, (_, values) in self._vmas.iteritems())
+
+  def update(self):
+    """Reads smaps and returns a ProcSmapsDelta against the previous sample.
+
+    The first call reports all VMAs as new.
+    """
+    if not self._file:
+      self._file = _ProcFile(os.path.join('/proc', str(self._pid), 'smaps'))
+    return self.update_from_string(self._file.read())
+
+  def update_from_string(self, smaps):
+    """Like update(), but for the given contents of a smaps file."""
+    headers = list(self._VMA_HEADER_PATTERN.finditer(smaps))
+    ends = [m.start() for m in headers[1:]] + [len(smaps)]
+    previous = self._vmas
+    current = {}
+    new = {}
+    changed = {}
+    for header, end in zip(headers, ends):
+      key = header.group(0)[:-1]
+      text = smaps[header.start():end]
+      old = previous.pop(key, None)
+      if old and old[0] == text:
+        current[key] = old
+        continue
+      values = self._parse_values(text)
+      current[key] = (text, values)
+      if not old:
+        new[self._range(key)] = values
+      elif old[1] != values:
+        changed[self._range(key)] = (old[1], values)
+    # Whatever was not seen again has been unmapped.
+    removed = dict((self._range(key), values)
+                   for key, (_, values) in previous.iteritems())
+    self._vmas = current
+    return ProcSmapsDelta(new, removed, changed)
+
+  def _parse_values(self, text):
+    values = []
+    for prefix in self._field_prefixes:
+      start = text.find(prefix)
+      if start == -1:
+        values.append(0)
+        continue
+      start += len(prefix)
+      end = text.find('\n', start)
+      values.append(int(text[start:end if end != -1 else None].split()[0]))
+    return tuple(values)
+
+  @staticmethod
+  def _range(key):
+    begin, end = key.split('-')
+    return int(begin, 16), int(end, 16)
+
+  def close(self):
+    if self._file:
+      self._file.close()
+      self._file = None
+
+
 class ProcPagemap(object):
   """Reads and stores partial information in /proc/pid/pagemap.
 
@@ -630,6 +727,220 @@ class ProcPagemap(object):
     return self._vma_internals
 
 
+class _ProcFile(object):
+  """A /proc file that is kept open and re-read into a reusable buffer."""
+  _INITIAL_BUFFER_SIZE = 4096
+
+  def __init__(self, path):
+    self._file = io.open(path, 'rb', buffering=0)
+    self._buf = bytearray(_ProcFile._INITIAL_BUFFER_SIZE)
+
+  def read(self):
+    """Returns the current contents of the file as a str."""
+    self._file.seek(0)
+    size = 0
+    while True:
+      # Files like maps return at most a page per read(), so read until EOF.
+      if size == len(self._buf):
+        self._buf.extend(bytearray(len(self._buf)))
+      read_size = self._file.readinto(memoryview(self._buf)[size:])
+      if not read_size:
+        return str(self._buf[:size])
+      size += read_size
+
+  def close(self):
+    self._file.close()
+
+
+class ProcessSample(collections.namedtuple('ProcessSample', [
+    'timestamp',  # Seconds since the epoch.
+    'pid',
+    'utime',  # Clock ticks.
+    'stime',  # Clock ticks.
+    'vsize',  # Bytes.
+    'rss',  # Pages, from /proc/pid/statm.
+    'shared',  # Pages, from /proc/pid/statm.
+    'pss',  # kB, from /proc/pid/smaps_rollup, or -1 if unavailable.
+    'swap',  # kB, from /proc/pid/smaps_rollup, or -1 if unavailable.
+    'pagemap_present',  # Pages, or -1 if pagemap is not sampled.
+    'pagemap_swapped',  # Pages, or -1 if pagemap is not sampled.
+    ])):
+  """One sample of the memory usage of a process.
+
+  Samples are stored compactly in time-series files with write_samples() and
+  read back with read_samples().
+  """
+  __slots__ = ()
+  _STRUCT = struct.Struct('<dIQQQQQqqqq')
+
+  def pack(self):
+    return ProcessSample._STRUCT.pack(*self)
+
+  @staticmethod
+  def unpack_from(buf, offset=0):
+    return ProcessSample(*ProcessSample._STRUCT.unpack_from(buf, offset))
+
+
+def write_samples(samples, out_f):
+  """Appends |samples| to a time-series file opened in binary mode."""
+  out_f.write(''.join(sample.pack() for sample in samples))
+
+
+def read_samples(in_f):
+  """Yields the ProcessSamples in a time-series file."""
+  record_size = ProcessSample._STRUCT.size  # pylint: disable=W0212
+  data = in_f.read()
+  for offset in xrange(0, len(data) - record_size + 1, record_size):
+    yield ProcessSample.unpack_from(data, offset)
+
+
+class _SampledProcess(object):
+  """Open /proc files of one process that is sampled by ProcSampler."""
+  # Bits in the most significant byte of a little-endian pagemap value.
+  # Translation tables map each byte value to '\x01' if the bit is set.
+  _PRESENT_TABLE = ''.join(
+      '\x01' if i & (ProcPagemap._MASK_PRESENT >> 56) else '\x00'
+      for i in xrange(256))
+  _SWAPPED_TABLE = ''.join(
+      '\x01' if i & (ProcPagemap._MASK_SWAPPED >> 56) else '\x00'
+      for i in xrange(256))
+
+  def __init__(self, pid, read_pagemap):
+    proc_dir = os.path.join('/proc', str(pid))
+    self._files = []
+    self._smaps_rollup = None
+    self._maps = None
+    self._pagemap = None
+    try:
+      self._stat = self._open(proc_dir, 'stat')
+      self._statm = self._open(proc_dir, 'statm')
+      if os.path.exists(os.path.join(proc_dir, 'smaps_rollup')):
+        self._smaps_rollup = self._open(proc_dir, 'smaps_rollup')
+      if read_pagemap:
+        self._maps = self._open(proc_dir, 'maps')
+        self._pagemap = io.open(os.path.join(proc_dir, 'pagemap'), 'rb',
+                                buffering=0)
+    except (IOError, OSError):
+      self.close()
+      raise
+
+  def _open(self, proc_dir, name):
+    proc_file = _ProcFile(os.path.join(proc_dir, name))
+    self._files.append(proc_file)
+    return proc_file
+
+  def close(self):
+    for proc_file in self._files:
+      proc_file.close()
+    self._files = []
+    if self._pagemap:
+      self._pagemap.close()
+      self._pagemap = None
+
+  def sample(self, timestamp, pid, pagemap_buf):
+    # The command name in stat may contain spaces and parentheses.
+    stat_fields = self._stat.read().rsplit(')', 1)[1].split()
+    statm_fields = self._statm.read().split()
+    pss = swap = -1
+    if self._smaps_rollup:
+      for line in self._smaps_rollup.read().splitlines():
+        if line.startswith('Pss:'):
+          pss = int(line.split()[1])
+        elif line.startswith('Swap:'):
+          swap = int(line.split()[1])
+    present = swapped = -1
+    if self._pagemap:
+      present, swapped = self._sample_pagemap(pagemap_buf)
+    return ProcessSample(
+        timestamp, pid,
+        int(stat_fields[11]), int(stat_fields[12]),  # utime, stime
+        int(stat_fields[20]),  # vsize
+        int(statm_fields[1]), int(statm_fields[2]),  # resident, shared
+        pss, swap, present, swapped)
+
+  def _sample_pagemap(self, pagemap_buf):
+    """Returns the number of present and swapped pages of the process.
+
+    Pagemap values are read in chunks into |pagemap_buf|. Their most
+    significant bytes hold the flags, and are counted in bulk.
+    """
+    present = 0
+    swapped = 0
+    value_size = ProcPagemap._BYTES_PER_PAGEMAP_VALUE
+    view = memoryview(pagemap_buf)
+    for line in self._maps.read().splitlines():
+      begin, _, end = line.partition(' ')[0].partition('-')
+      offset = ProcPagemap._offset(int(begin, 16))
+      end_offset = ProcPagemap._offset(int(end, 16))
+      while offset < end_offset:
+        self._pagemap.seek(offset)
+        chunk_size = min(end_offset - offset, len(pagemap_buf))
+        size = self._pagemap.readinto(view[:chunk_size])
+        if not size:
+          break
+        size -= size % value_size
+        flags = pagemap_buf[value_size - 1:size:value_size]
+        present += flags.translate(self._PRESENT_TABLE).count('\x01')
+        swapped += flags.translate(self._SWAPPED_TABLE).count('\x01')
+        offset += size
+    return present, swapped
+
+
+class ProcSampler(object):
+  """Samples the memory usage of many processes at once.
+
+  Unlike ProcStat.load() and friends, /proc files are opened once per process
+  and re-read into reusable buffers on each sample, and pagemap is read in
+  bounded chunks whose flags are counted in bulk rather than value by value.
+  Processes that exit are dropped from the sampler.
+  """
+  _PAGEMAP_BUFFER_SIZE = 1 << 20
+
+  def __init__(self, pids=(), read_pagemap=True):
+    self._read_pagemap = read_pagemap
+    self._processes = collections.OrderedDict()
+    self._pagemap_buf = bytearray(ProcSampler._PAGEMAP_BUFFER_SIZE)
+    for pid in pids:
+      self.add_pid(pid)
+
+  def add_pid(self, pid):
+    """Starts sampling |pid|. Returns False if it cannot be sampled."""
+    if pid in self._processes:
+      return True
+    try:
+      self._processes[pid] = _SampledProcess(pid, self._read_pagemap)
+    except (IOError, OSError):
+      _LOGGER.warn('Cannot sample process %d.' % pid)
+      return False
+    return True
+
+  def remove_pid(self, pid):
+    process = self._processes.pop(pid, None)
+    if process:
+      process.close()
+
+  @property
+  def pids(self):
+    return self._processes.keys()
+
+  def sample(self):
+    """Returns a list of ProcessSamples, one for each live process."""
+    timestamp = time.time()
+    samples = []
+    for pid, process in self._processes.items():
+      try:
+        samples.append(process.sample(timestamp, pid, self._pagemap_buf))
+      except (IOError, OSError, IndexError, ValueError):
+        # The process exited, possibly while being read.
+        _LOGGER.info('Process %d is gone.' % pid)
+        self.remove_pid(pid)
+    return samples
+
+  def close(self):
+    for pid in self.pids:
+      self.remove_pid(pid)
+
+
 class _ProcessMemory(object):
   """Aggregates process memory information from /proc for manual testing."""
   def __init__(self, pid):
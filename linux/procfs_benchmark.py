@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Measures the per-sample cost of procfs.ProcSampler.
+
+Compares it with loading the same information for each process with the
+ProcStat / ProcStatm / ProcMaps / ProcPagemap loaders.
+
+Example usage:
+  # Sample 100 spawned processes:
+  procfs_benchmark.py --spawn 100
+
+  # Sample existing processes:
+  procfs_benchmark.py $(pgrep chrome)
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+import procfs
+
+
+# Touches some memory so that pagemap has present pages to count.
+_CHILD_SCRIPT = 'import sys; x = "x" * (8 << 20); sys.stdin.read()'
+
+
+def _LoadAll(pids):
+  for pid in pids:
+    procfs.ProcStat.load(pid)
+    procfs.ProcStatm.load(pid)
+    maps = procfs.ProcMaps.load(pid)
+    if maps:
+      procfs.ProcPagemap.load(pid, maps)
+
+
+def _Measure(name, func, num_samples, num_pids):
+  start = time.time()
+  for _ in xrange(num_samples):
+    func()
+  elapsed = (time.time() - start) / num_samples
+  print '%-14s %8.2f ms/sample %8.3f ms/process' % (
+      name, elapsed * 1000, elapsed * 1000 / max(num_pids, 1))
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('pids', nargs='*', type=int, help='Processes to sample.')
+  parser.add_argument('--spawn', type=int, default=0, metavar='NUM',
+                      help='Spawn and sample this many processes.')
+  parser.add_argument('--samples', type=int, default=20,
+                      help='Number of samples to average over.')
+  parser.add_argument('--no-pagemap', action='store_true',
+                      help='Do not sample /proc/pid/pagemap.')
+  args = parser.parse_args()
+
+  children = [subprocess.Popen([sys.executable, '-c', _CHILD_SCRIPT],
+                               stdin=subprocess.PIPE)
+              for _ in xrange(args.spawn)]
+  try:
+    # Give children time to allocate.
+    time.sleep(1 if children else 0)
+    pids = args.pids + [c.pid for c in children]
+    if not pids:
+      parser.error('Pass pids or --spawn.')
+
+    sampler = procfs.ProcSampler(pids, read_pagemap=not args.no_pagemap)
+    print 'Sampling %d processes (average of %d samples):' % (
+        len(sampler.pids), args.samples)
+    if not args.no_pagemap:
+      _Measure('Per-file load', lambda: _LoadAll(sampler.pids), args.samples,
+               len(sampler.pids))
+    _Measure('ProcSampler', sampler.sample, args.samples, len(sampler.pids))
+    sampler.close()
+  finally:
+    for child in children:
+      child.stdin.close()
+      child.wait()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -6,6 +6,7 @@
 import cStringIO
 import logging
 import os
+import subprocess
 import sys
 import unittest
 
@@ -13,6 +14,11 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, ROOT_DIR)
 
 from procfs import ProcMaps
+from procfs import ProcSampler
+from procfs import ProcSmapsTracker
+from procfs import ProcessSample
+from procfs import read_samples
+from procfs import write_samples
 
 
 class ProcMapsTest(unittest.TestCase):
@@ -103,6 +109,113 @@ class ProcMapsTest(unittest.TestCase):
                        self._expected_as_dict(selected[index]))
 
 
+class ProcSmapsTrackerTest(unittest.TestCase):
+  @staticmethod
+  def _smaps(vmas):
+    lines = []
+    for begin, end, rss, pss, private_dirty in vmas:
+      lines.extend([
+          '%x-%x rw-p 00000000 00:00 0' % (begin, end),
+          'Size:               %d kB' % ((end - begin) / 1024),
+          'Rss:                %d kB' % rss,
+          'Pss:                %d kB' % pss,
+          'Pss_Dirty:          %d kB' % pss,
+          'Private_Dirty:      %d kB' % private_dirty,
+          'VmFlags: rd wr mr mw me ac',
+      ])
+    return '\n'.join(lines) + '\n'
+
+  def test_update(self):
+    tracker = ProcSmapsTracker(0)
+    delta = tracker.update_from_string(self._smaps([
+        (0x1000, 0x3000, 8, 4, 0),
+        (0x3000, 0x5000, 4, 4, 4),
+    ]))
+    self.assertEqual({(0x1000, 0x3000): (8, 4, 0),
+                      (0x3000, 0x5000): (4, 4, 4)}, delta.new)
+    self.assertEqual({}, delta.removed)
+    self.assertEqual({}, delta.changed)
+
+    delta = tracker.update_from_string(self._smaps([
+        (0x1000, 0x3000, 8, 2, 0),
+        (0x5000, 0x6000, 4, 4, 4),
+    ]))
+    self.assertEqual({(0x5000, 0x6000): (4, 4, 4)}, delta.new)
+    self.assertEqual({(0x3000, 0x5000): (4, 4, 4)}, delta.removed)
+    self.assertEqual({(0x1000, 0x3000): ((8, 4, 0), (8, 2, 0))}, delta.changed)
+    self.assertEqual({(0x1000, 0x3000): (8, 2, 0),
+                      (0x5000, 0x6000): (4, 4, 4)}, tracker.values)
+
+    delta = tracker.update_from_string(self._smaps([
+        (0x1000, 0x3000, 8, 2, 0),
+        (0x5000, 0x6000, 4, 4, 4),
+    ]))
+    self.assertEqual(({}, {}, {}), delta)
+
+  def test_fields(self):
+    tracker = ProcSmapsTracker(0, fields=('Size', 'Pss_Dirty', 'Swap'))
+    delta = tracker.update_from_string(self._smaps([
+        (0x1000, 0x3000, 8, 4, 0)]))
+    self.assertEqual({(0x1000, 0x3000): (8, 4, 0)}, delta.new)
+
+  def test_update_self(self):
+    tracker = ProcSmapsTracker(os.getpid())
+    try:
+      delta = tracker.update()
+    finally:
+      tracker.close()
+    self.assertTrue(delta.new)
+    self.assertEqual(delta.new, tracker.values)
+
+
+class ProcSamplerTest(unittest.TestCase):
+  def test_sample(self):
+    pid = os.getpid()
+    sampler = ProcSampler([pid])
+    try:
+      samples = sampler.sample()
+    finally:
+      sampler.close()
+    self.assertEqual(1, len(samples))
+    sample = samples[0]
+    self.assertEqual(pid, sample.pid)
+    self.assertTrue(sample.vsize > 0)
+    self.assertTrue(sample.rss > 0)
+    # Memory may have changed between reading statm and pagemap.
+    self.assertTrue(sample.rss / 2 < sample.pagemap_present < sample.rss * 2)
+
+  def test_sample_without_pagemap(self):
+    sampler = ProcSampler([os.getpid()], read_pagemap=False)
+    try:
+      sample = sampler.sample()[0]
+    finally:
+      sampler.close()
+    self.assertEqual(-1, sample.pagemap_present)
+    self.assertEqual(-1, sample.pagemap_swapped)
+
+  def test_exited_process(self):
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    sampler = ProcSampler([os.getpid(), child.pid])
+    try:
+      child.wait()
+      samples = sampler.sample()
+      self.assertEqual([os.getpid()], [s.pid for s in samples])
+      self.assertEqual([os.getpid()], sampler.pids)
+    finally:
+      sampler.close()
+
+  def test_write_read_samples(self):
+    samples = [
+        ProcessSample(1.5, 123, 10, 20, 4096, 1, 2, 3, 4, 5, 6),
+        ProcessSample(2.5, 456, 11, 21, 1 << 40, 7, 8, -1, -1, -1, -1),
+    ]
+    out_f = cStringIO.StringIO()
+    write_samples(samples, out_f)
+    write_samples(samples[:1], out_f)
+    out_f.seek(0)
+    self.assertEqual(samples + samples[:1], list(read_samples(out_f)))
+
+
 if __name__ == '__main__':
   logging.basicConfig(
       level=logging.DEBUG if '-v' in sys.argv else logging.ERROR,
@@ -59,10 +59,33 @@ def Classify(nativeheap, rule_tree):
   assert(isinstance(nativeheap, native_heap.NativeHeap))
   assert(isinstance(rule_tree, rules.Rule))
 
-  res = results.AggreatedResults(rule_tree, _RESULT_KEYS)
+  # The classification of an allocation depends only on the symbol names and
+  # source paths of its stack frames. Hence, first aggregate the allocations by
+  # call site and then walk the rule tree only once per unique stack trace.
+  # Stack frames are unique per address (see |NativeHeap.GetStackFrame|), so
+  # the first pass can cheaply key allocations by the identity of their frames.
+  values_by_frames = collections.defaultdict(lambda: [0, 0])
+  for allocation in nativeheap.allocations:
+    values = values_by_frames[tuple(map(id, allocation.stack_trace.frames))]
+    values[0] += allocation.size
+    values[1] += allocation.resident_size
+
+  # Different addresses can still resolve to the same symbols (e.g. different
+  # call sites within the same function), so aggregate once more by frame key.
+  frame_keys_by_id = {}
   for allocation in nativeheap.allocations:
-    res.AddToMatchingNodes(allocation,
-                           [allocation.size, allocation.resident_size])
+    for frame in allocation.stack_trace.frames:
+      frame_keys_by_id[id(frame)] = _GetFrameKey(frame)
+  values_by_frame_keys = collections.defaultdict(lambda: [0, 0])
+  for frame_ids, (size, resident_size) in values_by_frames.iteritems():
+    values = values_by_frame_keys[
+        tuple(frame_keys_by_id[frame_id] for frame_id in frame_ids)]
+    values[0] += size
+    values[1] += resident_size
+
+  res = results.AggreatedResults(rule_tree, _RESULT_KEYS)
+  for frame_keys, values in values_by_frame_keys.iteritems():
+    res.AddToMatchingNodes(frame_keys, values)
   return res
 
 
@@ -155,6 +178,15 @@ def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
   return LoadRules(str(rules_tree))
 
 
+def _GetFrameKey(frame):
+  """Returns the (symbol name, source path) tuple used to match a frame."""
+  if not frame.symbol:
+    return (None, None)
+  if not frame.symbol.source_info:
+    return (frame.symbol.name, None)
+  return (frame.symbol.name, frame.symbol.source_info[0].source_file_path)
+
+
 class _NHeapRule(rules.Rule):
   def __init__(self, name, filters):
     super(_NHeapRule, self).__init__(name)
@@ -182,16 +214,35 @@ class _NHeapRule(rules.Rule):
         raise exceptions.MemoryInspectorException(
             'Path regex error "%s" : %s' % (path_regex, descr))
 
-  def Match(self, allocation):
+    # The same symbols and source paths recur across many stack traces. Memoize
+    # the outcome of each regex, so that it runs at most once per unique value.
+    self._path_matches = {}  # source path -> bool.
+    # One dict per stack trace regex: symbol name -> bool.
+    self._symbol_matches = [{} for _ in self._stacktrace_regexs]
+
+  def Match(self, trace_record):
+    """Matches either an |Allocation| or a tuple of frame keys.
+
+    The latter (see |_GetFrameKey|) is what |Classify| uses to match all the
+    allocations with the same stack trace in one go.
+    """
+    if isinstance(trace_record, native_heap.Allocation):
+      frame_keys = map(_GetFrameKey, trace_record.stack_trace.frames)
+    else:
+      frame_keys = trace_record
+
     # Match the source file path, if the 'source_path' filter is specified.
     if self._path_regex:
       path_matches = False
-      for frame in allocation.stack_trace.frames:
-        if frame.symbol and frame.symbol.source_info:
-          if self._path_regex.search(
-              frame.symbol.source_info[0].source_file_path):
-            path_matches = True
-            break
+      for _, source_path in frame_keys:
+        if source_path is None:
+          continue
+        path_matches = self._path_matches.get(source_path)
+        if path_matches is None:
+          path_matches = bool(self._path_regex.search(source_path))
+          self._path_matches[source_path] = path_matches
+        if path_matches:
+          break
       if not path_matches:
         return False
 
@@ -200,12 +251,20 @@ class _NHeapRule(rules.Rule):
       return True
     cur_regex_idx = 0
     cur_regex = self._stacktrace_regexs[0]
-    for frame in allocation.stack_trace.frames:
-      if frame.symbol and cur_regex.search(frame.symbol.name):
+    cur_matches = self._symbol_matches[0]
+    for symbol_name, _ in frame_keys:
+      if symbol_name is None:
+        continue
+      matches = cur_matches.get(symbol_name)
+      if matches is None:
+        matches = bool(cur_regex.search(symbol_name))
+        cur_matches[symbol_name] = matches
+      if matches:
         # The current regex has been matched.
         if cur_regex_idx == len(self._stacktrace_regexs) - 1:
           return True  # All the provided regexs have been matched, we're happy.
         cur_regex_idx += 1
         cur_regex = self._stacktrace_regexs[cur_regex_idx]
+        cur_matches = self._symbol_matches[cur_regex_idx]
 
     return False  # Not all the provided regexs have been matched.
\ No newline at end of file
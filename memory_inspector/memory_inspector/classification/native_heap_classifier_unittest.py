@@ -5,6 +5,7 @@
 import unittest
 
 from memory_inspector.classification import native_heap_classifier
+from memory_inspector.classification import results
 from memory_inspector.core import native_heap
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
@@ -137,6 +138,44 @@ class NativeHeapClassifierTest(unittest.TestCase):
     res = native_heap_classifier.Classify(nheap, rule_tree)
     self._CheckResult(res.total, '', _HEURISTIC_EXPECTED_RESULTS)
 
+  def testClassifyAggregatesByStackTrace(self):
+    rule_tree = native_heap_classifier.LoadRules(_TEST_RULES)
+    nheap = native_heap.NativeHeap()
+    frames_by_name = {}
+    # Create several allocations per stack trace, sharing the stack frames as
+    # |NativeHeap.GetStackFrame| does. Two distinct addresses are used for each
+    # symbol, so that the same symbols are reachable through different frames.
+    for i in xrange(4):
+      for (alloc_size, frames) in _TEST_STACK_TRACES:
+        mock_strace = stacktrace.Stacktrace()
+        for (mock_btstr, mock_source_path) in frames:
+          key = (mock_btstr, mock_source_path, i % 2)
+          if key not in frames_by_name:
+            mock_frame = nheap.GetStackFrame(len(frames_by_name) * 4)
+            mock_frame.SetSymbolInfo(
+                symbol.Symbol(mock_btstr, mock_source_path))
+            frames_by_name[key] = mock_frame
+          mock_strace.Add(frames_by_name[key])
+        nheap.Add(native_heap.Allocation(
+            size=alloc_size, stack_trace=mock_strace, resident_size=i))
+
+    res = native_heap_classifier.Classify(nheap, rule_tree)
+    # Compare against classifying each allocation individually.
+    expected = results.AggreatedResults(
+        native_heap_classifier.LoadRules(_TEST_RULES), res.keys)
+    for alloc in nheap.allocations:
+      expected.AddToMatchingNodes(alloc, [alloc.size, alloc.resident_size])
+    expected_results = {}
+    self._CollectResults(expected.total, '', expected_results)
+    self.assertEqual(expected_results['Total'], [238 * 4, 6 * 12])
+    self._CheckResult(res.total, '', expected_results)
+
+  def _CollectResults(self, node, prefix, out_results):
+    node_name = prefix + node.name
+    out_results[node_name] = node.values
+    for child in node.children:
+      self._CollectResults(child, node_name + '::', out_results)
+
   def _CheckResult(self, node, prefix, expected_results):
     node_name = prefix + node.name
     self.assertIn(node_name, expected_results)
@@ -7,6 +7,9 @@ import bisect
 
 PAGE_SIZE = 4096
 
+# Number of bits set in each byte value.
+_POPCOUNT = [bin(i).count('1') for i in xrange(256)]
+
 
 class Map(object):
   """Models the memory map of a given |backends.Process|.
@@ -60,6 +63,9 @@ class MapEntry(object):
     # resident_pages is a bitmap (array of bytes) in which each bit represents
     # the presence of its corresponding page.
     self.resident_pages = resident_pages or []
+    # Prefix sums of the popcount of |resident_pages| (see _CountResidentPages).
+    self._resident_pages_prefix = None
+    self._resident_pages_prefix_src = None
 
   def GetRelativeMMOffset(self, abs_addr):
     """Converts abs_addr to the corresponding offset in the mm.
@@ -87,6 +93,46 @@ class MapEntry(object):
       return False
     return (self.resident_pages[arr_idx] & (1 << arr_bit)) != 0
 
+  def GetResidentBytes(self, start, end):
+    """Returns the number of resident bytes in the [start, end] address range.
+
+    The range is clipped to the mm boundaries. The cost does not depend on the
+    length of the range, as the fully covered pages are counted through the
+    prefix sums of the resident pages bitmap.
+    """
+    start = max(start, self.start)
+    end = min(end, self.end)
+    if start > end:
+      return 0
+    first_page, first_page_off = self.GetRelativeMMOffset(start)
+    last_page, last_page_off = self.GetRelativeMMOffset(end)
+    if first_page == last_page:
+      return end - start + 1 if self.IsPageResident(first_page) else 0
+    resident_bytes = 0
+    if self.IsPageResident(first_page):
+      resident_bytes += PAGE_SIZE - first_page_off
+    if self.IsPageResident(last_page):
+      resident_bytes += last_page_off + 1
+    resident_bytes += PAGE_SIZE * (self._CountResidentPages(last_page) -
+                                   self._CountResidentPages(first_page + 1))
+    return resident_bytes
+
+  def _CountResidentPages(self, num_pages):
+    """Returns the number of resident pages in the first |num_pages| pages."""
+    # resident_pages is a public attribute which is often set after __init__.
+    if self._resident_pages_prefix_src is not self.resident_pages:
+      prefix = [0]
+      for byte in self.resident_pages:
+        prefix.append(prefix[-1] + _POPCOUNT[byte])
+      self._resident_pages_prefix = prefix
+      self._resident_pages_prefix_src = self.resident_pages
+    arr_idx = num_pages / 8
+    if arr_idx >= len(self.resident_pages):
+      return self._resident_pages_prefix[-1]
+    arr_mask = (1 << (num_pages % 8)) - 1
+    return (self._resident_pages_prefix[arr_idx] +
+            _POPCOUNT[self.resident_pages[arr_idx] & arr_mask])
+
   def Contains(self, abs_addr):
     """Determines whether a given absolute address belongs to the current mm."""
     return abs_addr >= self.start and abs_addr <= self.end
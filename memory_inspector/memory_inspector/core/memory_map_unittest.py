@@ -32,6 +32,14 @@ class MemoryMapTest(unittest.TestCase):
     self.assertFalse(map_entry2.IsPageResident(1))
     self.assertTrue(map_entry2.IsPageResident(2))
 
+    # Test the resident bytes logic (ranges are clipped to the mm).
+    self.assertEqual(map_entry2.GetResidentBytes(0, 100000), 2 * 4096)
+    self.assertEqual(map_entry2.GetResidentBytes(65536, 65539), 4)
+    self.assertEqual(map_entry2.GetResidentBytes(69632, 73727), 0)
+    self.assertEqual(map_entry2.GetResidentBytes(69000, 73730), 632 + 3)
+    self.assertEqual(map_entry2.GetResidentBytes(81920, 90000), 0)
+    self.assertEqual(map_entry1.GetResidentBytes(4096, 8191), 0)
+
     # Test the lookup logic.
     mmap.Add(map_entry1)
     mmap.Add(map_entry2)
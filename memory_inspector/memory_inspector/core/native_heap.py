@@ -6,8 +6,6 @@ from memory_inspector.core import memory_map
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
 
-from memory_inspector.core.memory_map import PAGE_SIZE
-
 
 class NativeHeap(object):
   """A snapshot of outstanding (i.e. not freed) native allocations.
@@ -21,7 +19,7 @@ class NativeHeap(object):
 
   def Add(self, allocation):
     assert(isinstance(allocation, Allocation))
-    self.allocations += [allocation]
+    self.allocations.append(allocation)
 
   def GetStackFrame(self, absolute_addr):
     """Guarantees that multiple calls with the same addr return the same obj."""
@@ -62,38 +60,40 @@ class NativeHeap(object):
     estimates the resident size of an allocation intersecting the mmaps dump.
     """
     assert(isinstance(mmap, memory_map.Map))
-    for alloc in self.allocations:
-      # This function loops over all the memory pages that intersect, partially
-      # or fully, with each allocation. For each of them, the allocation  is
-      # attributed a resident size equal to the size of intersecting range iff
-      # the page is resident.
-      # The tricky part is that, in the general case, an allocation can span
-      # over multiple (contiguous) mmaps. See the chart below for a reference:
-      #
-      # VA space:  |0    |4k   |8k   |12k  |16k  |20k  |24k  |28k  |32k  |
-      # Mmaps:     [   mm 1   ][ mm2 ]           [          map 3        ]
-      # Allocs:      <a1>  <  a2  >                       <      a3      >
-      #
-      # Note: this accounting technique is not fully correct but is generally a
-      # good tradeoff between accuracy and speed of profiling. The OS provides
-      # resident information with the page granularity (typ. 4k). Finer values
-      # would require more fancy techniques based, for instance, on run-time
-      # instrumentation tools like Valgrind or *sanitizer.
-      cur_start = alloc.start
-      mm = None
-      while cur_start < alloc.end:
-        if not mm or not mm.Contains(cur_start):
-          mm = mmap.Lookup(cur_start)
-        if mm:
-          page, page_off = mm.GetRelativeMMOffset(cur_start)
-          if mm.IsPageResident(page):
-            page_end = mm.start + page * PAGE_SIZE + PAGE_SIZE - 1
-            alloc_memory_in_current_page = PAGE_SIZE - page_off
-            if alloc.end < page_end:
-              alloc_memory_in_current_page -= page_end - alloc.end
-            alloc.resident_size += alloc_memory_in_current_page
-        # Move to the next page boundary.
-        cur_start = (cur_start + PAGE_SIZE) & ~(PAGE_SIZE - 1)
+    # The resident size of an allocation is the sum, over all the resident
+    # pages that intersect it (partially or fully), of the size of the
+    # intersection. In the general case, an allocation can span over multiple
+    # (contiguous) mmaps. See the chart below for a reference:
+    #
+    # VA space:  |0    |4k   |8k   |12k  |16k  |20k  |24k  |28k  |32k  |
+    # Mmaps:     [   mm 1   ][ mm2 ]           [          map 3        ]
+    # Allocs:      <a1>  <  a2  >                       <      a3      >
+    #
+    # Rather than looking up each page of each allocation, this sweeps the
+    # allocations, sorted by start address, alongside the (sorted and
+    # non-overlapping) mmaps. Each mmap counts the resident bytes in a range
+    # in constant time (see |MapEntry|.|GetResidentBytes|).
+    # Allocations cover [start, end], including |end|: an allocation whose last
+    # byte is the first byte of a resident page gets that byte too.
+    #
+    # Note: this accounting technique is not fully correct but is generally a
+    # good tradeoff between accuracy and speed of profiling. The OS provides
+    # resident information with the page granularity (typ. 4k). Finer values
+    # would require more fancy techniques based, for instance, on run-time
+    # instrumentation tools like Valgrind or *sanitizer.
+    entries = mmap.entries
+    first_entry_idx = 0
+    for alloc in sorted(self.allocations, key=lambda alloc: alloc.start):
+      # Skip the mmaps which end before the allocation. As allocations are
+      # sorted, they would end before all the next allocations as well.
+      while (first_entry_idx < len(entries) and
+             entries[first_entry_idx].end < alloc.start):
+        first_entry_idx += 1
+      entry_idx = first_entry_idx
+      while entry_idx < len(entries) and entries[entry_idx].start <= alloc.end:
+        alloc.resident_size += entries[entry_idx].GetResidentBytes(
+            alloc.start, alloc.end)
+        entry_idx += 1
 
 
 class Allocation(object):
@@ -16,6 +16,7 @@ S.Traces:    |   |              +-----------> st1[exe1 + 0, exe1 + 4]
 Furthermore, the exe2 is a file mapping with non-zero (8k) offset.
 """
 
+import random
 import unittest
 
 from memory_inspector.core import memory_map
@@ -145,3 +146,70 @@ class NativeHeapTest(unittest.TestCase):
     #  [12288, 16384]: the 4th page is fully covered as well, but not resident.
     # *[16384, 18190]: the 5th page is partially covered and resident.
     self.assertEqual(alloc3.resident_size, (12288 - 8192) + (18190 - 16384))
+
+
+class NativeHeapResidentSizeTest(unittest.TestCase):
+  def runTest(self):
+    # Checks CalculateResidentSize against a page-by-page reference on random
+    # (page-aligned, possibly adjacent) mmaps and allocations.
+    rand = random.Random(0)
+    mmap = memory_map.Map()
+    page = 0
+    for _ in xrange(50):
+      page += rand.randint(0, 3)
+      num_pages = rand.randint(1, 40)
+      resident_pages = [rand.randint(0, 255)
+                        for _ in xrange(rand.randint(0, num_pages / 8 + 1))]
+      mmap.Add(memory_map.MapEntry(
+          page * PAGE_SIZE, (page + num_pages) * PAGE_SIZE - 1, 'rw--', '', 0,
+          resident_pages=resident_pages))
+      page += num_pages
+
+    nheap = native_heap.NativeHeap()
+    for _ in xrange(500):
+      nheap.Add(native_heap.Allocation(
+          start=rand.randint(0, page * PAGE_SIZE),
+          size=rand.choice([rand.randint(1, 64), rand.randint(1, 40000)]),
+          stack_trace=stacktrace.Stacktrace()))
+    nheap.CalculateResidentSize(mmap)
+
+    for alloc in nheap.allocations:
+      expected_resident_size = 0
+      for addr in xrange(alloc.start & ~(PAGE_SIZE - 1), alloc.end + 1,
+                         PAGE_SIZE):
+        mm = mmap.Lookup(addr)
+        if mm and mm.IsPageResident(mm.GetRelativeMMOffset(addr)[0]):
+          expected_resident_size += (min(alloc.end, addr + PAGE_SIZE - 1) -
+                                     max(alloc.start, addr) + 1)
+      self.assertEqual(alloc.resident_size, expected_resident_size)
+
+
+class NativeHeapResidentSizeBoundariesTest(unittest.TestCase):
+  def runTest(self):
+    # An allocation covers the [start, start + size - 1] range, including its
+    # last byte when that is the first byte of a page. The page-walking
+    # implementation used before the mmaps sweep did not count those bytes
+    # (nor 1-byte allocations), which these cases guard against.
+    mmap = memory_map.Map()
+    mmap.Add(memory_map.MapEntry(0, 3 * PAGE_SIZE - 1, 'rw--', '', 0,
+                                 resident_pages=[0b101]))
+    mmap.Add(memory_map.MapEntry(3 * PAGE_SIZE, 5 * PAGE_SIZE - 1, 'rw--', '',
+                                 0, resident_pages=[0b11]))
+    cases = [
+        # (start, size, expected resident_size). Page 1 is not resident.
+        (100, 1, 1),
+        (4095, 2, 1),
+        (0, 4097, 4096),
+        (8191, 2, 1),
+        (8000, 193, 1),
+        (3 * PAGE_SIZE - 1, 2, 2),  # Spans the two mmaps.
+        (3 * PAGE_SIZE + 10, 4087, 4087),
+        (3 * PAGE_SIZE, 4097, 4097),
+    ]
+    nheap = native_heap.NativeHeap()
+    for start, size, _ in cases:
+      nheap.Add(native_heap.Allocation(start=start, size=size,
+                                       stack_trace=stacktrace.Stacktrace()))
+    nheap.CalculateResidentSize(mmap)
+    self.assertEqual([expected for _, _, expected in cases],
+                     [alloc.resident_size for alloc in nheap.allocations])
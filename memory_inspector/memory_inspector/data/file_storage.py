@@ -11,6 +11,9 @@ Storage -> N Archives -> 1 Symbol index
 
 Where an "archive" is essentially a collection of snapshots taken for a given
 app at a given point in time.
+
+Native heap dumps are stored in the binary format of serialization.py, which is
+loaded lazily. Mmaps dumps and the symbol index are stored as JSON.
 """
 
 import datetime
@@ -30,6 +33,7 @@ class Storage(object):
   def __init__(self, root_path):
     """Creates a file-backed storage. Files will be placed in |root_path|."""
     self._root = root_path
+    self._archives = {}  # archive_name -> |Archive| (to reuse its caches).
     if not os.path.exists(self._root):
       os.makedirs(self._root)
 
@@ -65,11 +69,16 @@ class Storage(object):
     archive_path = os.path.join(self._root, archive_name)
     if not os.path.exists(archive_path) and create:
       os.makedirs(archive_path)
-    return Archive(archive_name, archive_path)
+    archive = self._archives.get(archive_name)
+    if not archive:
+      archive = Archive(archive_name, archive_path)
+      self._archives[archive_name] = archive
+    return archive
 
   def DeleteArchive(self, archive_name):
     """Deletes the archive (removing its folder)."""
     archive_path = os.path.join(self._root, archive_name)
+    self._archives.pop(archive_name, None)
     for f in os.listdir(archive_path):
       os.unlink(os.path.join(archive_path, f))
     os.rmdir(archive_path)
@@ -79,7 +88,8 @@ class Archive(object):
   """A collection of snapshots, each one holding one memory dump (per kind)."""
 
   _MMAP_EXT = '-mmap.json'
-  _NHEAP_EXT = '-nheap.json'
+  _NHEAP_EXT = '-nheap.bin'
+  _NHEAP_JSON_EXT = '-nheap.json'  # Legacy format, still supported by Load.
   _SNAP_EXT = '.snapshot'
   _SYM_FILE = 'syms.json'
   _TIME_FMT = '%Y-%m-%d_%H-%M-%S-%f'
@@ -89,22 +99,35 @@ class Archive(object):
     self._name = name
     self._path = path
     self._cur_snapshot = None
+    # The symbol db is loaded once and then reused until the file changes (it
+    # can be written by another process, see background_tasks.py).
+    self._symbols = None
+    self._symbols_stat = None
 
   def StoreSymbols(self, symbols):
     """Stores the symbol db (one per the overall archive)."""
     assert(isinstance(symbols, symbol.Symbols))
-    file_path = os.path.join(self._path, Archive._SYM_FILE)
-    with open(file_path, 'w') as f:
+    with open(self.GetSymbolsPath(), 'w') as f:
       json.dump(symbols, f, cls=serialization.Encoder)
+    self._symbols_stat = None
+
+  def GetSymbolsPath(self):
+    """Returns the path of the symbol db (which may not exist)."""
+    return os.path.join(self._path, Archive._SYM_FILE)
 
   def HasSymbols(self):
-    return os.path.exists(os.path.join(self._path, Archive._SYM_FILE))
+    return os.path.exists(self.GetSymbolsPath())
 
   def LoadSymbols(self):
     assert(self.HasSymbols())
-    file_path = os.path.join(self._path, Archive._SYM_FILE)
-    with open(file_path) as f:
-      return json.load(f, cls=serialization.SymbolsDecoder)
+    file_path = self.GetSymbolsPath()
+    stat = os.stat(file_path)
+    symbols_stat = (stat.st_mtime, stat.st_size)
+    if self._symbols_stat != symbols_stat:
+      with open(file_path) as f:
+        self._symbols = json.load(f, cls=serialization.SymbolsDecoder)
+      self._symbols_stat = symbols_stat
+    return self._symbols
 
   def StartNewSnapshot(self):
     """Creates a 2014-01-01_02:03:04.snapshot marker (an empty file)."""
@@ -146,16 +169,22 @@ class Archive(object):
     assert(self._cur_snapshot), 'Must call StartNewSnapshot first'
     file_path = os.path.join(self._path,
                              self._cur_snapshot + Archive._NHEAP_EXT)
-    with open(file_path, 'w') as f:
-      json.dump(nheap, f, cls=serialization.Encoder)
+    with open(file_path, 'wb') as f:
+      serialization.WriteNativeHeap(nheap, f)
 
   def HasNativeHeap(self, timestamp):
-    return self._HasSnapshotFile(timestamp, Archive._NHEAP_EXT)
+    return (self._HasSnapshotFile(timestamp, Archive._NHEAP_EXT) or
+            self._HasSnapshotFile(timestamp, Archive._NHEAP_JSON_EXT))
 
   def LoadNativeHeap(self, timestamp):
+    """Loads a native heap dump. Its allocations are decoded lazily."""
     assert(self.HasNativeHeap(timestamp))
     snapshot_name = Archive.TimestampToStr(timestamp)
     file_path = os.path.join(self._path, snapshot_name + Archive._NHEAP_EXT)
+    if os.path.exists(file_path):
+      return serialization.ReadNativeHeap(file_path)
+    file_path = os.path.join(self._path,
+                             snapshot_name + Archive._NHEAP_JSON_EXT)
     with open(file_path) as f:
       return json.load(f, cls=serialization.NativeHeapDecoder)
 
@@ -4,6 +4,7 @@
 
 """This unittest covers both file_storage and serialization modules."""
 
+import json
 import os
 import tempfile
 import time
@@ -14,6 +15,7 @@ from memory_inspector.core import native_heap
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
 from memory_inspector.data import file_storage
+from memory_inspector.data import serialization
 
 
 class FileStorageTest(unittest.TestCase):
@@ -91,11 +93,42 @@ class FileStorageTest(unittest.TestCase):
                                     stack_trace=stack_trace,
                                     start=i * 20,
                                     flags=i * 30))
+    # Allocations with the same stack trace, one of which has a frame without
+    # exec file info.
+    stack_trace = stacktrace.Stacktrace()
+    stack_trace.Add(nh.GetStackFrame(11))
+    stack_trace.Add(nh.GetStackFrame(99))
+    for i in xrange(1, 3):
+      nh.Add(native_heap.Allocation(size=i, stack_trace=stack_trace,
+                                    resident_size=i * 2))
     archive.StoreNativeHeap(nh)
     nh_deser = archive.LoadNativeHeap(timestamp)
+    self.assertEqual(len(nh_deser.allocations), len(nh.allocations))
+    self.assertIs(nh_deser.allocations[-1].stack_trace,
+                  nh_deser.allocations[-2].stack_trace)
+    # Allocations are decoded lazily. Compare them as a plain list.
+    nh_deser.allocations = list(nh_deser.allocations)
     self._DeepCompare(nh, nh_deser)
     self._storage.DeleteArchive('nheap')
 
+  def testNativeHeapLegacyJson(self):
+    archive = self._storage.OpenArchive('nheap_json', create=True)
+    timestamp = archive.StartNewSnapshot()
+    nh = native_heap.NativeHeap()
+    stack_trace = stacktrace.Stacktrace()
+    frame = nh.GetStackFrame(42)
+    frame.SetExecFileInfo('foo.so', 2)
+    stack_trace.Add(frame)
+    nh.Add(native_heap.Allocation(size=10, stack_trace=stack_trace, start=20))
+    file_path = os.path.join(self._storage_path, 'nheap_json',
+                             file_storage.Archive.TimestampToStr(timestamp) +
+                             '-nheap.json')
+    with open(file_path, 'w') as f:
+      json.dump(nh, f, cls=serialization.Encoder)
+    self.assertTrue(archive.HasNativeHeap(timestamp))
+    self._DeepCompare(nh, archive.LoadNativeHeap(timestamp))
+    self._storage.DeleteArchive('nheap_json')
+
   def testSymbols(self):
     archive = self._storage.OpenArchive('symbols', create=True)
     symbols = symbol.Symbols()
@@ -105,7 +138,9 @@ class FileStorageTest(unittest.TestCase):
     sym3 = symbol.Symbol('sym3', 'file2.c', 13)
     sym3.AddSourceLineInfo('outer_file.c', 23)
     symbols.Add('baz.so', 3, sym3)
+    self.assertFalse(os.path.exists(archive.GetSymbolsPath()))
     archive.StoreSymbols(symbols)
+    self.assertTrue(os.path.isfile(archive.GetSymbolsPath()))
     symbols_deser = archive.LoadSymbols()
     self._DeepCompare(symbols, symbols_deser)
     self._storage.DeleteArchive('symbols')
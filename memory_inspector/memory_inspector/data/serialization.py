@@ -10,9 +10,16 @@ files) and for short term data exchange (AJAX with the HTML UI).
 The rationale of these serializers is to store data in an efficient (i.e. avoid
 to store redundant information) and intelligible (i.e. flatten the classes
 hierarchy keeping only the meaningful bits) format.
+
+Native heaps, which can hold millions of allocations, are stored instead in a
+compact binary format (see WriteNativeHeap), which can be loaded lazily.
 """
 
+import array
 import json
+import mmap
+import struct
+import sys
 
 from memory_inspector.classification import results
 from memory_inspector.core import backends
@@ -25,7 +32,9 @@ from memory_inspector.core import symbol
 class Encoder(json.JSONEncoder):
   def default(self, obj):  # pylint: disable=E0202
     if isinstance(obj, memory_map.Map):
-      return [entry.__dict__ for entry in obj.entries]
+      # Skip the private attributes, which are just lazily computed caches.
+      return [dict((k, v) for k, v in entry.__dict__.iteritems()
+                   if not k.startswith('_')) for entry in obj.entries]
 
     if isinstance(obj, symbol.Symbols):
       return obj.symbols
@@ -37,7 +46,7 @@ class Encoder(json.JSONEncoder):
       # Just keep the list of (distinct) stack frames from the index. Encoding
       # it as a JSON dictionary would be redundant.
       return {'stack_frames': obj.stack_frames.values(),
-              'allocations': obj.allocations}
+              'allocations': list(obj.allocations)}
 
     if isinstance(obj, native_heap.Allocation):
       return obj.__dict__
@@ -110,4 +119,180 @@ class NativeHeapDecoder(json.JSONDecoder):
                                     stack_trace=stack_trace,
                                     flags=alloc_dict['flags'],
                                     resident_size=alloc_dict['resident_size']))
-    return nh
\ No newline at end of file
+    return nh
+
+
+_NHEAP_MAGIC = 'MINH'
+_NHEAP_VERSION = 1
+# magic, version, num_strings, num_frames, num_stack_traces, num_allocations.
+_NHEAP_HEADER = struct.Struct('<4sIIIII')
+_NHEAP_STRING_LEN = struct.Struct('<I')
+# address, exec_file_rel_path string index (-1 if not available), offset.
+_NHEAP_FRAME = struct.Struct('<QiQ')
+# start, size, flags, resident_size, stack trace index.
+_NHEAP_ALLOCATION = struct.Struct('<QQQQI')
+
+
+def WriteNativeHeap(nheap, f):
+  """Writes a |NativeHeap| to the file object |f| in a binary format.
+
+  The format consists of a header followed by these tables:
+  - strings: the (interned) exec file paths of the stack frames.
+  - frames: the address, exec file path and offset of each distinct frame.
+  - stack traces: the frame indexes of each distinct stack trace.
+  - allocations: fixed size records, referring to the stack traces by index.
+  Allocations are typically orders of magnitude more than the distinct stack
+  traces. The fixed size of their records allows ReadNativeHeap to decode them
+  lazily, on demand.
+  """
+  assert(isinstance(nheap, native_heap.NativeHeap))
+  string_index = {}  # exec_file_rel_path -> index.
+  frame_index = {}  # address -> index.
+  frames = []
+  stack_trace_index = {}  # tuple(frame indexes) -> index.
+  stack_trace_offsets = array.array('I', [0])
+  stack_trace_frames = array.array('I')
+  allocations = []
+
+  def GetFrameIndex(frame):
+    idx = frame_index.get(frame.address)
+    if idx is None:
+      idx = len(frames)
+      frame_index[frame.address] = idx
+      frames.append(frame)
+      if frame.exec_file_rel_path is not None:
+        string_index.setdefault(frame.exec_file_rel_path, len(string_index))
+    return idx
+
+  for frame in nheap.stack_frames.itervalues():
+    GetFrameIndex(frame)
+  for alloc in nheap.allocations:
+    key = tuple(GetFrameIndex(frame) for frame in alloc.stack_trace.frames)
+    idx = stack_trace_index.get(key)
+    if idx is None:
+      idx = len(stack_trace_index)
+      stack_trace_index[key] = idx
+      stack_trace_frames.extend(key)
+      stack_trace_offsets.append(len(stack_trace_frames))
+    allocations.append(_NHEAP_ALLOCATION.pack(
+        alloc.start, alloc.size, alloc.flags, alloc.resident_size, idx))
+
+  f.write(_NHEAP_HEADER.pack(_NHEAP_MAGIC, _NHEAP_VERSION, len(string_index),
+                             len(frames), len(stack_trace_index),
+                             len(allocations)))
+  for string in sorted(string_index, key=string_index.get):
+    if isinstance(string, unicode):
+      string = string.encode('utf-8')
+    f.write(_NHEAP_STRING_LEN.pack(len(string)))
+    f.write(string)
+  for frame in frames:
+    if frame.exec_file_rel_path is None:
+      f.write(_NHEAP_FRAME.pack(frame.address, -1, 0))
+    else:
+      f.write(_NHEAP_FRAME.pack(frame.address,
+                                string_index[frame.exec_file_rel_path],
+                                frame.offset))
+  for table in (stack_trace_offsets, stack_trace_frames):
+    if sys.byteorder == 'big':
+      table.byteswap()
+    f.write(table.tostring())
+  f.write(''.join(allocations))
+
+
+def ReadNativeHeap(file_path):
+  """Loads a |NativeHeap| stored by WriteNativeHeap.
+
+  Stack frames are loaded upfront, so that the heap can be symbolized. Stack
+  traces and allocations, instead, are decoded (from the mmap-ed file) only
+  when accessed.
+  """
+  with open(file_path, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  (magic, version, num_strings, num_frames, num_stack_traces,
+   num_allocations) = _NHEAP_HEADER.unpack_from(data)
+  assert(magic == _NHEAP_MAGIC), 'Not a native heap dump: ' + file_path
+  assert(version == _NHEAP_VERSION), 'Unsupported version %d' % version
+  pos = _NHEAP_HEADER.size
+
+  strings = []
+  for _ in xrange(num_strings):
+    (length,) = _NHEAP_STRING_LEN.unpack_from(data, pos)
+    pos += _NHEAP_STRING_LEN.size
+    strings.append(data[pos:pos + length])
+    pos += length
+
+  nh = native_heap.NativeHeap()
+  frames = []
+  for _ in xrange(num_frames):
+    address, string_idx, offset = _NHEAP_FRAME.unpack_from(data, pos)
+    pos += _NHEAP_FRAME.size
+    frame = nh.GetStackFrame(address)
+    if string_idx >= 0:
+      frame.SetExecFileInfo(strings[string_idx], offset)
+    frames.append(frame)
+
+  def ReadIndexTable(length):
+    table = array.array('I')
+    table.fromstring(data[pos:pos + length * table.itemsize])
+    if sys.byteorder == 'big':
+      table.byteswap()
+    return table
+
+  stack_trace_offsets = ReadIndexTable(num_stack_traces + 1)
+  pos += stack_trace_offsets.itemsize * len(stack_trace_offsets)
+  stack_trace_frames = ReadIndexTable(stack_trace_offsets[-1])
+  pos += stack_trace_frames.itemsize * len(stack_trace_frames)
+
+  stack_traces = [None] * num_stack_traces
+  def GetStackTrace(idx):
+    # Allocations with the same call site share the same |Stacktrace|.
+    stack_trace = stack_traces[idx]
+    if stack_trace is None:
+      stack_trace = stacktrace.Stacktrace()
+      for frame_idx in stack_trace_frames[
+          stack_trace_offsets[idx]:stack_trace_offsets[idx + 1]]:
+        stack_trace.Add(frames[frame_idx])
+      stack_traces[idx] = stack_trace
+    return stack_trace
+
+  nh.allocations = _LazyAllocations(data, pos, num_allocations, GetStackTrace)
+  return nh
+
+
+class _LazyAllocations(object):
+  """A list-like sequence of |Allocation|s decoded on demand from a dump.
+
+  Decoded allocations are retained, so that changes to them are preserved.
+  """
+
+  def __init__(self, data, offset, count, stack_trace_getter):
+    self._data = data
+    self._offset = offset
+    self._stack_trace_getter = stack_trace_getter
+    self._allocations = [None] * count
+
+  def append(self, allocation):
+    self._allocations.append(allocation)
+
+  def __len__(self):
+    return len(self._allocations)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in xrange(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self._allocations)
+    alloc = self._allocations[index]
+    if alloc is None:
+      start, size, flags, resident_size, stack_trace_idx = (
+          _NHEAP_ALLOCATION.unpack_from(
+              self._data, self._offset + index * _NHEAP_ALLOCATION.size))
+      alloc = native_heap.Allocation(
+          size=size, stack_trace=self._stack_trace_getter(stack_trace_idx),
+          start=start, flags=flags, resident_size=resident_size)
+      self._allocations[index] = alloc
+    return alloc
+
+  def __iter__(self):
+    for i in xrange(len(self._allocations)):
+      yield self[i]
@@ -0,0 +1,126 @@
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A thread-safe, size-bounded LRU cache for the www_server results.
+
+Objects are evicted (least recently used first) when the sum of their estimated
+sizes exceeds the cache budget. Concurrent requests for the same (not yet
+cached) key are coalesced: the value is computed only once, by the first
+caller, while the others wait for its result.
+"""
+
+import collections
+import threading
+
+
+class ResultCache(object):
+
+  def __init__(self, max_bytes, size_estimator):
+    """
+    Args:
+        max_bytes: the budget (sum of the sizes of the cached objects).
+        size_estimator: a function which returns the size (in bytes) of an
+            object being stored in the cache.
+    """
+    self._max_bytes = max_bytes
+    self._size_estimator = size_estimator
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()  # key -> (obj, size), LRU first.
+    self._in_flight = {}  # key -> |_PendingResult|.
+    self.cur_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.evictions = 0
+
+  def Get(self, key):
+    """Returns the object cached for |key| (or None)."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        self.misses += 1
+        return None
+      self._entries[key] = entry  # Move to the MRU end.
+      self.hits += 1
+      return entry[0]
+
+  def Put(self, key, obj):
+    """Caches |obj| and evicts the least recently used objects, if needed."""
+    size = self._size_estimator(obj)
+    with self._lock:
+      self._PutLocked(key, obj, size)
+
+  def GetOrCompute(self, key, compute_fn):
+    """Returns the cached object for |key|, computing it if not cached.
+
+    If a computation for the same key is already in progress (in another
+    thread), this waits for it instead of starting a new one. Results which
+    evaluate to None are not cached.
+    """
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+      pending = self._in_flight.get(key)
+      is_owner = pending is None
+      if is_owner:
+        self.misses += 1
+        pending = _PendingResult()
+        self._in_flight[key] = pending
+      else:
+        self.coalesced += 1
+    if not is_owner:
+      pending.event.wait()
+      if pending.error:
+        raise pending.error
+      return pending.result
+
+    try:
+      pending.result = compute_fn()
+      if pending.result is not None:
+        self.Put(key, pending.result)
+    except Exception as e:
+      pending.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._in_flight[key]
+      pending.event.set()
+    return pending.result
+
+  def GetStats(self):
+    with self._lock:
+      return {'entries': len(self._entries),
+              'bytes': self.cur_bytes,
+              'maxBytes': self._max_bytes,
+              'hits': self.hits,
+              'misses': self.misses,
+              'coalesced': self.coalesced,
+              'evictions': self.evictions}
+
+  def _PutLocked(self, key, obj, size):
+    old_entry = self._entries.pop(key, None)
+    if old_entry is not None:
+      self.cur_bytes -= old_entry[1]
+    self._entries[key] = (obj, size)
+    self.cur_bytes += size
+    # Always keep at least the newest object, even if it exceeds the budget.
+    while self.cur_bytes > self._max_bytes and len(self._entries) > 1:
+      _, (_, evicted_size) = self._entries.popitem(last=False)
+      self.cur_bytes -= evicted_size
+      self.evictions += 1
+
+  def __len__(self):
+    return len(self._entries)
+
+
+class _PendingResult(object):
+  """The state of an in-flight computation, shared with the waiters."""
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.error = None
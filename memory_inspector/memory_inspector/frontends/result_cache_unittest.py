@@ -0,0 +1,65 @@
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import threading
+import unittest
+
+from memory_inspector.frontends import result_cache
+
+
+class ResultCacheTest(unittest.TestCase):
+  def testLruEviction(self):
+    cache = result_cache.ResultCache(max_bytes=10, size_estimator=len)
+    cache.Put('a', 'aaaa')
+    cache.Put('b', 'bbbb')
+    self.assertEqual(cache.Get('a'), 'aaaa')  # 'b' is now the LRU.
+    cache.Put('c', 'cccc')
+    self.assertIsNone(cache.Get('b'))
+    self.assertEqual(cache.Get('a'), 'aaaa')
+    self.assertEqual(cache.Get('c'), 'cccc')
+    # Objects bigger than the budget are kept, until the next Put.
+    cache.Put('d', 'd' * 20)
+    self.assertEqual(len(cache), 1)
+    stats = cache.GetStats()
+    self.assertEqual(stats['bytes'], 20)
+    self.assertEqual(stats['hits'], 3)
+    self.assertEqual(stats['misses'], 1)
+    self.assertEqual(stats['evictions'], 3)
+
+  def testGetOrComputeCoalescesRequests(self):
+    cache = result_cache.ResultCache(max_bytes=100, size_estimator=len)
+    compute_started = threading.Event()
+    compute_can_finish = threading.Event()
+    calls = []
+    def Compute():
+      calls.append(1)
+      compute_started.set()
+      compute_can_finish.wait()
+      return 'result'
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cache.GetOrCompute('k', Compute)))
+        for _ in xrange(4)]
+    threads[0].start()
+    compute_started.wait()
+    for thread in threads[1:]:
+      thread.start()
+    while cache.GetStats()['coalesced'] < 3:
+      pass
+    compute_can_finish.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(results, ['result'] * 4)
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(cache.GetOrCompute('k', Compute), 'result')
+    self.assertEqual(len(calls), 1)
+
+  def testGetOrComputeErrors(self):
+    cache = result_cache.ResultCache(max_bytes=100, size_estimator=len)
+    def Fail():
+      raise ValueError('failed')
+    self.assertRaises(ValueError, cache.GetOrCompute, 'k', Fail)
+    # Failures are not cached.
+    self.assertEqual(cache.GetOrCompute('k', lambda: 'ok'), 'ok')
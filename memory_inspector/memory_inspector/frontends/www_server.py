@@ -11,6 +11,11 @@ The WSGI server essentially handles two kinds of requests:
  - /static/content: Anything not matching the /ajax/ prefix is treated as a
     static content request (for serving the index.html and JS/CSS resources).
 
+Requests are served concurrently (one thread per request), so that a long
+profile computation does not block the rest of the UI. Results are kept in a
+size-bounded LRU cache (see result_cache.py) and the server counters (cache
+hits, request latency) can be inspected through /ajax/server/stats.
+
 The following HTTP status code are returned by the server:
  - 200 - OK: The request was handled correctly.
  - 404 - Not found: None of the defined handlers did match the /request/path.
@@ -22,12 +27,16 @@ import cgi
 import collections
 import datetime
 import glob
+import hashlib
 import json
 import memory_inspector
 import mimetypes
 import os
 import posixpath
 import re
+import SocketServer
+import threading
+import time
 import traceback
 import urlparse
 import uuid
@@ -41,6 +50,7 @@ from memory_inspector.classification import native_heap_classifier
 from memory_inspector.data import serialization
 from memory_inspector.data import file_storage
 from memory_inspector.frontends import background_tasks
+from memory_inspector.frontends import result_cache
 
 
 _HTTP_OK = '200 OK'
@@ -53,11 +63,15 @@ _CONTENT_DIR = os.path.abspath(os.path.join(
     os.path.dirname(__file__), 'www_content'))
 _APP_PROCESS_RE = r'^[\w.:]+$'  # Regex for matching app processes.
 _STATS_HIST_SIZE = 120  # Keep at most 120 samples of stats per process.
-_CACHE_LEN = 10  # Max length of |_cached_objs|.
+_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Max size of |_cached_objs|.
+# Rough memory footprints used by _EstimateObjectSize, in bytes.
+_MMAP_ENTRY_SIZE = 512  # A |memory_map.MapEntry|, plus 8 per resident_pages.
+_BUCKET_SIZE = 256  # A |results.Bucket|, plus 8 per value.
 
 # |_cached_objs| keeps the state of short-lived objects that the client needs to
 # _cached_objs subsequent AJAX calls.
-_cached_objs = collections.OrderedDict()
+_cached_objs = result_cache.ResultCache(
+    _CACHE_MAX_BYTES, lambda obj: _EstimateObjectSize(obj))
 _persistent_storage = file_storage.Storage(_PERSISTENT_STORAGE_PATH)
 _proc_stats_history = {}  # /Android/device/PID -> deque([stats@T=0, stats@T=1])
 
@@ -74,6 +88,8 @@ class UriHandler(object):
     body: the HTTP response body.
   """
   _handlers = []
+  _stats_lock = threading.Lock()
+  _stats = {}  # path_regex -> {'count': N, 'totalMs': T, 'maxMs': M}.
 
   def __init__(self, path_regex, verb='GET', output_filter=None):
     self._path_regex = path_regex
@@ -96,14 +112,32 @@ class UriHandler(object):
       m = re.match(path_regex, path)
       if not m:
         continue
+      start_time = time.time()
       try:
         (http_code, headers, body) = fn(m.groups(), req_vars)
       except Exception as e:
         traceback.print_exc()
         return _HTTP_INTERNAL_ERROR, [], str(e)
+      finally:
+        UriHandler._RecordLatency(path_regex, time.time() - start_time)
       return output_filter(http_code, cache_headers + headers, body)
     return (_HTTP_NOT_FOUND, [], 'No AJAX handlers found')
 
+  @staticmethod
+  def _RecordLatency(path_regex, elapsed):
+    elapsed_ms = elapsed * 1000
+    with UriHandler._stats_lock:
+      stats = UriHandler._stats.setdefault(
+          path_regex, {'count': 0, 'totalMs': 0, 'maxMs': 0})
+      stats['count'] += 1
+      stats['totalMs'] += elapsed_ms
+      stats['maxMs'] = max(stats['maxMs'], elapsed_ms)
+
+  @staticmethod
+  def GetStats():
+    with UriHandler._stats_lock:
+      return dict((k, dict(v)) for k, v in UriHandler._stats.iteritems())
+
 
 class AjaxHandler(UriHandler):
   """Decorator for routing AJAX requests.
@@ -170,6 +204,11 @@ def _InitializeDevice(args, req_vars):  # pylint: disable=W0613
       'isNativeTracingEnabled': device.IsNativeTracingEnabled()}
 
 
+class _ProfileError(Exception):
+  """Raised when a profile cannot be created (the message is sent back)."""
+  pass
+
+
 @AjaxHandler(r'/ajax/profile/create', 'POST')
 def _CreateProfile(args, req_vars):  # pylint: disable=W0613
   """Creates (and caches) a profile from a set of dumps.
@@ -177,11 +216,53 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
   The profiling data can be retrieved afterwards using the /profile/{PROFILE_ID}
   endpoints (below).
   """
-  classifier = None  # A classifier module (/classification/*_classifier.py).
-  dumps = {}  # dump-time -> obj. to classify (e.g., |memory_map.Map|).
   for arg in 'type', 'source', 'ruleset':
     assert(arg in req_vars), 'Expecting %s argument in POST data' % arg
 
+  # The profile id is derived from the request (and the version of the rule
+  # file and of the symbol db), so that identical requests are served from the
+  # cache. Concurrent identical requests are coalesced into a single
+  # computation.
+  rules_path = os.path.join(constants.CLASSIFICATION_RULES_PATH,
+                            req_vars['ruleset'])
+  rules_mtime = (os.path.getmtime(rules_path) if os.path.isfile(rules_path)
+                 else None)
+  # Native heaps are symbolized with the symbol db of the archive, which can be
+  # rewritten at any time (see background_tasks.py).
+  symbols_path = None
+  symbols_mtime = None
+  if req_vars['source'] == 'archive' and req_vars['type'] == 'nheap':
+    archive = _persistent_storage.OpenArchive(req_vars['archive'])
+    symbols_path = archive.GetSymbolsPath()
+    symbols_mtime = (os.path.getmtime(symbols_path)
+                     if os.path.isfile(symbols_path) else None)
+  profile_key = (req_vars['type'], req_vars['source'],
+                 req_vars.get('archive'), req_vars.get('id'),
+                 tuple(req_vars.get('snapshots', ())), req_vars['ruleset'],
+                 rules_mtime, symbols_path, symbols_mtime)
+  profile_id = hashlib.sha1(repr(profile_key)).hexdigest()
+  try:
+    snapshots = _cached_objs.GetOrCompute(
+        profile_id, lambda: _ComputeProfile(req_vars, rules_path))
+  except _ProfileError as e:
+    return _HTTP_GONE, [], str(e)
+
+  first_snapshot = next(snapshots.itervalues())
+  return _HTTP_OK, [], {'id': profile_id,
+                        'times': snapshots.keys(),
+                        'metrics': first_snapshot.keys,
+                        'rootBucket': first_snapshot.total.name + '/'}
+
+
+def _ComputeProfile(req_vars, rules_path):
+  """Classifies the dumps requested by _CreateProfile.
+
+  Returns:
+    An OrderedDict {dump time: |AggregatedResult|}.
+  """
+  classifier = None  # A classifier module (/classification/*_classifier.py).
+  dumps = {}  # dump-time -> obj. to classify (e.g., |memory_map.Map|).
+
   # Step 1: collect the memory dumps, according to what the client specified in
   # the 'type' and 'source' POST arguments.
 
@@ -189,7 +270,7 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
   if req_vars['source'] == 'archive':
     archive = _persistent_storage.OpenArchive(req_vars['archive'])
     if not archive:
-      return _HTTP_GONE, [], 'Cannot open archive %s' % req_vars['archive']
+      raise _ProfileError('Cannot open archive %s' % req_vars['archive'])
     first_timestamp = None
     for timestamp_str in req_vars['snapshots']:
       timestamp = file_storage.Archive.StrToTimestamp(timestamp_str)
@@ -206,7 +287,7 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
     dumps[0] = _GetCacheObject(req_vars['id'])
 
   if not dumps:
-    return _HTTP_GONE, [], 'No memory dumps could be retrieved'
+    raise _ProfileError('No memory dumps could be retrieved')
 
   # Initialize the classifier (mmap or nheap) and prepare symbols for nheap.
   if req_vars['type'] == 'mmap':
@@ -214,13 +295,13 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
   elif req_vars['type'] == 'nheap':
     classifier = native_heap_classifier
     if not archive.HasSymbols():
-      return _HTTP_GONE, [], 'No symbols in archive %s' % req_vars['archive']
+      raise _ProfileError('No symbols in archive %s' % req_vars['archive'])
     symbols = archive.LoadSymbols()
     for nheap in dumps.itervalues():
       nheap.SymbolizeUsingSymbolDB(symbols)
 
   if not classifier:
-    return _HTTP_GONE, [], 'Classifier %s not supported.' % req_vars['type']
+    raise _ProfileError('Classifier %s not supported.' % req_vars['type'])
 
   # Step 2: Load the rule-set specified by the client in the 'ruleset' POST arg.
   if req_vars['ruleset'] == 'heuristic':
@@ -228,10 +309,8 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
         'heuristic rules are supported only for nheap')
     rules = native_heap_classifier.InferHeuristicRulesFromHeap(dumps[0])
   else:
-    rules_path = os.path.join(constants.CLASSIFICATION_RULES_PATH,
-                              req_vars['ruleset'])
     if not os.path.isfile(rules_path):
-      return _HTTP_GONE, [], 'Cannot find the rule-set %s' % rules_path
+      raise _ProfileError('Cannot find the rule-set %s' % rules_path)
     with open(rules_path) as f:
       rules = classifier.LoadRules(f.read())
 
@@ -243,20 +322,9 @@ def _CreateProfile(args, req_vars):  # pylint: disable=W0613
 
   # Converts the {time: dump_obj} dict into a {time: |AggregatedResult|} dict.
   # using the classifier.
-  snapshots = collections.OrderedDict((time, classifier.Classify(dump, rules))
+  return collections.OrderedDict((time, classifier.Classify(dump, rules))
      for time, dump in sorted(dumps.iteritems()))
 
-  # Add the profile to the cache (and eventually discard old items).
-  # |profile_id| is the key that the client will use in subsequent requests
-  # (to the /ajax/profile/{ID}/ endpoints) to refer to this particular profile.
-  profile_id = _CacheObject(snapshots)
-
-  first_snapshot = next(snapshots.itervalues())
-  return _HTTP_OK, [], {'id': profile_id,
-                        'times': snapshots.keys(),
-                        'metrics': first_snapshot.keys,
-                        'rootBucket': first_snapshot.total.name + '/'}
-
 
 @AjaxHandler(r'/ajax/profile/([^/]+)/tree/(\d+)/(\d+)')
 def _GetProfileTreeDataForSnapshot(args, req_vars):  # pylint: disable=W0613
@@ -594,18 +662,24 @@ def _LoadNheapFromStorage(args, req_vars):
           {'label': 'Stack Trace', 'type':'string'},
         ],
       'rows': []}
+  # Allocations loaded from storage share the |Stacktrace| objects of the same
+  # call site. Render each of them only once.
+  strace_by_id = {}
   for alloc in nheap.allocations:
-    strace = '<dl>'
-    for frame in alloc.stack_trace.frames:
-      # Use the fallback libname.so+0xaddr if symbol info is not available.
-      symbol_name = frame.symbol.name if frame.symbol else '??'
-      source_info = (str(frame.symbol.source_info[0]) if
-          frame.symbol and frame.symbol.source_info else frame.raw_address)
-      strace += '<dd title="%s">%s</dd><dt>%s</dt>' % (
-          cgi.escape(source_info),
-          cgi.escape(posixpath.basename(source_info)),
-          cgi.escape(symbol_name))
-    strace += '</dl>'
+    strace = strace_by_id.get(id(alloc.stack_trace))
+    if strace is None:
+      strace = '<dl>'
+      for frame in alloc.stack_trace.frames:
+        # Use the fallback libname.so+0xaddr if symbol info is not available.
+        symbol_name = frame.symbol.name if frame.symbol else '??'
+        source_info = (str(frame.symbol.source_info[0]) if
+            frame.symbol and frame.symbol.source_info else frame.raw_address)
+        strace += '<dd title="%s">%s</dd><dt>%s</dt>' % (
+            cgi.escape(source_info),
+            cgi.escape(posixpath.basename(source_info)),
+            cgi.escape(symbol_name))
+      strace += '</dl>'
+      strace_by_id[id(alloc.stack_trace)] = strace
 
     resp['rows'] += [{'c': [
         {'v': alloc.size, 'f': _StrMem(alloc.size)},
@@ -641,6 +715,13 @@ def _GetTracerStatus(args, req_vars):  # pylint: disable=W0613
   return _HTTP_OK, [], task.GetProgress()
 
 
+@AjaxHandler(r'/ajax/server/stats')
+def _GetServerStats(args, req_vars):  # pylint: disable=W0613
+  """Returns the result cache counters and the latency of each handler."""
+  return _HTTP_OK, [], {'cache': _cached_objs.GetStats(),
+                        'requests': UriHandler.GetStats()}
+
+
 @UriHandler(r'^(?!/ajax)/(.*)$')
 def _StaticContent(args, req_vars):  # pylint: disable=W0613
   req_path = args[0] if args[0] else 'index.html'
@@ -710,16 +791,36 @@ def _ConvertMmapToGTable(mmap):
 
 def _CacheObject(obj_to_store):
   """Stores an object in the server-side cache and returns its unique id."""
-  if len(_cached_objs) >= _CACHE_LEN:
-    _cached_objs.popitem(last=False)
-  obj_id = uuid.uuid4().hex
-  _cached_objs[obj_id] = obj_to_store
-  return str(obj_id)
+  obj_id = str(uuid.uuid4().hex)
+  _cached_objs.Put(obj_id, obj_to_store)
+  return obj_id
 
 
 def _GetCacheObject(obj_id):
   """Retrieves an object in the server-side cache by its id."""
-  return _cached_objs.get(obj_id)
+  return _cached_objs.Get(obj_id)
+
+
+def _EstimateObjectSize(obj):
+  """Estimates the memory footprint of a cached object (mmaps or profiles).
+
+  This is proportional to the number of entries (or buckets) rather than exact,
+  as measuring the objects (e.g. serializing them) would cost as much as the
+  requests which the cache saves.
+  """
+  if isinstance(obj, memory_map.Map):
+    return sum(_MMAP_ENTRY_SIZE + 8 * len(entry.resident_pages)
+               for entry in obj.entries)
+  # A profile: {dump time: |results.AggreatedResults|}.
+  size = 0
+  for result in obj.itervalues():
+    num_buckets = 0
+    buckets = [result.total]
+    while buckets:
+      buckets.extend(buckets.pop().children)
+      num_buckets += 1
+    size += num_buckets * (_BUCKET_SIZE + 8 * len(result.keys))
+  return size
 
 
 def _StrMem(nbytes):
@@ -749,7 +850,12 @@ def _HttpRequestHandler(environ, start_response):
   return [body]
 
 
-def Start(http_port):
+class _ThreadingWSGIServer(SocketServer.ThreadingMixIn,
+                           wsgiref.simple_server.WSGIServer):
+  daemon_threads = True  # Don't wait for pending requests on CTRL-C.
+
+
+def Start(http_port, threaded=True):
   # Load the saved backends' settings (some of them might be needed to bootstrap
   # as, for instance, the adb path for the Android backend).
   memory_inspector.RegisterAllBackends()
@@ -757,8 +863,10 @@ def Start(http_port):
     for k, v in _persistent_storage.LoadSettings(backend.name).iteritems():
       backend.settings[k] = v
 
+  server_class = (_ThreadingWSGIServer if threaded else
+                  wsgiref.simple_server.WSGIServer)
   httpd = wsgiref.simple_server.make_server(
-      '127.0.0.1', http_port, _HttpRequestHandler)
+      '127.0.0.1', http_port, _HttpRequestHandler, server_class=server_class)
   try:
     httpd.serve_forever()
   except KeyboardInterrupt:
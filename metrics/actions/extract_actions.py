@@ -24,11 +24,14 @@ will also be saved in a backup file.
 __author__ = 'evanm (Evan Martin)'
 
 from HTMLParser import HTMLParser
+import json
 import logging
+import multiprocessing
 import os
 import re
 import shutil
 import sys
+import tempfile
 from xml.dom import minidom
 
 import action_utils
@@ -159,6 +162,18 @@ REPOSITORY_ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
 
 number_of_files_total = 0
 
+# The file caching the actions found in each source file, so that only the
+# modified files are read again. Disabled by --no-scan-cache.
+SCAN_CACHE_PATH = os.path.join(tempfile.gettempdir(),
+                               'extract_actions_cache.json')
+
+# Bump this when _ScanFile() changes, to invalidate the cached results.
+SCAN_CACHE_VERSION = 1
+
+# Below this number of files to scan, the files are scanned in this process
+# rather than in a pool of worker processes.
+MIN_FILES_TO_SCAN_IN_PARALLEL = 64
+
 # Tags that need to be inserted to each 'action' tag and their default content.
 TAGS = {'description': 'Please enter the description of the metric.',
         'owner': ('Please list the metric\'s owners. Add more owner tags as '
@@ -335,44 +350,201 @@ class ActionNameFinder:
       (self.__path, line_number, statement))
 
 
-def GrepForActions(path, actions):
-  """Grep a source file for calls to UserMetrics functions.
+def _ScanFile(path, is_webui_html):
+  """Finds the actions used by a source file, reading it only once.
 
   Arguments:
     path: path to the file
-    actions: set of actions to add to
+    is_webui_html: whether the file is a WebUI HTML file, whose elements have
+        associated metrics, rather than a source file calling UserMetrics
+        functions.
+
+  Returns:
+    A dictionary with the sorted 'actions' found, the messages of the
+    'invalid_statements' and the 'computed_action_lines' (the line numbers of
+    the RecordComputedAction statements). It is cached as JSON.
   """
-  global number_of_files_total
-  number_of_files_total = number_of_files_total + 1
+  with open(path) as f:
+    contents = f.read()
 
-  # Check the extension, using the regular expression for C++ syntax by default.
-  ext = os.path.splitext(path)[1].lower()
-  if ext == '.js':
-    action_re = USER_METRICS_ACTION_RE_JS
+  actions = set()
+  invalid_statements = []
+  computed_action_lines = []
+  if is_webui_html:
+    _ParseWebUIActions(path, contents, actions)
   else:
-    action_re = USER_METRICS_ACTION_RE
+    # Check the extension, using the regular expression for C++ syntax by
+    # default.
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.js':
+      action_re = USER_METRICS_ACTION_RE_JS
+    else:
+      action_re = USER_METRICS_ACTION_RE
+
+    finder = ActionNameFinder(path, contents, action_re)
+    while True:
+      try:
+        action_name = finder.FindNextAction()
+        if not action_name:
+          break
+        actions.add(action_name)
+      except InvalidStatementException, e:
+        invalid_statements.append(str(e))
+
+    if action_re == USER_METRICS_ACTION_RE:
+      # Count the newlines incrementally, from one match to the next.
+      line_number = 1
+      pos = 0
+      for match in COMPUTED_ACTION_RE.finditer(contents):
+        line_number += contents.count('\n', pos, match.start())
+        pos = match.start()
+        if computed_action_lines[-1:] != [line_number]:
+          computed_action_lines.append(line_number)
+
+  return {'actions': sorted(actions),
+          'invalid_statements': invalid_statements,
+          'computed_action_lines': computed_action_lines}
+
+
+def _ScanFileWorker(args):
+  path, is_webui_html = args
+  return _ScanFile(path, is_webui_html)
+
+
+def _AddScanResult(path, result, actions):
+  """Adds the actions found by _ScanFile() and logs its warnings."""
+  actions.update(result['actions'])
+  for message in result['invalid_statements']:
+    logging.warning(message)
+  # Warn if this file shouldn't be calling RecordComputedAction.
+  if os.path.basename(path) not in KNOWN_COMPUTED_USERS:
+    for line_number in result['computed_action_lines']:
+      logging.warning('%s has RecordComputedAction statement on line %d' %
+                      (path, line_number))
+
+
+class ScanCache(object):
+  """Caches the _ScanFile() results, keyed on file path, mtime and size.
+
+  Arguments:
+    path: path to the cache file. It is read on creation and written by Save().
+  """
+
+  def __init__(self, path):
+    self._path = path
+    self._entries = {}
+    self._used_entries = {}
+    # The stats of the files when they were looked up, i.e. before the files
+    # missing from the cache are scanned.
+    self._stats = {}
+    self.hits = 0
+    self.misses = 0
+    if not os.path.isfile(path):
+      return
+    try:
+      with open(path) as f:
+        cache = json.load(f)
+    except ValueError:
+      logging.warning('Ignoring corrupted cache file: %s', path)
+      return
+    if cache.get('version') == SCAN_CACHE_VERSION:
+      self._entries = cache['entries']
+
+  @staticmethod
+  def _GetKey(path, is_webui_html):
+    # The same file can be scanned as WebUI HTML and as a source file.
+    return '%s:%s' % ('html' if is_webui_html else 'src',
+                      os.path.abspath(path))
+
+  def Get(self, path, is_webui_html):
+    """Returns the cached result for the file, or None if it has changed."""
+    key = self._GetKey(path, is_webui_html)
+    entry = self._entries.get(key)
+    stat = os.stat(path)
+    self._stats[key] = [stat.st_mtime, stat.st_size]
+    if entry is None or entry[:2] != self._stats[key]:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self._used_entries[key] = entry
+    result = dict(entry[2])
+    # Like the names read from the sources, the names are byte strings.
+    result['actions'] = [name.encode('utf-8') for name in result['actions']]
+    return result
+
+  def Put(self, path, is_webui_html, result):
+    """Caches the result for a file looked up by Get()."""
+    key = self._GetKey(path, is_webui_html)
+    self._used_entries[key] = self._stats[key] + [result]
+
+  def Save(self):
+    """Writes the entries used since the creation of the cache.
+
+    The entries of the files which were not scanned (e.g. deleted files) are
+    dropped.
+    """
+    tmp_path = self._path + '.tmp'
+    with open(tmp_path, 'w') as f:
+      json.dump({'version': SCAN_CACHE_VERSION,
+                 'entries': self._used_entries}, f)
+    # Atomically replace the cache, so that it is never left half-written.
+    if os.name == 'nt' and os.path.exists(self._path):
+      os.remove(self._path)
+    os.rename(tmp_path, self._path)
+
+
+def ScanFiles(paths, is_webui_html, actions, scan_cache=None):
+  """Adds the actions used by the source files.
+
+  The files missing from |scan_cache| are scanned by a pool of worker
+  processes, and the results are replayed in the order of |paths|.
 
-  finder = ActionNameFinder(path, open(path).read(), action_re)
-  while True:
+  Arguments:
+    paths: paths to the files
+    is_webui_html: whether the files are WebUI HTML files, see _ScanFile().
+    actions: set of actions to add to
+    scan_cache: optional ScanCache.
+  """
+  global number_of_files_total
+  if not is_webui_html:
+    number_of_files_total = number_of_files_total + len(paths)
+
+  results = {}
+  if scan_cache:
+    for path in paths:
+      result = scan_cache.Get(path, is_webui_html)
+      if result is not None:
+        results[path] = result
+  missed_paths = [path for path in paths if path not in results]
+
+  tasks = [(path, is_webui_html) for path in missed_paths]
+  if len(tasks) >= MIN_FILES_TO_SCAN_IN_PARALLEL:
+    pool = multiprocessing.Pool()
     try:
-      action_name = finder.FindNextAction()
-      if not action_name:
-        break
-      actions.add(action_name)
-    except InvalidStatementException, e:
-      logging.warning(str(e))
-
-  if action_re != USER_METRICS_ACTION_RE:
-    return
-
-  line_number = 0
-  for line in open(path):
-    line_number = line_number + 1
-    if COMPUTED_ACTION_RE.search(line):
-      # Warn if this file shouldn't be calling RecordComputedAction.
-      if os.path.basename(path) not in KNOWN_COMPUTED_USERS:
-        logging.warning('%s has RecordComputedAction statement on line %d' %
-                        (path, line_number))
+      missed_results = pool.map(_ScanFileWorker, tasks, chunksize=64)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    missed_results = [_ScanFileWorker(task) for task in tasks]
+
+  for path, result in zip(missed_paths, missed_results):
+    results[path] = result
+    if scan_cache:
+      scan_cache.Put(path, is_webui_html, result)
+
+  for path in paths:
+    _AddScanResult(path, results[path], actions)
+
+
+def GrepForActions(path, actions):
+  """Grep a source file for calls to UserMetrics functions.
+
+  Arguments:
+    path: path to the file
+    actions: set of actions to add to
+  """
+  ScanFiles([path], False, actions)
 
 class WebUIActionsParser(HTMLParser):
   """Parses an HTML file, looking for all tags with a 'metric' attribute.
@@ -411,17 +583,11 @@ class WebUIActionsParser(HTMLParser):
     else:
       self.actions.add(attrs['metric'])
 
-def GrepForWebUIActions(path, actions):
-  """Grep a WebUI source file for elements with associated metrics.
-
-  Arguments:
-    path: path to the file
-    actions: set of actions to add to
-  """
+def _ParseWebUIActions(path, contents, actions):
   close_called = False
   try:
     parser = WebUIActionsParser(actions)
-    parser.feed(open(path).read())
+    parser.feed(contents)
     # An exception can be thrown by parser.close(), so do it in the try to
     # ensure the path of the file being parsed gets printed if that happens.
     close_called = True
@@ -433,7 +599,18 @@ def GrepForWebUIActions(path, actions):
     if not close_called:
       parser.close()
 
-def WalkDirectory(root_path, actions, extensions, callback):
+def GrepForWebUIActions(path, actions):
+  """Grep a WebUI source file for elements with associated metrics.
+
+  Arguments:
+    path: path to the file
+    actions: set of actions to add to
+  """
+  ScanFiles([path], True, actions)
+
+def FindFiles(root_path, extensions):
+  """Returns the paths of the files with one of |extensions| under a root."""
+  paths = []
   for path, dirs, files in os.walk(root_path):
     if '.svn' in dirs:
       dirs.remove('.svn')
@@ -442,48 +619,51 @@ def WalkDirectory(root_path, actions, extensions, callback):
     for file in files:
       ext = os.path.splitext(file)[1]
       if ext in extensions:
-        callback(os.path.join(path, file), actions)
+        paths.append(os.path.join(path, file))
+  return paths
 
-def AddLiteralActions(actions):
+def WalkDirectory(root_path, actions, extensions, callback):
+  for path in FindFiles(root_path, extensions):
+    callback(path, actions)
+
+def AddLiteralActions(actions, scan_cache=None):
   """Add literal actions specified via calls to UserMetrics functions.
 
   Arguments:
     actions: set of actions to add to.
+    scan_cache: optional ScanCache.
   """
   EXTENSIONS = ('.cc', '.cpp', '.mm', '.c', '.m', '.java')
 
-  # Walk the source tree to process all files.
-  ash_root = os.path.normpath(os.path.join(REPOSITORY_ROOT, 'ash'))
-  WalkDirectory(ash_root, actions, EXTENSIONS, GrepForActions)
-  chrome_root = os.path.normpath(os.path.join(REPOSITORY_ROOT, 'chrome'))
-  WalkDirectory(chrome_root, actions, EXTENSIONS, GrepForActions)
-  content_root = os.path.normpath(os.path.join(REPOSITORY_ROOT, 'content'))
-  WalkDirectory(content_root, actions, EXTENSIONS, GrepForActions)
-  components_root = os.path.normpath(os.path.join(REPOSITORY_ROOT,
-                    'components'))
-  WalkDirectory(components_root, actions, EXTENSIONS, GrepForActions)
-  net_root = os.path.normpath(os.path.join(REPOSITORY_ROOT, 'net'))
-  WalkDirectory(net_root, actions, EXTENSIONS, GrepForActions)
   webkit_root = os.path.normpath(os.path.join(REPOSITORY_ROOT, 'webkit'))
-  WalkDirectory(os.path.join(webkit_root, 'glue'), actions, EXTENSIONS,
-                GrepForActions)
-  WalkDirectory(os.path.join(webkit_root, 'port'), actions, EXTENSIONS,
-                GrepForActions)
-  webkit_core_root = os.path.normpath(
-                     os.path.join(REPOSITORY_ROOT,
-                                  'third_party/blink/renderer/core'))
-  WalkDirectory(webkit_core_root, actions, EXTENSIONS, GrepForActions)
-
-def AddWebUIActions(actions):
+  roots = [
+      os.path.join(REPOSITORY_ROOT, 'ash'),
+      os.path.join(REPOSITORY_ROOT, 'chrome'),
+      os.path.join(REPOSITORY_ROOT, 'content'),
+      os.path.join(REPOSITORY_ROOT, 'components'),
+      os.path.join(REPOSITORY_ROOT, 'net'),
+      os.path.join(webkit_root, 'glue'),
+      os.path.join(webkit_root, 'port'),
+      os.path.join(REPOSITORY_ROOT, 'third_party/blink/renderer/core'),
+  ]
+
+  # Walk the source tree to find all files, then process them at once.
+  paths = []
+  for root in roots:
+    paths.extend(FindFiles(os.path.normpath(root), EXTENSIONS))
+  ScanFiles(paths, False, actions, scan_cache)
+
+def AddWebUIActions(actions, scan_cache=None):
   """Add user actions defined in WebUI files.
 
   Arguments:
     actions: set of actions to add to.
+    scan_cache: optional ScanCache.
   """
   resources_root = os.path.join(REPOSITORY_ROOT, 'chrome', 'browser',
                                 'resources')
-  WalkDirectory(resources_root, actions, ('.html'), GrepForWebUIActions)
-  WalkDirectory(resources_root, actions, ('.js'), GrepForActions)
+  ScanFiles(FindFiles(resources_root, ('.html',)), True, actions, scan_cache)
+  ScanFiles(FindFiles(resources_root, ('.js',)), False, actions, scan_cache)
 
 def AddHistoryPageActions(actions):
   """Add actions that are used in History page.
@@ -715,14 +895,21 @@ def PrettyPrint(actions_dict, comment_nodes, suffixes):
   return actions_print_style.GetPrintStyle().PrettyPrintXml(doc)
 
 
-def UpdateXml(original_xml):
+def UpdateXml(original_xml, scan_cache_path=None):
   actions_dict, comment_nodes, suffixes = ParseActionFile(original_xml)
 
+  scan_cache = ScanCache(scan_cache_path) if scan_cache_path else None
+
   actions = set()
   AddComputedActions(actions)
-  AddWebUIActions(actions)
+  AddWebUIActions(actions, scan_cache)
+
+  AddLiteralActions(actions, scan_cache)
 
-  AddLiteralActions(actions)
+  if scan_cache:
+    logging.info('Scanned %d source files (%d cached)',
+                 scan_cache.hits + scan_cache.misses, scan_cache.hits)
+    scan_cache.Save()
 
   # print "Scanned {0} number of files".format(number_of_files_total)
   # print "Found {0} entries".format(len(actions))
@@ -742,8 +929,10 @@ def UpdateXml(original_xml):
 
 
 def main(argv):
-  presubmit_util.DoPresubmitMain(argv, 'actions.xml', 'actions.old.xml',
-                                 'extract_actions.py', UpdateXml)
+  scan_cache_path = None if '--no-scan-cache' in argv else SCAN_CACHE_PATH
+  presubmit_util.DoPresubmitMain(
+      argv, 'actions.xml', 'actions.old.xml', 'extract_actions.py',
+      lambda original_xml: UpdateXml(original_xml, scan_cache_path))
 
 if '__main__' == __name__:
   sys.exit(main(sys.argv))
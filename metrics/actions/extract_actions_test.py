@@ -3,6 +3,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import action_utils
@@ -654,5 +657,66 @@ class ActionXmlTest(unittest.TestCase):
     self.assertFalse(finder.FindNextAction())
 
 
+class ScanFilesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_path = os.path.join(self.temp_dir, 'cache.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteFile(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def testScanFile(self):
+    path = self._WriteFile('foo.cc', """
+        base::RecordAction(base::UserMetricsAction("Foo.Bar"));
+        RecordComputedAction(a); RecordComputedAction(b);
+        base::RecordAction(base::UserMetricsAction(name));
+
+        RecordComputedAction(c);
+        """)
+    result = extract_actions._ScanFile(path, False)
+    self.assertEqual(['Foo.Bar'], result['actions'])
+    self.assertEqual([3, 6], result['computed_action_lines'])
+    self.assertEqual(1, len(result['invalid_statements']))
+    self.assertIn('on line 4', result['invalid_statements'][0])
+
+  def testScanWebUIFile(self):
+    path = self._WriteFile('foo.html', """
+        <input type="checkbox" metric="Foo.Checkbox">
+        <span metric="Foo.Span"></span>""")
+    result = extract_actions._ScanFile(path, True)
+    self.assertEqual(['Foo.Checkbox_Disable', 'Foo.Checkbox_Enable',
+                      'Foo.Span'], result['actions'])
+
+  def testScanCache(self):
+    foo_path = self._WriteFile('foo.cc', ' UserMetricsAction("Foo");')
+    bar_path = self._WriteFile('bar.js',
+        "chrome.send('coreOptionsUserMetricsAction', ['Bar']);")
+    paths = [foo_path, bar_path]
+
+    scan_cache = extract_actions.ScanCache(self.cache_path)
+    actions = set()
+    extract_actions.ScanFiles(paths, False, actions, scan_cache)
+    scan_cache.Save()
+    self.assertEqual(set(['Foo', 'Bar']), actions)
+    self.assertEqual((0, 2), (scan_cache.hits, scan_cache.misses))
+
+    # Only the modified file is scanned again.
+    self._WriteFile('foo.cc', ' UserMetricsAction("Foo2");')
+    scan_cache = extract_actions.ScanCache(self.cache_path)
+    actions = set()
+    extract_actions.ScanFiles(paths, False, actions, scan_cache)
+    self.assertEqual(set(['Foo2', 'Bar']), actions)
+    self.assertEqual((1, 1), (scan_cache.hits, scan_cache.misses))
+    for action in actions:
+      self.assertIsInstance(action, str)
+
+
 if __name__ == '__main__':
   unittest.main()
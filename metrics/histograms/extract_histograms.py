@@ -54,11 +54,12 @@ XML below will generate the following five histograms:
 """
 
 import bisect
-import copy
+import collections
 import datetime
 import logging
 import re
 import xml.dom.minidom
+import xml.etree.cElementTree as ElementTree
 
 OWNER_FIELD_PLACEHOLDER = (
     'Please list the metric\'s owners. Add more owner tags as needed.')
@@ -71,6 +72,42 @@ DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON = (
 EXPIRY_DATE_PATTERN = "%Y-%m-%d"
 EXPIRY_MILESTONE_RE = re.compile(r'M[0-9]{2,3}\Z')
 
+# The elements read from the XML. Their contents are extracted into the
+# records below, so that the rest of the XML does not need to be kept around.
+_ENUM_TAG = 'enum'
+_HISTOGRAM_TAG = 'histogram'
+_HISTOGRAM_SUFFIXES_TAG = 'histogram_suffixes'
+_EXTRACTED_TAGS = frozenset([_ENUM_TAG, _HISTOGRAM_TAG,
+                             _HISTOGRAM_SUFFIXES_TAG])
+
+# The tag of the comments in the ElementTree elements. It can't be an XML name.
+_COMMENT_TAG = '!--'
+
+# Size of the chunks in which ExtractHistograms() reads the XML file.
+_READ_CHUNK_SIZE = 1 << 20
+
+# The contents of the XML nodes, as needed by the extraction. |*_xml| fields
+# hold the XML of the children of the first descendant with that tag, or None.
+_EnumRecord = collections.namedtuple(
+    '_EnumRecord', ['name', 'ints', 'summary_xml'])
+# |value| and |label| are the attribute values, |summary_xml| the contents.
+_EnumIntRecord = collections.namedtuple(
+    '_EnumIntRecord', ['value', 'label', 'summary_xml'])
+_HistogramRecord = collections.namedtuple(
+    '_HistogramRecord', ['name', 'expires_after', 'units', 'enum', 'base',
+                         'owners_xml', 'summary_xml', 'obsolete_xml',
+                         'details_xml'])
+# Both <suffix> and <with-suffix> nodes. |obsolete_xml| is only read from the
+# immediate children.
+_SuffixRecord = collections.namedtuple(
+    '_SuffixRecord', ['name', 'label', 'base', 'obsolete_xml'])
+_AffectedHistogramRecord = collections.namedtuple(
+    '_AffectedHistogramRecord', ['name', 'with_suffixes'])
+_HistogramSuffixesRecord = collections.namedtuple(
+    '_HistogramSuffixesRecord', ['name', 'separator', 'ordering',
+                                 'obsolete_xml', 'owners_xml', 'suffixes',
+                                 'affected_histograms'])
+
 class Error(Exception):
   pass
 
@@ -86,7 +123,164 @@ def _JoinChildNodes(tag):
   Returns:
     a string with concatenated nodes' text representation.
   """
-  return ''.join(c.toxml() for c in tag.childNodes).strip()
+  return ''.join(_NodeToXml(c) for c in tag.childNodes).strip()
+
+
+def _NodeToXml(node):
+  # Text nodes, the most common by far, are escaped without toxml()'s overhead.
+  if node.nodeType == xml.dom.minidom.Node.TEXT_NODE:
+    return _EscapeXml(node.data)
+  return node.toxml()
+
+
+def _EscapeXml(data):
+  """Escapes text and attribute values the way minidom's toxml() does."""
+  return (data.replace('&', '&amp;').replace('<', '&lt;')
+          .replace('"', '&quot;').replace('>', '&gt;'))
+
+
+def _ElementToXml(element, output):
+  """Appends the XML of an ElementTree element to |output|, like toxml()."""
+  if element.tag == _COMMENT_TAG:
+    output.append('<!--%s-->' % element.text)
+    return
+  output.append('<' + element.tag)
+  for name in sorted(element.keys()):
+    output.append(' %s="%s"' % (name, _EscapeXml(element.get(name))))
+  if element.text or len(element):
+    output.append('>')
+    _ElementChildrenToXml(element, output)
+    output.append('</%s>' % element.tag)
+  else:
+    output.append('/>')
+
+
+def _ElementChildrenToXml(element, output):
+  if element.text:
+    output.append(_EscapeXml(element.text))
+  for child in element:
+    _ElementToXml(child, output)
+    if child.tail:
+      output.append(_EscapeXml(child.tail))
+
+
+def _JoinChildElements(element):
+  """_JoinChildNodes() for ElementTree elements."""
+  output = []
+  _ElementChildrenToXml(element, output)
+  return ''.join(output).strip()
+
+
+class _DomAdapter(object):
+  """Reads the records from minidom nodes."""
+
+  @staticmethod
+  def GetAttribute(node, name):
+    if node.hasAttribute(name):
+      return node.getAttribute(name)
+    return None
+
+  @staticmethod
+  def GetDescendants(node, tag):
+    return node.getElementsByTagName(tag)
+
+  @staticmethod
+  def GetChildren(node, tag):
+    return [c for c in node.childNodes if c.localName == tag]
+
+  JoinChildNodes = staticmethod(_JoinChildNodes)
+
+
+class _ElementTreeAdapter(object):
+  """Reads the records from ElementTree elements."""
+
+  @staticmethod
+  def GetAttribute(element, name):
+    return element.get(name)
+
+  @staticmethod
+  def GetDescendants(element, tag):
+    return [e for e in element.iter(tag) if e is not element]
+
+  @staticmethod
+  def GetChildren(element, tag):
+    return [e for e in element if e.tag == tag]
+
+  JoinChildNodes = staticmethod(_JoinChildElements)
+
+
+def _GetFirstDescendantXml(adapter, node, tag):
+  descendants = adapter.GetDescendants(node, tag)
+  if descendants:
+    return adapter.JoinChildNodes(descendants[0])
+  return None
+
+
+def _GetObsoleteXml(adapter, node):
+  # There can be at most 1 obsolete element per node.
+  children = adapter.GetChildren(node, 'obsolete')
+  if children:
+    return adapter.JoinChildNodes(children[0])
+  return None
+
+
+def _ReadOwnersXml(adapter, node):
+  return [adapter.JoinChildNodes(owner)
+          for owner in adapter.GetDescendants(node, 'owner')]
+
+
+def _ReadEnumRecord(adapter, node):
+  ints = [_EnumIntRecord(adapter.GetAttribute(int_tag, 'value') or '',
+                         adapter.GetAttribute(int_tag, 'label') or '',
+                         adapter.JoinChildNodes(int_tag))
+          for int_tag in adapter.GetDescendants(node, 'int')]
+  return _EnumRecord(adapter.GetAttribute(node, 'name') or '', ints,
+                     _GetFirstDescendantXml(adapter, node, 'summary'))
+
+
+def _ReadHistogramRecord(adapter, node):
+  return _HistogramRecord(
+      name=adapter.GetAttribute(node, 'name') or '',
+      expires_after=adapter.GetAttribute(node, 'expires_after'),
+      units=adapter.GetAttribute(node, 'units'),
+      enum=adapter.GetAttribute(node, 'enum'),
+      base=adapter.GetAttribute(node, 'base'),
+      owners_xml=_ReadOwnersXml(adapter, node),
+      summary_xml=_GetFirstDescendantXml(adapter, node, 'summary'),
+      obsolete_xml=_GetFirstDescendantXml(adapter, node, 'obsolete'),
+      details_xml=_GetFirstDescendantXml(adapter, node, 'details'))
+
+
+def _ReadSuffixRecord(adapter, node):
+  return _SuffixRecord(adapter.GetAttribute(node, 'name') or '',
+                       adapter.GetAttribute(node, 'label') or '',
+                       adapter.GetAttribute(node, 'base'),
+                       _GetObsoleteXml(adapter, node))
+
+
+def _ReadHistogramSuffixesRecord(adapter, node):
+  affected_histograms = [
+      _AffectedHistogramRecord(
+          adapter.GetAttribute(affected, 'name') or '',
+          [_ReadSuffixRecord(adapter, with_suffix) for with_suffix in
+           adapter.GetDescendants(affected, 'with-suffix')])
+      for affected in adapter.GetDescendants(node, 'affected-histogram')]
+  return _HistogramSuffixesRecord(
+      name=adapter.GetAttribute(node, 'name') or '',
+      separator=adapter.GetAttribute(node, 'separator'),
+      ordering=adapter.GetAttribute(node, 'ordering'),
+      obsolete_xml=_GetObsoleteXml(adapter, node),
+      owners_xml=_ReadOwnersXml(adapter, node),
+      suffixes=[_ReadSuffixRecord(adapter, suffix)
+                for suffix in adapter.GetDescendants(node, 'suffix')],
+      affected_histograms=affected_histograms)
+
+
+_RECORD_READERS = {
+    _ENUM_TAG: _ReadEnumRecord,
+    _HISTOGRAM_TAG: _ReadHistogramRecord,
+    _HISTOGRAM_SUFFIXES_TAG: _ReadHistogramSuffixesRecord,
+}
 
 
 def _NormalizeString(s):
@@ -103,33 +297,102 @@ def _NormalizeString(s):
   return ' '.join(s.split())
 
 
-def _NormalizeAllAttributeValues(node):
-  """Recursively normalizes all tag attribute values in the given tree.
+def _NormalizeAllAttributeValues(node, elements_by_tag=None):
+  """Iteratively normalizes all tag attribute values in the given tree.
 
   Args:
     node: The minidom node to be normalized.
+    elements_by_tag: If set, a dictionary of tag -> list, to which the elements
+        with these tags are appended in document order.
 
   Returns:
     The normalized minidom node.
   """
-  if node.nodeType == xml.dom.minidom.Node.ELEMENT_NODE:
-    for a in node.attributes.keys():
-      node.attributes[a].value = _NormalizeString(node.attributes[a].value)
-
-  for c in node.childNodes:
-    _NormalizeAllAttributeValues(c)
+  # Iterate in document order, without recursing (the trees are deep).
+  stack = [node]
+  while stack:
+    current = stack.pop()
+    if current.nodeType == xml.dom.minidom.Node.ELEMENT_NODE:
+      for attribute in current.attributes.values():
+        # Only set the changed values, since setting a value is slow.
+        value = _NormalizeString(attribute.value)
+        if value != attribute.value:
+          attribute.value = value
+      if elements_by_tag is not None and current.tagName in elements_by_tag:
+        elements_by_tag[current.tagName].append(current)
+    stack.extend(reversed(current.childNodes))
   return node
 
 
+class _StreamingTreeBuilder(object):
+  """An XMLParser target which only builds the elements being extracted.
+
+  The subtrees of the elements with |_EXTRACTED_TAGS| are built (with their
+  attribute values normalized) and read into records as soon as they are
+  closed. Everything else is dropped while parsing.
+  """
+
+  def __init__(self):
+    self.records_by_tag = dict((tag, []) for tag in _EXTRACTED_TAGS)
+    self._stack = []
+    self._data = []
+
+  def _FlushData(self):
+    if not self._data:
+      return
+    text = ''.join(self._data)
+    self._data = []
+    parent = self._stack[-1]
+    if len(parent):
+      parent[-1].tail = text
+    else:
+      parent.text = text
+
+  def _Append(self, element):
+    self._FlushData()
+    self._stack[-1].append(element)
+
+  def start(self, tag, attrib):
+    if not self._stack and tag not in _EXTRACTED_TAGS:
+      return
+    element = ElementTree.Element(
+        tag, dict((k, _NormalizeString(v)) for k, v in attrib.iteritems()))
+    if self._stack:
+      self._Append(element)
+    self._stack.append(element)
+
+  def end(self, tag):
+    if not self._stack:
+      return
+    self._FlushData()
+    element = self._stack.pop()
+    if not self._stack:
+      self.records_by_tag[tag].append(
+          _RECORD_READERS[tag](_ElementTreeAdapter, element))
+
+  def data(self, data):
+    if self._stack:
+      self._data.append(data)
+
+  def comment(self, text):
+    if self._stack:
+      comment = ElementTree.Element(_COMMENT_TAG)
+      comment.text = text
+      self._Append(comment)
+
+  def close(self):
+    return self.records_by_tag
+
+
 def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
-                                     histogram_suffixes_node):
+                                     histogram_suffixes):
   """Creates a new histogram name based on a histogram suffix.
 
   Args:
     suffix_name: The suffix string to apply to the histogram name. May be empty.
     histogram_name: The name of the histogram. May be of the form
       Group.BaseName or BaseName.
-    histogram_suffixes_node: The histogram_suffixes XML node.
+    histogram_suffixes: The histogram_suffixes record.
 
   Returns:
     A string with the expanded histogram name.
@@ -137,14 +400,12 @@ def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
   Raises:
     Error: if the expansion can't be done.
   """
-  if histogram_suffixes_node.hasAttribute('separator'):
-    separator = histogram_suffixes_node.getAttribute('separator')
-  else:
+  separator = histogram_suffixes.separator
+  if separator is None:
     separator = '_'
 
-  if histogram_suffixes_node.hasAttribute('ordering'):
-    ordering = histogram_suffixes_node.getAttribute('ordering')
-  else:
+  ordering = histogram_suffixes.ordering
+  if ordering is None:
     ordering = 'suffix'
   parts = ordering.split(',')
   ordering = parts[0]
@@ -171,7 +432,7 @@ def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
         'Prefix histogram_suffixes expansions require histogram names which '
         'include a dot separator. Histogram name is %s, histogram_suffixes is '
         '%s, and placment is %d', histogram_name,
-        histogram_suffixes_node.getAttribute('name'), placement)
+        histogram_suffixes.name, placement)
     raise Error()
 
   cluster = '.'.join(sections[0:placement]) + '.'
@@ -179,15 +440,15 @@ def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
   return cluster + suffix_name + separator + remainder
 
 
-def _ExtractEnumsFromXmlTree(tree):
-  """Extract all <enum> nodes in the tree into a dictionary."""
+def _ExtractEnums(enum_records):
+  """Extract all <enum> records into a dictionary."""
 
   enums = {}
   have_errors = False
 
   last_name = None
-  for enum in tree.getElementsByTagName('enum'):
-    name = enum.getAttribute('name')
+  for enum in enum_records:
+    name = enum.name
     if last_name is not None and name.lower() < last_name.lower():
       logging.error('Enums %s and %s are not in alphabetical order', last_name,
                     name)
@@ -203,22 +464,22 @@ def _ExtractEnumsFromXmlTree(tree):
     enum_dict['name'] = name
     enum_dict['values'] = {}
 
-    for int_tag in enum.getElementsByTagName('int'):
+    for int_tag in enum.ints:
       value_dict = {}
-      int_value = int(int_tag.getAttribute('value'))
+      int_value = int(int_tag.value)
       if int_value in enum_dict['values']:
         logging.error('Duplicate enum value %d for enum %s', int_value, name)
         have_errors = True
         continue
-      value_dict['label'] = int_tag.getAttribute('label')
-      value_dict['summary'] = _JoinChildNodes(int_tag)
+      value_dict['label'] = int_tag.label
+      value_dict['summary'] = int_tag.summary_xml
       enum_dict['values'][int_value] = value_dict
 
     enum_int_values = sorted(enum_dict['values'].keys())
 
     last_int_value = None
-    for int_tag in enum.getElementsByTagName('int'):
-      int_value = int(int_tag.getAttribute('value'))
+    for int_tag in enum.ints:
+      int_value = int(int_tag.value)
       if last_int_value is not None and int_value < last_int_value:
         logging.error('Enum %s int values %d and %d are not in numerical order',
                       name, last_int_value, int_value)
@@ -234,20 +495,19 @@ def _ExtractEnumsFromXmlTree(tree):
       else:
         last_int_value = int_value
 
-    summary_nodes = enum.getElementsByTagName('summary')
-    if summary_nodes:
-      enum_dict['summary'] = _NormalizeString(_JoinChildNodes(summary_nodes[0]))
+    if enum.summary_xml is not None:
+      enum_dict['summary'] = _NormalizeString(enum.summary_xml)
 
     enums[name] = enum_dict
 
   return enums, have_errors
 
 
-def _ExtractOwners(xml_node):
-  """Extract all owners into a list from owner tag under |xml_node|."""
+def _ExtractOwners(owners_xml):
+  """Extract all owners into a list from the XML of the owner tags."""
   owners = []
-  for owner_node in xml_node.getElementsByTagName('owner'):
-    owner_entry = _NormalizeString(_JoinChildNodes(owner_node))
+  for owner_xml in owners_xml:
+    owner_entry = _NormalizeString(owner_xml)
     if OWNER_FIELD_PLACEHOLDER not in owner_entry:
       owners.append(owner_entry)
   return owners
@@ -272,23 +532,24 @@ def _ValidateMilestoneString(milestone_str):
   """Check if |milestone_str| matches 'M*'."""
   return EXPIRY_MILESTONE_RE.match(milestone_str) is not None
 
-def _ProcessBaseHistogramAttribute(node, histogram_entry):
-  if node.hasAttribute('base'):
-    is_base = node.getAttribute('base').lower() == 'true'
+def _ProcessBaseHistogramAttribute(base, histogram_entry):
+  """Applies the |base| attribute value (None if absent) to the histogram."""
+  if base is not None:
+    is_base = base.lower() == 'true'
     histogram_entry['base'] = is_base
     if is_base and 'obsolete' not in histogram_entry:
       histogram_entry['obsolete'] = DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON
 
 
-def _ExtractHistogramsFromXmlTree(tree, enums):
-  """Extract all <histogram> nodes in the tree into a dictionary."""
+def _ExtractHistograms(histogram_records, enums):
+  """Extract all <histogram> records into a dictionary."""
 
   # Process the histograms. The descriptions can include HTML tags.
   histograms = {}
   have_errors = False
   last_name = None
-  for histogram in tree.getElementsByTagName('histogram'):
-    name = histogram.getAttribute('name')
+  for histogram in histogram_records:
+    name = histogram.name
     if last_name is not None and name.lower() < last_name.lower():
       logging.error('Histograms %s and %s are not in alphabetical order',
                     last_name, name)
@@ -301,8 +562,8 @@ def _ExtractHistogramsFromXmlTree(tree, enums):
     histograms[name] = histogram_entry = {}
 
     # Handle expiry attribute.
-    if histogram.hasAttribute('expires_after'):
-      expiry_str = histogram.getAttribute('expires_after')
+    if histogram.expires_after is not None:
+      expiry_str = histogram.expires_after
       if (expiry_str == "never" or _ValidateMilestoneString(expiry_str) or
           _ValidateDateString(expiry_str)):
         histogram_entry['expires_after'] = expiry_str
@@ -314,138 +575,155 @@ def _ExtractHistogramsFromXmlTree(tree, enums):
         have_errors = True
 
     # Find <owner> tag.
-    owners = _ExtractOwners(histogram)
+    owners = _ExtractOwners(histogram.owners_xml)
     if owners:
       histogram_entry['owners'] = owners
 
     # Find <summary> tag.
-    summary_nodes = histogram.getElementsByTagName('summary')
-    if summary_nodes:
-      histogram_entry['summary'] = _NormalizeString(
-          _JoinChildNodes(summary_nodes[0]))
+    if histogram.summary_xml is not None:
+      histogram_entry['summary'] = _NormalizeString(histogram.summary_xml)
     else:
       histogram_entry['summary'] = 'TBD'
 
     # Find <obsolete> tag.
-    obsolete_nodes = histogram.getElementsByTagName('obsolete')
-    if obsolete_nodes:
-      reason = _JoinChildNodes(obsolete_nodes[0])
-      histogram_entry['obsolete'] = reason
+    if histogram.obsolete_xml is not None:
+      histogram_entry['obsolete'] = histogram.obsolete_xml
 
     # Handle units.
-    if histogram.hasAttribute('units'):
-      histogram_entry['units'] = histogram.getAttribute('units')
+    if histogram.units is not None:
+      histogram_entry['units'] = histogram.units
 
     # Find <details> tag.
-    details_nodes = histogram.getElementsByTagName('details')
-    if details_nodes:
-      histogram_entry['details'] = _NormalizeString(
-          _JoinChildNodes(details_nodes[0]))
+    if histogram.details_xml is not None:
+      histogram_entry['details'] = _NormalizeString(histogram.details_xml)
 
     # Handle enum types.
-    if histogram.hasAttribute('enum'):
-      enum_name = histogram.getAttribute('enum')
+    if histogram.enum is not None:
+      enum_name = histogram.enum
       if enum_name not in enums:
         logging.error('Unknown enum %s in histogram %s', enum_name, name)
         have_errors = True
       else:
         histogram_entry['enum'] = enums[enum_name]
 
-    _ProcessBaseHistogramAttribute(histogram, histogram_entry)
+    _ProcessBaseHistogramAttribute(histogram.base, histogram_entry)
 
   return histograms, have_errors
 
 
-# Finds an <obsolete> node amongst |node|'s immediate children and returns its
-# content as a string. Returns None if no such node exists.
-def _GetObsoleteReason(node):
-  for child in node.childNodes:
-    if child.localName == 'obsolete':
-      # There can be at most 1 obsolete element per node.
-      return _JoinChildNodes(child)
-  return None
-
+class _HistogramView(collections.MutableMapping):
+  """A copy-on-write view of a histogram description.
 
-def _UpdateHistogramsWithSuffixes(tree, histograms):
-  """Process <histogram_suffixes> tags and combine with affected histograms.
+  Histograms generated by suffixes share the values of the histogram they are
+  expanded from, instead of deep copying it (and e.g. its enum). The view reads
+  through to a base description, which is never modified, and holds its own
+  changes.
+  """
 
-  The histograms dictionary will be updated in-place by adding new histograms
-  created by combining histograms themselves with histogram_suffixes targeting
-  these histograms.
+  def __init__(self, base):
+    if isinstance(base, _HistogramView):
+      # Flatten, so that lookups never go through more than one view.
+      self._base = base._base
+      self._changes = dict(base._changes)
+      self._deleted = base._deleted
+    else:
+      self._base = base
+      self._changes = {}
+      self._deleted = frozenset()
+
+  def __getitem__(self, key):
+    if key in self._changes:
+      return self._changes[key]
+    if key in self._deleted:
+      raise KeyError(key)
+    return self._base[key]
+
+  def __setitem__(self, key, value):
+    self._changes[key] = value
+    if key in self._deleted:
+      self._deleted = self._deleted - frozenset([key])
+
+  def __delitem__(self, key):
+    if key not in self:
+      raise KeyError(key)
+    self._changes.pop(key, None)
+    if key in self._base:
+      self._deleted = self._deleted | frozenset([key])
+
+  def __iter__(self):
+    for key in self._changes:
+      yield key
+    for key in self._base:
+      if key not in self._changes and key not in self._deleted:
+        yield key
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+  def __repr__(self):
+    return repr(dict(self))
+
+  def copy(self):
+    return dict(self)
+
+
+def _OrderHistogramSuffixes(histogram_suffixes_records, histogram_names):
+  """Orders the <histogram_suffixes> so that their dependencies come first.
+
+  histogram_suffixes can depend on the histograms generated by other
+  histogram_suffixes. Only the names of the histograms are needed to resolve
+  the dependencies, so the order is computed once, before any histogram
+  description is generated. The names generated by each group are computed
+  along the way and returned with it.
 
   Args:
-    tree: XML dom tree.
-    histograms: a dictionary of histograms previously extracted from the tree;
+    histogram_suffixes_records: the histogram_suffixes records, in document
+        order.
+    histogram_names: the names of the histograms defined in <histogram> tags.
 
   Returns:
-    True if any errors were found.
+    A tuple of (ordered, have_errors), where |ordered| is a list of tuples of
+    a histogram_suffixes record and its expansions: (histogram name, suffix
+    record, expanded histogram name) tuples.
   """
   have_errors = False
 
-  histogram_suffix_tag = 'histogram_suffixes'
-  suffix_tag = 'suffix'
-  with_tag = 'with-suffix'
-
   # Verify order of histogram_suffixes fields first.
   last_name = None
-  for histogram_suffixes in tree.getElementsByTagName(histogram_suffix_tag):
-    name = histogram_suffixes.getAttribute('name')
+  for histogram_suffixes in histogram_suffixes_records:
+    name = histogram_suffixes.name
     if last_name is not None and name.lower() < last_name.lower():
       logging.error('histogram_suffixes %s and %s are not in alphabetical '
                     'order', last_name, name)
       have_errors = True
     last_name = name
 
-  # histogram_suffixes can depend on other histogram_suffixes, so we need to be
-  # careful. Make a temporary copy of the list of histogram_suffixes to use as a
-  # queue. histogram_suffixes whose dependencies have not yet been processed
-  # will get relegated to the back of the queue to be processed later.
-  reprocess_queue = []
-
-  def GenerateHistogramSuffixes():
-    for f in tree.getElementsByTagName(histogram_suffix_tag):
-      yield 0, f
-    for r, f in reprocess_queue:
-      yield r, f
-
-  for reprocess_count, histogram_suffixes in GenerateHistogramSuffixes():
-    # Check dependencies first
-    dependencies_valid = True
-    affected_histograms = histogram_suffixes.getElementsByTagName(
-        'affected-histogram')
-    for affected_histogram in affected_histograms:
-      histogram_name = affected_histogram.getAttribute('name')
-      if histogram_name not in histograms:
-        # Base histogram is missing
-        dependencies_valid = False
-        missing_dependency = histogram_name
-        break
-    if not dependencies_valid:
+  # A group is processed once all its affected histograms exist. Groups whose
+  # dependencies have not been processed yet are deferred to a later pass, in
+  # document order, which is the order the generated histograms have always
+  # been produced in.
+  known_names = set(histogram_names)
+  ordered = []
+  pending = [(0, f) for f in histogram_suffixes_records]
+  for reprocess_count, histogram_suffixes in pending:
+    missing_dependency = next(
+        (affected.name for affected in histogram_suffixes.affected_histograms
+         if affected.name not in known_names), None)
+    if missing_dependency is not None:
       if reprocess_count < MAX_HISTOGRAM_SUFFIX_DEPENDENCY_DEPTH:
-        reprocess_queue.append((reprocess_count + 1, histogram_suffixes))
-        continue
+        # Appending while iterating is fine: the loop picks up new items.
+        pending.append((reprocess_count + 1, histogram_suffixes))
       else:
         logging.error('histogram_suffixes %s is missing its dependency %s',
-                      histogram_suffixes.getAttribute('name'),
-                      missing_dependency)
+                      histogram_suffixes.name, missing_dependency)
         have_errors = True
-        continue
-
-    # If the suffix group has an obsolete tag, all suffixes it generates inherit
-    # its reason.
-    group_obsolete_reason = _GetObsoleteReason(histogram_suffixes)
-
-    name = histogram_suffixes.getAttribute('name')
-    suffix_nodes = histogram_suffixes.getElementsByTagName(suffix_tag)
-    suffix_labels = {}
-    for suffix in suffix_nodes:
-      suffix_labels[suffix.getAttribute('name')] = suffix.getAttribute('label')
-    # Find owners list under current histogram_suffixes tag.
-    owners = _ExtractOwners(histogram_suffixes)
+      continue
 
+    name = histogram_suffixes.name
+    expansions = []
     last_histogram_name = None
-    for affected_histogram in affected_histograms:
-      histogram_name = affected_histogram.getAttribute('name')
+    for affected_histogram in histogram_suffixes.affected_histograms:
+      histogram_name = affected_histogram.name
       if (last_histogram_name is not None and
           histogram_name.lower() < last_histogram_name.lower()):
         logging.error('Affected histograms %s and %s of histogram_suffixes %s '
@@ -453,72 +731,112 @@ def _UpdateHistogramsWithSuffixes(tree, histograms):
                       histogram_name, name)
         have_errors = True
       last_histogram_name = histogram_name
-      with_suffixes = affected_histogram.getElementsByTagName(with_tag)
-      if with_suffixes:
-        suffixes_to_add = with_suffixes
-      else:
-        suffixes_to_add = suffix_nodes
-      for suffix in suffixes_to_add:
-        suffix_name = suffix.getAttribute('name')
+      for suffix in (affected_histogram.with_suffixes or
+                     histogram_suffixes.suffixes):
         try:
           new_histogram_name = _ExpandHistogramNameWithSuffixes(
-              suffix_name, histogram_name, histogram_suffixes)
-          if new_histogram_name != histogram_name:
-            new_histogram = copy.deepcopy(histograms[histogram_name])
-            # Do not copy forward base histogram state to suffixed
-            # histograms. Any suffixed histograms that wish to remain base
-            # histograms must explicitly re-declare themselves as base
-            # histograms.
-            if new_histogram.get('base', False):
-              del new_histogram['base']
-              if (new_histogram.get(
-                  'obsolete', '') == DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON):
-                del new_histogram['obsolete']
-            histograms[new_histogram_name] = new_histogram
-
-          suffix_label = suffix_labels.get(suffix_name, '')
-
-          # TODO(yiyaoliu): Rename these to be consistent with the new naming.
-          # It is kept unchanged for now to be it's used by dashboards.
-          if 'fieldtrial_groups' not in histograms[new_histogram_name]:
-            histograms[new_histogram_name]['fieldtrial_groups'] = []
-          histograms[new_histogram_name]['fieldtrial_groups'].append(
-              suffix_name)
-
-          if 'fieldtrial_names' not in histograms[new_histogram_name]:
-            histograms[new_histogram_name]['fieldtrial_names'] = []
-          histograms[new_histogram_name]['fieldtrial_names'].append(name)
-
-          if 'fieldtrial_labels' not in histograms[new_histogram_name]:
-            histograms[new_histogram_name]['fieldtrial_labels'] = []
-          histograms[new_histogram_name]['fieldtrial_labels'].append(
-              suffix_label)
-
-          # If no owners are added for this histogram-suffixes, it inherits the
-          # owners of its parents.
-          if owners:
-            histograms[new_histogram_name]['owners'] = owners
-
-          # If a suffix has an obsolete node, it's marked as obsolete for the
-          # specified reason, overwriting its group's obsoletion reason if the
-          # group itself was obsolete as well.
-          obsolete_reason = _GetObsoleteReason(suffix)
-          if not obsolete_reason:
-            obsolete_reason = group_obsolete_reason
-
-          # If the suffix has an obsolete tag, all histograms it generates
-          # inherit it.
-          if obsolete_reason:
-            histograms[new_histogram_name]['obsolete'] = obsolete_reason
-
-          _ProcessBaseHistogramAttribute(suffix, histograms[new_histogram_name])
-
+              suffix.name, histogram_name, histogram_suffixes)
         except Error:
           have_errors = True
+          continue
+        expansions.append((histogram_name, suffix, new_histogram_name))
+        known_names.add(new_histogram_name)
+    ordered.append((histogram_suffixes, expansions))
+
+  return ordered, have_errors
+
+
+def _UpdateHistogramsWithSuffixes(histogram_suffixes_records, histograms):
+  """Process <histogram_suffixes> records and combine with affected histograms.
+
+  The histograms dictionary will be updated in-place by adding new histograms
+  created by combining histograms themselves with histogram_suffixes targeting
+  these histograms. The added (or updated) histograms are |_HistogramView|s.
+
+  Args:
+    histogram_suffixes_records: the histogram_suffixes records.
+    histograms: a dictionary of histograms previously extracted from the tree;
+
+  Returns:
+    True if any errors were found.
+  """
+  ordered, have_errors = _OrderHistogramSuffixes(histogram_suffixes_records,
+                                                 histograms)
+
+  for histogram_suffixes, expansions in ordered:
+    name = histogram_suffixes.name
+    # If the suffix group has an obsolete tag, all suffixes it generates inherit
+    # its reason.
+    group_obsolete_reason = histogram_suffixes.obsolete_xml
+
+    suffix_labels = {}
+    for suffix in histogram_suffixes.suffixes:
+      suffix_labels[suffix.name] = suffix.label
+    # Find owners list under current histogram_suffixes tag.
+    owners = _ExtractOwners(histogram_suffixes.owners_xml)
+
+    for histogram_name, suffix, new_histogram_name in expansions:
+      # Descriptions are never modified in place, since other views may share
+      # them: the updated histogram is a new view.
+      new_histogram = _HistogramView(histograms[histogram_name])
+      if new_histogram_name != histogram_name:
+        # Do not copy forward base histogram state to suffixed
+        # histograms. Any suffixed histograms that wish to remain base
+        # histograms must explicitly re-declare themselves as base
+        # histograms.
+        if new_histogram.get('base', False):
+          del new_histogram['base']
+          if (new_histogram.get(
+              'obsolete', '') == DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON):
+            del new_histogram['obsolete']
+      histograms[new_histogram_name] = new_histogram
+
+      suffix_name = suffix.name
+      suffix_label = suffix_labels.get(suffix_name, '')
+
+      # TODO(yiyaoliu): Rename these to be consistent with the new naming.
+      # It is kept unchanged for now to be it's used by dashboards.
+      # The lists may be shared with other views, so they are replaced rather
+      # than appended to.
+      new_histogram['fieldtrial_groups'] = (
+          new_histogram.get('fieldtrial_groups', []) + [suffix_name])
+      new_histogram['fieldtrial_names'] = (
+          new_histogram.get('fieldtrial_names', []) + [name])
+      new_histogram['fieldtrial_labels'] = (
+          new_histogram.get('fieldtrial_labels', []) + [suffix_label])
+
+      # If no owners are added for this histogram-suffixes, it inherits the
+      # owners of its parents.
+      if owners:
+        new_histogram['owners'] = owners
+
+      # If a suffix has an obsolete node, it's marked as obsolete for the
+      # specified reason, overwriting its group's obsoletion reason if the
+      # group itself was obsolete as well.
+      obsolete_reason = suffix.obsolete_xml
+      if not obsolete_reason:
+        obsolete_reason = group_obsolete_reason
+
+      # If the suffix has an obsolete tag, all histograms it generates
+      # inherit it.
+      if obsolete_reason:
+        new_histogram['obsolete'] = obsolete_reason
+
+      _ProcessBaseHistogramAttribute(suffix.base, new_histogram)
 
   return have_errors
 
 
+def _ExtractHistogramsFromRecords(records_by_tag):
+  enums, enum_errors = _ExtractEnums(records_by_tag[_ENUM_TAG])
+  histograms, histogram_errors = _ExtractHistograms(
+      records_by_tag[_HISTOGRAM_TAG], enums)
+  update_errors = _UpdateHistogramsWithSuffixes(
+      records_by_tag[_HISTOGRAM_SUFFIXES_TAG], histograms)
+
+  return histograms, enum_errors or histogram_errors or update_errors
+
+
 def ExtractHistogramsFromDom(tree):
   """Compute the histogram names and descriptions from the XML representation.
 
@@ -530,18 +848,21 @@ def ExtractHistogramsFromDom(tree):
     histogram names to dictionaries containing histogram descriptions and status
     is a boolean indicating if errros were encoutered in processing.
   """
-  _NormalizeAllAttributeValues(tree)
-
-  enums, enum_errors = _ExtractEnumsFromXmlTree(tree)
-  histograms, histogram_errors = _ExtractHistogramsFromXmlTree(tree, enums)
-  update_errors = _UpdateHistogramsWithSuffixes(tree, histograms)
+  nodes_by_tag = dict((tag, []) for tag in _EXTRACTED_TAGS)
+  _NormalizeAllAttributeValues(tree, nodes_by_tag)
 
-  return histograms, enum_errors or histogram_errors or update_errors
+  records_by_tag = {}
+  for tag, nodes in nodes_by_tag.iteritems():
+    records_by_tag[tag] = [_RECORD_READERS[tag](_DomAdapter, node)
+                           for node in nodes]
+  return _ExtractHistogramsFromRecords(records_by_tag)
 
 
 def ExtractHistograms(filename):
   """Load histogram definitions from a disk file.
 
+  The file is parsed as a stream, without building its DOM tree.
+
   Args:
     filename: a file path to load data from.
 
@@ -551,13 +872,15 @@ def ExtractHistograms(filename):
   Raises:
     Error: if the file is not well-formatted.
   """
-  with open(filename, 'r') as f:
-    tree = xml.dom.minidom.parse(f)
-    histograms, had_errors = ExtractHistogramsFromDom(tree)
-    if had_errors:
-      logging.error('Error parsing %s', filename)
-      raise Error()
-    return histograms
+  parser = ElementTree.XMLParser(target=_StreamingTreeBuilder())
+  with open(filename, 'rb') as f:
+    for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+      parser.feed(chunk)
+  histograms, had_errors = _ExtractHistogramsFromRecords(parser.close())
+  if had_errors:
+    logging.error('Error parsing %s', filename)
+    raise Error()
+  return histograms
 
 
 def ExtractNames(histograms):
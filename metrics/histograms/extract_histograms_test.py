@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+import xml.dom.minidom
+
+import extract_histograms
+
+
+TEST_XML = """
+<histogram-configuration>
+<histograms>
+<histogram name="Test.Base" enum="TestEnum" base="true">
+  <owner>person@chromium.org</owner>
+  <summary>
+    A <b class="a"   id="b">base</b> histogram &amp; "its" <!-- hidden --> text.
+  </summary>
+</histogram>
+<histogram name="Test.Histogram" units="things
+                                         and stuff">
+  <owner>person@chromium.org</owner>
+  <summary>A histogram.<br/></summary>
+  <details>Some <code>x &lt; y</code> details.</details>
+</histogram>
+</histograms>
+<enums>
+<enum name="TestEnum">
+  <summary>An enum.</summary>
+  <int value="0" label="Zero"/>
+  <int value="1" label="One">The <i>first</i> value.</int>
+</enum>
+</enums>
+<histogram_suffixes_list>
+<histogram_suffixes name="Chained" separator=".">
+  <suffix name="Second" label="Second level"/>
+  <affected-histogram name="Test.Base_First"/>
+</histogram_suffixes>
+<histogram_suffixes name="First">
+  <owner>suffix-owner@chromium.org</owner>
+  <suffix name="First" label="First level"/>
+  <suffix name="" label="No suffix"/>
+  <affected-histogram name="Test.Base"/>
+  <affected-histogram name="Test.Histogram">
+    <with-suffix name="First"/>
+    <with-suffix name="Base" base="true"/>
+  </affected-histogram>
+</histogram_suffixes>
+<histogram_suffixes name="Prefix" ordering="prefix" separator="_">
+  <obsolete>Removed.</obsolete>
+  <suffix name="Pre" label="Prefixed"/>
+  <affected-histogram name="Test.Histogram"/>
+</histogram_suffixes>
+</histogram_suffixes_list>
+</histogram-configuration>
+"""
+
+
+class ExtractHistogramsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _ExtractFromDom(self, xml_string):
+    histograms, had_errors = extract_histograms.ExtractHistogramsFromDom(
+        xml.dom.minidom.parseString(xml_string))
+    self.assertFalse(had_errors)
+    return histograms
+
+  def _ExtractFromFile(self, xml_string):
+    path = os.path.join(self.temp_dir, 'histograms.xml')
+    with open(path, 'w') as f:
+      f.write(xml_string)
+    return extract_histograms.ExtractHistograms(path)
+
+  def testNames(self):
+    histograms = self._ExtractFromDom(TEST_XML)
+    self.assertEqual(['Test.Base', 'Test.Base_First', 'Test.Base_First.Second',
+                      'Test.Histogram', 'Test.Histogram_Base',
+                      'Test.Histogram_First', 'Test.Pre_Histogram'],
+                     extract_histograms.ExtractNames(histograms))
+
+  def testStreamingMatchesDom(self):
+    dom_histograms = self._ExtractFromDom(TEST_XML)
+    file_histograms = self._ExtractFromFile(TEST_XML)
+    self.assertEqual(sorted(dom_histograms), sorted(file_histograms))
+    for name in dom_histograms:
+      self.assertEqual(dict(dom_histograms[name]), dict(file_histograms[name]))
+
+  def testDescriptions(self):
+    histograms = self._ExtractFromFile(TEST_XML)
+    base = histograms['Test.Base']
+    self.assertEqual(
+        'A <b class="a" id="b">base</b> histogram &amp; &quot;its&quot; '
+        '<!-- hidden --> text.', base['summary'])
+    self.assertEqual('The <i>first</i> value.',
+                     base['enum']['values'][1]['summary'])
+    histogram = histograms['Test.Histogram']
+    self.assertEqual('things and stuff', histogram['units'])
+    self.assertEqual('A histogram.<br/>', histogram['summary'])
+    self.assertEqual('Some <code>x &lt; y</code> details.',
+                     histogram['details'])
+
+  def testSuffixedHistograms(self):
+    histograms = self._ExtractFromFile(TEST_XML)
+    base = histograms['Test.Base']
+    # The empty suffix updates the affected histogram itself.
+    self.assertEqual([''], base['fieldtrial_groups'])
+    self.assertTrue(base['base'])
+
+    first = histograms['Test.Base_First']
+    self.assertNotIn('base', first)
+    self.assertNotIn('obsolete', first)
+    self.assertEqual(['First'], first['fieldtrial_groups'])
+    self.assertEqual(['suffix-owner@chromium.org'], first['owners'])
+    self.assertIs(base['enum'], first['enum'])
+
+    second = histograms['Test.Base_First.Second']
+    self.assertEqual(['First', 'Second'], second['fieldtrial_groups'])
+    self.assertEqual(['First', 'Chained'], second['fieldtrial_names'])
+    self.assertEqual(['First level', 'Second level'],
+                     second['fieldtrial_labels'])
+    # Expanding a histogram doesn't modify the histogram it is expanded from.
+    self.assertEqual(['First'], first['fieldtrial_groups'])
+
+    self.assertTrue(histograms['Test.Histogram_Base']['base'])
+    self.assertNotIn('Test.Histogram_', histograms)
+    self.assertEqual('Removed.', histograms['Test.Pre_Histogram']['obsolete'])
+    self.assertNotIn('obsolete', histograms['Test.Histogram'])
+
+  def testMissingSuffixDependency(self):
+    xml_string = TEST_XML.replace('name="Test.Base_First"',
+                                  'name="Test.Missing"')
+    with self.assertRaises(extract_histograms.Error):
+      self._ExtractFromFile(xml_string)
+
+
+if __name__ == '__main__':
+  unittest.main()
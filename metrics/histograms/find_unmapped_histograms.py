@@ -10,13 +10,17 @@ trials are entirely ignored by this script.
 
 """
 
+import bisect
 import hashlib
+import json
 import logging
+import multiprocessing
 import optparse
 import os
 import re
 import subprocess
 import sys
+import tempfile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'common'))
 import path_util
@@ -107,16 +111,38 @@ STANDARD_LIKE_SUFFIXES = frozenset(['SCROLL_LATENCY_SHORT',
                                     'ASPECT_RATIO', 'LOCATION_RESPONSE_TIMES',
                                     'LOCK_TIMES', 'OOM_KILL_TIME_INTERVAL'])
 OTHER_STANDARD_LIKE_HISTOGRAMS = frozenset(['SCOPED_BLINK_UMA_HISTOGRAM_TIMER'])
+# Matches calls to the histogram functions, e.g. base::UmaHistogramSparse().
+# Their first argument is the full name of the histogram.
+HISTOGRAM_FUNCTION_REGEX = re.compile(r"""
+    \bbase::        # The functions are only matched when namespace-qualified,
+                    # which skips their declarations in base/
+    (UmaHistogram\w*) # Capture the function name
+    \(              # Match the opening parenthesis for the call
+    \s*             # Match any whitespace -- especially, any newlines
+    ([^,)]*)        # Capture the first argument to the function
+    [,)]            # Match the comma/paren that delineates the first argument
+    """, re.VERBOSE)
+
+# Bump this when scanFile() changes, to invalidate the cached results.
+SCANNER_VERSION = 1
+DEFAULT_CACHE_FILE = os.path.join(tempfile.gettempdir(),
+                                  'find_unmapped_histograms_cache.json')
+
+# Kinds of entries returned by scanFile().
+ENTRY_HISTOGRAM = 'histogram'
+ENTRY_UNKNOWN_MACRO = 'unknown_macro'
+ENTRY_NON_LITERAL = 'non_literal'
 
 
-def RunGit(command):
+def RunGit(command, stdin=None):
   """Run a git subcommand, returning its output."""
   # On Windows, use shell=True to get PATH interpretation.
   command = ['git'] + command
   logging.info(' '.join(command))
   shell = (os.name == 'nt')
-  proc = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE)
-  out = proc.communicate()[0].strip()
+  proc = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE,
+                          stdin=None if stdin is None else subprocess.PIPE)
+  out = proc.communicate(stdin)[0].strip()
   return out
 
 
@@ -220,12 +246,122 @@ def logNonLiteralHistogram(filename, histogram):
                   histogram)
 
 
-def readChromiumHistograms():
+def getHistogramName(expression):
+  """Returns the literal histogram name of a macro or function argument.
+
+  Args:
+    expression: The first argument of the macro or function, e.g.
+                '"Foo"\n    "Bar"'
+
+  Returns:
+    The histogram name, e.g. 'FooBar', or None if the argument is not a string
+    literal.
+  """
+  histogram = collapseAdjacentCStrings(expression.strip())
+
+  # Must begin and end with a quotation mark.
+  if not histogram or histogram[0] != '"' or histogram[-1] != '"':
+    return None
+
+  # Must not include any quotation marks other than at the beginning or end.
+  histogram_stripped = histogram.strip('"')
+  if '"' in histogram_stripped:
+    return None
+  return histogram_stripped
+
+
+def scanFile(filename):
+  """Finds the histograms used by a source file.
+
+  The comments are removed and the histogram macros and functions are matched
+  in linear passes over the file. Line numbers are found by bisecting the
+  offsets of the newlines, rather than by counting the newlines preceding each
+  match.
+
+  Args:
+    filename: The path of the file to scan, e.g. 'chrome/browser/foo.cc'
+
+  Returns:
+    A list of [kind, line_number, value] entries, in the order of the file:
+      [ENTRY_HISTOGRAM, line_number, histogram_name],
+      [ENTRY_UNKNOWN_MACRO, line_number, macro_name], or
+      [ENTRY_NON_LITERAL, line_number, expression].
+  """
+  with open(filename, 'r') as f:
+    contents = removeComments(f.read())
+  # removeComments() preserves the newlines, so the offsets match the source.
+  newline_offsets = [m.start() for m in re.finditer('\n', contents)]
+
+  all_suffixes = STANDARD_HISTOGRAM_SUFFIXES | STANDARD_LIKE_SUFFIXES
+  all_others = OTHER_STANDARD_HISTOGRAMS | OTHER_STANDARD_LIKE_HISTOGRAMS
+  matches = []
+  for match in HISTOGRAM_REGEX.finditer(contents):
+    if (match.group(2) not in all_suffixes and
+        match.group(1) not in all_others):
+      matches.append((match.start(), ENTRY_UNKNOWN_MACRO, match.group(1)))
+    else:
+      matches.append((match.start(), None, match.group(3)))
+  for match in HISTOGRAM_FUNCTION_REGEX.finditer(contents):
+    matches.append((match.start(), None, match.group(2)))
+  matches.sort()
+
+  entries = []
+  for start, kind, value in matches:
+    line_number = bisect.bisect_left(newline_offsets, start) + 1
+    if kind is None:
+      histogram = getHistogramName(value)
+      if histogram is None:
+        kind, value = ENTRY_NON_LITERAL, collapseAdjacentCStrings(value.strip())
+      else:
+        kind, value = ENTRY_HISTOGRAM, histogram
+    entries.append([kind, line_number, value])
+  return entries
+
+
+def _scanFileWorker(filename):
+  return filename, scanFile(filename)
+
+
+def readScanCache(cache_file):
+  """Returns the cached scanFile() results, keyed by git blob hash."""
+  if not cache_file or not os.path.isfile(cache_file):
+    return {}
+  try:
+    with open(cache_file) as f:
+      cache = json.load(f)
+  except ValueError:
+    logging.warning('Ignoring corrupted cache file: %s', cache_file)
+    return {}
+  if cache.get('version') != SCANNER_VERSION:
+    return {}
+  return cache['entries_by_blob']
+
+
+def writeScanCache(cache_file, entries_by_blob):
+  """Stores the scanFile() results, keyed by git blob hash."""
+  tmp_file = cache_file + '.tmp'
+  with open(tmp_file, 'w') as f:
+    json.dump({'version': SCANNER_VERSION, 'entries_by_blob': entries_by_blob},
+              f)
+  # Atomically replace the cache, so that it is never left half-written.
+  if os.name == 'nt' and os.path.exists(cache_file):
+    os.remove(cache_file)
+  os.rename(tmp_file, cache_file)
+
+
+def readChromiumHistograms(cache_file=None, jobs=None):
   """Searches the Chromium source for all histogram names.
 
   Also prints warnings for any invocations of the UMA_HISTOGRAM_* macros with
   names that might vary during a single run of the app.
 
+  Args:
+    cache_file: The file in which the results are cached per git blob hash, so
+                that only the modified files are scanned again. None disables
+                the cache.
+    jobs: The number of processes scanning the files. Defaults to the number
+          of CPUs.
+
   Returns:
     A tuple of
       a set containing any found literal histogram names, and
@@ -233,56 +369,70 @@ def readChromiumHistograms():
   """
   logging.info('Scanning Chromium source for histograms...')
 
-  # Use git grep to find all invocations of the UMA_HISTOGRAM_* macros.
+  # Use git grep to find all invocations of the UMA_HISTOGRAM_* macros and of
+  # the base::UmaHistogram*() functions.
   # Examples:
   #   'path/to/foo.cc:420:  UMA_HISTOGRAM_COUNTS_100("FooGroup.FooName",'
   #   'path/to/bar.cc:632:  UMA_HISTOGRAM_ENUMERATION('
-  locations = RunGit(['gs', 'UMA_HISTOGRAM']).split('\n')
+  #   'path/to/baz.cc:17:  base::UmaHistogramSparse("Baz.Error", error);'
+  locations = (RunGit(['gs', 'UMA_HISTOGRAM']).split('\n') +
+               RunGit(['gs', 'UmaHistogram']).split('\n'))
   all_filenames = set(location.split(':')[0] for location in locations);
-  filenames = [f for f in all_filenames
-               if C_FILENAME.match(f) and not TEST_FILENAME.match(f)]
+  filenames = sorted(f for f in all_filenames
+                     if C_FILENAME.match(f) and not TEST_FILENAME.match(f))
+  if not filenames:
+    return set(), {}
+
+  # Unlike the index, "git hash-object" takes the local modifications into
+  # account.
+  blobs = RunGit(['hash-object', '--stdin-paths'],
+                 stdin='\n'.join(filenames) + '\n').split('\n')
+  assert len(blobs) == len(filenames)
+  cached_entries_by_blob = readScanCache(cache_file)
+  entries_by_filename = {}
+  missed_filenames = []
+  for filename, blob in zip(filenames, blobs):
+    if blob in cached_entries_by_blob:
+      entries_by_filename[filename] = cached_entries_by_blob[blob]
+    else:
+      missed_filenames.append(filename)
+  logging.info('Scanning %d files (%d cached)...', len(missed_filenames),
+               len(filenames) - len(missed_filenames))
+
+  if missed_filenames:
+    jobs = min(jobs or multiprocessing.cpu_count(), len(missed_filenames))
+    if jobs > 1:
+      pool = multiprocessing.Pool(jobs)
+      try:
+        results = pool.imap_unordered(_scanFileWorker, missed_filenames,
+                                      chunksize=16)
+        entries_by_filename.update(results)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      entries_by_filename.update(_scanFileWorker(f) for f in missed_filenames)
+
+  if cache_file:
+    writeScanCache(cache_file, {
+        blob: entries_by_filename[filename]
+        for filename, blob in zip(filenames, blobs)})
 
   histograms = set()
   location_map = dict()
   unknown_macros = set()
-  all_suffixes = STANDARD_HISTOGRAM_SUFFIXES | STANDARD_LIKE_SUFFIXES
-  all_others = OTHER_STANDARD_HISTOGRAMS | OTHER_STANDARD_LIKE_HISTOGRAMS
   for filename in filenames:
-    contents = ''
-    with open(filename, 'r') as f:
-      contents = removeComments(f.read())
-
-    # TODO(isherman): Look for histogram function calls like
-    # base::UmaHistogramSparse() in addition to macro invocations.
-    for match in HISTOGRAM_REGEX.finditer(contents):
-      line_number = contents[:match.start()].count('\n') + 1
-      if (match.group(2) not in all_suffixes and
-          match.group(1) not in all_others):
-        full_macro_name = match.group(1)
-        if (full_macro_name not in unknown_macros):
+    for kind, line_number, value in entries_by_filename[filename]:
+      if kind == ENTRY_UNKNOWN_MACRO:
+        if value not in unknown_macros:
           logging.warning('%s:%d: Unknown macro name: <%s>' %
-                          (filename, line_number, match.group(1)))
-          unknown_macros.add(full_macro_name)
-
-        continue
-
-      histogram = match.group(3).strip()
-      histogram = collapseAdjacentCStrings(histogram)
-
-      # Must begin and end with a quotation mark.
-      if not histogram or histogram[0] != '"' or histogram[-1] != '"':
-        logNonLiteralHistogram(filename, histogram)
-        continue
-
-      # Must not include any quotation marks other than at the beginning or end.
-      histogram_stripped = histogram.strip('"')
-      if '"' in histogram_stripped:
-        logNonLiteralHistogram(filename, histogram)
-        continue
-
-      if histogram_stripped not in histograms:
-        histograms.add(histogram_stripped)
-        location_map[histogram_stripped] = '%s:%d' % (filename, line_number)
+                          (filename, line_number, value))
+          unknown_macros.add(value)
+      elif kind == ENTRY_NON_LITERAL:
+        logNonLiteralHistogram(filename, value)
+      elif value not in histograms:
+        histograms.add(value)
+        location_map[value] = '%s:%d' % (filename, line_number)
 
   return histograms, location_map
 
@@ -373,6 +523,18 @@ def main():
       help=(
           'print file position information with histograms ' +
           '[optional, defaults to %default]'))
+  parser.add_option(
+      '--cache-file', dest='cache_file', default=DEFAULT_CACHE_FILE,
+      help=(
+          'cache the scan results of the source files in FILE, keyed by git '
+          'blob hash; pass an empty string to disable the cache ' +
+          '[optional, defaults to %default]'),
+      metavar='FILE')
+  parser.add_option(
+      '-j', '--jobs', dest='jobs', type='int', default=None,
+      help=(
+          'number of processes scanning the source files ' +
+          '[optional, defaults to the number of CPUs]'))
 
   (options, args) = parser.parse_args()
   if args:
@@ -386,7 +548,8 @@ def main():
   except EnvironmentError as e:
     logging.error("Could not change to root directory: %s", e)
     sys.exit(1)
-  chromium_histograms, location_map = readChromiumHistograms()
+  chromium_histograms, location_map = readChromiumHistograms(
+      options.cache_file, options.jobs)
   xml_histograms = readXmlHistograms(options.histograms_file_location)
   unmapped_histograms = chromium_histograms - xml_histograms
 
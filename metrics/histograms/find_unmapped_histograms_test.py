@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Copyright 2019 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import find_unmapped_histograms
+
+
+FOO_CC = """
+void Foo() {
+  UMA_HISTOGRAM_BOOLEAN("Test.Foo", true);
+  // UMA_HISTOGRAM_BOOLEAN("Test.Commented", true);
+}
+"""
+
+BAR_CC = """
+void Bar() {
+  base::UmaHistogramSparse("Test.Bar", 1);
+}
+"""
+
+
+class FindUnmappedHistogramsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.root_dir = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.root_dir, 'cache.json')
+    self.old_cwd = os.getcwd()
+    os.chdir(self.root_dir)
+    self.git_commands = []
+    self.scanned_filenames = []
+    self.old_run_git = find_unmapped_histograms.RunGit
+    self.old_scan_file = find_unmapped_histograms.scanFile
+    find_unmapped_histograms.RunGit = self._RunGit
+    find_unmapped_histograms.scanFile = self._ScanFile
+
+  def tearDown(self):
+    find_unmapped_histograms.RunGit = self.old_run_git
+    find_unmapped_histograms.scanFile = self.old_scan_file
+    os.chdir(self.old_cwd)
+    shutil.rmtree(self.root_dir)
+
+  def _WriteFile(self, filename, contents):
+    with open(filename, 'w') as f:
+      f.write(contents)
+
+  def _RunGit(self, command, stdin=None):
+    """Emulates "git gs" and "git hash-object" over the files in the cwd."""
+    self.git_commands.append(command[0])
+    if command[0] == 'gs':
+      return '\n'.join('%s:1:' % f for f in sorted(os.listdir('.'))
+                       if f.endswith('.cc'))
+    assert command == ['hash-object', '--stdin-paths']
+    blobs = []
+    for filename in stdin.splitlines():
+      with open(filename) as f:
+        blobs.append(hashlib.sha1(f.read()).hexdigest())
+    return '\n'.join(blobs)
+
+  def _ScanFile(self, filename):
+    self.scanned_filenames.append(filename)
+    return self.old_scan_file(filename)
+
+  def _ReadChromiumHistograms(self):
+    return find_unmapped_histograms.readChromiumHistograms(
+        cache_file=self.cache_file, jobs=1)
+
+  def testNoFiles(self):
+    self.assertEqual((set(), {}), self._ReadChromiumHistograms())
+    self.assertEqual(['gs', 'gs'], self.git_commands)
+    self.assertFalse(os.path.exists(self.cache_file))
+
+  def testCache(self):
+    self._WriteFile('foo.cc', FOO_CC)
+    self._WriteFile('bar.cc', BAR_CC)
+    expected = ({'Test.Foo', 'Test.Bar'},
+                {'Test.Foo': 'foo.cc:3', 'Test.Bar': 'bar.cc:3'})
+
+    # Cache miss.
+    self.assertEqual(expected, self._ReadChromiumHistograms())
+    self.assertEqual(['bar.cc', 'foo.cc'], sorted(self.scanned_filenames))
+
+    # Cache hit.
+    self.scanned_filenames = []
+    self.assertEqual(expected, self._ReadChromiumHistograms())
+    self.assertEqual([], self.scanned_filenames)
+
+    # Only the modified file is scanned again.
+    self._WriteFile('foo.cc', '\n' + FOO_CC)
+    expected[1]['Test.Foo'] = 'foo.cc:4'
+    self.assertEqual(expected, self._ReadChromiumHistograms())
+    self.assertEqual(['foo.cc'], self.scanned_filenames)
+
+  def testCorruptedCache(self):
+    self._WriteFile('foo.cc', FOO_CC)
+    self._WriteFile(self.cache_file, '{')
+    self.assertEqual(({'Test.Foo'}, {'Test.Foo': 'foo.cc:3'}),
+                     self._ReadChromiumHistograms())
+    self.assertEqual(['foo.cc'], self.scanned_filenames)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -21,6 +21,8 @@ def resolve(*paths):
 
 sys.exit(typ.main(tests=resolve(
    'actions/extract_actions_test.py',
+   'histograms/extract_histograms_test.py',
+   'histograms/find_unmapped_histograms_test.py',
    'histograms/generate_expired_histograms_array_unittest.py',
    'histograms/pretty_print_test.py',
    'rappor/rappor_model_test.py',